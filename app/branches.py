@@ -0,0 +1,72 @@
+"""
+教室（校舎）単位の DB 分割の設定と、処理中の教室
+教室ごとに別の DB を持ち、
+リクエストはセッション（または X-Branch ヘッダー）で選んだ教室の DB を使う
+処理中の教室はコンテキスト変数で持ち、データバージョンやキャッシュのキーに含める
+"""
+
+from contextvars import ContextVar
+from typing import Iterable, List, Optional
+
+from app.config import settings
+
+DEFAULT_BRANCH = settings.DEFAULT_BRANCH
+
+_current_branch: ContextVar[str] = ContextVar(
+    "current_branch", default=DEFAULT_BRANCH
+)
+
+
+def sharding_enabled() -> bool:
+    return bool(settings.BRANCH_DATABASES)
+
+
+def branch_codes() -> List[str]:
+    """全教室のコード（既定の教室が先頭）"""
+    others = (code for code in settings.BRANCH_DATABASES if code != DEFAULT_BRANCH)
+    return [DEFAULT_BRANCH, *others]
+
+
+def is_branch(code: Optional[str]) -> bool:
+    return code in branch_codes()
+
+
+def current_branch() -> str:
+    return _current_branch.get()
+
+
+def set_current_branch(branch: str):
+    """処理中の教室を設定（戻り値を reset_current_branch に渡すと元に戻る）"""
+    return _current_branch.set(branch)
+
+
+def reset_current_branch(token):
+    _current_branch.reset(token)
+
+
+def resolve_branch(classroom_code: str) -> Optional[str]:
+    """
+    CSV の教室コードから教室を決める
+    （教室コードと一致、または最も長く前方一致する教室）
+    """
+    code = (classroom_code or "").strip()
+    matches = [b for b in branch_codes() if code == b or code.startswith(b)]
+    return max(matches, key=len) if matches else None
+
+
+def resolve_csv_branch(classroom_codes: Iterable[str]) -> Optional[str]:
+    """
+    CSV 全体の教室を決める（分割していない・どの教室にも当たらない場合は None）
+
+    Raises:
+        ValueError: 複数の教室のデータが含まれている
+    """
+    if not sharding_enabled():
+        return None
+    found = {resolve_branch(code) for code in classroom_codes} - {None}
+    if len(found) > 1:
+        raise ValueError(
+            f"複数の教室のデータが含まれています（{', '.join(sorted(found))}）。"
+            "教室ごとに分けてください"
+        )
+    return found.pop() if found else None
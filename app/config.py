@@ -1,12 +1,68 @@
 import os
-from dotenv import load_dotenv
+from dotenv import dotenv_values
+
+# .env の値（環境変数が優先）。os.environ には書き込まない
+_env = {**dotenv_values(), **os.environ}
+
+
+def _getenv(key: str, default: str) -> str:
+    value = _env.get(key)
+    return default if value is None else value
+
+
+def _parse_branches(value: str) -> dict:
+    """
+    "駅前=sqlite:///./ekimae.db,北口=postgresql://..." を
+    {教室コード: DB の URL} にする
+    """
+    branches = {}
+    for item in value.split(","):
+        code, sep, url = item.partition("=")
+        if sep and code.strip() and url.strip():
+            branches[code.strip()] = url.strip()
+    return branches
 
-load_dotenv()
 
 class Settings:
-    SECRET_KEY: str = os.getenv("SECRET_KEY", "dev-secret-key-change-in-production")
-    ADMIN_PASSWORD: str = os.getenv("ADMIN_PASSWORD", "admin")
-    DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite:///./student_manager.db")
-    DEBUG: bool = os.getenv("DEBUG", "false").lower() == "true"
+    SECRET_KEY: str = _getenv("SECRET_KEY", "dev-secret-key-change-in-production")
+    ADMIN_PASSWORD: str = _getenv("ADMIN_PASSWORD", "admin")
+    DATABASE_URL: str = _getenv("DATABASE_URL", "sqlite:///./student_manager.db")
+    DEBUG: bool = _getenv("DEBUG", "false").lower() == "true"
+    # Jinja2 バイトコードキャッシュの保存先（空文字で無効）
+    TEMPLATE_CACHE_DIR: str = _getenv("TEMPLATE_CACHE_DIR", "./.cache/jinja")
+    # 成績の列指向インメモリストア（単一プロセス運用時のみ有効にする）
+    GRADE_STORE_ENABLED: bool = (
+        _getenv("GRADE_STORE_ENABLED", "false").lower() == "true"
+    )
+
+    # 書き込みを専用スレッドで直列化してグループコミット（既定は SQLite のときだけ有効）
+    WRITE_QUEUE_ENABLED: bool = _getenv(
+        "WRITE_QUEUE_ENABLED", "true" if DATABASE_URL.startswith("sqlite") else "false"
+    ).lower() == "true"
+    # 夜間の事前計算・DB メンテナンスのスケジューラ（ロックを取れた1プロセスだけが実行）
+    SCHEDULER_ENABLED: bool = _getenv("SCHEDULER_ENABLED", "true").lower() == "true"
+    SCHEDULER_LOCK_FILE: str = _getenv("SCHEDULER_LOCK_FILE", "./.cache/scheduler.lock")
+    # 分割アップロードの受信中ファイルと取込プレビューの保存先（複数ワーカーで共有する）
+    UPLOAD_SPOOL_DIR: str = _getenv("UPLOAD_SPOOL_DIR", "./.cache/uploads")
+    # 教室（校舎）ごとの DB 分割
+    # DATABASE_URL は DEFAULT_BRANCH の DB で、それ以外の教室を列挙する
+    DEFAULT_BRANCH: str = _getenv("DEFAULT_BRANCH", "main")
+    BRANCH_DATABASES: dict = _parse_branches(_getenv("BRANCH_DATABASES", ""))
+    # 他のプロセス（別のワーカー・スクリプト）の書き込みをキャッシュに反映する間隔（秒）
+    DATA_VERSION_REFRESH_SECONDS: float = float(
+        _getenv("DATA_VERSION_REFRESH_SECONDS", "1")
+    )
+    # 生徒ダッシュボードを書き込みのたびに HTML ファイルへ書き出し、
+    # 表示はファイルから返す（空文字で無効）
+    DASHBOARD_PUBLISH_DIR: str = _getenv("DASHBOARD_PUBLISH_DIR", "")
+    # テンプレートの事前コンパイル:
+    # background（起動後に別スレッドで）/ startup（起動を待たせて）/ off
+    TEMPLATE_PRECOMPILE: str = _getenv("TEMPLATE_PRECOMPILE", "background").lower()
+    # 接続プール（PostgreSQL など SQLite 以外の DB。教室ごとの DB にそれぞれ作られる）
+    DB_POOL_SIZE: int = int(_getenv("DB_POOL_SIZE", "10"))
+    DB_MAX_OVERFLOW: int = int(_getenv("DB_MAX_OVERFLOW", "20"))
+    DB_POOL_TIMEOUT: int = int(_getenv("DB_POOL_TIMEOUT", "30"))
+    # 秒。DB やプロキシのアイドル切断より短くする
+    DB_POOL_RECYCLE: int = int(_getenv("DB_POOL_RECYCLE", "1800"))
 
 settings = Settings()
@@ -0,0 +1,149 @@
+"""
+データバージョン管理
+コミットされた書き込みをテーブル単位で数え、キャッシュのキーとして使う
+教室ごとに DB を分けている場合は教室ごとに数え、バージョンの先頭に教室コードを含める
+
+このプロセスのコミットはコミット時に進める。他のプロセス（別のワーカー・定期処理の
+リーダー・scripts/）の書き込みは、バージョンを使うとき（キャッシュ・集計のキー）に
+DB の data_versions（app.database）を読んで取り込む（sync_stored_versions）
+読み込みは教室ごとに DATA_VERSION_REFRESH_SECONDS に1回まで
+（キャッシュを使わないリクエストは DB に問い合わせない）
+"""
+
+import logging
+import time
+from collections import defaultdict
+from threading import Lock
+from typing import Callable, Dict, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.branches import current_branch
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# (教室コード, テーブル名) → バージョン
+_versions: dict[tuple, int] = defaultdict(int)
+# (教室コード, テーブル名) → 最後に見た data_versions の値
+_stored: dict[tuple, int] = {}
+_lock = Lock()
+# 教室コード → data_versions を返す関数（app.database が登録する）
+_loader: Optional[Callable[[str], Dict[str, int]]] = None
+# 教室コード → 最後に data_versions を読んだ時刻（time.monotonic）
+_refreshed_at: Dict[str, float] = {}
+
+
+def set_stored_version_loader(loader: Callable[[str], Dict[str, int]]):
+    global _loader
+    _loader = loader
+
+
+def _refresh_stored(branch: str):
+    """他のプロセスの書き込みを取り込む（前回から間隔が空いていれば問い合わせ1回）"""
+    if _loader is None:
+        return
+    now = time.monotonic()
+    with _lock:
+        last = _refreshed_at.get(branch)
+        if last is not None and now - last < settings.DATA_VERSION_REFRESH_SECONDS:
+            return
+        # 同時に来た呼び出しは読み込みを待たずに今のバージョンを使う
+        _refreshed_at[branch] = now
+    try:
+        stored = _loader(branch)
+    except Exception as e:
+        logger.warning("Failed to read data versions (%s): %s", branch, e)
+        return
+    sync_stored_versions(branch, stored)
+
+
+def get_data_version(*tables: str) -> tuple:
+    """
+    処理中の教室の指定テーブルの現在のバージョンを
+    (教室コード, バージョン...) のタプルで返す
+    """
+    branch = current_branch()
+    _refresh_stored(branch)
+    return (branch, *(_versions[(branch, t)] for t in tables))
+
+
+def bump_data_version(*tables: str, branch: Optional[str] = None):
+    """
+    指定テーブルのバージョンを進める（ORM を経由しない書き込み用）
+    教室の省略時は処理中の教室
+    """
+    branch = branch or current_branch()
+    with _lock:
+        for t in tables:
+            _versions[(branch, t)] += 1
+
+
+def sync_stored_versions(branch: str, stored: dict):
+    """
+    DB に記録したバージョン {テーブル名: 値} を取り込む
+    前回から進んでいるテーブル（他のプロセスの書き込み）はこのプロセスのバージョンも進める
+    """
+    with _lock:
+        for table, version in stored.items():
+            key = (branch, table)
+            if _stored.get(key) != version:
+                _stored[key] = version
+                _versions[key] += 1
+
+
+def note_stored_versions(branch: str, stored: dict):
+    """このプロセスのコミットで進めた DB のバージョンを記録（二重に進めないように）"""
+    with _lock:
+        _stored.update(((branch, table), version) for table, version in stored.items())
+
+
+def _changed_tables(session: Session) -> set:
+    return session.info.setdefault("changed_tables", set())
+
+
+def mark_tables_changed(session: Session, *tables: str):
+    """
+    SQL を直接送る書き込み（PostgreSQL の COPY など）の変更テーブルを記録
+    （コミット時にバージョンを進める）
+    """
+    _changed_tables(session).update(tables)
+
+
+def track_data_version(factory: sessionmaker):
+    """
+    セッションファクトリにイベントを登録
+    flush / DML 実行で変更テーブルを記録し、コミット時にバージョンを進める
+    """
+
+    @event.listens_for(factory, "before_flush")
+    def _collect_flush(session, flush_context, instances):
+        for obj in (*session.new, *session.dirty, *session.deleted):
+            table = getattr(obj, "__tablename__", None)
+            if table:
+                _changed_tables(session).add(table)
+
+    @event.listens_for(factory, "do_orm_execute")
+    def _collect_dml(state):
+        if state.is_insert or state.is_update or state.is_delete:
+            table = getattr(state.statement, "table", None)
+            if table is not None:
+                _changed_tables(state.session).add(table.name)
+
+    @event.listens_for(factory, "after_commit")
+    def _bump(session):
+        tables = session.info.pop("changed_tables", None)
+        if not tables:
+            return
+        branch = session.info.get("branch")
+        # 書き込みキュー内のコミットは SAVEPOINT なので、グループコミット後に進める
+        deferred = session.info.get("deferred_callbacks")
+        if deferred is not None:
+            deferred.append(lambda: bump_data_version(*tables, branch=branch))
+        else:
+            bump_data_version(*tables, branch=branch)
+
+    @event.listens_for(factory, "after_rollback")
+    def _discard(session):
+        session.info.pop("changed_tables", None)
@@ -1,27 +1,445 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import declarative_base, sessionmaker
-from app.config import settings
+import hashlib
+import importlib
+import logging
+import pkgutil
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from threading import Lock
+from typing import Callable, Dict, List, Optional, TypeVar
+
+from fastapi import Request
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Index,
+    Integer,
+    String,
+    Table,
+    create_engine,
+    delete,
+    event,
+    func,
+    insert,
+    inspect,
+    select,
+    text,
+    update,
+)
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session, declarative_base, sessionmaker
+from sqlalchemy.schema import CreateIndex, CreateTable
 
-# データベース接続
-engine = create_engine(
-    settings.DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in settings.DATABASE_URL else {},
-    echo=settings.DEBUG
+from app.branches import (
+    DEFAULT_BRANCH,
+    branch_codes,
+    is_branch,
+    reset_current_branch,
+    set_current_branch,
+    sharding_enabled,
+)
+from app.config import settings
+from app.data_version import (
+    note_stored_versions,
+    set_stored_version_loader,
+    sync_stored_versions,
+    track_data_version,
 )
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+try:
+    import fcntl
+except ImportError:  # Windows ではロックファイルを使わない
+    fcntl = None
+
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+# スキーマ更新中に取る PostgreSQL のアドバイザリロックのキー（定期処理とは別の値）
+SCHEMA_LOCK_KEY = 726_1002
+
+
+def _create_engine(url: str) -> Engine:
+    if "sqlite" in url:
+        return create_engine(
+            url, connect_args={"check_same_thread": False}, echo=settings.DEBUG
+        )
+    return create_engine(
+        url,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        # 切れた接続（DB の再起動・アイドル切断）を使う前に検出して張り直す
+        pool_pre_ping=True,
+        echo=settings.DEBUG,
+    )
+
+
+def _create_sessionmaker(bind: Engine, branch: str) -> sessionmaker:
+    factory = sessionmaker(
+        autocommit=False, autoflush=False, bind=bind, info={"branch": branch}
+    )
+    # コミットごとにテーブル単位のデータバージョンを進める（キャッシュキー用）
+    track_data_version(factory)
+    _persist_data_versions(factory)
+    return factory
+
 
 # 全モデルが継承するベースクラス
 Base = declarative_base()
 
-def get_db():
-    """依存関数: DB セッションを取得"""
-    db = SessionLocal()
+# 最後にテーブルを用意したときのモデル定義の指紋
+# （同じなら起動時の create_all などを省く）
+schema_version = Table(
+    "schema_version",
+    Base.metadata,
+    Column("fingerprint", String(64), primary_key=True),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+# テーブルごとの書き込み回数（コミットと同じトランザクションで進める）
+# get_data_version はプロセス内だけなので、他のワーカー・スクリプトの書き込みも
+# 見る必要があるキャッシュはこちらを使う（stored_data_version）
+data_versions = Table(
+    "data_versions",
+    Base.metadata,
+    Column("table_name", String(64), primary_key=True),
+    Column("version", Integer, nullable=False, default=0),
+)
+
+
+def _persist_data_versions(factory: sessionmaker):
+    """コミット時に変更テーブルの data_versions を同じトランザクションで進める"""
+
+    @event.listens_for(factory, "before_commit")
+    def _bump_stored(session):
+        # コミット時の flush より先に呼ばれるので、未 flush の変更もここで記録する
+        session.flush()
+        tables = session.info.get("changed_tables")
+        if not tables:
+            return
+        # テーブル名の順に行ロックを取る
+        # （同時にコミットする処理どうしのデッドロック防止）
+        stmt = (
+            update(data_versions)
+            .where(data_versions.c.table_name.in_(sorted(tables)))
+            .values(version=data_versions.c.version + 1)
+        )
+        conn = session.connection()
+        if conn.dialect.update_returning:
+            stmt = stmt.returning(data_versions.c.table_name, data_versions.c.version)
+            session.info["stored_versions"] = dict(conn.execute(stmt).all())
+        else:
+            conn.execute(stmt)
+
+    @event.listens_for(factory, "after_commit")
+    def _note_stored(session):
+        stored = session.info.pop("stored_versions", None)
+        if stored:
+            branch = session.info.get("branch")
+            run_after_commit(session, lambda: note_stored_versions(branch, stored))
+
+    @event.listens_for(factory, "after_rollback")
+    def _discard_stored(session):
+        session.info.pop("stored_versions", None)
+
+
+def stored_data_version(db: Session, *tables: str) -> tuple:
+    """
+    DB に記録した指定テーブルのバージョンを (教室コード, バージョン...) のタプルで返す
+    他のプロセス（別のワーカー・定期処理のリーダー・scripts/）の書き込みも反映される
+    """
+    stored = dict(db.execute(
+        select(data_versions.c.table_name, data_versions.c.version)
+        .where(data_versions.c.table_name.in_(tables))
+    ).all())
+    return (db.info.get("branch", DEFAULT_BRANCH), *(stored.get(t, 0) for t in tables))
+
+
+def _read_stored_versions(bind: Engine) -> Dict[str, int]:
+    # 書き込みキューの完了を待つ間などに接続を持ち続けないよう、すぐに返す
+    with bind.connect() as conn:
+        return dict(conn.execute(
+            select(data_versions.c.table_name, data_versions.c.version)
+        ).all())
+
+
+def refresh_data_versions(db: Session):
+    """
+    他のプロセスの書き込みをこのプロセスのデータバージョンにすぐ取り込む（問い合わせ1回）
+    通常は get_data_version が間隔を空けて取り込むので、呼ぶ必要はない
+    """
+    stored = _read_stored_versions(db.get_bind())
+    sync_stored_versions(db.info.get("branch", DEFAULT_BRANCH), stored)
+
+
+# データベース接続（既定の教室）
+engine = _create_engine(settings.DATABASE_URL)
+
+SessionLocal = _create_sessionmaker(engine, DEFAULT_BRANCH)
+
+# 教室コード → セッションファクトリ（既定の教室以外は初回利用時に接続を作る）
+_sessionmakers: Dict[str, sessionmaker] = {DEFAULT_BRANCH: SessionLocal}
+_registry_lock = Lock()
+
+
+def get_branch_sessionmaker(branch: str) -> sessionmaker:
+    """教室のセッションファクトリ（BRANCH_DATABASES にない教室は KeyError）"""
+    factory = _sessionmakers.get(branch)
+    if factory is None:
+        with _registry_lock:
+            factory = _sessionmakers.get(branch)
+            if factory is None:
+                url = settings.BRANCH_DATABASES[branch]
+                factory = _create_sessionmaker(_create_engine(url), branch)
+                _sessionmakers[branch] = factory
+    return factory
+
+
+def get_branch_engine(branch: str) -> Engine:
+    return get_branch_sessionmaker(branch).kw["bind"]
+
+
+# キャッシュ・集計のキーを作るときに、他のプロセスの書き込みを取り込む
+set_stored_version_loader(
+    lambda branch: _read_stored_versions(get_branch_engine(branch))
+)
+
+
+def all_branch_engines() -> List[Engine]:
+    return [get_branch_engine(branch) for branch in branch_codes()]
+
+
+def request_branch(request: Request) -> str:
+    """リクエストの教室（X-Branch ヘッダー → セッション → 既定の教室）"""
+    if not sharding_enabled():
+        return DEFAULT_BRANCH
+    branch = request.headers.get("x-branch") or request.session.get("branch")
+    return branch if is_branch(branch) else DEFAULT_BRANCH
+
+
+async def get_db(request: Request):
+    """依存関数: リクエストの教室の DB セッションを取得"""
+    branch = request_branch(request)
+    # 以降の処理（データバージョン・キャッシュ）がこの教室を対象にする
+    set_current_branch(branch)
+    db = get_branch_sessionmaker(branch)()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+@contextmanager
+def branch_session(branch: str):
+    """別の教室の DB を一時的に使う（CSV の教室コードで振り分けるときなど）"""
+    token = set_current_branch(branch)
+    db = get_branch_sessionmaker(branch)()
     try:
         yield db
     finally:
         db.close()
+        reset_current_branch(token)
+
+
+def for_each_branch(fn: Callable[[Session], T]) -> Dict[str, T]:
+    """
+    全教室の DB で fn を並列に実行（全校集計用）
+
+    Returns:
+        {教室コード: fn の戻り値}
+    """
+    branches = branch_codes()
+
+    def _run(branch: str) -> T:
+        with branch_session(branch) as db:
+            return fn(db)
+
+    if len(branches) == 1:
+        return {branches[0]: _run(branches[0])}
+    with ThreadPoolExecutor(
+        max_workers=len(branches), thread_name_prefix="branch"
+    ) as pool:
+        return dict(zip(branches, pool.map(_run, branches)))
+
+
+def run_after_commit(db, callback):
+    """
+    コミット確定後の処理（キャッシュ反映など）を実行
+    書き込みキュー内ではグループコミットが確定するまで遅らせる
+    """
+    deferred = db.info.get("deferred_callbacks")
+    if deferred is not None:
+        deferred.append(callback)
+    else:
+        callback()
+
+
+def _add_missing_columns(bind: Engine):
+    """
+    既存テーブルに後から追加した列を追加
+    （NULL 可の列のみ。既存の行は NULL になる）
+    """
+    inspector = inspect(bind)
+    existing_tables = set(inspector.get_table_names())
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {c["name"] for c in inspector.get_columns(table.name)}
+        missing = [c for c in table.columns if c.name not in existing and c.nullable]
+        for column in missing:
+            column_type = column.type.compile(dialect=bind.dialect)
+            try:
+                with bind.begin() as conn:
+                    conn.execute(text(
+                        f"ALTER TABLE {table.name} "
+                        f"ADD COLUMN {column.name} {column_type}"
+                    ))
+            except DBAPIError:
+                # ロックを使えない環境で、別のプロセスが先に追加した
+                columns = inspect(bind).get_columns(table.name)
+                if column.name not in {c["name"] for c in columns}:
+                    raise
+
+
+def _drop_duplicates(bind: Engine, index: Index):
+    """
+    一意インデックスを後から追加する前に、キーが重なる行を消す
+    （主キーが最小の1行を残す）
+    """
+    table = index.table
+    key = list(table.primary_key.columns)[0]
+    keep = select(func.min(key)).group_by(*index.columns)
+    with bind.begin() as conn:
+        removed = conn.execute(delete(table).where(key.not_in(keep))).rowcount
+    if removed:
+        logger.warning(
+            "Removed %d duplicate rows from %s before adding %s",
+            removed, table.name, index.name,
+        )
+
+
+@contextmanager
+def _schema_lock(bind: Engine):
+    """
+    スキーマ更新を複数のプロセス（ワーカー）の間で1つずつにするロック
+    PostgreSQL はアドバイザリロック、SQLite は DB ファイルの隣のロックファイル
+    （ロックを取れない環境では何もしない。列の追加は重複しても続行する）
+    """
+    if bind.dialect.name == "postgresql":
+        with bind.connect() as conn:
+            conn.execute(
+                text("SELECT pg_advisory_lock(:key)"), {"key": SCHEMA_LOCK_KEY}
+            )
+            try:
+                yield
+            finally:
+                conn.execute(
+                    text("SELECT pg_advisory_unlock(:key)"), {"key": SCHEMA_LOCK_KEY}
+                )
+        return
+
+    path = bind.url.database if bind.dialect.name == "sqlite" else None
+    if fcntl is None or not path or path == ":memory:":
+        yield
+        return
+    with open(f"{path}.migrate.lock", "w") as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        yield
+
+
+def schema_fingerprint(bind: Engine) -> str:
+    """モデル定義（その DB 向けの CREATE TABLE / CREATE INDEX）の SHA-256"""
+    digest = hashlib.sha256()
+    for table in Base.metadata.sorted_tables:
+        digest.update(str(CreateTable(table).compile(dialect=bind.dialect)).encode("utf-8"))
+        for index in sorted(table.indexes, key=lambda i: i.name):
+            digest.update(str(CreateIndex(index).compile(dialect=bind.dialect)).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _stored_fingerprint(bind: Engine) -> Optional[str]:
+    try:
+        with bind.connect() as conn:
+            return conn.scalar(select(schema_version.c.fingerprint))
+    except DBAPIError:
+        # schema_version がない（新しい DB・記録を始める前の DB）
+        return None
+
+
+def load_models():
+    """
+    app.models の全モデルを Base.metadata に登録
+    （一部のモデルだけを読み込むスクリプトでも、外部キー・relationship の参照先と
+    全テーブルの指紋がそろうように）
+    """
+    import app.models
+
+    for module in pkgutil.iter_modules(app.models.__path__):
+        importlib.import_module(f"app.models.{module.name}")
+
+
+def migrate_schema(bind: Engine) -> bool:
+    """
+    モデル定義が変わっていればテーブル・列・インデックスを追加し、指紋を記録する
+    記録済みの指紋と同じなら問い合わせ1回で終わる
+
+    Returns:
+        作成・追加を行ったら True
+    """
+    load_models()
+    fingerprint = schema_fingerprint(bind)
+    if _stored_fingerprint(bind) == fingerprint:
+        return False
+    with _schema_lock(bind):
+        # ロックを待つ間に別のワーカーが更新を済ませた
+        if _stored_fingerprint(bind) == fingerprint:
+            return False
+        _apply_schema(bind, fingerprint)
+    return True
+
+
+def _apply_schema(bind: Engine, fingerprint: str):
+    """テーブル・列・インデックスを追加し、指紋を記録（_schema_lock の中で呼ぶ）"""
+    Base.metadata.create_all(bind=bind)
+    _add_missing_columns(bind)
+    # 既存テーブルに後から追加したインデックスも作成
+    # （create_all は既存テーブルを変更しない）
+    inspector = inspect(bind)
+    for table in Base.metadata.sorted_tables:
+        existing = {i["name"] for i in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.unique and index.name not in existing:
+                _drop_duplicates(bind, index)
+            index.create(bind=bind, checkfirst=True)
+    with bind.begin() as conn:
+        # 新しいテーブルの data_versions の行を用意（更新は UPDATE だけで済むように）
+        known = set(conn.scalars(select(data_versions.c.table_name)))
+        names = [t.name for t in Base.metadata.sorted_tables if t.name not in known]
+        if names:
+            conn.execute(
+                insert(data_versions),
+                [{"table_name": n, "version": 0} for n in names],
+            )
+        conn.execute(delete(schema_version))
+        conn.execute(insert(schema_version).values(
+            fingerprint=fingerprint, applied_at=datetime.now()
+        ))
+
+
+def create_db_and_tables() -> Dict[str, bool]:
+    """
+    アプリ起動時にテーブルを用意（全教室の DB）
 
-def create_db_and_tables():
-    """アプリ起動時にテーブルを作成"""
-    Base.metadata.create_all(bind=engine)
+    Returns:
+        {教室コード: 作成・追加を行ったか}
+    """
+    migrated = {
+        branch: migrate_schema(get_branch_engine(branch)) for branch in branch_codes()
+    }
+    for branch, changed in migrated.items():
+        if changed:
+            logger.info("Database schema updated (%s)", branch)
+    return migrated
@@ -0,0 +1,249 @@
+"""
+書き込みの直列化（シングルライター）
+専用スレッドが書き込み用の接続を1本だけ持ち、リクエストから渡された書き込み処理を順に実行する
+数ミリ秒以内に届いた小さな書き込みはまとめて1回でコミットする（グループコミット）
+
+各書き込み処理は SAVEPOINT 付きのセッションで実行するため、処理内の db.commit() は
+SAVEPOINT の確定になり、失敗した処理だけが巻き戻る
+読み取りは従来どおり get_db の接続を使う
+教室ごとに DB を分けている場合は教室ごとに書き込みスレッドを持つ
+"""
+
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError
+from typing import Any, Callable, Dict, Optional
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session
+
+from app.branches import (
+    DEFAULT_BRANCH,
+    branch_codes,
+    reset_current_branch,
+    set_current_branch,
+)
+from app.config import settings
+from app.database import SessionLocal, get_branch_engine, get_branch_sessionmaker
+
+logger = logging.getLogger(__name__)
+
+# 教室コード → 書き込みスレッド（起動時に start_writer で作成。無効時・テスト時は空）
+_writers: Dict[str, "DatabaseWriter"] = {}
+
+
+def _create_writer_engine(branch: str):
+    """
+    教室の書き込み専用エンジン（接続1本）
+    SQLite は BEGIN IMMEDIATE で最初に書き込みロックを取る
+    """
+    source = get_branch_engine(branch)
+    if source.dialect.name != "sqlite":
+        return create_engine(source.url, pool_size=1, max_overflow=0)
+
+    writer_engine = create_engine(
+        source.url,
+        connect_args={"check_same_thread": False, "timeout": 30},
+        pool_size=1,
+        max_overflow=0,
+    )
+
+    # pysqlite の暗黙トランザクションを止め、SAVEPOINT が正しく動くよう自前で BEGIN する
+    @event.listens_for(writer_engine, "connect")
+    def _disable_pysqlite_transaction(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+        # WAL なら書き込み中も読み取り側の接続がブロックされない
+        # （DB ファイルに保存される設定）
+        dbapi_connection.execute("PRAGMA journal_mode=WAL")
+
+    @event.listens_for(writer_engine, "begin")
+    def _begin_immediate(conn):
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+    return writer_engine
+
+
+class DatabaseWriter:
+    """書き込み専用スレッド（キューから処理を取り出してグループコミット）"""
+
+    def __init__(
+        self, branch: str = DEFAULT_BRANCH,
+        group_window: float = 0.005, max_batch: int = 64,
+    ):
+        self.branch = branch
+        self.group_window = group_window
+        self.max_batch = max_batch
+        self._queue: queue.Queue = queue.Queue()
+        self._engine = _create_writer_engine(branch)
+        self._factory = get_branch_sessionmaker(branch)
+        self._thread = threading.Thread(
+            target=self._run, name=f"db-writer-{branch}", daemon=True
+        )
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._queue.put(None)
+        self._thread.join()
+        self._engine.dispose()
+
+    def submit(self, fn: Callable[[Session], Any]) -> Future:
+        """書き込み処理をキューに入れる（結果はコミット後に Future に入る）"""
+        future: Future = Future()
+        self._queue.put((fn, future))
+        return future
+
+    def _run(self):
+        # 書き込み処理とコミット後の処理（成績ストアなど）はこの教室のものとして動く
+        token = set_current_branch(self.branch)
+        try:
+            self._serve()
+        finally:
+            reset_current_branch(token)
+
+    def _serve(self):
+        with self._engine.connect() as conn:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    return
+                batch = [item]
+                stopping = False
+                deadline = time.monotonic() + self.group_window
+                while len(batch) < self.max_batch:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = self._queue.get(timeout=timeout)
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        stopping = True
+                        break
+                    batch.append(item)
+                try:
+                    self._run_batch(conn, batch)
+                except Exception as e:
+                    # 書き込みスレッドが止まると以降の書き込みがすべて待ち続ける
+                    logger.error("Write batch failed: %s", e, exc_info=True)
+                if stopping:
+                    return
+
+    def _run_batch(self, conn, batch: list):
+        outcomes = []
+        callbacks = []
+        try:
+            with conn.begin():
+                for fn, future in batch:
+                    # 待っていたリクエストが切断などで取り消した処理は実行しない
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    unit_callbacks = []
+                    db = self._factory(
+                        bind=conn, join_transaction_mode="create_savepoint"
+                    )
+                    db.info["deferred_callbacks"] = unit_callbacks
+                    try:
+                        result = fn(db)
+                        db.commit()
+                        outcomes.append((future, result, None))
+                        callbacks.extend(unit_callbacks)
+                    except Exception as e:
+                        db.rollback()
+                        outcomes.append((future, None, e))
+                    finally:
+                        db.close()
+        except Exception as e:
+            logger.error(
+                "Group commit failed (%d writes): %s", len(batch), e, exc_info=True
+            )
+            for _, future in batch:
+                _deliver(future, error=e)
+            return
+
+        # コミット確定後にキャッシュ更新などを実行してから結果を返す
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error("After-commit callback failed: %s", e, exc_info=True)
+        for future, result, error in outcomes:
+            _deliver(future, result, error)
+
+
+def _deliver(future: Future, result: Any = None, error: Optional[Exception] = None):
+    """結果を Future に入れる（取り消し済みの Future でも書き込みスレッドを止めない）"""
+    if future.cancelled():
+        return
+    try:
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+    except InvalidStateError:
+        pass
+
+
+def start_writer() -> Optional[DatabaseWriter]:
+    """設定で有効なら教室ごとに書き込みスレッドを起動（既定の教室のものを返す）"""
+    if settings.WRITE_QUEUE_ENABLED and not _writers:
+        for branch in branch_codes():
+            writer = DatabaseWriter(branch)
+            writer.start()
+            _writers[branch] = writer
+    return _writers.get(DEFAULT_BRANCH)
+
+
+def stop_writer():
+    while _writers:
+        _, writer = _writers.popitem()
+        writer.stop()
+
+
+async def submit_write(db: Session, fn: Callable[[Session], Any]) -> Any:
+    """
+    書き込み処理を実行して結果を返す
+
+    書き込みスレッドが動いていればキュー経由でグループコミットし、
+    なければ（無効時・テスト時）リクエストのセッションでそのまま実行する
+
+    Args:
+        db: リクエストのセッション（書き込み後の再読込に使う）
+        fn: セッションを受け取って書き込む関数
+            （内部の commit は SAVEPOINT の確定になる）
+    """
+    writer = _writers.get(db.info.get("branch", DEFAULT_BRANCH))
+    if writer is None:
+        return fn(db)
+    result = await asyncio.wrap_future(writer.submit(fn))
+    # 書き込み前に読み込んだオブジェクトを破棄し、再描画で最新値を読む
+    db.expire_all()
+    return result
+
+
+def submit_write_sync(
+    fn: Callable[[Session], Any], db: Optional[Session] = None
+) -> Any:
+    """
+    リクエスト外（定期処理など）から書き込む同期版
+    db を渡すとその教室の書き込みスレッドへ、省略時は既定の教室へ送る
+    書き込みスレッドがなければ、既定以外の教室は db で、既定の教室は新しい
+    セッションで実行してコミットする
+    """
+    branch = DEFAULT_BRANCH if db is None else db.info.get("branch", DEFAULT_BRANCH)
+    writer = _writers.get(branch)
+    if writer is not None:
+        return writer.submit(fn).result()
+    if branch != DEFAULT_BRANCH:
+        result = fn(db)
+        db.commit()
+        return result
+    with SessionLocal() as db:
+        result = fn(db)
+        db.commit()
+        return result
@@ -0,0 +1,183 @@
+"""
+変更イベントの配信（Server-Sent Events 用のプロセス内イベントバス）
+書き込み処理がコミット後にイベントを発行し、接続中のページへ教室内の講座・生徒単位で届ける
+ページ側は HTMX の sse 拡張で受け取り、変わった部分だけを再取得する
+
+イベント名:
+    grades-changed      成績の追加・更新
+    students-changed    生徒の追加・更新
+    attendance-changed  出欠の記録
+    import-finished     CSV 取込の完了（data は表示用のメッセージ）
+"""
+
+import asyncio
+import logging
+from threading import Lock
+from typing import Callable, Iterable, Optional
+
+from sqlalchemy.orm import Session
+
+from app.branches import DEFAULT_BRANCH
+from app.database import run_after_commit
+
+logger = logging.getLogger(__name__)
+
+# 1接続あたりの未送信イベントの上限（超えた分は捨てる。次のイベントで再取得される）
+QUEUE_SIZE = 100
+
+
+class Event:
+    __slots__ = ("name", "data", "class_ids", "student_ids", "branch")
+
+    def __init__(
+        self,
+        name: str,
+        data: str,
+        class_ids: frozenset,
+        student_ids: frozenset,
+        branch: str,
+    ):
+        self.name = name
+        self.data = data
+        self.class_ids = class_ids
+        self.student_ids = student_ids
+        self.branch = branch
+
+
+class Subscription:
+    """
+    1つの SSE 接続
+    （教室内で講座・生徒で絞り込み、どちらもなければ教室の全イベント）
+    """
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        class_id: Optional[str],
+        student_id: Optional[str],
+        branch: str = DEFAULT_BRANCH,
+    ):
+        self.loop = loop
+        self.class_id = class_id
+        self.student_id = student_id
+        self.branch = branch
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+
+    def wants(self, event: Event) -> bool:
+        if event.branch != self.branch:
+            return False
+        if self.class_id is None and self.student_id is None:
+            return True
+        return (
+            (self.class_id is not None and self.class_id in event.class_ids)
+            or (self.student_id is not None and self.student_id in event.student_ids)
+        )
+
+    def _put(self, event: Optional[Event]):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            pass
+
+    def deliver(self, event: Optional[Event]):
+        """別スレッド（書き込みスレッドなど）からでも安全に渡す"""
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            # ループが終了済み（サーバー停止中）
+            pass
+
+
+class EventBus:
+    def __init__(self):
+        self._subscriptions: set = set()
+        self._listeners: list = []
+        self._lock = Lock()
+
+    def subscribe(
+        self,
+        class_id: Optional[str] = None,
+        student_id: Optional[str] = None,
+        branch: str = DEFAULT_BRANCH,
+    ) -> Subscription:
+        """イベントループ上で呼ぶ"""
+        subscription = Subscription(
+            asyncio.get_running_loop(), class_id, student_id, branch
+        )
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def add_listener(self, listener: Callable[[Event], None]):
+        """
+        プロセス内の処理をイベントに登録（静的ダッシュボードの無効化など）
+        発行したスレッドで、SSE の接続へ届けるより先に呼ぶ
+        （重い処理は別スレッドへ渡すこと）
+        """
+        with self._lock:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[Event], None]):
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def publish(
+        self,
+        name: str,
+        data: str = "",
+        class_ids: Iterable[Optional[str]] = (),
+        student_ids: Iterable[str] = (),
+        branch: str = DEFAULT_BRANCH,
+    ):
+        event = Event(
+            name,
+            data.replace("\n", " "),
+            frozenset(c for c in class_ids if c),
+            frozenset(student_ids),
+            branch,
+        )
+        with self._lock:
+            listeners = list(self._listeners)
+            targets = [s for s in self._subscriptions if s.wants(event)]
+        for listener in listeners:
+            try:
+                listener(event)
+            except Exception as e:
+                logger.error("Event listener failed (%s): %s", name, e, exc_info=True)
+        for subscription in targets:
+            subscription.deliver(event)
+
+    def close(self):
+        """全接続に終了を通知（サーバー停止時）"""
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            subscription.deliver(None)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscriptions)
+
+
+event_bus = EventBus()
+
+
+def publish_after_commit(
+    db: Session,
+    name: str,
+    data: str = "",
+    class_ids: Iterable[Optional[str]] = (),
+    student_ids: Iterable[str] = (),
+):
+    """コミットが確定してからイベントを発行（書き込みキュー内ではグループコミット後）"""
+    class_ids = list(class_ids)
+    student_ids = list(student_ids)
+    branch = db.info.get("branch", DEFAULT_BRANCH)
+    run_after_commit(
+        db, lambda: event_bus.publish(name, data, class_ids, student_ids, branch)
+    )
@@ -1,25 +1,100 @@
+# 読み込み時間の起点（最初に読み込む）
+from app import startup
+
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
 from starlette.middleware.sessions import SessionMiddleware
 import os
 
-from app.database import create_db_and_tables
+from app.branches import branch_codes
+from app.database import all_branch_engines, create_db_and_tables, get_branch_engine
+from app.db_writer import start_writer, stop_writer
+from app.events import event_bus
+from app.scheduler import start_scheduler, stop_scheduler
+from app.services.maintenance import register_jobs
 from app.config import settings
-from app.routers import pages, students, grades, classes, attendance, upload, auth as auth_router
+from app.middleware import CompressionMiddleware, ETagMiddleware
+from app.static_assets import STATIC_DIR, HashedStaticFiles
+from app.services.attendance_bitmap import ensure_attendance_bitmaps
+from app.services.dashboard_publisher import start_publisher, stop_publisher
+from app.services.grade_store import init_grade_store
+from app.services.student_search import ensure_search_index
+from app.templates_config import precompile_templates
+from app.routers import (
+    api_v1,
+    attendance,
+    classes,
+    events,
+    grades,
+    jobs,
+    pages,
+    students,
+    upload,
+)
+from app.routers import auth as auth_router
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # DB のテーブル（モデル定義が前回と同じなら指紋の確認だけ）
+    with startup.phase("schema"):
+        create_db_and_tables()
+
+    for branch_engine in all_branch_engines():
+        # 生徒検索インデックス（FTS5）を用意
+        with startup.phase("search_index"):
+            ensure_search_index(branch_engine)
+
+        # 出欠のビット配列が attendance と合わなければ作り直す
+        with startup.phase("attendance_bitmaps"):
+            ensure_attendance_bitmaps(branch_engine)
+
+    # 成績の列指向ストア（任意）を教室ごとに読み込み
+    # （読み込み中の書き込みを取りこぼさないよう起動前に済ませる）
+    if settings.GRADE_STORE_ENABLED:
+        with startup.phase("grade_store"):
+            for branch in branch_codes():
+                init_grade_store(get_branch_engine(branch), branch)
+
+    # テンプレートを事前コンパイル（バイトコードキャッシュにも保存される）
+    if settings.TEMPLATE_PRECOMPILE == "startup":
+        with startup.phase("templates"):
+            precompile_templates()
+    elif settings.TEMPLATE_PRECOMPILE == "background":
+        startup.start_warmup("templates", precompile_templates)
+
+    with startup.phase("workers"):
+        # 書き込み専用スレッド（WRITE_QUEUE_ENABLED のとき、教室ごとに1本）
+        start_writer()
+        # 定期処理（ロックを取れた1プロセスだけがジョブを実行）
+        start_scheduler(register_jobs)
+        # 生徒ダッシュボードの書き出し（DASHBOARD_PUBLISH_DIR を設定したとき）
+        start_publisher()
+    startup.mark_ready()
+    yield
+    # 接続中の SSE ストリームを終了させる
+    event_bus.close()
+    stop_publisher()
+    stop_scheduler()
+    stop_writer()
 
 # FastAPI アプリ作成
 app = FastAPI(
     title="塾成績管理システム",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan,
 )
 
 # セッションミドルウェア設定
 app.add_middleware(SessionMiddleware, secret_key=settings.SECRET_KEY)
 
-# 静的ファイル配信
-static_dir = os.path.join(os.path.dirname(__file__), "..", "static")
-if os.path.exists(static_dir):
-    app.mount("/static", StaticFiles(directory=static_dir), name="static")
+# GET 応答に ETag（304 対応）、その外側で圧縮（後に追加したものが外側）
+app.add_middleware(ETagMiddleware)
+app.add_middleware(CompressionMiddleware, minimum_size=500)
+
+# 静的ファイル配信（内容ハッシュ付き URL は長期キャッシュ）
+if os.path.exists(STATIC_DIR):
+    app.mount("/static", HashedStaticFiles(directory=STATIC_DIR), name="static")
 
 # ルーター登録（認証関連は最初に）
 app.include_router(auth_router.router, prefix="/auth", tags=["auth"])
@@ -29,11 +104,13 @@ app.include_router(grades.router, prefix="/api/grades", tags=["grades"])
 app.include_router(classes.router, prefix="/api/classes", tags=["classes"])
 app.include_router(attendance.router, prefix="/api/attendance", tags=["attendance"])
 app.include_router(upload.router, prefix="/api/upload", tags=["upload"])
-
-# アプリ起動時にDBテーブルを作成
-create_db_and_tables()
+app.include_router(api_v1.router, prefix="/api/v1", tags=["api-v1"])
+app.include_router(jobs.router, prefix="/api/jobs", tags=["jobs"])
+app.include_router(events.router, prefix="/api/events", tags=["events"])
 
 @app.get("/health")
 async def health_check():
-    """ヘルスチェック"""
-    return {"status": "ok"}
+    """ヘルスチェック（起動処理の所要時間も返す）"""
+    return {"status": "ok", "startup": startup.startup_report()}
+
+startup.mark_imported()
@@ -0,0 +1,196 @@
+"""
+レスポンス最適化ミドルウェア
+- ETagMiddleware: GET レスポンスに弱い ETag を付け、一致すれば 304 を返す
+- CompressionMiddleware: brotli（導入時）/ gzip 圧縮
+  ストリーミング応答はチャンクごとに圧縮
+"""
+
+import hashlib
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # brotli は任意（未導入なら gzip のみ）
+    brotli = None
+
+# 圧縮しても効果がない / 圧縮してはいけない Content-Type
+_UNCOMPRESSIBLE_PREFIXES = (
+    "image/", "audio/", "video/", "font/woff", "text/event-stream",
+)
+
+
+def _strip_weak(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+class ETagMiddleware:
+    """
+    GET の 200 応答に本文ハッシュの弱い ETag を付与
+    If-None-Match が一致すれば本文を送らず 304 を返す
+    ストリーミング応答・既に ETag がある応答（静的ファイル）はそのまま通す
+    """
+
+    def __init__(self, app: ASGIApp, max_size: int = 1024 * 1024):
+        self.app = app
+        self.max_size = max_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["method"] != "GET":
+            await self.app(scope, receive, send)
+            return
+
+        if_none_match = Headers(scope=scope).get("if-none-match", "")
+        start: Message = {}
+        passthrough = False
+
+        async def send_with_etag(message: Message):
+            nonlocal start, passthrough
+            if message["type"] == "http.response.start":
+                start = message
+                headers = Headers(raw=message["headers"])
+                passthrough = message["status"] != 200 or "etag" in headers
+                if passthrough:
+                    await send(message)
+                return
+
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            if message.get("more_body", False) or len(body) > self.max_size:
+                # ストリーミング応答は全体のハッシュが取れないので付与しない
+                passthrough = True
+                await send(start)
+                await send(message)
+                return
+
+            etag = 'W/"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+            headers = MutableHeaders(raw=start["headers"])
+            headers["ETag"] = etag
+            if "cache-control" not in headers:
+                # キャッシュは保持するが毎回再検証させる（更新はすぐ反映）
+                headers["Cache-Control"] = "no-cache"
+
+            candidates = {_strip_weak(t) for t in if_none_match.split(",") if t.strip()}
+            if _strip_weak(etag) in candidates or "*" in candidates:
+                for name in ("content-length", "content-type"):
+                    if name in headers:
+                        del headers[name]
+                start["status"] = 304
+                await send(start)
+                await send({"type": "http.response.body", "body": b""})
+                return
+
+            await send(start)
+            await send(message)
+
+        await self.app(scope, receive, send_with_etag)
+
+
+class _Compressor:
+    """br / gzip の逐次圧縮（チャンクごとに flush してストリーミング表示を妨げない）"""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._obj = brotli.Compressor(quality=5)
+        else:
+            self._obj = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: gzip 形式
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        if self.encoding == "br":
+            out = self._obj.process(data)
+            return out + (self._obj.finish() if final else self._obj.flush())
+        out = self._obj.compress(data)
+        return out + self._obj.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class CompressionMiddleware:
+    """
+    Accept-Encoding に応じて br（brotli 導入時）または gzip で圧縮
+    minimum_size 未満の単発応答・圧縮済み・画像や SSE は圧縮しない
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 500):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    def _choose_encoding(self, accept_encoding: str):
+        tokens = {t.split(";")[0].strip().lower() for t in accept_encoding.split(",")}
+        if brotli is not None and "br" in tokens:
+            return "br"
+        if "gzip" in tokens:
+            return "gzip"
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = Headers(scope=scope).get("accept-encoding", "")
+        encoding = self._choose_encoding(accept_encoding)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Message = {}
+        compressor = None
+        passthrough = False
+
+        async def send_compressed(message: Message):
+            nonlocal start, compressor, passthrough
+            if message["type"] == "http.response.start":
+                start = message
+                headers = Headers(raw=message["headers"])
+                passthrough = (
+                    "content-encoding" in headers
+                    or headers.get("content-type", "").startswith(
+                        _UNCOMPRESSIBLE_PREFIXES
+                    )
+                )
+                if passthrough:
+                    await send(message)
+                return
+
+            if passthrough or message["type"] != "http.response.body":
+                if not passthrough and start:
+                    await send(start)
+                    start = {}
+                    passthrough = True
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if compressor is None:
+                if not more_body and len(body) < self.minimum_size:
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                compressor = _Compressor(encoding)
+                headers = MutableHeaders(raw=start["headers"])
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                body = compressor.compress(body, final=not more_body)
+                if more_body:
+                    if "content-length" in headers:
+                        del headers["content-length"]
+                else:
+                    headers["Content-Length"] = str(len(body))
+                await send(start)
+            else:
+                body = compressor.compress(body, final=not more_body)
+
+            await send(
+                {"type": "http.response.body", "body": body, "more_body": more_body}
+            )
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,42 @@
+from sqlalchemy import Column, Date, DateTime, Index, Integer, String, Table
+
+from app.database import Base
+from app.models.attendance import Attendance
+from app.models.grade import Grade
+
+
+def _archive_table(source: Table, name: str, *indexes: Index) -> Table:
+    """
+    同じ列を持つアーカイブ用テーブル
+    （外部キーなし。生徒を削除しても過去の記録は残す）
+    """
+    columns = [
+        Column(c.name, c.type, primary_key=c.primary_key, nullable=c.nullable)
+        for c in source.columns
+    ]
+    return Table(name, Base.metadata, *columns, *indexes)
+
+
+# 終了した年度の成績・出席（通常テーブルから移動）
+grades_archive = _archive_table(
+    Grade.__table__, "grades_archive",
+    Index("ix_grades_archive_student_date", "student_id", "date"),
+)
+attendance_archive = _archive_table(
+    Attendance.__table__, "attendance_archive",
+    Index("ix_attendance_archive_student_date", "student_id", "date"),
+)
+
+
+class ArchivedYear(Base):
+    """アーカイブ済みの年度（移動件数と内容のダイジェストで検証する）"""
+    __tablename__ = "archived_years"
+
+    academic_year = Column(Integer, primary_key=True)   # 2024 = 2024/4/1〜2025/3/31
+    start_date = Column(Date, nullable=False)
+    end_date = Column(Date, nullable=False)
+    grades = Column(Integer, nullable=False, default=0)
+    attendance = Column(Integer, nullable=False, default=0)
+    grades_digest = Column(String(64), nullable=False)
+    attendance_digest = Column(String(64), nullable=False)
+    archived_at = Column(DateTime, nullable=False)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Date, ForeignKey
+from sqlalchemy import Column, String, Date, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from app.database import Base
 
@@ -12,3 +12,18 @@ class Attendance(Base):
     status = Column(String(10), nullable=False)   # "出席" / "欠席" / "遅刻"
 
     student = relationship("Student", back_populates="attendance")
+
+    __table_args__ = (
+        # 出欠入力の一括 upsert で (講座, 日付) の既存記録を引くため
+        Index("ix_attendance_class_date", "class_id", "date"),
+        # 同じ生徒・講座・日付の出欠は1件だけ（出欠入力の ON CONFLICT の対象）
+        Index(
+            "ux_attendance_student_class_date", "student_id", "class_id", "date",
+            unique=True,
+        ),
+        # PostgreSQL のみ: 生徒ごとの出欠の集計をインデックスだけで済ませる（INCLUDE）
+        Index(
+            "ix_attendance_student_date_cover", "student_id", "date",
+            postgresql_include=["status"],
+        ).ddl_if(dialect="postgresql"),
+    )
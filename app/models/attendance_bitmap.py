@@ -0,0 +1,19 @@
+from sqlalchemy import Column, Date, ForeignKey, Integer, LargeBinary, String
+
+from app.database import Base
+
+
+class AttendanceBitmap(Base):
+    """
+    出欠の圧縮表現（生徒×学期ごとに1行）
+    学期初日からの日数を位置として、1日2ビットで状態コードを詰める（0=記録なし）
+    attendance の記録と同時に更新する
+    """
+    __tablename__ = "attendance_bitmaps"
+
+    student_id = Column(String(20), ForeignKey("students.id"), primary_key=True)
+    term = Column(String(10), primary_key=True)  # "2025-1"（年度-学期）
+    start_date = Column(Date, nullable=False)    # 学期の初日（ビット位置 0）
+    bits = Column(LargeBinary, nullable=False)   # リトルエンディアン
+    # 記録のある日数（整合性確認用）
+    recorded = Column(Integer, nullable=False, default=0)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, Date, ForeignKey
+from sqlalchemy import Column, String, Integer, Date, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from app.database import Base
 
@@ -27,6 +27,21 @@ class Grade(Base):
     max_vocabulary = Column(Integer, default=20)
     max_listening = Column(Integer, default=20)
     max_total = Column(Integer, default=100)
+    # 最後に書き込んだ CSV 取込（import_batches.id）
+    batch_id = Column(Integer, index=True)
 
     student = relationship("Student", back_populates="grades")
     class_ = relationship("Class")
+
+    __table_args__ = (
+        # PostgreSQL のみ: 生徒・講座ごとの成績の読み出しと平均の集計を
+        # インデックスだけで済ませる（INCLUDE）
+        Index(
+            "ix_grades_student_date_cover", "student_id", "date",
+            postgresql_include=["lesson_number", "score_total", "max_total"],
+        ).ddl_if(dialect="postgresql"),
+        Index(
+            "ix_grades_class_date_cover", "class_id", "date",
+            postgresql_include=["student_id", "score_total", "max_total"],
+        ).ddl_if(dialect="postgresql"),
+    )
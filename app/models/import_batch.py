@@ -0,0 +1,82 @@
+from sqlalchemy import Column, DateTime, Index, Integer, String
+
+from app.database import Base
+
+
+class ImportBatch(Base):
+    """CSV 取込の履歴（取り込んだ生徒・成績の行に batch_id を付けて取消に使う）"""
+    __tablename__ = "import_batches"
+
+    id = Column(Integer, primary_key=True)
+    filename = Column(String(255))
+    file_sha256 = Column(String(64), index=True)   # 同じファイルの再取込を見分ける
+    created_at = Column(DateTime, nullable=False)
+    duration_ms = Column(Integer, nullable=False, default=0)
+    added_students = Column(Integer, nullable=False, default=0)
+    updated_students = Column(Integer, nullable=False, default=0)
+    added_grades = Column(Integer, nullable=False, default=0)
+    updated_grades = Column(Integer, nullable=False, default=0)
+    # "取込済" / "取消済"
+    status = Column(String(10), nullable=False, default="取込済")
+    rolled_back_at = Column(DateTime)
+    # 取込を確定したときの students / grades のバージョン（stored_data_version）
+    # その後に画面・API・スクリプトの書き込みがあれば、同じファイルでも
+    # 取込済みとみなさない
+    data_version = Column(String(100))
+
+    __table_args__ = (
+        # PostgreSQL のみ: 取消されていない取込だけの部分インデックス
+        # （最新の取込の検索用）
+        Index(
+            "ix_import_batches_active", "id", postgresql_where=status == "取込済"
+        ).ddl_if(dialect="postgresql"),
+    )
+
+
+class ImportRowHash(Base):
+    """
+    取り込んだ CSV の行（正規化した生徒行・成績行）のハッシュ
+    再取込では新しい行・変わった行だけを扱う
+    """
+    __tablename__ = "import_row_hashes"
+
+    row_hash = Column(String(32), primary_key=True)
+    batch_id = Column(Integer, nullable=False, index=True)
+    # 行を書き込んだ生徒・成績と、書き込んだ値のハッシュ（今も同じ値のときだけ行を省く）
+    kind = Column(String(10))          # "student" / "grade"
+    entity_id = Column(String(30))
+    value_digest = Column(String(32))
+
+
+class StudentPrior(Base):
+    """取込で上書きした生徒の更新前の値（取消時に1文で書き戻す）"""
+    __tablename__ = "students_prior"
+
+    batch_id = Column(Integer, primary_key=True)
+    student_id = Column(String(20), primary_key=True)
+    name = Column(String(100), nullable=False)
+    name_kana = Column(String(100))
+    classroom = Column(String(100))
+    gender = Column(String(10))
+    high_school = Column(String(100))
+    course_subject = Column(String(50))
+    school_class = Column(String(20))
+    club = Column(String(100))
+    target_university = Column(String(100))
+    target_dept = Column(String(100))
+    prior_batch_id = Column(Integer)   # 上書き前に付いていた batch_id
+
+
+class GradePrior(Base):
+    """取込で上書きした成績の更新前の得点"""
+    __tablename__ = "grades_prior"
+
+    batch_id = Column(Integer, primary_key=True)
+    grade_id = Column(String(30), primary_key=True)
+    score_comprehension = Column(Integer)
+    score_unseen = Column(Integer)
+    score_grammar = Column(Integer)
+    score_vocabulary = Column(Integer)
+    score_listening = Column(Integer)
+    score_total = Column(Integer)
+    prior_batch_id = Column(Integer)
@@ -0,0 +1,20 @@
+from sqlalchemy import Column, DateTime, Index, Integer, String, Text
+
+from app.database import Base
+
+
+class JobRun(Base):
+    """定期処理の実行履歴"""
+    __tablename__ = "job_runs"
+
+    id = Column(Integer, primary_key=True)
+    job_name = Column(String(50), nullable=False)
+    started_at = Column(DateTime, nullable=False)
+    duration_ms = Column(Integer, nullable=False)
+    status = Column(String(10), nullable=False)   # "成功" / "失敗"
+    message = Column(Text)
+
+    __table_args__ = (
+        # ジョブごとの最新の実行を引くため
+        Index("ix_job_runs_job_started", "job_name", "started_at"),
+    )
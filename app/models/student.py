@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Date, ForeignKey
+from sqlalchemy import Column, String, Integer, Date, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from app.database import Base
 
@@ -18,7 +18,18 @@ class Student(Base):
     target_dept = Column(String(100))
     class_id = Column(String(20), ForeignKey("classes.id"))
     join_date = Column(Date)
+    # 最後に書き込んだ CSV 取込（import_batches.id）
+    batch_id = Column(Integer, index=True)
 
     class_ = relationship("Class", backref="students")
     grades = relationship("Grade", back_populates="student")
     attendance = relationship("Attendance", back_populates="student")
+
+    __table_args__ = (
+        # PostgreSQL のみ: 講座の生徒の選択肢（id・氏名）を部分インデックスだけで返す
+        # （未所属の生徒は含めない）
+        Index(
+            "ix_students_class_cover", "class_id",
+            postgresql_include=["name"], postgresql_where=class_id.isnot(None),
+        ).ddl_if(dialect="postgresql"),
+    )
@@ -0,0 +1,14 @@
+from sqlalchemy import Column, Integer, String, Text
+
+from app.database import Base
+
+
+class StudentSearch(Base):
+    """生徒検索用の正規化済みインデックス（students の書き込み時に更新）"""
+    __tablename__ = "student_search"
+
+    id = Column(Integer, primary_key=True)      # FTS5 の rowid と対応
+    student_id = Column(String(20), unique=True, nullable=False)
+    name_key = Column(String(100), index=True)  # 正規化した氏名（前方一致用）
+    kana_key = Column(String(100), index=True)  # 正規化したふりがな（前方一致用）
+    body = Column(Text, nullable=False)         # 検索対象項目を正規化して連結
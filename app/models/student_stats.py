@@ -0,0 +1,21 @@
+from sqlalchemy import Column, DateTime, Float, ForeignKey, Integer, String, Text
+
+from app.database import Base
+
+
+class StudentStats(Base):
+    """生徒ごとの集計とアドバイス（夜間の定期処理で事前計算）"""
+    __tablename__ = "student_stats"
+
+    student_id = Column(String(20), ForeignKey("students.id"), primary_key=True)
+    grade_count = Column(Integer, nullable=False, default=0)
+    average = Column(Integer, nullable=False, default=0)           # 0-100
+    attendance_rate = Column(Integer, nullable=False, default=0)   # 0-100
+    # "上昇" / "下降" / "横ばい" / "データ不足"
+    trend_direction = Column(String(10))
+    trend_slope = Column(Float)                                    # 30日あたりの変化
+    forecast = Column(Float)                                       # 次回予測
+    advice = Column(Text, nullable=False)
+    computed_at = Column(DateTime, nullable=False)
+    # 計算時の grades / attendance / students のバージョン（stored_data_version）
+    source_version = Column(String(100))
@@ -0,0 +1,523 @@
+"""
+JSON API v1（外部連携用）
+時間割・SMS 通知スクリプトが HTML を解析せずに使えるよう、
+ORM インスタンスを作らない列射影で一覧・一括登録・集計を返す
+
+一覧は id 順のキーセットページング: ?limit=500&after=<前ページの next_cursor>
+成績・出席の一覧は date_from がアーカイブ済みの年度にかかるとアーカイブも含める
+"""
+
+from datetime import date as date_type
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel
+from sqlalchemy import case, func, select
+from sqlalchemy.orm import Session
+
+from app.database import for_each_branch, get_db, run_after_commit
+from app.db_writer import submit_write
+from app.dependencies import require_auth
+from app.events import publish_after_commit
+from app.models.attendance import Attendance
+from app.models.class_ import Class
+from app.models.grade import Grade
+from app.models.student import Student
+from app.responses import FastJSONResponse
+from app.services.archive import attendance_entity, grade_entity
+from app.services.bulk_write import upsert
+from app.services.grade_calculator import (
+    calculate_class_average,
+    calculate_student_average,
+    get_attendance_summary,
+    summarize_class_grades,
+)
+from app.services.grade_store import record_grades
+from app.services.lesson_pivot import AXES, DEFAULT_AXIS, get_lesson_pivot
+from app.single_flight import coalesce, coalescing_stats
+
+router = APIRouter(default_response_class=FastJSONResponse)
+
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+MAX_BULK_SIZE = 5000
+# IN 句に渡す件数の上限（SQLite の変数上限対策）
+IN_CHUNK_SIZE = 500
+
+STUDENT_COLUMNS = (
+    Student.id, Student.classroom, Student.name, Student.name_kana, Student.gender,
+    Student.high_school, Student.course_subject, Student.school_class, Student.club,
+    Student.target_university, Student.target_dept, Student.class_id, Student.join_date,
+)
+CLASS_COLUMNS = (Class.id, Class.name, Class.day, Class.time, Class.capacity)
+GRADE_COLUMNS = (
+    Grade.id, Grade.student_id, Grade.class_id, Grade.date,
+    Grade.lesson_number, Grade.lesson_content,
+    Grade.score_comprehension, Grade.score_unseen, Grade.score_grammar,
+    Grade.score_vocabulary, Grade.score_listening, Grade.score_total,
+    Grade.max_comprehension, Grade.max_unseen, Grade.max_grammar,
+    Grade.max_vocabulary, Grade.max_listening, Grade.max_total,
+)
+ATTENDANCE_COLUMNS = (
+    Attendance.id, Attendance.student_id, Attendance.class_id,
+    Attendance.date, Attendance.status,
+)
+
+
+class StudentIn(BaseModel):
+    """生徒の一括登録用（id 省略時は新規採番）"""
+    id: Optional[str] = None
+    name: str
+    classroom: Optional[str] = None
+    name_kana: Optional[str] = None
+    gender: Optional[str] = None
+    high_school: Optional[str] = None
+    course_subject: Optional[str] = None
+    school_class: Optional[str] = None
+    club: Optional[str] = None
+    target_university: Optional[str] = None
+    target_dept: Optional[str] = None
+    class_id: Optional[str] = None
+    join_date: Optional[date_type] = None
+
+
+class GradeIn(BaseModel):
+    """成績の一括登録用（生徒・日付・授業回が同じなら上書き）"""
+    student_id: str
+    class_id: Optional[str] = None
+    date: date_type
+    lesson_number: int
+    lesson_content: Optional[str] = None
+    score_comprehension: int = 0
+    score_unseen: int = 0
+    score_grammar: int = 0
+    score_vocabulary: int = 0
+    score_listening: int = 0
+    score_total: Optional[int] = None   # 省略時は5科目の合計
+    max_comprehension: int = 20
+    max_unseen: int = 20
+    max_grammar: int = 20
+    max_vocabulary: int = 20
+    max_listening: int = 20
+    max_total: int = 100
+
+
+def _rows_to_dicts(result) -> List[dict]:
+    keys = list(result.keys())
+    return [dict(zip(keys, row)) for row in result]
+
+
+def _page(
+    db: Session, columns: tuple, filters: list, after: Optional[str], limit: int
+) -> dict:
+    """先頭列（id）順のキーセットページング"""
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    id_column = columns[0]
+    stmt = select(*columns).where(*filters)
+    if after:
+        stmt = stmt.where(id_column > after)
+    stmt = stmt.order_by(id_column).limit(limit + 1)
+    items = _rows_to_dicts(db.execute(stmt))
+    has_more = len(items) > limit
+    items = items[:limit]
+    return {"items": items, "next_cursor": items[-1]["id"] if has_more else None}
+
+
+def _date_filters(
+    column, date_from: Optional[date_type], date_to: Optional[date_type]
+) -> list:
+    filters = []
+    if date_from:
+        filters.append(column >= date_from)
+    if date_to:
+        filters.append(column <= date_to)
+    return filters
+
+
+def _entity_columns(entity, columns: tuple) -> tuple:
+    """列射影を別名のエンティティ（アーカイブを含む副問い合わせ）に置き換える"""
+    return tuple(getattr(entity, c.key) for c in columns)
+
+
+def _existing_ids(db: Session, id_column, ids: List[str]) -> set:
+    found = set()
+    for i in range(0, len(ids), IN_CHUNK_SIZE):
+        chunk = ids[i:i + IN_CHUNK_SIZE]
+        found.update(db.scalars(select(id_column).where(id_column.in_(chunk))))
+    return found
+
+
+def _check_bulk_size(items: list):
+    if len(items) > MAX_BULK_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"一度に登録できるのは {MAX_BULK_SIZE} 件までです",
+        )
+
+
+# ---- 生徒 ----
+
+@router.get("/students")
+async def list_students(
+    class_id: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    db: Session = Depends(get_db),
+    _: None = Depends(require_auth),
+):
+    """生徒一覧"""
+    filters = [Student.class_id == class_id] if class_id else []
+    return _page(db, STUDENT_COLUMNS, filters, after, limit)
+
+
+@router.get("/students/{student_id}")
+async def get_student(
+    student_id: str,
+    db: Session = Depends(get_db),
+    _: None = Depends(require_auth),
+):
+    """生徒1件"""
+    rows = _rows_to_dicts(
+        db.execute(select(*STUDENT_COLUMNS).where(Student.id == student_id))
+    )
+    if not rows:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="生徒が見つかりません"
+        )
+    return rows[0]
+
+
+def _upsert_students(db: Session, students: List[StudentIn]) -> List[dict]:
+    """生徒の一括登録・更新の本体（書き込みキューで実行）"""
+    given_ids = [s.id for s in students if s.id]
+    existing = {
+        s.id: s
+        for i in range(0, len(given_ids), IN_CHUNK_SIZE)
+        for s in db.query(Student).filter(
+            Student.id.in_(given_ids[i:i + IN_CHUNK_SIZE])
+        )
+    }
+
+    # 新規採番（既存の最大の数値 + 1 から）
+    max_id = 0
+    for sid in db.scalars(select(Student.id)):
+        try:
+            max_id = max(max_id, int(sid.lstrip("s")))
+        except ValueError:
+            pass
+
+    results = []
+    for data in students:
+        values = data.model_dump(exclude={"id"})
+        student = existing.get(data.id) if data.id else None
+        if student:
+            for key, value in values.items():
+                setattr(student, key, value)
+            results.append({"id": student.id, "status": "updated"})
+            continue
+        if data.id:
+            new_id = data.id
+        else:
+            max_id += 1
+            new_id = f"s{max_id:03d}"
+        values["join_date"] = values["join_date"] or date_type.today()
+        student = Student(id=new_id, **values)
+        db.add(student)
+        existing[new_id] = student
+        results.append({"id": new_id, "status": "created"})
+
+    db.commit()
+    publish_after_commit(
+        db,
+        "students-changed",
+        class_ids={s.class_id for s in existing.values()},
+        student_ids=[r["id"] for r in results],
+    )
+    return results
+
+
+@router.post("/students/bulk")
+async def bulk_upsert_students(
+    students: List[StudentIn],
+    db: Session = Depends(get_db),
+    _: None = Depends(require_auth),
+):
+    """生徒の一括登録・更新（1トランザクション）"""
+    _check_bulk_size(students)
+    results = await submit_write(db, lambda w: _upsert_students(w, students))
+    return {"items": results}
+
+
+# ---- 講座 ----
+
+@router.get("/classes")
+async def list_classes(
+    after: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    db: Session = Depends(get_db),
+    _: None = Depends(require_auth),
+):
+    """講座一覧"""
+    return _page(db, CLASS_COLUMNS, [], after, limit)
+
+
+@router.get("/classes/{class_id}/grades")
+async def list_class_grades(
+    class_id: str,
+    date_from: Optional[date_type] = None,
+    date_to: Optional[date_type] = None,
+    after: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    db: Session = Depends(get_db),
+    _: None = Depends(require_auth),
+):
+    """講座に所属する全生徒の成績（1リクエストで講座全体を取得）"""
+    member_ids = select(Student.id).where(Student.class_id == class_id)
+    source = grade_entity(db, date_from)
+    filters = [
+        source.student_id.in_(member_ids),
+        *_date_filters(source.date, date_from, date_to),
+    ]
+    return _page(db, _entity_columns(source, GRADE_COLUMNS), filters, after, limit)
+
+
+# ---- 成績 ----
+
+@router.get("/grades")
+async def list_grades(
+    student_id: Optional[str] = None,
+    class_id: Optional[str] = None,
+    date_from: Optional[date_type] = None,
+    date_to: Optional[date_type] = None,
+    after: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    db: Session = Depends(get_db),
+    _: None = Depends(require_auth),
+):
+    """成績一覧"""
+    source = grade_entity(db, date_from)
+    filters = _date_filters(source.date, date_from, date_to)
+    if student_id:
+        filters.append(source.student_id == student_id)
+    if class_id:
+        filters.append(source.class_id == class_id)
+    return _page(db, _entity_columns(source, GRADE_COLUMNS), filters, after, limit)
+
+
+def _upsert_grades(db: Session, grades: List[GradeIn]) -> List[dict]:
+    """成績の一括登録・更新の本体（書き込みキューで実行）"""
+    rows = {}
+    for g in grades:
+        row = g.model_dump()
+        if row["score_total"] is None:
+            row["score_total"] = (
+                g.score_comprehension + g.score_unseen + g.score_grammar
+                + g.score_vocabulary + g.score_listening
+            )
+        # 成績IDは create_grade / CSV 取込と同じ規則
+        row["id"] = f"g_{g.student_id}_{g.date.isoformat()}_{g.lesson_number}"
+        rows[row["id"]] = row
+
+    student_ids = list({r["student_id"] for r in rows.values()})
+    unknown = set(student_ids) - _existing_ids(db, Student.id, student_ids)
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"存在しない生徒IDがあります: {', '.join(sorted(unknown))}",
+        )
+
+    # PostgreSQL は INSERT ... ON CONFLICT の1文で、追加か更新かも同時に受け取る
+    created = upsert(db, Grade, list(rows.values()))
+    db.commit()
+    run_after_commit(db, lambda: record_grades(list(rows.values())))
+    publish_after_commit(
+        db, "grades-changed",
+        class_ids={r["class_id"] for r in rows.values()}, student_ids=student_ids,
+    )
+
+    return [
+        {"id": r["id"], "status": "created" if r["id"] in created else "updated"}
+        for r in rows.values()
+    ]
+
+
+@router.post("/grades/bulk")
+async def bulk_upsert_grades(
+    grades: List[GradeIn],
+    db: Session = Depends(get_db),
+    _: None = Depends(require_auth),
+):
+    """成績の一括登録・更新（一括 INSERT / UPDATE と1回のコミット）"""
+    _check_bulk_size(grades)
+    results = await submit_write(db, lambda w: _upsert_grades(w, grades))
+    return {"items": results}
+
+
+# ---- 出席 ----
+
+@router.get("/attendance")
+async def list_attendance(
+    student_id: Optional[str] = None,
+    class_id: Optional[str] = None,
+    date_from: Optional[date_type] = None,
+    date_to: Optional[date_type] = None,
+    after: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    db: Session = Depends(get_db),
+    _: None = Depends(require_auth),
+):
+    """出席記録一覧"""
+    source = attendance_entity(db, date_from)
+    filters = _date_filters(source.date, date_from, date_to)
+    if student_id:
+        filters.append(source.student_id == student_id)
+    if class_id:
+        filters.append(source.class_id == class_id)
+    return _page(db, _entity_columns(source, ATTENDANCE_COLUMNS), filters, after, limit)
+
+
+# ---- 集計 ----
+
+@router.get("/stats/students/{student_id}")
+async def get_student_stats(
+    student_id: str,
+    db: Session = Depends(get_db),
+    _: None = Depends(require_auth),
+):
+    """生徒の平均・クラス平均・出席状況"""
+    row = db.execute(select(Student.class_id).where(Student.id == student_id)).first()
+    if row is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="生徒が見つかりません"
+        )
+    class_id = row[0]
+    return {
+        "student_id": student_id,
+        "class_id": class_id,
+        "average": await calculate_student_average.run_async(db, student_id),
+        "class_average": (
+            await calculate_class_average.run_async(db, class_id) if class_id else 0
+        ),
+        "attendance": get_attendance_summary(db, student_id),
+    }
+
+
+@router.get("/stats/classes/{class_id}")
+async def get_class_stats(
+    class_id: str,
+    db: Session = Depends(get_db),
+    _: None = Depends(require_auth),
+):
+    """講座の平均と所属生徒ごとの平均（1回の GROUP BY で集計）"""
+    summary = await summarize_class_grades.run_async(db, class_id)
+    return {"class_id": class_id, **summary}
+
+
+@router.get("/stats/lessons")
+async def get_lesson_stats(
+    axis: str = DEFAULT_AXIS,
+    db: Session = Depends(get_db),
+    _: None = Depends(require_auth),
+):
+    """
+    講座 × 授業回（axis=lesson_content なら授業内容）の平均・ばらつき・件数
+    （1回の GROUP BY で集計）
+    cells と school は lessons と同じ順（成績のない組み合わせは null）
+    """
+    if axis not in AXES:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"axis は {' / '.join(AXES)} のいずれかです",
+        )
+    pivot = await get_lesson_pivot.run_async(db, axis)
+    lessons = pivot["lessons"]
+    return {
+        "axis": axis,
+        "lessons": lessons,
+        "classes": [
+            {
+                "id": row["id"],
+                "name": row["name"],
+                "cells": [row["cells"].get(lesson) for lesson in lessons],
+                "overall": row["overall"],
+            }
+            for row in pivot["classes"]
+        ],
+        "school": [pivot["school"][lesson] for lesson in lessons],
+    }
+
+
+@coalesce("branch_stats", "grades", "attendance", "students", "classes")
+def _branch_stats(db: Session) -> dict:
+    """
+    1教室分の集計（for_each_branch から教室ごとに並列で呼ぶ。
+    同時の全校集計とは教室ごとに計算を共有する）
+    """
+    normalized = case(
+        (Grade.max_total > 0, Grade.score_total * 100.0 / Grade.max_total),
+        else_=0,
+    )
+    average, grade_count = db.execute(
+        select(func.avg(normalized), func.count()).select_from(Grade)
+    ).one()
+    attended = func.sum(case((Attendance.status == "出席", 1), else_=0))
+    present, recorded = db.execute(
+        select(attended, func.count()).select_from(Attendance)
+    ).one()
+    return {
+        "students": db.scalar(select(func.count()).select_from(Student)),
+        "classes": db.scalar(select(func.count()).select_from(Class)),
+        "grade_count": grade_count,
+        "average_exact": float(average or 0),
+        "attendance_present": int(present or 0),
+        "attendance_count": recorded,
+    }
+
+
+@router.get("/stats/school")
+async def get_school_stats(_: None = Depends(require_auth)):
+    """
+    全校の集計（教室ごとに DB を分けている場合は全教室を並列に集計してまとめる）
+    平均は成績数、出席率は記録数で重み付けして合算する
+    """
+    per_branch = await run_in_threadpool(for_each_branch, _branch_stats)
+
+    grade_count = sum(b["grade_count"] for b in per_branch.values())
+    present = sum(b["attendance_present"] for b in per_branch.values())
+    recorded = sum(b["attendance_count"] for b in per_branch.values())
+    weighted = sum(b["average_exact"] * b["grade_count"] for b in per_branch.values())
+
+    def _summary(stats: dict) -> dict:
+        return {
+            "students": stats["students"],
+            "classes": stats["classes"],
+            "grade_count": stats["grade_count"],
+            "average": round(stats["average_exact"]),
+            "attendance_rate": (
+                round(stats["attendance_present"] * 100 / stats["attendance_count"])
+                if stats["attendance_count"] else 0
+            ),
+        }
+
+    return {
+        **_summary({
+            "students": sum(b["students"] for b in per_branch.values()),
+            "classes": sum(b["classes"] for b in per_branch.values()),
+            "grade_count": grade_count,
+            "average_exact": weighted / grade_count if grade_count else 0,
+            "attendance_present": present,
+            "attendance_count": recorded,
+        }),
+        "branches": {branch: _summary(stats) for branch, stats in per_branch.items()},
+    }
+
+
+@router.get("/stats/coalescing")
+async def get_coalescing_stats(_: None = Depends(require_auth)):
+    """
+    同時の集計をまとめた件数（起動から）
+    calls: 呼び出し数 / executions: 実際に計算した回数
+    coalesced: 実行中の計算に相乗りした回数
+    """
+    return coalescing_stats()
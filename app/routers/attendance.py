@@ -1,16 +1,38 @@
+from datetime import date as date_type
+
 from fastapi import APIRouter, Depends, Request
 from fastapi.responses import HTMLResponse
 from sqlalchemy.orm import Session
 
 from app.database import get_db
+from app.db_writer import submit_write
 from app.dependencies import require_auth
 from app.models.student import Student
+from app.services.attendance_bitmap import class_absence_heatmap
 from app.services.grade_calculator import get_attendance_summary
+from app.services.roll_call import ATTENDANCE_STATUSES, get_roll_call, record_roll_call
 from app.templates_config import templates
 
 router = APIRouter()
 
 
+def _render_roll_call(
+    request: Request, db: Session, class_id: str, target_date: date_type, **extra
+):
+    roll_call = get_roll_call(db, class_id, target_date)
+    return templates.TemplateResponse(
+        "partials/attendance_rollcall.html",
+        {
+            "request": request,
+            "class_id": class_id,
+            "date": target_date,
+            "statuses": ATTENDANCE_STATUSES,
+            **roll_call,
+            **extra,
+        },
+    )
+
+
 @router.get("/student/{student_id}", response_class=HTMLResponse)
 async def get_attendance(
     student_id: str,
@@ -27,3 +49,69 @@ async def get_attendance(
         "partials/attendance.html",
         {"request": request, "summary": summary},
     )
+
+
+@router.get("/rollcall", response_class=HTMLResponse)
+async def get_roll_call_grid(
+    request: Request,
+    class_id: str = "",
+    date: str = "",
+    db: Session = Depends(get_db),
+    _: None = Depends(require_auth),
+):
+    """出欠入力グリッド（HTMX用、講座×日付）"""
+    if not class_id:
+        return "<p style='color:#999;'>講座を選択してください</p>"
+    try:
+        target_date = date_type.fromisoformat(date) if date else date_type.today()
+    except ValueError:
+        return "<p style='color:#c62828;'>日付の形式が正しくありません</p>"
+    return _render_roll_call(request, db, class_id, target_date)
+
+
+@router.post("/rollcall", response_class=HTMLResponse)
+async def save_roll_call(
+    request: Request,
+    db: Session = Depends(get_db),
+    _: None = Depends(require_auth),
+):
+    """出欠の一括保存（HTMX用、講座全員分を1コミットで記録）"""
+    form_data = await request.form()
+    class_id = form_data.get("class_id", "")
+    try:
+        target_date = date_type.fromisoformat(form_data.get("date", ""))
+    except ValueError:
+        return "<p style='color:#c62828;'>日付の形式が正しくありません</p>"
+
+    # status_<生徒ID> フィールドを集める
+    statuses = {
+        key[len("status_"):]: value
+        for key, value in form_data.items()
+        if key.startswith("status_")
+    }
+    try:
+        result = await submit_write(
+            db, lambda w: record_roll_call(w, class_id, target_date, statuses)
+        )
+    except ValueError as e:
+        db.rollback()
+        return _render_roll_call(request, db, class_id, target_date, error=str(e))
+    return _render_roll_call(request, db, class_id, target_date, saved=result)
+
+
+@router.get("/heatmap", response_class=HTMLResponse)
+async def get_absence_heatmap(
+    request: Request,
+    class_id: str = "",
+    term: str = "",
+    db: Session = Depends(get_db),
+    _: None = Depends(require_auth),
+):
+    """講座の授業日ごとの欠席ヒートマップ（HTMX用、学期単位）"""
+    if not class_id:
+        return "<p style='color:#999;'>講座を選択してください</p>"
+    heatmap = class_absence_heatmap(db, class_id, term or None)
+    return templates.TemplateResponse(
+        "partials/absence_heatmap.html",
+        {"request": request, "class_id": class_id, **heatmap},
+    )
@@ -2,6 +2,8 @@ from fastapi import APIRouter, Request
 from fastapi.responses import HTMLResponse, RedirectResponse
 from datetime import datetime
 from app.auth import authenticate_admin, clear_session
+from app.branches import is_branch
+from app.dependencies import is_authenticated
 
 router = APIRouter()
 
@@ -58,3 +60,14 @@ async def logout(request: Request):
 
     # ログイン画面にリダイレクト
     return RedirectResponse(url="/login", status_code=302)
+
+@router.post("/branch")
+async def switch_branch(request: Request):
+    """操作する教室の切り替え（教室ごとに DB を分けている場合）"""
+    if not is_authenticated(request):
+        return RedirectResponse(url="/login", status_code=302)
+    form_data = await request.form()
+    branch = form_data.get("branch", "")
+    if is_branch(branch):
+        request.session["branch"] = branch
+    return RedirectResponse(url="/admin", status_code=302)
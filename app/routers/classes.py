@@ -4,9 +4,8 @@ from sqlalchemy.orm import Session
 
 from app.database import get_db
 from app.dependencies import require_auth
-from app.models.class_ import Class
-from app.models.student import Student
-from app.templates_config import templates
+from app.services.read_models import class_options, class_rows, class_student_options
+from app.templates_config import render_fragment, templates
 
 router = APIRouter()
 
@@ -17,11 +16,25 @@ async def list_classes(
     db: Session = Depends(get_db),
     _: None = Depends(require_auth),
 ):
-    """講座一覧（HTMX用）"""
-    classes = db.query(Class).all()
-    return templates.TemplateResponse(
+    """講座一覧（HTMX用、生徒数を含むため students の更新でも再描画）"""
+    return render_fragment(
         "partials/classes_table.html",
-        {"request": request, "classes": classes},
+        ("classes", "students"),
+        lambda: {"classes": class_rows(db)},
+    )
+
+
+@router.get("/options", response_class=HTMLResponse)
+async def list_class_options(
+    request: Request,
+    db: Session = Depends(get_db),
+    _: None = Depends(require_auth),
+):
+    """講座セレクトボックスの選択肢（HTMX用）"""
+    return render_fragment(
+        "partials/class_options.html",
+        ("classes",),
+        lambda: {"classes": class_options(db)},
     )
 
 
@@ -33,8 +46,7 @@ async def get_class_students(
     _: None = Depends(require_auth),
 ):
     """講座別生徒セレクトボックス（HTMX用、連鎖セレクト）"""
-    students = db.query(Student).filter(Student.class_id == class_id).all()
     return templates.TemplateResponse(
         "partials/class_students_select.html",
-        {"request": request, "students": students},
+        {"request": request, "students": class_student_options(db, class_id)},
     )
@@ -0,0 +1,62 @@
+import asyncio
+
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import StreamingResponse
+
+from app.database import request_branch
+from app.dependencies import require_auth
+from app.events import event_bus
+
+router = APIRouter()
+
+# 接続確認のコメントを送る間隔（秒）
+HEARTBEAT_SECONDS = 15
+
+
+@router.get("")
+async def stream_events(
+    request: Request,
+    class_id: str = "",
+    student_id: str = "",
+    _: None = Depends(require_auth),
+):
+    """
+    変更イベントの配信（Server-Sent Events、HTMX の sse 拡張用）
+    class_id / student_id を指定するとその講座・生徒に関係するイベントだけを送る
+    """
+    subscription = event_bus.subscribe(
+        class_id or None, student_id or None, request_branch(request)
+    )
+
+    async def _stream():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(
+                        subscription.queue.get(), HEARTBEAT_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    yield ": ping\n\n"
+                    continue
+
+                # 溜まっているイベントをまとめ、同じ名前は1回だけ送る
+                # （取込中の連続更新で再取得が重ならない）
+                events = [event]
+                while not subscription.queue.empty():
+                    events.append(subscription.queue.get_nowait())
+                if None in events:
+                    return
+                latest = {e.name: e for e in events}
+                for e in latest.values():
+                    yield f"event: {e.name}\ndata: {e.data}\n\n"
+        finally:
+            event_bus.unsubscribe(subscription)
+
+    return StreamingResponse(
+        _stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
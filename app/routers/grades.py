@@ -1,41 +1,92 @@
 import logging
 from datetime import date as date_type
+from itertools import chain
 from fastapi import APIRouter, Depends, Request, Form
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import HTMLResponse
-from sqlalchemy import func
 from sqlalchemy.orm import Session
 
-from app.database import get_db
+from app.database import get_branch_sessionmaker, get_db, request_branch
+from app.db_writer import submit_write
 from app.dependencies import require_auth
-from app.models.grade import Grade
 from app.models.student import Student
-from app.templates_config import templates
+from app.services.dashboard_publisher import comparison_context
+from app.services.lesson_pivot import (
+    AXES,
+    DEFAULT_AXIS,
+    get_lesson_pivot,
+    hardest_lessons,
+    heatmap,
+)
+from app.services.read_models import iter_recent_grade_rows, recent_grade_rows
+from app.services.student_stats import get_precomputed_advice
+from app.services.trends import (
+    DEFAULT_WINDOW,
+    get_all_trends,
+    get_student_trend,
+    trend_report,
+)
+from app.templates_config import render_fragment, stream_template, templates
 from app.services.grade_calculator import (
     get_student_grades,
     calculate_student_average,
     calculate_class_average,
     generate_advice,
 )
+from app.services.grade_entry import (
+    SCORE_FIELDS,
+    SCORE_LABELS,
+    MAX_SCORE,
+    get_grade_grid,
+    insert_grades,
+    parse_score_row,
+)
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+# ストリーミング時に1回のフェッチで読み込む行数
+STREAM_BATCH_SIZE = 500
+
+
+def _iter_recent_grades(branch: str, limit: int = None):
+    """
+    成績を新しい順に少しずつ読み出すジェネレーター（表示する列だけの読み取りモデル）
+    レスポンス送信中も読み続けるため、専用のセッションを持つ
+    """
+    db = get_branch_sessionmaker(branch)()
+    try:
+        yield from iter_recent_grade_rows(db, limit, STREAM_BATCH_SIZE)
+    finally:
+        db.close()
+
 
 @router.get("", response_class=HTMLResponse)
 async def list_grades(
     request: Request,
     limit: int = None,
-    db: Session = Depends(get_db),
     _: None = Depends(require_auth),
 ):
-    """最近の成績一覧（管理画面用）"""
-    query = db.query(Grade).order_by(Grade.date.desc())
-    if limit:
-        query = query.limit(limit)
-    grades = query.all()
-    return templates.TemplateResponse(
+    """最近の成績一覧（管理画面用、件数が多くてもストリーミングで返す）"""
+    rows = _iter_recent_grades(request_branch(request), limit)
+    # 空判定のため1件だけ先読みし、残りはテンプレート描画に合わせて読み出す
+    # （最初のフェッチも DB を待つので、イベントループを止めないようスレッドで）
+    try:
+        first = await run_in_threadpool(next, rows, None)
+    except BaseException:
+        await run_in_threadpool(rows.close)
+        raise
+    if first is None:
+        # 読み出し用のセッションを閉じる
+        await run_in_threadpool(rows.close)
+        grades = []
+    else:
+        grades = chain([first], rows)
+    # 途中でクライアントが切断しても、送信の終了時に読み出し用のセッションを閉じる
+    return stream_template(
         "partials/grades_table.html",
         {"request": request, "grades": grades},
+        on_close=rows.close,
     )
 
 
@@ -68,19 +119,15 @@ async def get_comparison(
     student = db.query(Student).filter(Student.id == student_id).first()
     if not student:
         return "<p>生徒が見つかりません</p>"
-    student_avg = calculate_student_average(db, student_id)
-    class_avg = calculate_class_average(db, student.class_id) if student.class_id else 0
-    difference = student_avg - class_avg
+    # 同じ講座の生徒が同時に開いてもクラス平均の集計は1回で済む
+    student_avg = await calculate_student_average.run_async(db, student_id)
+    class_avg = (
+        await calculate_class_average.run_async(db, student.class_id)
+        if student.class_id else 0
+    )
     return templates.TemplateResponse(
         "partials/comparison.html",
-        {
-            "request": request,
-            "student_avg": student_avg,
-            "class_avg": class_avg,
-            "difference": abs(difference),
-            "difference_color": "#2e7d32" if difference >= 0 else "#c62828",
-            "difference_sign": "+" if difference >= 0 else "-",
-        },
+        {"request": request, **comparison_context(student_avg, class_avg)},
     )
 
 
@@ -95,13 +142,91 @@ async def get_advice(
     student = db.query(Student).filter(Student.id == student_id).first()
     if not student:
         return "<p>生徒が見つかりません</p>"
-    advice = generate_advice(db, student_id)
+    # 夜間に事前計算した後でデータが変わっていなければそれを使う
+    advice = get_precomputed_advice(db, student_id) or generate_advice(db, student_id)
     return templates.TemplateResponse(
         "partials/advice.html",
         {"request": request, "advice": advice},
     )
 
 
+@router.get("/trend/{student_id}", response_class=HTMLResponse)
+async def get_trend(
+    student_id: str,
+    request: Request,
+    db: Session = Depends(get_db),
+    _: None = Depends(require_auth),
+):
+    """成績トレンドと次回予測（HTMX用）"""
+    trend = get_student_trend(db, student_id)
+    return templates.TemplateResponse(
+        "partials/trend.html",
+        {
+            "request": request,
+            "trend": trend,
+            "labels": SCORE_LABELS,
+            "window": DEFAULT_WINDOW,
+        },
+    )
+
+
+@router.get("/trends", response_class=HTMLResponse)
+async def get_trend_report(
+    request: Request,
+    class_id: str = "",
+    db: Session = Depends(get_db),
+    _: None = Depends(require_auth),
+):
+    """全生徒のトレンド一覧（HTMX用、下降が大きい順）"""
+    # 重い全生徒分の計算はスレッドプールで1回にまとめて行い、
+    # 一覧はそのキャッシュから作る
+    await get_all_trends.run_async(db)
+    return templates.TemplateResponse(
+        "partials/trend_report.html",
+        {
+            "request": request,
+            "rows": trend_report(db, class_id or None),
+            "labels": SCORE_LABELS,
+        },
+    )
+
+
+@router.get("/pivot", response_class=HTMLResponse)
+async def get_lesson_pivot_heatmap(
+    request: Request,
+    axis: str = DEFAULT_AXIS,
+    series: str = "total",
+    db: Session = Depends(get_db),
+    _: None = Depends(require_auth),
+):
+    """講座 × 授業回の平均スコアのヒートマップ（HTMX用、科目・集計軸を切り替え）"""
+    if axis not in AXES:
+        axis = DEFAULT_AXIS
+    if series != "total" and series not in SCORE_LABELS:
+        series = "total"
+    # 集計はスレッドプールで1回にまとめて行い、描画はそのキャッシュから
+    # （HTML もデータバージョンでキャッシュ）
+    await get_lesson_pivot.run_async(db, axis)
+
+    def load_context() -> dict:
+        pivot = get_lesson_pivot(db, axis)
+        return {
+            "table": heatmap(pivot, series),
+            "axis": axis,
+            "series": series,
+            "axes": AXES,
+            "labels": {"total": "合計", **SCORE_LABELS},
+            "hardest": hardest_lessons(pivot, series),
+        }
+
+    return render_fragment(
+        "partials/lesson_pivot.html",
+        ("grades", "classes"),
+        load_context,
+        key=(axis, series),
+    )
+
+
 @router.post("", response_class=HTMLResponse)
 async def create_grade(
     request: Request,
@@ -119,39 +244,23 @@ async def create_grade(
 ):
     """成績入力（HTMX用）"""
     try:
-        # lesson_number 自動採番（その生徒の最大 + 1）
-        max_lesson = (
-            db.query(func.max(Grade.lesson_number))
-            .filter(Grade.student_id == student_id)
-            .scalar()
+        target_date = date_type.fromisoformat(date)
+        scores = {
+            student_id: {
+                "comprehension": score_comprehension,
+                "unseen": score_unseen,
+                "grammar": score_grammar,
+                "vocabulary": score_vocabulary,
+                "listening": score_listening,
+            }
+        }
+        await submit_write(
+            db,
+            lambda w: insert_grades(w, class_id, target_date, lesson_content, scores),
         )
-        lesson_number = (max_lesson or 0) + 1
-
-        score_total = (
-            score_comprehension + score_unseen + score_grammar
-            + score_vocabulary + score_listening
-        )
-        grade_id = f"g_{student_id}_{date}_{lesson_number}"
-
-        new_grade = Grade(
-            id=grade_id,
-            student_id=student_id,
-            class_id=class_id,
-            date=date,
-            lesson_number=lesson_number,
-            lesson_content=lesson_content,
-            score_comprehension=score_comprehension,
-            score_unseen=score_unseen,
-            score_grammar=score_grammar,
-            score_vocabulary=score_vocabulary,
-            score_listening=score_listening,
-            score_total=score_total,
-        )
-        db.add(new_grade)
-        db.commit()
 
         # 最近5件を返す
-        grades = db.query(Grade).order_by(Grade.date.desc()).limit(5).all()
+        grades = recent_grade_rows(db, 5)
         return templates.TemplateResponse(
             "partials/grades_table.html",
             {"request": request, "grades": grades},
@@ -159,3 +268,118 @@ async def create_grade(
     except Exception as e:
         logger.error("Grade create error: %s", e, exc_info=True)
         return "<p style='color:#c62828;'>保存中にエラーが発生しました</p>"
+
+
+def _render_grade_grid(
+    request: Request,
+    db: Session,
+    class_id: str,
+    target_date,
+    lesson_content: str,
+    **extra,
+):
+    return templates.TemplateResponse(
+        "partials/grades_grid.html",
+        {
+            "request": request,
+            "class_id": class_id,
+            "date": target_date,
+            "lesson_content": lesson_content,
+            "students": get_grade_grid(db, class_id),
+            "fields": SCORE_FIELDS,
+            "labels": SCORE_LABELS,
+            "max_score": MAX_SCORE,
+            "entered": {},
+            "row_errors": {},
+            **extra,
+        },
+    )
+
+
+@router.get("/grid", response_class=HTMLResponse)
+async def get_grade_grid_html(
+    request: Request,
+    class_id: str = "",
+    date: str = "",
+    lesson_content: str = "",
+    db: Session = Depends(get_db),
+    _: None = Depends(require_auth),
+):
+    """講座一括入力グリッド（HTMX用）"""
+    if not class_id:
+        return "<p style='color:#999;'>講座を選択してください</p>"
+    try:
+        target_date = date_type.fromisoformat(date) if date else date_type.today()
+    except ValueError:
+        return "<p style='color:#c62828;'>日付の形式が正しくありません</p>"
+    return _render_grade_grid(request, db, class_id, target_date, lesson_content)
+
+
+@router.post("/grid", response_class=HTMLResponse)
+async def save_grade_grid(
+    request: Request,
+    db: Session = Depends(get_db),
+    _: None = Depends(require_auth),
+):
+    """
+    講座一括入力の保存（HTMX用）
+    全行をまとめて検証し、1件でもエラーがあれば何も保存しない
+    空欄だけの行（欠席など）は保存しない
+    """
+    form_data = await request.form()
+    class_id = form_data.get("class_id", "")
+    lesson_content = form_data.get("lesson_content", "")
+    try:
+        target_date = date_type.fromisoformat(form_data.get("date", ""))
+    except ValueError:
+        return "<p style='color:#c62828;'>日付の形式が正しくありません</p>"
+
+    entered = {}
+    for student in get_grade_grid(db, class_id):
+        values = {f: form_data.get(f"{f}_{student.id}", "") for f in SCORE_FIELDS}
+        if any(v.strip() for v in values.values()):
+            entered[student.id] = values
+
+    scores_by_student = {}
+    row_errors = {}
+    for student_id, values in entered.items():
+        scores, errors = parse_score_row(values)
+        if errors:
+            row_errors[student_id] = errors
+        else:
+            scores_by_student[student_id] = scores
+
+    if row_errors or not scores_by_student:
+        return _render_grade_grid(
+            request, db, class_id, target_date, lesson_content,
+            entered=entered,
+            row_errors=row_errors,
+            error=(
+                "入力内容にエラーがあります" if row_errors
+                else "得点が入力されていません"
+            ),
+        )
+
+    try:
+        saved = await submit_write(
+            db,
+            lambda w: insert_grades(
+                w, class_id, target_date, lesson_content, scores_by_student
+            ),
+        )
+    except Exception as e:
+        db.rollback()
+        logger.error("Grade grid save error: %s", e, exc_info=True)
+        return _render_grade_grid(
+            request, db, class_id, target_date, lesson_content,
+            entered=entered, error="保存中にエラーが発生しました",
+        )
+
+    response = _render_grade_grid(
+        request, db, class_id, target_date, lesson_content,
+        saved_count=len(saved),
+        class_avg=await calculate_class_average.run_async(db, class_id, target_date),
+    )
+    # 最近の成績一覧を1回だけ再読込させる
+    response.headers["HX-Trigger"] = "grades-updated"
+    return response
@@ -0,0 +1,63 @@
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import HTMLResponse
+
+from app.dependencies import require_auth
+from app.scheduler import get_scheduler, recent_runs
+from app.templates_config import templates
+
+router = APIRouter()
+
+
+def _render_jobs(request: Request, **extra):
+    scheduler = get_scheduler()
+    now = datetime.now()
+    runs = recent_runs()
+    last_runs = {}
+    for run in runs:
+        last_runs.setdefault(run.job_name, run)
+    jobs = [
+        {
+            "job": job,
+            "next_run": job.schedule.next_after(now),
+            "last_run": last_runs.get(job.name),
+        }
+        for job in (scheduler.jobs.values() if scheduler else [])
+    ]
+    return templates.TemplateResponse(
+        "partials/jobs.html",
+        {
+            "request": request,
+            "scheduler": scheduler,
+            "jobs": jobs,
+            "runs": runs,
+            **extra,
+        },
+    )
+
+
+@router.get("", response_class=HTMLResponse)
+async def list_jobs(
+    request: Request,
+    _: None = Depends(require_auth),
+):
+    """定期処理の一覧と実行履歴（HTMX用）"""
+    return _render_jobs(request)
+
+
+@router.post("/{job_name}/run", response_class=HTMLResponse)
+async def run_job_now(
+    job_name: str,
+    request: Request,
+    _: None = Depends(require_auth),
+):
+    """ジョブを今すぐ実行（HTMX用、終わるまで待って一覧を返す）"""
+    scheduler = get_scheduler()
+    if scheduler is None or job_name not in scheduler.jobs:
+        return _render_jobs(request, error="ジョブが見つかりません")
+    started = await run_in_threadpool(scheduler.run_job, job_name)
+    if not started:
+        return _render_jobs(request, error="このジョブは実行中です")
+    return _render_jobs(request)
@@ -1,15 +1,14 @@
-from fastapi import APIRouter, Request
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
-import os
 
-from app.dependencies import is_authenticated
+from app.branches import branch_codes, sharding_enabled
+from app.database import request_branch
+from app.dependencies import is_authenticated, require_auth
+from app.services.dashboard_publisher import published_fragment, published_page
+from app.templates_config import templates
 
 router = APIRouter()
 
-templates_dir = os.path.join(os.path.dirname(__file__), "..", "templates")
-templates = Jinja2Templates(directory=templates_dir)
-
 
 @router.get("/", response_class=HTMLResponse)
 async def root(request: Request):
@@ -29,19 +28,51 @@ async def login_page(request: Request):
 async def admin_page(request: Request):
     if not is_authenticated(request):
         return RedirectResponse(url="/login", status_code=302)
-    return templates.TemplateResponse("admin/index.html", {"request": request})
+    return templates.TemplateResponse(
+        "admin/index.html",
+        {
+            "request": request,
+            "branches": branch_codes() if sharding_enabled() else [],
+            "current_branch": request_branch(request),
+        },
+    )
 
 
 @router.get("/dashboard/{student_id}", response_class=HTMLResponse)
 async def dashboard_page(request: Request, student_id: str):
     if not is_authenticated(request):
         return RedirectResponse(url="/login", status_code=302)
+    # 公開モードで書き出し済みならファイルをそのまま返す（テンプレートを使わない）
+    published = published_page(request, request_branch(request), student_id)
+    if published is not None:
+        return published
     return templates.TemplateResponse(
         "dashboard/index.html",
         {"request": request, "student_id": student_id}
     )
 
 
+@router.get("/dashboard/{student_id}/fragments/{name}", response_class=HTMLResponse)
+async def dashboard_fragment(
+    request: Request,
+    student_id: str,
+    name: str,
+    _: None = Depends(require_auth),
+):
+    """
+    書き出したダッシュボードの SSE 更新用パーシャル
+    （なければ通常のエンドポイントへ）
+    """
+    response = published_fragment(
+        request, request_branch(request), student_id, name
+    )
+    if response is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="パーシャルが見つかりません"
+        )
+    return response
+
+
 @router.get("/upload", response_class=HTMLResponse)
 async def upload_page(request: Request):
     if not is_authenticated(request):
@@ -58,10 +89,12 @@ async def admin_tab(request: Request, tab_name: str):
     tab_templates = {
         "dashboard": "admin/_dashboard_tab.html",
         "grades": "admin/_grades_tab.html",
+        "attendance": "admin/_attendance_tab.html",
         "students": "admin/_students_tab.html",
         "classes": "admin/_classes_tab.html",
         "upload": "upload/index.html",
         "reports": "admin/_reports_tab.html",
+        "jobs": "admin/_jobs_tab.html",
     }
 
     template_path = tab_templates.get(tab_name)
@@ -5,14 +5,27 @@ from fastapi.responses import HTMLResponse
 from sqlalchemy.orm import Session
 
 from app.database import get_db
+from app.db_writer import submit_write
 from app.dependencies import require_auth
+from app.events import publish_after_commit
 from app.models.student import Student
-from app.templates_config import templates
+from app.services.read_models import student_rows
+from app.services.student_search import search_students
+from app.templates_config import render_fragment, templates
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
 
+def _render_students_table(db: Session) -> HTMLResponse:
+    """生徒一覧パーシャル（生徒データが変わるまでキャッシュ）"""
+    return render_fragment(
+        "partials/students_table.html",
+        ("students",),
+        lambda: {"students": student_rows(db)},
+    )
+
+
 @router.get("", response_class=HTMLResponse)
 async def list_students(
     request: Request,
@@ -20,10 +33,45 @@ async def list_students(
     _: None = Depends(require_auth),
 ):
     """生徒一覧（HTMX用）"""
-    students = db.query(Student).order_by(Student.name).all()
+    return _render_students_table(db)
+
+
+@router.get("/search", response_class=HTMLResponse)
+async def search_students_html(
+    request: Request,
+    q: str = "",
+    limit: int = 10,
+    db: Session = Depends(get_db),
+    _: None = Depends(require_auth),
+):
+    """生徒検索の候補一覧（HTMX用、タイプアヘッド）"""
+    students = search_students(db, q, min(limit, 50))
     return templates.TemplateResponse(
-        "partials/students_table.html",
-        {"request": request, "students": students},
+        "partials/student_search_results.html",
+        {"request": request, "students": students, "query": q},
+    )
+
+
+@router.get("/search/select", response_class=HTMLResponse)
+async def search_students_select(
+    request: Request,
+    q: str = "",
+    limit: int = 20,
+    db: Session = Depends(get_db),
+    _: None = Depends(require_auth),
+):
+    """生徒検索の結果をセレクトボックスで返す（成績入力フォーム用）"""
+    students = search_students(db, q, min(limit, 50))
+    return templates.TemplateResponse(
+        "partials/class_students_select.html",
+        {
+            "request": request,
+            "students": students,
+            "empty_message": (
+                "該当する生徒がいません" if q.strip()
+                else "氏名・ふりがなを入力してください"
+            ),
+        },
     )
 
 
@@ -41,10 +89,11 @@ async def create_student(
     _: None = Depends(require_auth),
 ):
     """生徒追加（HTMX用）"""
-    try:
+
+    def _insert(w: Session):
         # ID 自動採番（最大の数値 + 1）
         max_id = 0
-        for s in db.query(Student).all():
+        for s in w.query(Student).all():
             try:
                 num = int(s.id.lstrip("s"))
                 if num > max_id:
@@ -64,14 +113,19 @@ async def create_student(
             class_id=class_id or None,
             join_date=date_type.today(),
         )
-        db.add(new_student)
-        db.commit()
-
-        students = db.query(Student).order_by(Student.name).all()
-        return templates.TemplateResponse(
-            "partials/students_table.html",
-            {"request": request, "students": students},
+        w.add(new_student)
+        w.commit()
+        publish_after_commit(
+            w,
+            "students-changed",
+            class_ids=[new_student.class_id],
+            student_ids=[new_id],
         )
+
+    try:
+        # 採番と追加は書き込みキューで直列化（同時追加で ID が重複しない）
+        await submit_write(db, _insert)
+        return _render_students_table(db)
     except Exception as e:
         logger.error("Student create error: %s", e, exc_info=True)
         return "<p style='color:#c62828;'>保存中にエラーが発生しました</p>"
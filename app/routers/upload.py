@@ -1,24 +1,138 @@
 import logging
-import uuid
-from fastapi import APIRouter, Depends, Request, UploadFile, File
-from fastapi.responses import HTMLResponse, Response
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Request, UploadFile, File, status
+from fastapi.responses import HTMLResponse, JSONResponse, Response
+from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
-from app.database import get_db
+from app.branches import resolve_csv_branch, sharding_enabled
+from app.database import branch_session, get_db
+from app.db_writer import submit_write
 from app.dependencies import require_auth
 from app.services.csv_importer import (
     parse_new_format_csv,
     match_students_to_ids,
     match_grades_to_students,
-    save_csv_data,
+    save_csv_data_in_chunks,
 )
+from app.services.chunked_upload import (
+    CHUNK_SIZE,
+    OffsetMismatch,
+    append_chunk,
+    create_session,
+    discard_session,
+    finalize_session,
+    get_session,
+)
+from app.services.import_batch import (
+    file_digest,
+    filter_new_rows,
+    find_imported_file,
+    latest_active_batch_id,
+    list_batches,
+    rollback_batch,
+)
+from app.services.import_diff import STATUSES, diff_import, filter_rows
+from app.services.upload_preview import get_preview, pop_preview, store_preview
 from app.templates_config import templates
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
-# UUIDキーでキャッシュ。セッションにキーを保存して他ユーザーの改ざんを防ぐ
-preview_cache: dict = {}
+# プレビューの行一覧の1ページの行数
+PREVIEW_PAGE_SIZE = 50
+
+
+def _render_preview(
+    request: Request,
+    db: Session,
+    students_raw,
+    grades_raw,
+    filename: str = "",
+    file_sha256: Optional[str] = None,
+):
+    """
+    解析結果を生徒IDに突き合わせてプレビューを返す
+    取込済みで変更のない行は省き、新しい行・変わった行だけを突き合わせる
+    教室ごとに DB を分けている場合は、CSV の教室コードが示す教室の DB で突き合わせる
+    """
+    csv_branch = resolve_csv_branch(s.get("student_code", "") for s in students_raw)
+    branch = csv_branch or db.info["branch"]
+    if branch != db.info["branch"]:
+        with branch_session(branch) as branch_db:
+            return _render_preview(
+                request, branch_db, students_raw, grades_raw, filename, file_sha256
+            )
+
+    duplicate = _render_duplicate(request, db, file_sha256)
+    if duplicate is not None:
+        return duplicate
+
+    new_students, new_grades, skipped = filter_new_rows(db, students_raw, grades_raw)
+    students_with_ids = match_students_to_ids(db, new_students)
+    matched_grades = match_grades_to_students(
+        db,
+        students_with_ids,
+        new_grades,
+        known_names={s["name"] for s in students_raw},
+    )
+    diff = diff_import(db, students_with_ids, matched_grades)
+
+    # セッションにUUIDキーを保存（外部改ざん防止）
+    request.session["upload_cache_key"] = store_preview({
+        "students_with_ids": students_with_ids,
+        "matched_grades": matched_grades,
+        "diff": diff,
+        "branch": branch,
+        "filename": filename,
+        "file_sha256": file_sha256,
+    })
+
+    return templates.TemplateResponse(
+        "partials/upload_preview.html",
+        {
+            "request": request,
+            "counts": diff["counts"],
+            "duplicates": diff["duplicates"],
+            "skipped": skipped,
+            "branch": branch if sharding_enabled() else None,
+            **_diff_page(diff, "students", None, 1),
+        },
+    )
+
+
+def _diff_page(diff: dict, kind: str, status_filter: Optional[str], page: int) -> dict:
+    """差分の1ページ分（プレビューの行一覧の表示用）"""
+    rows = filter_rows(diff, kind, status_filter)
+    pages = max(1, -(-len(rows) // PREVIEW_PAGE_SIZE))
+    page = max(1, min(page, pages))
+    return {
+        "kind": kind,
+        "status_filter": status_filter if status_filter in STATUSES else "",
+        "rows": rows[(page - 1) * PREVIEW_PAGE_SIZE:page * PREVIEW_PAGE_SIZE],
+        "total": len(rows),
+        "page": page,
+        "pages": pages,
+    }
+
+
+def _duplicate_message(batch) -> str:
+    return (
+        f"同じ内容のファイルは {batch.created_at:%Y-%m-%d %H:%M} に取込済みです"
+        f"（取込 #{batch.id}{'・' + batch.filename if batch.filename else ''}）。"
+        "変更はありません"
+    )
+
+
+def _render_duplicate(request: Request, db: Session, file_sha256: Optional[str]):
+    """同じファイルを取込済みなら案内を返す（解析・突き合わせを省く）"""
+    batch = find_imported_file(db, file_sha256)
+    if batch is None:
+        return None
+    return templates.TemplateResponse(
+        "partials/upload_duplicate.html",
+        {"request": request, "message": _duplicate_message(batch)},
+    )
 
 
 @router.post("/csv", response_class=HTMLResponse)
@@ -31,42 +145,196 @@ async def upload_csv(
     """CSV解析＆プレビュー（HTMX用）"""
     try:
         content = await file.read()
+        file_sha256 = file_digest(content)
+        # 教室ごとに DB を分けていないときは解析前に判定できる
+        if not sharding_enabled():
+            duplicate = _render_duplicate(request, db, file_sha256)
+            if duplicate is not None:
+                return duplicate
+
         csv_text = content.decode("utf-8-sig")
 
         students_raw, grades_raw = parse_new_format_csv(csv_text)
-        students_with_ids = match_students_to_ids(db, students_raw)
-        matched_grades = match_grades_to_students(db, students_with_ids, grades_raw)
-
-        # セッションにUUIDキーを保存（外部改ざん防止）
-        cache_key = str(uuid.uuid4())
-        preview_cache[cache_key] = {
-            "students_with_ids": students_with_ids,
-            "matched_grades": matched_grades,
-        }
-        request.session["upload_cache_key"] = cache_key
+        return _render_preview(
+            request, db, students_raw, grades_raw, file.filename or "", file_sha256
+        )
 
+    except ValueError as e:
         return templates.TemplateResponse(
-            "partials/upload_preview.html",
-            {
-                "request": request,
-                "students": students_with_ids,
-                "grades": matched_grades,
-            },
+            "partials/upload_error.html",
+            {"request": request, "message": str(e)},
+        )
+    except Exception as e:
+        logger.error("CSV upload error: %s", e, exc_info=True)
+        return templates.TemplateResponse(
+            "partials/upload_error.html",
+            {"request": request, "message": "ファイルの処理中にエラーが発生しました"},
+        )
+
+
+# ---- 分割・再開可能アップロード ----
+
+class UploadSessionIn(BaseModel):
+    filename: str = ""
+    size: int
+    sha256: Optional[str] = None   # ファイル全体の SHA-256（確定時に検証）
+
+
+def _get_upload_session(upload_id: str):
+    try:
+        return get_session(upload_id)
+    except KeyError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="アップロードが見つかりません"
         )
 
+
+def _offset_response(
+    session, status_code: int = status.HTTP_200_OK, **extra
+) -> JSONResponse:
+    return JSONResponse(
+        {**session.status(), **extra},
+        status_code=status_code,
+        headers={"Upload-Offset": str(session.offset)},
+    )
+
+
+@router.post("/sessions", status_code=status.HTTP_201_CREATED)
+async def create_upload_session(
+    data: UploadSessionIn,
+    db: Session = Depends(get_db),
+    _: None = Depends(require_auth),
+):
+    """
+    分割アップロードを開始（以後 PUT でチャンクを送る）
+    sha256 が取込済みのファイルと同じなら送信を省くよう duplicate を返す
+    """
+    if not sharding_enabled():
+        batch = find_imported_file(db, data.sha256)
+        if batch is not None:
+            return JSONResponse({"duplicate": _duplicate_message(batch)})
+    try:
+        session = create_session(data.filename, data.size, data.sha256)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e)
+        )
+    return _offset_response(session, status.HTTP_201_CREATED, chunk_size=CHUNK_SIZE)
+
+
+@router.get("/sessions/{upload_id}")
+async def get_upload_session(
+    upload_id: str,
+    _: None = Depends(require_auth),
+):
+    """受信済みオフセットの問い合わせ（再開時はここから送り直す）"""
+    return _offset_response(_get_upload_session(upload_id))
+
+
+@router.put("/sessions/{upload_id}")
+async def put_upload_chunk(
+    upload_id: str,
+    request: Request,
+    _: None = Depends(require_auth),
+):
+    """
+    チャンクの受信
+    Content-Range: bytes 開始-終了/全体 と X-Chunk-SHA256（チャンクの SHA-256）が必要
+    開始位置が受信済みの位置と違えば 409 と現在のオフセットを返す
+    """
+    session = _get_upload_session(upload_id)
+    data = await request.body()
+    try:
+        append_chunk(
+            session,
+            request.headers.get("content-range"),
+            request.headers.get("x-chunk-sha256"),
+            data,
+        )
+    except OffsetMismatch as e:
+        return _offset_response(session, status.HTTP_409_CONFLICT, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return _offset_response(session)
+
+
+@router.delete("/sessions/{upload_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def cancel_upload_session(
+    upload_id: str,
+    _: None = Depends(require_auth),
+):
+    """分割アップロードの中止"""
+    discard_session(_get_upload_session(upload_id))
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+@router.post("/sessions/{upload_id}/finalize", response_class=HTMLResponse)
+async def finalize_upload_session(
+    upload_id: str,
+    request: Request,
+    db: Session = Depends(get_db),
+    _: None = Depends(require_auth),
+):
+    """分割アップロードの確定＆プレビュー（受信と並行して解析済み）"""
+    try:
+        session = _get_upload_session(upload_id)
+        students_raw, grades_raw = finalize_session(session)
+        return _render_preview(
+            request,
+            db,
+            students_raw,
+            grades_raw,
+            session.filename,
+            session.hasher.hexdigest(),
+        )
+    except HTTPException:
+        raise
     except ValueError as e:
         return templates.TemplateResponse(
             "partials/upload_error.html",
             {"request": request, "message": str(e)},
         )
     except Exception as e:
-        logger.error("CSV upload error: %s", e, exc_info=True)
+        logger.error("CSV finalize error: %s", e, exc_info=True)
         return templates.TemplateResponse(
             "partials/upload_error.html",
             {"request": request, "message": "ファイルの処理中にエラーが発生しました"},
         )
 
 
+@router.get("/preview/rows", response_class=HTMLResponse)
+async def get_preview_rows(
+    request: Request,
+    kind: str = "students",
+    status_filter: Optional[str] = None,
+    page: int = 1,
+    _: None = Depends(require_auth),
+):
+    """プレビューの行一覧（種類・状態で絞り込み、ページ送り。HTMX用）"""
+    data = get_preview(request.session.get("upload_cache_key"))
+    if data is None or "diff" not in data:
+        return templates.TemplateResponse(
+            "partials/upload_error.html",
+            {
+                "request": request,
+                "message": (
+                    "プレビューデータが見つかりません。"
+                    "もう一度アップロードしてください。"
+                ),
+            },
+        )
+    if kind not in ("students", "grades"):
+        kind = "students"
+    return templates.TemplateResponse(
+        "partials/upload_diff_rows.html",
+        {
+            "request": request,
+            "counts": data["diff"]["counts"],
+            **_diff_page(data["diff"], kind, status_filter, page),
+        },
+    )
+
+
 @router.post("/save", response_class=HTMLResponse)
 async def save_csv(
     request: Request,
@@ -76,23 +344,38 @@ async def save_csv(
     """保存確定（HTMX用）"""
     try:
         # セッションからキーを取得（外部からの偽装を防ぐ）
-        cache_key = request.session.pop("upload_cache_key", None)
-        if not cache_key or cache_key not in preview_cache:
+        data = pop_preview(request.session.pop("upload_cache_key", None))
+        if data is None:
             raise ValueError("プレビューデータが見つかりません。もう一度アップロードしてください。")
 
-        data = preview_cache.pop(cache_key)
-        results = save_csv_data(db, data["students_with_ids"], data["matched_grades"])
+        args = (
+            data["students_with_ids"], data["matched_grades"],
+            data.get("filename", ""), data.get("file_sha256"), data.get("diff"),
+        )
+        # プレビュー時に決めた教室の DB に保存（書き込みキューでは成績を分けて書き込む）
+        branch = data.get("branch", db.info["branch"])
+        if branch != db.info["branch"]:
+            with branch_session(branch) as branch_db:
+                results = await save_csv_data_in_chunks(branch_db, *args)
+        else:
+            results = await save_csv_data_in_chunks(db, *args)
 
-        return templates.TemplateResponse(
+        response = templates.TemplateResponse(
             "partials/upload_success.html",
             {
                 "request": request,
                 "added_students": results["added_students"],
                 "updated_students": results["updated_students"],
                 "added_grades": results["added_grades"],
+                "updated_grades": results["updated_grades"],
+                "unchanged_students": results["unchanged_students"],
+                "unchanged_grades": results["unchanged_grades"],
                 "errors": results["errors"],
             },
         )
+        # 取込履歴を再読込させる
+        response.headers["HX-Trigger"] = "import-batches-changed"
+        return response
 
     except ValueError as e:
         return templates.TemplateResponse(
@@ -107,6 +390,55 @@ async def save_csv(
         )
 
 
+# ---- 取込履歴 ----
+
+def _render_batches(request: Request, db: Session, message: str = "", error: str = ""):
+    return templates.TemplateResponse(
+        "partials/import_batches.html",
+        {
+            "request": request,
+            "batches": list_batches(db),
+            "latest_id": latest_active_batch_id(db),
+            "message": message,
+            "error": error,
+        },
+    )
+
+
+@router.get("/batches", response_class=HTMLResponse)
+async def get_import_batches(
+    request: Request,
+    db: Session = Depends(get_db),
+    _: None = Depends(require_auth),
+):
+    """取込履歴（HTMX用）"""
+    return _render_batches(request, db)
+
+
+@router.post("/batches/{batch_id}/rollback", response_class=HTMLResponse)
+async def rollback_import_batch(
+    batch_id: int,
+    request: Request,
+    db: Session = Depends(get_db),
+    _: None = Depends(require_auth),
+):
+    """取込の取消（最新の取込のみ。HTMX用）"""
+    try:
+        result = await submit_write(db, lambda w: rollback_batch(w, batch_id))
+    except ValueError as e:
+        return _render_batches(request, db, error=str(e))
+    return _render_batches(
+        request, db,
+        message=(
+            f"取込 #{batch_id} を取り消しました"
+            f"（生徒 削除{result['deleted_students']}件"
+            f"・復元{result['restored_students']}件、"
+            f"成績 削除{result['deleted_grades']}件"
+            f"・復元{result['restored_grades']}件）"
+        ),
+    )
+
+
 @router.get("/template")
 async def download_template(_: None = Depends(require_auth)):
     """CSVテンプレートダウンロード"""
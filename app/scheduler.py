@@ -0,0 +1,333 @@
+"""
+プロセス内スケジューラ（夜間の事前計算・DB メンテナンスなど）
+登録したジョブを cron 形式のスケジュール（分 時 日 月 曜日）で実行し、
+実行履歴と所要時間を job_runs に記録する
+（ジョブは全教室を対象に1回ずつ動くので、履歴は既定の教室の DB にまとめる。
+記録は submit_write_sync、表示は recent_runs で、どちらも既定の教室の DB を使う）
+
+複数ワーカーで起動しても実行するのは1プロセスだけにするため、起動時にロックを取る
+（PostgreSQL はアドバイザリロック、それ以外はロックファイル）
+取れなかったプロセスはジョブを実行しない（管理画面からの手動実行は可能）
+手動実行はどのワーカーにも届くので、ジョブの実行中はジョブごとのロックも持ち、
+定期実行と手動実行が別のプロセスで重ならないようにする
+"""
+
+import logging
+import os
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import insert, text
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import SessionLocal, engine
+from app.db_writer import submit_write_sync
+from app.models.job_run import JobRun
+
+try:
+    import fcntl
+except ImportError:  # Windows ではロックファイルを使わない
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# PostgreSQL のアドバイザリロックのキー（任意の固定値）
+ADVISORY_LOCK_KEY = 726_1001
+# ジョブごとのロック（2引数のアドバイザリロックの1つ目。2つ目はジョブ名から作る）
+JOB_LOCK_CLASS = 726_1003
+
+# 起動時に start_scheduler で作成
+_scheduler: Optional["Scheduler"] = None
+
+
+def _parse_field(expr: str, low: int, high: int) -> frozenset:
+    """cron の1フィールド（*, 5, 1-5, */10, 1,3,5 など）を値の集合にする"""
+    values = set()
+    for part in expr.split(","):
+        step = 1
+        if "/" in part:
+            part, step_text = part.split("/", 1)
+            step = int(step_text)
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            start, end = (int(v) for v in part.split("-", 1))
+        else:
+            start = int(part)
+            end = high if step > 1 else start
+        if step < 1 or start < low or end > high or start > end:
+            raise ValueError(f"不正なスケジュールです: {expr}")
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+
+class CronSchedule:
+    """cron 形式のスケジュール（分 時 日 月 曜日、曜日は 0=日曜）"""
+
+    def __init__(self, expr: str):
+        fields = expr.split()
+        if len(fields) != 5:
+            raise ValueError(f"不正なスケジュールです: {expr}")
+        self.expr = expr
+        self.minutes = _parse_field(fields[0], 0, 59)
+        self.hours = _parse_field(fields[1], 0, 23)
+        self.days = _parse_field(fields[2], 1, 31)
+        self.months = _parse_field(fields[3], 1, 12)
+        # 7 も日曜として扱う
+        self.weekdays = frozenset(d % 7 for d in _parse_field(fields[4], 0, 7))
+        self._any_day = fields[2] == "*"
+        self._any_weekday = fields[4] == "*"
+
+    def _day_matches(self, dt: datetime) -> bool:
+        day_ok = dt.day in self.days
+        weekday_ok = (dt.weekday() + 1) % 7 in self.weekdays
+        # cron と同じく、日と曜日の両方を指定したときはどちらかに合えばよい
+        if not self._any_day and not self._any_weekday:
+            return day_ok or weekday_ok
+        return day_ok and weekday_ok
+
+    def matches(self, dt: datetime) -> bool:
+        return (
+            dt.minute in self.minutes
+            and dt.hour in self.hours
+            and dt.month in self.months
+            and self._day_matches(dt)
+        )
+
+    def next_after(self, dt: datetime) -> Optional[datetime]:
+        """dt より後で最初に実行される時刻（1年以内になければ None）"""
+        start = dt.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        day = start.replace(hour=0, minute=0)
+        for _ in range(367):
+            if day.month in self.months and self._day_matches(day):
+                for hour in sorted(self.hours):
+                    for minute in sorted(self.minutes):
+                        candidate = day.replace(hour=hour, minute=minute)
+                        if candidate >= start:
+                            return candidate
+            day += timedelta(days=1)
+        return None
+
+
+class Job:
+    """登録済みのジョブ（戻り値の文字列は実行履歴のメッセージになる）"""
+
+    def __init__(
+        self,
+        name: str,
+        schedule: str,
+        func: Callable[[], Optional[str]],
+        description: str = "",
+    ):
+        self.name = name
+        self.schedule = CronSchedule(schedule)
+        self.func = func
+        self.description = description
+        self.lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self.lock.locked()
+
+
+@contextmanager
+def _job_lock(name: str):
+    """
+    ジョブのプロセス間のロック（取れたら True を渡す。取れなければ待たずに False）
+    PostgreSQL はアドバイザリロック、それ以外はジョブごとのロックファイル
+    """
+    if engine.dialect.name == "postgresql":
+        key = zlib.crc32(name.encode("utf-8")) & 0x7FFFFFFF
+        with engine.connect() as conn:
+            locked = conn.execute(
+                text("SELECT pg_try_advisory_lock(:cls, :key)"),
+                {"cls": JOB_LOCK_CLASS, "key": key},
+            ).scalar()
+            try:
+                yield bool(locked)
+            finally:
+                if locked:
+                    conn.execute(
+                        text("SELECT pg_advisory_unlock(:cls, :key)"),
+                        {"cls": JOB_LOCK_CLASS, "key": key},
+                    )
+        return
+
+    if fcntl is None:
+        yield True
+        return
+    path = f"{settings.SCHEDULER_LOCK_FILE}.{name}"
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as handle:
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            yield False
+            return
+        yield True
+
+
+class Scheduler:
+    """1分ごとにスケジュールを確認してジョブを実行するスレッド"""
+
+    def __init__(self):
+        self.jobs: Dict[str, Job] = {}
+        self.is_leader = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="scheduler", daemon=True)
+        self._lock_handle = None
+
+    def register(
+        self,
+        name: str,
+        schedule: str,
+        func: Callable[[], Optional[str]],
+        description: str = "",
+    ):
+        self.jobs[name] = Job(name, schedule, func, description)
+
+    # ---- 単一プロセスのロック ----
+
+    def _acquire_lock(self) -> bool:
+        if engine.dialect.name == "postgresql":
+            conn = engine.connect()
+            locked = conn.execute(
+                text("SELECT pg_try_advisory_lock(:key)"), {"key": ADVISORY_LOCK_KEY}
+            ).scalar()
+            if locked:
+                # 接続を持ち続ける間ロックが保持される
+                self._lock_handle = conn
+                return True
+            conn.close()
+            return False
+
+        if fcntl is None:
+            return True
+        os.makedirs(os.path.dirname(settings.SCHEDULER_LOCK_FILE) or ".", exist_ok=True)
+        handle = open(settings.SCHEDULER_LOCK_FILE, "w")
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            return False
+        handle.write(str(os.getpid()))
+        handle.flush()
+        self._lock_handle = handle
+        return True
+
+    def _release_lock(self):
+        if self._lock_handle is not None:
+            self._lock_handle.close()
+            self._lock_handle = None
+
+    # ---- 実行 ----
+
+    def start(self):
+        self.is_leader = self._acquire_lock()
+        if self.is_leader:
+            self._thread.start()
+            logger.info("Scheduler started (%d jobs)", len(self.jobs))
+        else:
+            logger.info(
+                "Scheduler lock held by another process; jobs will not run here"
+            )
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self._release_lock()
+
+    def _run(self):
+        last_tick = None
+        while True:
+            # 次の分の境目まで待つ
+            if self._stop.wait(60 - time.time() % 60):
+                return
+            now = datetime.now().replace(second=0, microsecond=0)
+            if now == last_tick:
+                continue
+            last_tick = now
+            for job in list(self.jobs.values()):
+                if job.schedule.matches(now) and not job.running:
+                    self.run_job(job.name)
+
+    def run_job(self, name: str) -> bool:
+        """
+        ジョブを実行して履歴を記録
+        同じジョブがこのプロセスか別のプロセスで実行中なら何もせず False
+        """
+        job = self.jobs[name]
+        if not job.lock.acquire(blocking=False):
+            return False
+        try:
+            with _job_lock(name) as locked:
+                if not locked:
+                    return False
+                self._run_locked(job)
+            return True
+        finally:
+            job.lock.release()
+
+    def _run_locked(self, job: Job):
+        """ジョブを実行して履歴を記録（ロックは呼び出し側で取る）"""
+        name = job.name
+        started_at = datetime.now()
+        start = time.perf_counter()
+        try:
+            message = job.func() or ""
+            status = "成功"
+        except Exception as e:
+            logger.error("Job %s failed: %s", name, e, exc_info=True)
+            message = str(e)
+            status = "失敗"
+        run = {
+            "job_name": name,
+            "started_at": started_at,
+            "duration_ms": round((time.perf_counter() - start) * 1000),
+            "status": status,
+            "message": message[:1000],
+        }
+
+        def _record(w: Session):
+            w.execute(insert(JobRun), [run])
+            w.commit()
+
+        submit_write_sync(_record)
+
+
+def get_scheduler() -> Optional[Scheduler]:
+    return _scheduler
+
+
+def start_scheduler(register: Callable[[Scheduler], None]) -> Optional[Scheduler]:
+    """設定で有効ならジョブを登録してスケジューラを起動"""
+    global _scheduler
+    if settings.SCHEDULER_ENABLED and _scheduler is None:
+        _scheduler = Scheduler()
+        register(_scheduler)
+        _scheduler.start()
+    return _scheduler
+
+
+def stop_scheduler():
+    global _scheduler
+    if _scheduler is not None:
+        _scheduler.stop()
+        _scheduler = None
+
+
+def recent_runs(limit: int = 50) -> List[JobRun]:
+    """最近の実行履歴（新しい順。リクエストの教室によらず既定の教室の DB から読む）"""
+    with SessionLocal() as db:
+        return (
+            db.query(JobRun)
+            .order_by(JobRun.started_at.desc(), JobRun.id.desc())
+            .limit(limit)
+            .all()
+        )
@@ -0,0 +1,207 @@
+"""
+年度アーカイブ
+終了した年度（4月〜翌3月）の grades / attendance を
+grades_archive / attendance_archive に移し、
+普段の問い合わせが見る通常テーブルを今の年度分だけに保つ
+
+問い合わせは期間の開始日がアーカイブ済みの年度にかかるときだけ、
+通常テーブルとアーカイブを UNION ALL した副問い合わせ（同じ ORM クラスの別名）を使う
+期間を指定しない問い合わせは通常テーブルのみを見る（全期間は include_archive=True）
+
+移動は年度単位で1トランザクション。移動前後の件数と内容のダイジェストを比べ、
+一致しなければ巻き戻す。ダイジェストは archived_years に残し、後から検証できる
+"""
+
+import hashlib
+from datetime import date, datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import delete, func, insert, select, union_all
+from sqlalchemy.orm import Session, aliased
+
+from app.models.archive import ArchivedYear, attendance_archive, grades_archive
+from app.models.attendance import Attendance
+from app.models.grade import Grade
+
+# (ORM クラス, アーカイブテーブル, archived_years の件数列名)
+_TABLES = (
+    (Grade, grades_archive, "grades"),
+    (Attendance, attendance_archive, "attendance"),
+)
+
+# ダイジェストに含めない列
+_UNHASHED_COLUMNS = {"batch_id"}
+
+
+def academic_year(d: date) -> int:
+    """年度（4月始まり）"""
+    return d.year if d.month >= 4 else d.year - 1
+
+
+def academic_year_range(year: int) -> Tuple[date, date]:
+    """年度の初日と最終日"""
+    return date(year, 4, 1), date(year + 1, 3, 31)
+
+
+def archived_until(db: Session) -> Optional[date]:
+    """
+    アーカイブ済みの最新年度の最終日（なければ None）
+    scripts/archive_year.py など別のプロセスで移動した年度も反映するよう毎回問い合わせる
+    （archived_years は年度ごとに1行だけの小さな表）
+    """
+    return db.scalar(select(func.max(ArchivedYear.end_date)))
+
+
+def spans_archive(db: Session, date_from: Optional[date]) -> bool:
+    """期間の開始日がアーカイブ済みの年度にかかるか"""
+    if date_from is None:
+        return False
+    until = archived_until(db)
+    return until is not None and date_from <= until
+
+
+def _with_archive(model, archive, name: str):
+    combined = union_all(select(model.__table__), select(archive)).subquery(name)
+    return aliased(model, combined, name=name)
+
+
+def grade_entity(db: Session, date_from: Optional[date] = None):
+    """
+    成績の問い合わせに使うエンティティ
+    date_from がアーカイブ済みの年度にかかれば通常テーブル＋アーカイブ、
+    そうでなければ Grade
+    （どちらも Grade.student_id などと同じ属性で条件を書ける）
+    """
+    if spans_archive(db, date_from):
+        return _with_archive(Grade, grades_archive, "grades_all")
+    return Grade
+
+
+def attendance_entity(db: Session, date_from: Optional[date] = None):
+    """出席の問い合わせに使うエンティティ（grade_entity と同じ規則）"""
+    if spans_archive(db, date_from):
+        return _with_archive(Attendance, attendance_archive, "attendance_all")
+    return Attendance
+
+
+def _digest(db: Session, source, start: date, end: date) -> Tuple[int, str]:
+    """期間内の行の件数と、全列を id 順に並べた SHA-256"""
+    hasher = hashlib.sha256()
+    count = 0
+    # 取込の管理用の列は含めない（列の追加前に記録したダイジェストと比べられるように）
+    columns = [c for c in source.c if c.name not in _UNHASHED_COLUMNS]
+    rows = db.execute(
+        select(*columns)
+        .where(source.c.date >= start, source.c.date <= end)
+        .order_by(source.c.id)
+        .execution_options(yield_per=10000)
+    )
+    for row in rows:
+        hasher.update(repr(tuple(row)).encode("utf-8"))
+        count += 1
+    return count, hasher.hexdigest()
+
+
+def archive_year(db: Session, year: int) -> dict:
+    """
+    年度の記録をアーカイブへ移動して検証（アーカイブ済みの年度なら後から入った分を追加で移動）
+
+    Returns:
+        {"academic_year", "grades": 今回移動した成績数,
+         "attendance": 今回移動した出席数,
+         "total_grades", "total_attendance": アーカイブ内の件数}
+
+    Raises:
+        ValueError: 終了していない年度、または移動後の検証に失敗した
+    """
+    if year >= academic_year(date.today()):
+        raise ValueError(f"{year}年度はまだ終了していません")
+    start, end = academic_year_range(year)
+
+    record = db.get(ArchivedYear, year)
+    values = {
+        "academic_year": year, "start_date": start, "end_date": end,
+        "archived_at": datetime.now(),
+    }
+    moved = {}
+    try:
+        for model, archive, key in _TABLES:
+            hot = model.__table__
+            combined = union_all(select(hot), select(archive)).subquery()
+            expected = _digest(db, combined, start, end)
+
+            in_range = (hot.c.date >= start, hot.c.date <= end)
+            moved[key] = db.execute(
+                insert(archive).from_select(
+                    list(hot.c.keys()), select(hot).where(*in_range)
+                )
+            ).rowcount
+            db.execute(delete(hot).where(*in_range))
+
+            actual = _digest(db, archive, start, end)
+            remaining = db.scalar(
+                select(func.count()).select_from(hot).where(*in_range)
+            )
+            if actual != expected or remaining:
+                raise ValueError(
+                    f"{key} の移動結果が一致しません"
+                    f"（移動前 {expected[0]} 件 / 移動後 {actual[0]} 件）"
+                )
+            values[key] = actual[0]
+            values[f"{key}_digest"] = actual[1]
+
+        if record is None:
+            db.add(ArchivedYear(**values))
+        else:
+            for name, value in values.items():
+                setattr(record, name, value)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    return {
+        "academic_year": year,
+        "grades": moved["grades"],
+        "attendance": moved["attendance"],
+        "total_grades": values["grades"],
+        "total_attendance": values["attendance"],
+    }
+
+
+def verify_archive(db: Session, year: int) -> List[str]:
+    """
+    アーカイブ済みの年度を検証
+
+    Returns:
+        問題点のリスト（空なら正常）
+    """
+    record = db.get(ArchivedYear, year)
+    if record is None:
+        return [f"{year}年度はアーカイブされていません"]
+
+    problems = []
+    for model, archive, key in _TABLES:
+        count, digest = _digest(db, archive, record.start_date, record.end_date)
+        if count != getattr(record, key):
+            problems.append(
+                f"{key}: アーカイブの件数 {count} 件が"
+                f"記録 {getattr(record, key)} 件と一致しません"
+            )
+        elif digest != getattr(record, f"{key}_digest"):
+            problems.append(f"{key}: アーカイブの内容がアーカイブ時から変わっています")
+        hot = model.__table__
+        remaining = db.scalar(
+            select(func.count()).select_from(hot)
+            .where(hot.c.date >= record.start_date, hot.c.date <= record.end_date)
+        )
+        if remaining:
+            problems.append(
+                f"{key}: 通常テーブルに {year}年度の記録が {remaining} 件残っています"
+                "（再度アーカイブしてください）"
+            )
+    return problems
+
+
+def list_archives(db: Session) -> List[ArchivedYear]:
+    return db.query(ArchivedYear).order_by(ArchivedYear.academic_year).all()
@@ -0,0 +1,360 @@
+"""
+出欠の圧縮表現（生徒×学期の2ビット配列）とビット演算による集計
+状態は整数コード（1=出席, 2=欠席, 3=遅刻, 0=記録なし）にして、学期初日からの日数の位置に
+2ビットずつ詰め、Python の整数として扱う
+
+各位置の下位ビットを lo、上位ビットを hi とすると
+    出席 = lo & ~hi、欠席 = hi & ~lo、遅刻 = lo & hi、記録あり = lo | hi
+になり、件数は bit_count、連続出席は欠席・遅刻の位置の間にある出席の数で求まる
+生徒1人の集計は学期の数（年3行）の整数演算で済み、記録の件数にはほぼ依存しない
+アーカイブ済みの年度の出欠もこの表には残るので、集計は全期間を対象にする
+
+1日は1つの位置なので、同じ生徒の同じ日に複数の記録（講座の移動などで別の講座の
+記録がある）があれば、重い状態を採る（欠席 > 遅刻 > 出席）。記録の順序によらず
+同じ値になるので、全件の再構築と記録ごとの更新の結果が一致する
+
+attendance の行は従来どおり残し、出欠を記録する処理が同じトランザクションで
+この表も更新する
+"""
+
+import logging
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.models.attendance_bitmap import AttendanceBitmap
+from app.models.student import Student
+from app.services.archive import attendance_entity
+
+logger = logging.getLogger(__name__)
+
+STATUS_CODES = {"出席": 1, "欠席": 2, "遅刻": 3}
+CODE_STATUSES = {code: status for status, code in STATUS_CODES.items()}
+# 同じ日に複数の記録があるときの優先度（大きいほうを採る）
+_SEVERITY = {0: 0, 1: 1, 3: 2, 2: 3}
+
+
+def term_of(d: date) -> Tuple[str, date]:
+    """
+    日付の学期（1学期 4〜7月、2学期 8〜12月、3学期 1〜3月）
+
+    Returns:
+        ("年度-学期", 学期の初日)
+    """
+    if d.month >= 8:
+        return f"{d.year}-2", date(d.year, 8, 1)
+    if d.month >= 4:
+        return f"{d.year}-1", date(d.year, 4, 1)
+    return f"{d.year - 1}-3", date(d.year, 1, 1)
+
+
+# ---- ビット演算 ----
+
+def _low_mask(bits: int) -> int:
+    """bits の全位置を覆う 0b0101...01（各位置の下位ビット）"""
+    slots = (bits.bit_length() + 1) // 2
+    return ((1 << (2 * slots)) - 1) // 3
+
+
+def _planes(bits: int) -> Tuple[int, int, int, int]:
+    """(出席, 欠席, 遅刻, 記録あり) のマスク（各位置の下位ビットに立つ）"""
+    mask = _low_mask(bits)
+    lo = bits & mask
+    hi = (bits >> 1) & mask
+    return lo & ~hi, hi & ~lo, lo & hi, lo | hi
+
+
+def set_code(bits: int, slot: int, code: int) -> int:
+    """slot 番目の状態コードを書き換えた値を返す"""
+    shift = 2 * slot
+    return (bits & ~(3 << shift)) | (code << shift)
+
+
+def get_code(bits: int, slot: int) -> int:
+    return (bits >> (2 * slot)) & 3
+
+
+def worse_code(current: int, code: int) -> int:
+    """同じ日の2つの状態コードのうち採るほう（欠席 > 遅刻 > 出席 > 記録なし）"""
+    return code if _SEVERITY[code] > _SEVERITY[current] else current
+
+
+def _to_bytes(bits: int) -> bytes:
+    return bits.to_bytes((bits.bit_length() + 7) // 8, "little")
+
+
+def _from_bytes(data: bytes) -> int:
+    return int.from_bytes(data, "little")
+
+
+def summarize_bitmaps(bitmaps: Iterable[bytes]) -> dict:
+    """
+    学期の古い順に並んだ配列から出席状況を集計
+
+    Returns:
+        {"present", "absent", "late", "total", "rate": 出席率,
+         "current_streak": 直近の連続出席回数, "longest_streak": 最長の連続出席回数}
+    """
+    present = absent = late = total = 0
+    run = longest = 0
+    for data in bitmaps:
+        p, a, tardy, recorded = _planes(_from_bytes(data))
+        present += p.bit_count()
+        absent += a.bit_count()
+        late += tardy.bit_count()
+        total += recorded.bit_count()
+
+        # 欠席・遅刻の位置で連続出席が途切れる（記録のない日は飛ばす）
+        breaks = a | tardy
+        while breaks:
+            lowest = breaks & -breaks
+            run += (p & (lowest - 1)).bit_count()
+            longest = max(longest, run)
+            run = 0
+            p &= ~((lowest << 1) - 1)
+            breaks ^= lowest
+        run += p.bit_count()
+        longest = max(longest, run)
+
+    return {
+        "present": present,
+        "absent": absent,
+        "late": late,
+        "total": total,
+        "rate": round(present * 100 / total) if total else 0,
+        "current_streak": run,
+        "longest_streak": longest,
+    }
+
+
+def _column_counts(masks: Iterable[int]) -> List[int]:
+    """
+    マスクを位置ごとに足し合わせる（ビットスライスの加算器）
+    戻り値の i 番目の整数が、各位置の人数の 2^i の桁を持つ
+    """
+    planes: List[int] = []
+    for carry in masks:
+        i = 0
+        while carry:
+            if i == len(planes):
+                planes.append(0)
+            planes[i], carry = planes[i] ^ carry, planes[i] & carry
+            i += 1
+    return planes
+
+
+def _count_at(planes: List[int], shift: int) -> int:
+    return sum(((plane >> shift) & 1) << i for i, plane in enumerate(planes))
+
+
+# ---- 読み取り ----
+
+def get_attendance_summary(db: Session, student_id: str) -> dict:
+    """生徒の出席状況（学期ごとの配列を読むだけで attendance は走査しない）"""
+    rows = db.scalars(
+        select(AttendanceBitmap.bits)
+        .where(AttendanceBitmap.student_id == student_id)
+        .order_by(AttendanceBitmap.start_date)
+    )
+    return summarize_bitmaps(rows)
+
+
+def class_absence_heatmap(
+    db: Session, class_id: str, term: Optional[str] = None
+) -> dict:
+    """
+    講座の授業日ごとの欠席・遅刻人数（学期単位）
+
+    Args:
+        db: DB セッション
+        class_id: 講座ID（所属生徒の出欠を集計）
+        term: "年度-学期"（省略時は記録のある最新の学期）
+
+    Returns:
+        {"term": 学期, "terms": 選択可能な学期, "students": 生徒数,
+         "days": [{"date", "recorded", "absent", "late", "absent_rate"}, ...]}
+    """
+    members = select(Student.id).where(Student.class_id == class_id)
+    terms = list(db.scalars(
+        select(AttendanceBitmap.term)
+        .where(AttendanceBitmap.student_id.in_(members))
+        .group_by(AttendanceBitmap.term)
+        .order_by(func.min(AttendanceBitmap.start_date).desc())
+    ))
+    result = {"term": term, "terms": terms, "students": 0, "days": []}
+    if term is None:
+        if not terms:
+            return result
+        term = result["term"] = terms[0]
+
+    rows = db.execute(
+        select(AttendanceBitmap.start_date, AttendanceBitmap.bits)
+        .where(AttendanceBitmap.student_id.in_(members), AttendanceBitmap.term == term)
+    ).all()
+    if not rows:
+        return result
+
+    start_date = rows[0][0]
+    planes = [_planes(_from_bytes(bits)) for _, bits in rows]
+    absent = _column_counts(p[1] for p in planes)
+    late = _column_counts(p[2] for p in planes)
+    recorded = _column_counts(p[3] for p in planes)
+
+    any_recorded = 0
+    for p in planes:
+        any_recorded |= p[3]
+    days = []
+    while any_recorded:
+        lowest = any_recorded & -any_recorded
+        shift = lowest.bit_length() - 1
+        count = _count_at(recorded, shift)
+        absent_count = _count_at(absent, shift)
+        days.append({
+            "date": start_date + timedelta(days=shift // 2),
+            "recorded": count,
+            "absent": absent_count,
+            "late": _count_at(late, shift),
+            "absent_rate": round(absent_count * 100 / count),
+        })
+        any_recorded ^= lowest
+
+    result["students"] = len(rows)
+    result["days"] = days
+    return result
+
+
+# ---- 書き込み ----
+
+def apply_attendance(db: Session, days: Iterable[Tuple[str, date]]):
+    """
+    出欠を書き込んだ生徒・日の状態を学期ごとの配列に反映
+    attendance への書き込みの後、同じトランザクション内で呼ぶ（コミットはしない）
+    その日の記録をすべて読み直すので、他の講座の記録があっても重い状態になる
+
+    Args:
+        days: (生徒ID, 日付) の並び
+    """
+    days = set(days)
+    if not days:
+        return
+    source = attendance_entity(db, min(d for _, d in days))
+    codes: Dict[Tuple[str, date], int] = defaultdict(int)
+    for student_id, target_date, status in db.execute(
+        select(source.student_id, source.date, source.status)
+        .where(
+            source.student_id.in_({student_id for student_id, _ in days}),
+            source.date.in_({target_date for _, target_date in days}),
+            source.status.in_(STATUS_CODES),
+        )
+    ):
+        key = (student_id, target_date)
+        codes[key] = worse_code(codes[key], STATUS_CODES[status])
+
+    changes: Dict[Tuple[str, str], list] = defaultdict(list)
+    starts: Dict[str, date] = {}
+    for student_id, target_date in days:
+        term, start = term_of(target_date)
+        starts[term] = start
+        slot = (target_date - start).days
+        changes[(student_id, term)].append((slot, codes[(student_id, target_date)]))
+
+    student_ids = {student_id for student_id, _ in changes}
+    existing = {
+        (student_id, term): bits
+        for student_id, term, bits in db.execute(
+            select(
+                AttendanceBitmap.student_id,
+                AttendanceBitmap.term,
+                AttendanceBitmap.bits,
+            )
+            .where(
+                AttendanceBitmap.student_id.in_(student_ids),
+                AttendanceBitmap.term.in_(starts),
+            )
+        )
+    }
+
+    new_rows = []
+    changed_rows = []
+    for (student_id, term), slots in changes.items():
+        data = existing.get((student_id, term))
+        bits = _from_bytes(data) if data is not None else 0
+        for slot, code in slots:
+            bits = set_code(bits, slot, code)
+        row = {
+            "student_id": student_id,
+            "term": term,
+            "bits": _to_bytes(bits),
+            "recorded": _planes(bits)[3].bit_count(),
+        }
+        if data is None:
+            new_rows.append({**row, "start_date": starts[term]})
+        else:
+            changed_rows.append(row)
+
+    if new_rows:
+        db.execute(insert(AttendanceBitmap), new_rows)
+    if changed_rows:
+        db.execute(update(AttendanceBitmap), changed_rows)
+
+
+def rebuild_attendance_bitmaps(db: Session) -> int:
+    """
+    attendance から配列を全件作り直す（既存DBへの導入時や不整合時）
+
+    Returns:
+        作成した行数（生徒×学期）
+    """
+    db.execute(delete(AttendanceBitmap))
+    bitmaps: Dict[Tuple[str, str], list] = {}
+    source = attendance_entity(db, date.min)
+    rows = db.execute(
+        select(source.student_id, source.date, source.status)
+        .where(source.status.in_(STATUS_CODES))
+        .execution_options(yield_per=10000)
+    )
+    for student_id, target_date, status in rows:
+        term, start = term_of(target_date)
+        entry = bitmaps.setdefault((student_id, term), [start, 0])
+        slot = (target_date - start).days
+        code = worse_code(get_code(entry[1], slot), STATUS_CODES[status])
+        entry[1] = set_code(entry[1], slot, code)
+
+    values = [
+        {
+            "student_id": student_id,
+            "term": term,
+            "start_date": start,
+            "bits": _to_bytes(bits),
+            "recorded": _planes(bits)[3].bit_count(),
+        }
+        for (student_id, term), (start, bits) in bitmaps.items()
+    ]
+    if values:
+        db.execute(insert(AttendanceBitmap), values)
+    db.commit()
+    return len(values)
+
+
+def ensure_attendance_bitmaps(engine: Engine):
+    """起動時に記録日数が attendance と合わなければ再構築"""
+    with Session(engine) as db:
+        recorded = db.scalar(
+            select(func.coalesce(func.sum(AttendanceBitmap.recorded), 0))
+        )
+        source = attendance_entity(db, date.min)
+        expected = db.scalar(
+            select(func.count()).select_from(
+                select(source.student_id, source.date)
+                .where(source.status.in_(STATUS_CODES))
+                .distinct()
+                .subquery()
+            )
+        )
+        if recorded != expected:
+            count = rebuild_attendance_bitmaps(db)
+            logger.info("Attendance bitmaps rebuilt: %d student terms", count)
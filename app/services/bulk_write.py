@@ -0,0 +1,225 @@
+"""
+一括書き込み（PostgreSQL では COPY と ON CONFLICT を使う）
+SQLite など他の DB では従来どおり executemany の INSERT / UPDATE を使う
+
+PostgreSQL（psycopg2 / psycopg 3）での動作
+    bulk_insert  COPY ... FROM STDIN（CSV 形式）で1回で流し込む
+    bulk_update  書き込む列だけの一時テーブルへ COPY し、UPDATE ... FROM の1文で
+                 書き換える
+    upsert       同じく一時テーブルへ COPY し、INSERT ... SELECT ... ON CONFLICT
+                 DO UPDATE ... RETURNING の1文で、追加か更新かも同じ文で受け取る
+
+COPY は ORM を通らないので、Python 側の列の既定値（Grade.max_total = 100 など）は
+行に補い、変更したテーブルは mark_tables_changed で記録する
+（コミット時にデータバージョンが進む）
+session.execute も通らないので、書き込んだ行から派生データを作るもの（生徒検索の
+インデックスなど）は listen_bulk_write で登録した関数で受け取る
+"""
+
+import csv
+import io
+import itertools
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Set
+
+from sqlalchemy import insert, literal_column, select, text, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app.data_version import mark_tables_changed
+
+# IN 句1回あたりの件数（PostgreSQL 以外で既存の行を調べるとき）
+_IN_CHUNK = 500
+
+_COPY_DRIVERS = ("psycopg2", "psycopg")
+
+# 一時テーブル名の連番
+_temp_ids = itertools.count()
+
+# テーブル名 → COPY で書き込んだ後に呼ぶ関数 fn(db, rows)
+_listeners: Dict[str, List[Callable]] = defaultdict(list)
+
+
+def listen_bulk_write(table_name: str):
+    """
+    COPY で table_name に書き込んだ後（同じトランザクション内）に呼ぶ関数を登録する
+    デコレーター。rows は書き込んだ行（bulk_update は主キーと書き込んだ列だけ）
+    COPY を使わない場合は session.execute の do_orm_execute で受け取ること
+    """
+    def decorator(fn: Callable):
+        _listeners[table_name].append(fn)
+        return fn
+
+    return decorator
+
+
+def _copied(db: Session, table, rows: List[dict]):
+    """COPY で書き込んだことを記録し、登録した関数を呼ぶ"""
+    mark_tables_changed(db, table.name)
+    for fn in _listeners.get(table.name, ()):
+        fn(db, rows)
+
+
+def copy_supported(db: Session) -> bool:
+    """COPY を使えるか（PostgreSQL かつ psycopg2 / psycopg 3）"""
+    dialect = db.get_bind().dialect
+    return dialect.name == "postgresql" and dialect.driver in _COPY_DRIVERS
+
+
+def _defaults(table) -> Dict[str, object]:
+    """Python 側の列の既定値（INSERT なら SQLAlchemy が補う値）"""
+    defaults = {}
+    for column in table.columns:
+        if column.default is None:
+            continue
+        if column.default.is_scalar:
+            defaults[column.key] = column.default.arg
+        elif column.default.is_callable:
+            defaults[column.key] = column.default.arg(None)
+    return defaults
+
+
+def _insert_columns(table, rows: List[dict]) -> List[str]:
+    """追加する行の列（行にある列と、既定値のある列）"""
+    columns = list(dict.fromkeys(key for row in rows for key in row))
+    return columns + [key for key in _defaults(table) if key not in columns]
+
+
+def _copy(db: Session, table_name: str, columns: List[str], rows):
+    """
+    行（値のタプル）を COPY FROM STDIN で書き込む
+    NULL は引用符なしの空欄、文字列は引用符付き
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, quoting=csv.QUOTE_NOTNULL, lineterminator="\n")
+    writer.writerows(rows)
+
+    dialect = db.get_bind().dialect
+    quote = dialect.identifier_preparer.quote
+    column_list = ", ".join(map(quote, columns))
+    sql = f"COPY {quote(table_name)} ({column_list}) FROM STDIN WITH (FORMAT csv)"
+    dbapi_connection = db.connection().connection.driver_connection
+    with dbapi_connection.cursor() as cursor:
+        if dialect.driver == "psycopg2":
+            buffer.seek(0)
+            cursor.copy_expert(sql, buffer)
+        else:
+            with cursor.copy(sql) as copy:
+                copy.write(buffer.getvalue())
+
+
+@contextmanager
+def _staged(db: Session, table, columns: List[str], rows: List[dict]):
+    """行を table と同じ型の一時テーブルへ COPY し、その名前を渡す（抜けると削除）"""
+    quote = db.get_bind().dialect.identifier_preparer.quote
+    defaults = _defaults(table)
+    temp = f"_bulk_{table.name}_{next(_temp_ids)}"
+    db.execute(text(
+        f"CREATE TEMP TABLE {temp} AS SELECT {', '.join(map(quote, columns))} "
+        f"FROM {quote(table.name)} WITH NO DATA"
+    ))
+    try:
+        values = ([row.get(c, defaults.get(c)) for c in columns] for row in rows)
+        _copy(db, temp, columns, values)
+        yield temp
+    finally:
+        db.execute(text(f"DROP TABLE IF EXISTS {temp}"))
+
+
+def bulk_insert(db: Session, model, rows: List[dict]):
+    """行をまとめて追加（PostgreSQL は COPY。コミットは呼び出し側）"""
+    if not rows:
+        return
+    if not copy_supported(db):
+        db.execute(insert(model), rows)
+        return
+
+    table = model.__table__
+    defaults = _defaults(table)
+    columns = _insert_columns(table, rows)
+    values = ([row.get(c, defaults.get(c)) for c in columns] for row in rows)
+    _copy(db, table.name, columns, values)
+    _copied(db, table, rows)
+
+
+def bulk_update(db: Session, model, rows: List[dict]) -> None:
+    """
+    主キーを含む行でまとめて更新（rows はすべて同じ列を持つこと。コミットは呼び出し側）
+    PostgreSQL は一時テーブルへの COPY と UPDATE ... FROM の1文
+    """
+    if not rows:
+        return
+    if not copy_supported(db):
+        db.execute(update(model), rows)
+        return
+
+    table = model.__table__
+    quote = db.get_bind().dialect.identifier_preparer.quote
+    keys = [c.name for c in table.primary_key.columns]
+    columns = list(rows[0])
+    assignments = ", ".join(
+        f"{quote(c)} = s.{quote(c)}" for c in columns if c not in keys
+    )
+    matches = " AND ".join(f"d.{quote(k)} = s.{quote(k)}" for k in keys)
+    with _staged(db, table, columns, rows) as temp:
+        db.execute(text(
+            f"UPDATE {quote(table.name)} AS d SET {assignments} "
+            f"FROM {temp} AS s WHERE {matches}"
+        ))
+    _copied(db, table, rows)
+
+
+def upsert(db: Session, model, rows: List[dict]) -> Set:
+    """
+    主キーが同じ行があれば渡した列で上書きし、なければ追加（コミットは呼び出し側）
+    PostgreSQL は INSERT ... ON CONFLICT DO UPDATE（xmax = 0 の行が追加した行）
+    rows はすべて同じ列を持つこと（上書きするのは rows[0] の列）
+
+    Returns:
+        追加した行の主キーの集合
+    """
+    if not rows:
+        return set()
+    table = model.__table__
+    key = list(table.primary_key.columns)[0]
+    overwrite = [c for c in rows[0] if c != key.key]
+
+    if copy_supported(db):
+        quote = db.get_bind().dialect.identifier_preparer.quote
+        columns = _insert_columns(table, rows)
+        column_list = ", ".join(map(quote, columns))
+        assignments = ", ".join(f"{quote(c)} = EXCLUDED.{quote(c)}" for c in overwrite)
+        with _staged(db, table, columns, rows) as temp:
+            result = db.execute(text(
+                f"INSERT INTO {quote(table.name)} ({column_list}) "
+                f"SELECT {column_list} FROM {temp} "
+                f"ON CONFLICT ({quote(key.name)}) DO UPDATE SET {assignments} "
+                f"RETURNING {quote(key.name)}, xmax = 0"
+            ))
+            created = {pk for pk, inserted in result if inserted}
+        _copied(db, table, rows)
+        return created
+
+    if db.get_bind().dialect.name == "postgresql":
+        # COPY の使えないドライバー: executemany
+        # （SQLAlchemy が複数行の VALUES にまとめて送る）
+        stmt = pg_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[key], set_={c: stmt.excluded[c] for c in overwrite},
+        ).returning(key, literal_column("xmax = 0"))
+        created = {pk for pk, inserted in db.execute(stmt, rows) if inserted}
+        mark_tables_changed(db, table.name)
+        return created
+
+    ids = [row[key.key] for row in rows]
+    existing = set()
+    for i in range(0, len(ids), _IN_CHUNK):
+        existing.update(db.scalars(select(key).where(key.in_(ids[i:i + _IN_CHUNK]))))
+    new_rows = [row for row in rows if row[key.key] not in existing]
+    updated_rows = [row for row in rows if row[key.key] in existing]
+    if new_rows:
+        db.execute(insert(model), new_rows)
+    if updated_rows:
+        db.execute(update(model), updated_rows)
+    return {row[key.key] for row in new_rows}
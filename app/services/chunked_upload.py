@@ -0,0 +1,263 @@
+"""
+CSV の分割・再開可能アップロード
+セッションを作成 → バイト範囲ごとに PUT（チャンクの SHA-256 を検証）
+→ 受信済みオフセットを問い合わせて再開 → 確定
+受信したチャンクはディスクに追記しながら NewFormatCsvParser に流し、
+最後のチャンクが届いた時点で解析を終えている
+
+受信済みの位置は保存ファイルのサイズそのもの。
+プロセスが再起動した場合や別ワーカーに届いた場合は保存ファイルを読み直して解析状態を作り直す
+"""
+
+import hashlib
+import json
+import os
+import re
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.services.csv_importer import NewFormatCsvParser
+
+# クライアントに勧めるチャンクサイズと、受け付ける上限
+CHUNK_SIZE = 1024 * 1024
+MAX_CHUNK_SIZE = 8 * 1024 * 1024
+MAX_UPLOAD_SIZE = 100 * 1024 * 1024
+# 確定されないまま放置されたセッションの保持時間（秒）
+SESSION_TTL_SECONDS = 24 * 60 * 60
+
+_CONTENT_RANGE = re.compile(r"bytes (\d+)-(\d+)/(\d+)")
+_UPLOAD_ID = re.compile(r"[0-9a-f]{32}")
+
+_sessions: Dict[str, "UploadSession"] = {}
+
+
+class OffsetMismatch(ValueError):
+    """チャンクの開始位置が受信済みの位置と合わない（クライアントはオフセットを問い合わせて再送する）"""
+
+    def __init__(self, offset: int):
+        super().__init__(f"受信済みの位置（{offset} バイト）から送信してください")
+        self.offset = offset
+
+
+class UploadSession:
+    def __init__(
+        self,
+        upload_id: str,
+        filename: str,
+        size: int,
+        sha256: Optional[str],
+        created_at: float,
+    ):
+        self.id = upload_id
+        self.filename = filename
+        self.size = size
+        self.sha256 = sha256
+        self.created_at = created_at
+        self.offset = 0
+        self.parser = NewFormatCsvParser()
+        self.hasher = hashlib.sha256()
+
+    @property
+    def data_path(self) -> str:
+        return os.path.join(settings.UPLOAD_SPOOL_DIR, f"{self.id}.part")
+
+    @property
+    def meta_path(self) -> str:
+        return os.path.join(settings.UPLOAD_SPOOL_DIR, f"{self.id}.json")
+
+    @property
+    def complete(self) -> bool:
+        return self.offset == self.size
+
+    def status(self) -> dict:
+        return {
+            "upload_id": self.id,
+            "offset": self.offset,
+            "size": self.size,
+            "complete": self.complete,
+        }
+
+    def _replay(self):
+        """保存ファイルを先頭から読み直して解析状態を作り直す"""
+        self.parser = NewFormatCsvParser()
+        self.hasher = hashlib.sha256()
+        self.offset = 0
+        if not os.path.exists(self.data_path):
+            return
+        with open(self.data_path, "rb") as f:
+            while True:
+                data = f.read(CHUNK_SIZE)
+                if not data:
+                    break
+                self.parser.feed(data)
+                self.hasher.update(data)
+                self.offset += len(data)
+
+    def sync(self):
+        """他のプロセスが追記していたら読み直す"""
+        on_disk = (
+            os.path.getsize(self.data_path) if os.path.exists(self.data_path) else 0
+        )
+        if on_disk != self.offset:
+            self._replay()
+
+
+def create_session(
+    filename: str, size: int, sha256: Optional[str] = None
+) -> UploadSession:
+    """アップロードセッションを作成"""
+    if size < 0 or size > MAX_UPLOAD_SIZE:
+        limit_mb = MAX_UPLOAD_SIZE // (1024 * 1024)
+        raise ValueError(f"ファイルサイズは {limit_mb}MB までです")
+    os.makedirs(settings.UPLOAD_SPOOL_DIR, exist_ok=True)
+    session = UploadSession(
+        uuid.uuid4().hex,
+        filename,
+        size,
+        sha256.lower() if sha256 else None,
+        time.time(),
+    )
+    with open(session.meta_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "filename": filename,
+            "size": size,
+            "sha256": session.sha256,
+            "created_at": session.created_at,
+        }, f)
+    open(session.data_path, "wb").close()
+    _sessions[session.id] = session
+    return session
+
+
+def get_session(upload_id: str) -> UploadSession:
+    """セッションを取得（このプロセスになければ保存ファイルから復元）"""
+    session = _sessions.get(upload_id)
+    if session is None:
+        if not _UPLOAD_ID.fullmatch(upload_id):
+            raise KeyError(upload_id)
+        meta_path = os.path.join(settings.UPLOAD_SPOOL_DIR, f"{upload_id}.json")
+        if not os.path.exists(meta_path):
+            raise KeyError(upload_id)
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        session = UploadSession(
+            upload_id,
+            meta["filename"],
+            meta["size"],
+            meta["sha256"],
+            meta["created_at"],
+        )
+        session._replay()
+        _sessions[upload_id] = session
+    else:
+        session.sync()
+    return session
+
+
+def parse_content_range(header: Optional[str]) -> Tuple[int, int, int]:
+    """Content-Range: bytes start-end/total を (start, end（含む）, total) にする"""
+    match = _CONTENT_RANGE.fullmatch((header or "").strip())
+    if not match:
+        raise ValueError(
+            "Content-Range ヘッダーが必要です（例: bytes 0-1048575/5242880）"
+        )
+    start, end, total = (int(v) for v in match.groups())
+    if end < start:
+        raise ValueError("Content-Range の範囲が正しくありません")
+    return start, end, total
+
+
+def append_chunk(
+    session: UploadSession, content_range: str, checksum: Optional[str], data: bytes
+) -> int:
+    """
+    チャンクを検証して追記し、受信済みオフセットを返す
+
+    受信済みの範囲を再送してきた場合（応答が届かず再試行したなど）は何もせず現在位置を返す
+
+    Raises:
+        ValueError: 範囲・サイズ・チェックサムが正しくない
+        OffsetMismatch: 開始位置が受信済みの位置と合わない
+    """
+    start, end, total = parse_content_range(content_range)
+    if total != session.size or end >= session.size:
+        raise ValueError("Content-Range がファイルサイズと一致しません")
+    if len(data) != end - start + 1:
+        raise ValueError("Content-Range とチャンクの長さが一致しません")
+    if len(data) > MAX_CHUNK_SIZE:
+        raise ValueError(f"チャンクは {MAX_CHUNK_SIZE // (1024 * 1024)}MB までです")
+    if not checksum:
+        raise ValueError("X-Chunk-SHA256 ヘッダーが必要です")
+    if hashlib.sha256(data).hexdigest() != checksum.strip().lower():
+        raise ValueError("チャンクのチェックサムが一致しません。再送してください")
+
+    if end < session.offset:
+        return session.offset
+    if start != session.offset:
+        raise OffsetMismatch(session.offset)
+
+    try:
+        session.parser.feed(data)
+    except UnicodeDecodeError:
+        discard_session(session)
+        raise ValueError("ファイルの文字コードが UTF-8 ではありません")
+    with open(session.data_path, "ab") as f:
+        f.write(data)
+    session.hasher.update(data)
+    session.offset += len(data)
+    return session.offset
+
+
+def finalize_session(session: UploadSession) -> Tuple[List[Dict], List[Dict]]:
+    """
+    受信を確定して解析結果を返す（保存ファイルは削除）
+
+    Returns:
+        (students_list, grades_list) のタプル
+    """
+    if not session.complete:
+        raise OffsetMismatch(session.offset)
+    if session.sha256 and session.hasher.hexdigest() != session.sha256:
+        discard_session(session)
+        raise ValueError(
+            "ファイル全体のチェックサムが一致しません。もう一度アップロードしてください"
+        )
+    try:
+        return session.parser.close()
+    finally:
+        discard_session(session)
+
+
+def discard_session(session: UploadSession):
+    _sessions.pop(session.id, None)
+    for path in (session.data_path, session.meta_path):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def purge_expired_sessions() -> int:
+    """期限切れのセッションと保存ファイルを削除して件数を返す"""
+    if not os.path.isdir(settings.UPLOAD_SPOOL_DIR):
+        return 0
+    now = time.time()
+    count = 0
+    for name in os.listdir(settings.UPLOAD_SPOOL_DIR):
+        if not name.endswith(".json"):
+            continue
+        upload_id = name[:-len(".json")]
+        paths = [
+            os.path.join(settings.UPLOAD_SPOOL_DIR, name),
+            os.path.join(settings.UPLOAD_SPOOL_DIR, f"{upload_id}.part"),
+        ]
+        # 最後にチャンクを受信してからの経過時間で判断
+        last_activity = max(os.path.getmtime(p) for p in paths if os.path.exists(p))
+        if now - last_activity <= SESSION_TTL_SECONDS:
+            continue
+        _sessions.pop(upload_id, None)
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+        count += 1
+    return count
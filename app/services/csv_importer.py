@@ -3,14 +3,52 @@ CSV インポーター
 既存の uploadHandler.js の parseNewFormatCSV をPython化
 """
 
-from typing import List, Dict, Tuple
-from datetime import date
+import asyncio
+import codecs
 import csv
 import io
+import logging
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from app.models.student import Student
+
+from app.database import run_after_commit
+from app.db_writer import submit_write
+from app.events import publish_after_commit
 from app.models.grade import Grade
-from app.models.class_ import Class
+from app.models.import_batch import ImportBatch
+from app.models.student import Student
+from app.services.bulk_write import bulk_insert, bulk_update
+from app.services.grade_store import record_grades
+from app.services.import_batch import (
+    GRADE_COLUMNS,
+    STUDENT_COLUMNS,
+    finish_batch,
+    hash_entry,
+    record_priors,
+    record_row_hashes,
+    rollback_batch,
+    stamp_file_version,
+    start_batch,
+    value_digest,
+)
+from app.services.import_diff import (
+    STATUSES,
+    diff_import,
+    stale_grade_keys,
+    stale_student_keys,
+)
+
+logger = logging.getLogger(__name__)
+
+# 書き込みキュー経由の保存で、1つの書き込みジョブにまとめる成績の行数
+IMPORT_CHUNK_ROWS = 2000
+
+# 分割して保存する取込どうしは重ねない
+# （取消用の上書き前の値が取込ごとに正しく残るように）
+_import_lock = asyncio.Lock()
 
 
 def parse_csv_line(line: str) -> List[str]:
@@ -19,41 +57,71 @@ def parse_csv_line(line: str) -> List[str]:
     return next(reader)
 
 
-def parse_new_format_csv(csv_text: str) -> Tuple[List[Dict], List[Dict]]:
+class NewFormatCsvParser:
     """
-    新フォーマットCSVを解析（【生徒データ】【チェックテスト成績】セクション対応）
-
-    Returns:
-        (students_list, grades_list) のタプル
+    新フォーマットCSVの行単位パーサ（【生徒データ】【チェックテスト成績】セクション対応）
+    バイト列を少しずつ feed でき、分割アップロードの受信と並行して解析する
     """
-    lines = csv_text.strip().split('\n')
-
-    students = []
-    grades = []
-    current_section = None
-    student_header_index = -1
-    grade_header_index = -1
 
-    for i, line in enumerate(lines):
+    def __init__(self):
+        self.students: List[Dict] = []
+        self.grades: List[Dict] = []
+        self._section = None
+        self._student_header_seen = False
+        self._grade_header_seen = False
+        self._line_no = 0
+        self._pending = ""
+        self._decoder = codecs.getincrementaldecoder("utf-8-sig")()
+
+    def feed(self, data: bytes):
+        """受信したバイト列を解析（行の途中・文字の途中で切れていてもよい）"""
+        self.feed_text(self._decoder.decode(data))
+
+    def feed_text(self, text: str):
+        lines = (self._pending + text).split('\n')
+        self._pending = lines.pop()
+        for line in lines:
+            self.feed_line(line)
+
+    def close(self) -> Tuple[List[Dict], List[Dict]]:
+        """
+        残りを解析して結果を返す
+
+        Returns:
+            (students_list, grades_list) のタプル
+        """
+        self.feed_text(self._decoder.decode(b"", final=True))
+        if self._pending:
+            self.feed_line(self._pending)
+            self._pending = ""
+
+        if not self.students:
+            raise ValueError('【生徒データ】セクションが見つかるか、データが空です')
+
+        return self.students, self.grades
+
+    def feed_line(self, line: str):
+        i = self._line_no
+        self._line_no += 1
         line = line.strip()
 
         # セクション判別
         if line in ['【生徒データ】セクション', '【生徒データ】']:
-            current_section = 'students'
-            continue
+            self._section = 'students'
+            return
         elif line in ['【チェックテスト成績】セクション', '【チェックテスト成績】']:
-            current_section = 'grades'
-            continue
+            self._section = 'grades'
+            return
         elif not line:
-            continue
+            return
 
         # 生徒データセクション
-        if current_section == 'students':
-            if ',' in line and student_header_index == -1:
+        if self._section == 'students':
+            if ',' in line and not self._student_header_seen:
                 # ヘッダー行
-                student_header_index = i
-                continue
-            elif student_header_index != -1 and ',' in line:
+                self._student_header_seen = True
+                return
+            elif ',' in line:
                 # データ行
                 try:
                     values = parse_csv_line(line)
@@ -71,18 +139,17 @@ def parse_new_format_csv(csv_text: str) -> Tuple[List[Dict], List[Dict]]:
                             'target_university': values[9],
                             'target_dept': values[10]
                         }
-                        students.append(student)
+                        self.students.append(student)
                 except Exception as e:
                     print(f"Error parsing student row {i}: {e}")
-                    continue
 
         # 成績セクション
-        elif current_section == 'grades':
-            if ',' in line and grade_header_index == -1:
+        elif self._section == 'grades':
+            if ',' in line and not self._grade_header_seen:
                 # ヘッダー行
-                grade_header_index = i
-                continue
-            elif grade_header_index != -1 and ',' in line:
+                self._grade_header_seen = True
+                return
+            elif ',' in line:
                 # データ行
                 try:
                     values = parse_csv_line(line)
@@ -99,15 +166,21 @@ def parse_new_format_csv(csv_text: str) -> Tuple[List[Dict], List[Dict]]:
                             'listening': int(values[8]) if values[8] else 0,
                             'total': int(values[9]) if values[9] else 0
                         }
-                        grades.append(grade)
+                        self.grades.append(grade)
                 except Exception as e:
                     print(f"Error parsing grade row {i}: {e}")
-                    continue
 
-    if not students:
-        raise ValueError('【生徒データ】セクションが見つかるか、データが空です')
 
-    return students, grades
+def parse_new_format_csv(csv_text: str) -> Tuple[List[Dict], List[Dict]]:
+    """
+    新フォーマットCSVを解析（【生徒データ】【チェックテスト成績】セクション対応）
+
+    Returns:
+        (students_list, grades_list) のタプル
+    """
+    parser = NewFormatCsvParser()
+    parser.feed_text(csv_text)
+    return parser.close()
 
 
 def match_students_to_ids(db: Session, students: List[Dict]) -> List[Tuple[Dict, str]]:
@@ -120,27 +193,28 @@ def match_students_to_ids(db: Session, students: List[Dict]) -> List[Tuple[Dict,
         [(student_dict, student_id), ...] のリスト
     """
     matched = []
+    if not students:
+        return matched
 
     # 既存の最大 ID を取得
     max_id = 0
-    existing_students = db.query(Student).all()
-    for s in existing_students:
+    for existing_id in db.scalars(select(Student.id)):
         try:
-            id_num = int(s.id.replace('s', ''))
+            id_num = int(existing_id.replace('s', ''))
             if id_num > max_id:
                 max_id = id_num
         except:
             pass
 
-    for student in students:
-        student_name = student['name']
+    # 同じ名前の生徒をまとめて検索
+    name_to_id = _student_ids_by_name(db, {s['name'] for s in students})
 
-        # 同じ名前の生徒を検索
-        existing = db.query(Student).filter(Student.name == student_name).first()
+    for student in students:
+        existing_id = name_to_id.get(student['name'])
 
-        if existing:
+        if existing_id:
             # 既存生徒: そのIDを使用
-            matched.append((student, existing.id))
+            matched.append((student, existing_id))
         else:
             # 新規生徒: 新しいIDを割り当て
             max_id += 1
@@ -150,19 +224,43 @@ def match_students_to_ids(db: Session, students: List[Dict]) -> List[Tuple[Dict,
     return matched
 
 
+def _student_ids_by_name(db: Session, names: Iterable[str]) -> Dict[str, str]:
+    """氏名 → 生徒ID（同名の生徒がいれば最初の1人）"""
+    names = list(names)
+    name_to_id = {}
+    for i in range(0, len(names), 500):
+        rows = db.execute(
+            select(Student.name, Student.id)
+            .where(Student.name.in_(names[i:i + 500]))
+            .order_by(Student.id)
+        )
+        for name, student_id in rows:
+            name_to_id.setdefault(name, student_id)
+    return name_to_id
+
+
 def match_grades_to_students(
     db: Session,
     students_with_ids: List[Tuple[Dict, str]],
-    grades: List[Dict]
+    grades: List[Dict],
+    known_names: Iterable[str] = ()
 ) -> List[Tuple[Dict, str]]:
     """
     CSV の成績データを生徒IDにマッチング
 
+    Args:
+        known_names: CSV の生徒セクションにあるが students_with_ids から省いた
+            （取込済みで変更のない）生徒の氏名
+                     これらの生徒の成績は DB の生徒IDに結び付ける
+
     Returns:
         [(grade_dict, student_id), ...] のリスト
     """
     # 生徒名 → ID マップを作成
     student_name_to_id = {s[0]['name']: s[1] for s in students_with_ids}
+    missing = set(known_names) & {g['name'] for g in grades} - student_name_to_id.keys()
+    if missing:
+        student_name_to_id.update(_student_ids_by_name(db, missing))
 
     matched_grades = []
     for grade in grades:
@@ -176,115 +274,266 @@ def match_grades_to_students(
     return matched_grades
 
 
+def _begin_import(
+    db: Session,
+    students_with_ids: List[Tuple[Dict, str]],
+    matched_grades: List[Tuple[Dict, str]],
+    filename: str,
+    file_sha256: Optional[str],
+    diff: Optional[Dict],
+) -> Dict:
+    """
+    差分を確かめて取込の行を作り、生徒を書き込む（コミットは呼び出し側）
+
+    Returns:
+        成績の書き込み（_write_grades）と完了（_finish_import）に渡す取込の状態
+    """
+    started = time.perf_counter()
+    if diff is None:
+        current = diff_import(db, students_with_ids, matched_grades)
+    else:
+        # プレビューの差分を使い、書き込む行だけ同じトランザクションで読み直す
+        # （上書き前の値がこの時点でも同じなら、プレビューの内容をそのまま書き込める）
+        if (
+            stale_student_keys(db, diff["students"])
+            or stale_grade_keys(db, diff["grades"])
+        ):
+            raise ValueError(
+                "プレビューの後に生徒・成績が変更されました。"
+                "もう一度アップロードしてください"
+            )
+        current = diff
+
+    batch = start_batch(db, filename, file_sha256)
+    students = {status: [] for status in STATUSES}
+    for row in current["students"]:
+        students[row["status"]].append(row)
+    grades = {status: [] for status in STATUSES}
+    for row in current["grades"]:
+        grades[row["status"]].append(row)
+
+    # 生徒: 追加は ORM 経由（成績ストアの所属講座をフラッシュ時に更新）、
+    # 更新は主キー指定の一括 UPDATE（検索インデックスはどちらも同じトランザクションで
+    # 更新される。app.services.student_search）
+    db.add_all(
+        Student(id=row["key"], batch_id=batch.id, **row["values"])
+        for row in students["added"]
+    )
+    # 成績の外部キーより先に生徒を書き込む（PostgreSQL は外部キーを即時に検査する）
+    db.flush()
+    if students["changed"]:
+        bulk_update(db, Student, [
+            {"id": row["key"], "batch_id": batch.id,
+             **{c: row["values"][c] for c in STUDENT_COLUMNS}}
+            for row in students["changed"]
+        ])
+    record_priors(db, students=[
+        {**row["prior"], "batch_id": batch.id} for row in students["changed"]
+    ])
+    written = {}
+    _record_written(db, batch.id, written, [
+        row for status in ("added", "changed", "unchanged") for row in students[status]
+    ])
+
+    errors = students["error"] + grades["error"]
+    return {
+        "batch_id": batch.id,
+        "started": started,
+        "grades": grades["added"] + grades["changed"] + grades["unchanged"],
+        "superseded": current.get("superseded", []),
+        "written": written,
+        "student_classes": {
+            row["key"]: row["values"]["class_id"]
+            for row in students["added"] + students["changed"]
+        },
+        "grade_classes": set(),
+        "grade_students": set(),
+        "results": {
+            "batch_id": batch.id,
+            "added_students": len(students["added"]),
+            "updated_students": len(students["changed"]),
+            "unchanged_students": len(students["unchanged"]),
+            "added_grades": 0,
+            "updated_grades": 0,
+            "unchanged_grades": len(grades["unchanged"]),
+            "errors": [
+                f"{row['label']} の取込に失敗: {row['message']}" for row in errors
+            ],
+        },
+    }
+
+
+def _record_written(db: Session, batch_id: int, written: Dict, rows: List[dict]):
+    """書き込んだ行のハッシュを記録し、written に {(kind, key): 値のハッシュ} を足す"""
+    digests = {
+        (row["kind"], row["key"]): value_digest(row["kind"], row["values"])
+        for row in rows
+    }
+    record_row_hashes(db, batch_id, [
+        hash_entry(row, digests[(row["kind"], row["key"])]) for row in rows
+    ])
+    written.update(digests)
+
+
+def _write_grades(db: Session, state: Dict, rows: List[dict], recheck: bool = False):
+    """
+    成績の行を書き込む（追加・更新とも一括。PostgreSQL は COPY。コミットは呼び出し側）
+
+    Args:
+        recheck: 差分を作ったのと別のトランザクションで書き込むとき True
+            （その間に変わった成績は上書きせず、エラーとして報告する）
+    """
+    batch_id = state["batch_id"]
+    results = state["results"]
+    if recheck:
+        stale = stale_grade_keys(db, rows)
+        for row in rows:
+            if row["key"] in stale:
+                results["errors"].append(
+                    f"{row['label']} の取込に失敗: 取込の途中で変更されました"
+                )
+        rows = [row for row in rows if row["key"] not in stale]
+
+    added = [row for row in rows if row["status"] == "added"]
+    changed = [row for row in rows if row["status"] == "changed"]
+    bulk_insert(db, Grade, [{**row["values"], "batch_id": batch_id} for row in added])
+    bulk_update(db, Grade, [
+        {"id": row["key"], "batch_id": batch_id,
+         **{c: row["values"][c] for c in GRADE_COLUMNS}}
+        for row in changed
+    ])
+    # 取消用の上書き前の値と、次の取込で省く行のハッシュ
+    record_priors(db, grades=[
+        {**row["prior"], "batch_id": batch_id} for row in changed
+    ])
+    _record_written(db, batch_id, state["written"], rows)
+    results["added_grades"] += len(added)
+    results["updated_grades"] += len(changed)
+
+    saved_grades = [
+        {k: row["values"][k]
+         for k in ("student_id", "class_id", "date", "lesson_number", *GRADE_COLUMNS)}
+        for row in added + changed
+    ]
+    state["grade_classes"].update(g["class_id"] for g in saved_grades)
+    state["grade_students"].update(g["student_id"] for g in saved_grades)
+    if saved_grades:
+        run_after_commit(db, lambda: record_grades(saved_grades))
+
+
+def _finish_import(db: Session, state: Dict) -> Dict:
+    """件数を記録してコミットし、開いているページへ変更を通知"""
+    results = state["results"]
+    # CSV 内で後の行に上書きされた行は、後の行を書き込めたときだけ省けるようにする
+    written = state["written"]
+    record_row_hashes(db, state["batch_id"], [
+        hash_entry(row, written[(row["kind"], row["key"])])
+        for row in state["superseded"] if (row["kind"], row["key"]) in written
+    ])
+    batch = db.get(ImportBatch, state["batch_id"])
+    finish_batch(batch, results, state["started"])
+    stamp_file_version(db, batch)
+    db.commit()
+
+    student_classes = state["student_classes"]
+    if student_classes:
+        publish_after_commit(
+            db, "students-changed",
+            class_ids=set(student_classes.values()), student_ids=list(student_classes),
+        )
+    if state["grade_students"]:
+        publish_after_commit(
+            db, "grades-changed",
+            class_ids=state["grade_classes"], student_ids=state["grade_students"],
+        )
+    publish_after_commit(
+        db, "import-finished",
+        f"CSV 取込が完了しました（生徒 追加{results['added_students']}件・"
+        f"更新{results['updated_students']}件、成績 追加{results['added_grades']}件・"
+        f"更新{results['updated_grades']}件）",
+    )
+    return results
+
+
 def save_csv_data(
     db: Session,
     students_with_ids: List[Tuple[Dict, str]],
-    matched_grades: List[Tuple[Dict, str]]
+    matched_grades: List[Tuple[Dict, str]],
+    filename: str = "",
+    file_sha256: Optional[str] = None,
+    diff: Optional[Dict] = None
 ) -> Dict:
     """
-    CSV データを DB に保存
+    CSV データを DB に保存（1トランザクション）
+    取込ごとに import_batches の行を作り、書き込んだ行に batch_id を付ける（取消用）
+    保存できた行のハッシュ（filter_new_rows が付けた row_hash）を記録し、次の取込で省く
+
+    Args:
+        diff: プレビューで作った diff_import の結果
+            （差分の行を読み直し、プレビュー後に変更があれば保存しない。
+            省略時は保存時に差分を作る）
 
     Returns:
         {
+            "batch_id": 取込ID,
             "added_students": 追加した生徒数,
             "updated_students": 更新した生徒数,
+            "unchanged_students": 値が同じで書き込まなかった生徒数,
             "added_grades": 追加した成績数,
+            "updated_grades": 更新した成績数,
+            "unchanged_grades": 値が同じで書き込まなかった成績数,
             "errors": エラーメッセージのリスト
         }
-    """
-    results = {
-        "added_students": 0,
-        "updated_students": 0,
-        "added_grades": 0,
-        "errors": []
-    }
 
-    # 生徒データの保存
-    for student, student_id in students_with_ids:
-        try:
-            existing = db.query(Student).filter(Student.id == student_id).first()
-
-            if existing:
-                # 既存生徒を更新
-                existing.name = student['name']
-                existing.name_kana = student['name_kana']
-                existing.classroom = student['classroom']
-                existing.gender = student['gender']
-                existing.high_school = student['high_school']
-                existing.course_subject = student['course_subject']
-                existing.school_class = student['school_class']
-                existing.club = student['club']
-                existing.target_university = student['target_university']
-                existing.target_dept = student['target_dept']
-                results["updated_students"] += 1
-            else:
-                # 新規生徒を追加（CSV の student_code から講座を検索）
-                student_code = student.get('student_code', '')
-                class_obj = db.query(Class).filter(Class.id == student_code).first()
-                new_student = Student(
-                    id=student_id,
-                    name=student['name'],
-                    name_kana=student['name_kana'],
-                    classroom=student['classroom'],
-                    gender=student['gender'],
-                    high_school=student['high_school'],
-                    course_subject=student['course_subject'],
-                    school_class=student['school_class'],
-                    club=student['club'],
-                    target_university=student['target_university'],
-                    target_dept=student['target_dept'],
-                    class_id=class_obj.id if class_obj else None,
-                    join_date=date.today()
-                )
-                db.add(new_student)
-                results["added_students"] += 1
+    Raises:
+        ValueError: プレビューの後に取り込む行が変更された
+    """
+    state = _begin_import(
+        db, students_with_ids, matched_grades, filename, file_sha256, diff,
+    )
+    _write_grades(db, state, state["grades"])
+    return _finish_import(db, state)
 
-        except Exception as e:
-            results["errors"].append(f"生徒 {student['name']} の保存に失敗: {str(e)}")
 
-    db.commit()
+async def save_csv_data_in_chunks(
+    db: Session,
+    students_with_ids: List[Tuple[Dict, str]],
+    matched_grades: List[Tuple[Dict, str]],
+    filename: str = "",
+    file_sha256: Optional[str] = None,
+    diff: Optional[Dict] = None
+) -> Dict:
+    """
+    書き込みキュー経由で CSV データを保存（戻り値・例外は save_csv_data と同じ）
 
-    # 成績データの保存
-    for grade, student_id in matched_grades:
+    生徒、成績 IMPORT_CHUNK_ROWS 行ずつ、完了の記録をそれぞれ別の書き込みジョブにして、
+    大きな取込の間も他の書き込み（成績入力・出欠）が待たされないようにする
+    途中のジョブが失敗したら、書き込んだ分を取込の取消で戻してから例外を送る
+    """
+    def _committed(fn):
+        def _job(w: Session):
+            result = fn(w)
+            w.commit()
+            return result
+        return _job
+
+    async with _import_lock:
+        state = await submit_write(db, _committed(lambda w: _begin_import(
+            w, students_with_ids, matched_grades, filename, file_sha256, diff,
+        )))
         try:
-            # 既存の成績をチェック
-            existing_grade = db.query(Grade).filter(
-                Grade.student_id == student_id,
-                Grade.date == grade['date'],
-                Grade.lesson_number == grade['lesson_number']
-            ).first()
-
-            if existing_grade:
-                # 既存成績を更新
-                existing_grade.score_comprehension = grade['comprehension']
-                existing_grade.score_unseen = grade['unseen_problems']
-                existing_grade.score_grammar = grade['grammar']
-                existing_grade.score_vocabulary = grade['vocabulary']
-                existing_grade.score_listening = grade['listening']
-                existing_grade.score_total = grade['total']
-            else:
-                # 新規成績を追加（生徒の所属講座を使用）
-                student_obj = db.query(Student).filter(Student.id == student_id).first()
-                new_grade = Grade(
-                    id=f"g_{student_id}_{grade['date']}_{grade['lesson_number']}",
-                    student_id=student_id,
-                    class_id=student_obj.class_id if student_obj else None,
-                    date=grade['date'],
-                    lesson_number=grade['lesson_number'],
-                    lesson_content=grade['lesson_content'],
-                    score_comprehension=grade['comprehension'],
-                    score_unseen=grade['unseen_problems'],
-                    score_grammar=grade['grammar'],
-                    score_vocabulary=grade['vocabulary'],
-                    score_listening=grade['listening'],
-                    score_total=grade['total']
+            rows = state["grades"]
+            for i in range(0, len(rows), IMPORT_CHUNK_ROWS):
+                chunk = rows[i:i + IMPORT_CHUNK_ROWS]
+                await submit_write(db, _committed(
+                    lambda w, chunk=chunk: _write_grades(w, state, chunk, recheck=True)
+                ))
+            return await submit_write(db, lambda w: _finish_import(w, state))
+        except Exception:
+            try:
+                await submit_write(db, lambda w: rollback_batch(w, state["batch_id"]))
+            except Exception as e:
+                logger.error(
+                    "Rollback of failed import %s failed: %s", state["batch_id"], e,
                 )
-                db.add(new_grade)
-                results["added_grades"] += 1
-
-        except Exception as e:
-            results["errors"].append(f"成績 {grade['name']} のインポートに失敗: {str(e)}")
-
-    db.commit()
-
-    return results
+            raise
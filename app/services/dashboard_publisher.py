@@ -0,0 +1,410 @@
+"""
+生徒ダッシュボードの静的配信（公開モード）
+DASHBOARD_PUBLISH_DIR を設定すると、生徒に関わる書き込みのコミット後にその生徒の
+ダッシュボード（ページと各パーシャル）を描画して HTML ファイルに書き出す。
+表示はファイルをそのまま返すだけで、テンプレートにも DB にも触れない
+
+    <DASHBOARD_PUBLISH_DIR>/<教室コード>/<生徒ID>/index.html
+        ページ（パーシャルを埋め込み済み）
+    <DASHBOARD_PUBLISH_DIR>/<教室コード>/<生徒ID>/<パーシャル>.html
+        SSE で更新するときの取得先
+    <DASHBOARD_PUBLISH_DIR>/<教室コード>/<生徒ID>/.version
+        描画を始めたときの教室の .generation
+    <DASHBOARD_PUBLISH_DIR>/<教室コード>/.generation
+        教室の全生徒をまとめて無効にするための値（invalidate_branch で書き換える）
+
+更新の流れ
+    1. 成績・出欠・生徒のイベントの発行時に、対象の生徒のファイルを消す
+       （古い内容を返さない）
+    2. 公開スレッドがその生徒を描画し直して書き出す
+       （成績の変更はクラス平均が変わるので講座の全生徒）
+    ファイルがなければ通常どおり描画して返し、公開スレッドに書き出しを頼む
+    （起動直後・取消の後など）
+イベントを発行しない書き込み（夜間の事前計算・年度アーカイブ）の後は
+invalidate_branch で .generation を書き換える（公開スレッドがないプロセス・
+scripts/ からも呼べる）。返す前に .version と比べ、違えばファイルがないときと
+同じく通常どおり描画し、書き出し直しを頼む
+講座の他の生徒のクラス平均は 2 が終わるまでの短い間だけ古い値になる
+描画中に同じ生徒が再び無効化されたら書き出さない（次の描画に任せる）
+"""
+
+import logging
+import os
+import queue
+import threading
+import uuid
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+from urllib.parse import quote
+
+from fastapi import Request
+from fastapi.responses import FileResponse, RedirectResponse, Response
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import branch_session
+from app.events import Event, event_bus
+from app.models.student import Student
+from app.services.grade_calculator import (
+    calculate_class_average,
+    calculate_student_average,
+    generate_advice,
+    get_attendance_summary,
+    get_student_grades,
+)
+from app.services.grade_entry import SCORE_LABELS
+from app.services.student_stats import get_precomputed_advice
+from app.services.trends import DEFAULT_WINDOW, get_student_trend
+from app.templates_config import env
+
+logger = logging.getLogger(__name__)
+
+# パーシャル名 → (テンプレート, 通常時の取得先)
+FRAGMENTS = {
+    "grades": ("partials/grades_table.html", "/api/grades/student/{}"),
+    "comparison": ("partials/comparison.html", "/api/grades/comparison/{}"),
+    "trend": ("partials/trend.html", "/api/grades/trend/{}"),
+    "advice": ("partials/advice.html", "/api/grades/advice/{}"),
+    "attendance": ("partials/attendance.html", "/api/attendance/student/{}"),
+}
+PAGE = "index"
+STAMP = ".version"
+GENERATION = ".generation"
+
+# 書き出し直すイベント（成績の変更は講座の全生徒のクラス平均に影響する）
+_STUDENT_EVENTS = ("grades-changed", "attendance-changed", "students-changed")
+_CLASS_EVENTS = ("grades-changed",)
+
+_IN_CHUNK = 500
+
+# 起動時に start_publisher で作成（無効時は None のまま）
+_publisher: Optional["DashboardPublisher"] = None
+
+# (教室コード, 生徒ID) → 無効化の回数（描画中に無効化されたかを見分ける）
+_generations: Dict[tuple, int] = defaultdict(int)
+_generations_lock = threading.Lock()
+
+
+def comparison_context(student_avg: int, class_avg: int) -> dict:
+    """クラス平均比較のテンプレート変数"""
+    difference = student_avg - class_avg
+    return {
+        "student_avg": student_avg,
+        "class_avg": class_avg,
+        "difference": abs(difference),
+        "difference_color": "#2e7d32" if difference >= 0 else "#c62828",
+        "difference_sign": "+" if difference >= 0 else "-",
+    }
+
+
+def _student_dir(root: Path, branch: str, student_id: str) -> Path:
+    # 生徒IDは URL から来るので、区切り文字などを含んでも1つのディレクトリ名にする
+    return _branch_dir(root, branch) / quote(student_id, safe="")
+
+
+def _branch_dir(root: Path, branch: str) -> Path:
+    return root / quote(branch, safe="")
+
+
+def _generation(root: Path, branch: str) -> str:
+    """教室の .generation（まだ無効化されていなければ空文字）"""
+    try:
+        return (_branch_dir(root, branch) / GENERATION).read_text(encoding="utf-8")
+    except FileNotFoundError:
+        return ""
+
+
+def _publish_root() -> Optional[Path]:
+    if _publisher is not None:
+        return _publisher.root
+    if settings.DASHBOARD_PUBLISH_DIR:
+        return Path(settings.DASHBOARD_PUBLISH_DIR)
+    return None
+
+
+def _fragment_contexts(db: Session, student: Student) -> Dict[str, dict]:
+    """各パーシャルのテンプレート変数（各エンドポイントと同じ内容）"""
+    student_avg = calculate_student_average(db, student.id)
+    class_avg = (
+        calculate_class_average(db, student.class_id) if student.class_id else 0
+    )
+    advice = (
+        get_precomputed_advice(db, student.id) or generate_advice(db, student.id)
+    )
+    return {
+        "grades": {"grades": get_student_grades(db, student.id)},
+        "comparison": comparison_context(student_avg, class_avg),
+        "trend": {
+            "trend": get_student_trend(db, student.id),
+            "labels": SCORE_LABELS,
+            "window": DEFAULT_WINDOW,
+        },
+        "advice": {"advice": advice},
+        "attendance": {"summary": get_attendance_summary(db, student.id)},
+    }
+
+
+def _write(path: Path, html: str):
+    """
+    同じ内容なら書き込まない（ETag が変わらない）
+    置き換えは一時ファイルからの rename で行う
+    """
+    data = html.encode("utf-8")
+    try:
+        if path.read_bytes() == data:
+            return
+    except FileNotFoundError:
+        pass
+    tmp = path.with_name(f".{path.name}.{threading.get_ident()}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def _remove(directory: Path):
+    for name in (PAGE, *FRAGMENTS):
+        try:
+            os.remove(directory / f"{name}.html")
+        except FileNotFoundError:
+            pass
+
+
+def invalidate(branch: str, student_ids: Iterable[str]):
+    """生徒のファイルを消す（以降は書き出し直すまで通常の描画で返す）"""
+    if _publisher is None:
+        return
+    for student_id in student_ids:
+        with _generations_lock:
+            _generations[(branch, student_id)] += 1
+        _remove(_student_dir(_publisher.root, branch, student_id))
+
+
+def invalidate_branch(branch: str):
+    """
+    教室の書き出し済みダッシュボードをすべて古いものにする
+    イベントを発行しない書き込み（夜間の事前計算・年度アーカイブ）の後に呼ぶ。
+    公開スレッドのないプロセスからも、設定があれば .generation を書き換える
+    """
+    root = _publish_root()
+    if root is None:
+        return
+    directory = _branch_dir(root, branch)
+    directory.mkdir(parents=True, exist_ok=True)
+    _write(directory / GENERATION, uuid.uuid4().hex)
+
+
+def publish_student(
+    db: Session, root: Path, branch: str, student_id: str,
+    stamp: Optional[str] = None,
+) -> bool:
+    """
+    1生徒分のページとパーシャルを書き出す
+    stamp は描画を始める前に読んだ教室の .generation（省略時はここで読む）
+
+    Returns:
+        書き出したら True（生徒がいない・描画中に無効化された場合は False）
+    """
+    with _generations_lock:
+        generation = _generations[(branch, student_id)]
+    if stamp is None:
+        stamp = _generation(root, branch)
+    directory = _student_dir(root, branch, student_id)
+    student = db.get(Student, student_id)
+    if student is None:
+        _remove(directory)
+        return False
+
+    fragments = {
+        name: env.get_template(FRAGMENTS[name][0]).render(context)
+        for name, context in _fragment_contexts(db, student).items()
+    }
+    page = env.get_template("dashboard/index.html").render(
+        student_id=student_id,
+        fragments=fragments,
+        fragment_urls={
+            name: f"/dashboard/{quote(student_id, safe='')}/fragments/{name}"
+            for name in FRAGMENTS
+        },
+    )
+
+    directory.mkdir(parents=True, exist_ok=True)
+    with _generations_lock:
+        if _generations[(branch, student_id)] != generation:
+            return False
+        # ページを最後に書く（ページがあればパーシャルもそろっている）
+        for name, html in fragments.items():
+            _write(directory / f"{name}.html", html)
+        _write(directory / STAMP, stamp)
+        _write(directory / f"{PAGE}.html", page)
+    return True
+
+
+class DashboardPublisher:
+    """書き出し専用スレッド（依頼をまとめ、教室ごとに1つのセッションで描画する）"""
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+        self._queue: queue.Queue = queue.Queue()
+        self._thread = threading.Thread(
+            target=self._run, name="dashboard-publisher", daemon=True
+        )
+
+    def start(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._thread.start()
+
+    def stop(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def request(
+        self, branch: str,
+        student_ids: Iterable[str] = (), class_ids: Iterable[str] = (),
+    ):
+        self._queue.put(
+            (branch, frozenset(student_ids), frozenset(c for c in class_ids if c))
+        )
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            # 溜まっている依頼をまとめる（取込直後の大量のイベントも1回で処理する）
+            pending = defaultdict(lambda: (set(), set()))
+            stopping = False
+            while item is not None:
+                branch, student_ids, class_ids = item
+                pending[branch][0].update(student_ids)
+                pending[branch][1].update(class_ids)
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+            for branch, (student_ids, class_ids) in pending.items():
+                try:
+                    self._publish_branch(branch, student_ids, class_ids)
+                except Exception as e:
+                    logger.error(
+                        "Dashboard publishing failed (%s): %s", branch, e,
+                        exc_info=True,
+                    )
+            if stopping:
+                return
+
+    def _publish_branch(self, branch: str, student_ids: set, class_ids: set):
+        stamp = _generation(self.root, branch)
+        with branch_session(branch) as db:
+            class_ids = sorted(class_ids)
+            for i in range(0, len(class_ids), _IN_CHUNK):
+                chunk = class_ids[i:i + _IN_CHUNK]
+                student_ids.update(db.scalars(
+                    select(Student.id).where(Student.class_id.in_(chunk))
+                ))
+            published = sum(
+                publish_student(db, self.root, branch, sid, stamp)
+                for sid in sorted(student_ids)
+            )
+        logger.info("Published %d dashboards (%s)", published, branch)
+
+
+def _on_event(event: Event):
+    """コミット後のイベントで生徒のファイルを消し、書き出しを依頼する"""
+    if event.name not in _STUDENT_EVENTS or _publisher is None:
+        return
+    invalidate(event.branch, event.student_ids)
+    class_ids = event.class_ids if event.name in _CLASS_EVENTS else ()
+    _publisher.request(event.branch, event.student_ids, class_ids)
+
+
+def start_publisher() -> Optional[DashboardPublisher]:
+    """設定で有効なら公開スレッドを起動"""
+    global _publisher
+    if settings.DASHBOARD_PUBLISH_DIR and _publisher is None:
+        _publisher = DashboardPublisher(settings.DASHBOARD_PUBLISH_DIR)
+        _publisher.start()
+        event_bus.add_listener(_on_event)
+    return _publisher
+
+
+def stop_publisher():
+    global _publisher
+    if _publisher is not None:
+        event_bus.remove_listener(_on_event)
+        _publisher.stop()
+        _publisher = None
+
+
+def publishing_enabled() -> bool:
+    return _publisher is not None
+
+
+def _strip_weak(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def _file_response(
+    request: Request, branch: str, student_id: str, name: str
+) -> Optional[Response]:
+    """
+    書き出したファイルを返す（なければ、または invalidate_branch の後なら None）
+    ETag は更新時刻とサイズ（同じ内容は書き込まないので内容が同じ間は変わらない）。
+    圧縮の有無で本文のバイト列が変わるので弱い ETag にする
+    """
+    directory = _student_dir(_publisher.root, branch, student_id)
+    path = directory / f"{name}.html"
+    try:
+        stat = os.stat(path)
+        stamp = (directory / STAMP).read_text(encoding="utf-8")
+    except FileNotFoundError:
+        return None
+    if stamp != _generation(_publisher.root, branch):
+        return None
+    etag = f'W/"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if _strip_weak(etag) in {_strip_weak(t) for t in if_none_match.split(",")}:
+        return Response(status_code=304, headers=headers)
+    return FileResponse(
+        path, media_type="text/html; charset=utf-8", headers=headers,
+        stat_result=stat,
+    )
+
+
+def published_page(
+    request: Request, branch: str, student_id: str
+) -> Optional[Response]:
+    """
+    書き出し済みのページ（なければ None を返し、書き出しを依頼する）
+    公開モードでなければ常に None
+    """
+    if _publisher is None:
+        return None
+    response = _file_response(request, branch, student_id, PAGE)
+    if response is None:
+        _publisher.request(branch, [student_id])
+    return response
+
+
+def published_fragment(
+    request: Request, branch: str, student_id: str, name: str
+) -> Optional[Response]:
+    """
+    書き出し済みのパーシャル（なければ通常の取得先へリダイレクト）
+
+    Returns:
+        None: パーシャル名が不正
+    """
+    if name not in FRAGMENTS:
+        return None
+    if _publisher is not None:
+        response = _file_response(request, branch, student_id, name)
+        if response is not None:
+            return response
+        _publisher.request(branch, [student_id])
+    url = FRAGMENTS[name][1].format(quote(student_id, safe=""))
+    return RedirectResponse(url, status_code=307)
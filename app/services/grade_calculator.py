@@ -5,24 +5,51 @@
 
 from typing import List
 from datetime import date
+from sqlalchemy import case, func, select
 from sqlalchemy.orm import Session
 from app.models.grade import Grade
 from app.models.student import Student
 from app.models.attendance import Attendance
-
-def get_student_grades(db: Session, student_id: str) -> List[Grade]:
-    """特定の生徒の成績を取得（日付でソート）"""
-    return db.query(Grade)\
-        .filter(Grade.student_id == student_id)\
-        .order_by(Grade.date)\
-        .all()
-
-def get_student_attendance(db: Session, student_id: str) -> List[Attendance]:
-    """特定の生徒の出席記録を取得（日付でソート）"""
-    return db.query(Attendance)\
-        .filter(Attendance.student_id == student_id)\
-        .order_by(Attendance.date)\
-        .all()
+from app.services import attendance_bitmap
+from app.services.archive import attendance_entity, grade_entity
+from app.services.grade_entry import SCORE_LABELS
+from app.services.grade_store import get_grade_store
+from app.services.trends import get_student_trend
+from app.single_flight import coalesce
+
+def get_student_grades(
+    db: Session, student_id: str, date_from: date = None, date_to: date = None,
+    include_archive: bool = False,
+) -> List[Grade]:
+    """
+    特定の生徒の成績を取得（日付でソート）
+    date_from がアーカイブ済みの年度にかかるときだけアーカイブも含める
+    期間を指定しなければ今の年度以降（通常テーブル）だけで、アーカイブ済みの年度の
+    成績は含まない。全期間が必要なら include_archive=True を渡す
+    """
+    source = grade_entity(db, date.min if include_archive else date_from)
+    query = db.query(source).filter(source.student_id == student_id)
+    if date_from:
+        query = query.filter(source.date >= date_from)
+    if date_to:
+        query = query.filter(source.date <= date_to)
+    return query.order_by(source.date).all()
+
+def get_student_attendance(
+    db: Session, student_id: str, date_from: date = None, date_to: date = None,
+    include_archive: bool = False,
+) -> List[Attendance]:
+    """
+    特定の生徒の出席記録を取得（日付でソート）
+    アーカイブの扱いは get_student_grades と同じ（期間の指定がなければ含まない）
+    """
+    source = attendance_entity(db, date.min if include_archive else date_from)
+    query = db.query(source).filter(source.student_id == student_id)
+    if date_from:
+        query = query.filter(source.date >= date_from)
+    if date_to:
+        query = query.filter(source.date <= date_to)
+    return query.order_by(source.date).all()
 
 def get_class_grades(db: Session, class_id: str) -> List[Grade]:
     """特定の講座に属する全生徒の成績を取得"""
@@ -31,11 +58,18 @@ def get_class_grades(db: Session, class_id: str) -> List[Grade]:
         .filter(Student.class_id == class_id)\
         .all()
 
+@coalesce("student_average", "grades")
 def calculate_student_average(db: Session, student_id: str) -> int:
     """
     特定の生徒の平均スコア（0-100）を計算
     各成績の score_total を 0-100 にスケールして平均を計算
+    成績ストアが有効ならメモリ上の列から集計する
+    同じ生徒の同時の呼び出しは1回の計算にまとめる（app.single_flight）
     """
+    store = get_grade_store()
+    if store is not None:
+        return store.average(student_id=student_id)[0]
+
     grades = get_student_grades(db, student_id)
 
     if not grades:
@@ -49,9 +83,11 @@ def calculate_student_average(db: Session, student_id: str) -> int:
 
     return round(total_score / len(grades))
 
+@coalesce("class_average", "grades", "students")
 def calculate_class_average(db: Session, class_id: str, target_date: date = None) -> int:
     """
     特定の講座（クラス）の平均スコア（0-100）を計算
+    同じ講座・同じ日付の同時の呼び出しは1回の計算にまとめる（app.single_flight）
 
     Args:
         db: DB セッション
@@ -61,6 +97,13 @@ def calculate_class_average(db: Session, class_id: str, target_date: date = None
     Returns:
         0-100 のスコア
     """
+    store = get_grade_store()
+    if store is not None:
+        average, _ = store.average(
+            class_id=class_id, date_from=target_date, date_to=target_date
+        )
+        return average
+
     grades = get_class_grades(db, class_id)
 
     # 特定の日付の成績に絞る場合
@@ -78,6 +121,39 @@ def calculate_class_average(db: Session, class_id: str, target_date: date = None
 
     return round(total_score / len(grades))
 
+@coalesce("class_summary", "grades", "students")
+def summarize_class_grades(db: Session, class_id: str) -> dict:
+    """
+    講座の平均と所属生徒ごとの平均
+    （1回の GROUP BY で集計、同時の呼び出しは1回にまとめる）
+
+    Returns:
+        {"average": 講座平均, "grade_count": 成績数,
+         "students": [{"student_id", "average", "grade_count"}, ...]}
+    """
+    normalized = case(
+        (Grade.max_total > 0, Grade.score_total * 100.0 / Grade.max_total),
+        else_=0,
+    )
+    rows = db.execute(
+        select(Grade.student_id, func.avg(normalized), func.count())
+        .join(Student, Grade.student_id == Student.id)
+        .where(Student.class_id == class_id)
+        .group_by(Grade.student_id)
+        .order_by(Grade.student_id)
+    ).all()
+
+    total_count = sum(count for _, _, count in rows)
+    total_score = sum(avg * count for _, avg, count in rows)
+    return {
+        "average": round(total_score / total_count) if total_count else 0,
+        "grade_count": total_count,
+        "students": [
+            {"student_id": sid, "average": round(avg), "grade_count": count}
+            for sid, avg, count in rows
+        ],
+    }
+
 def calculate_attendance_rate(db: Session, student_id: str) -> int:
     """
     特定の生徒の出席率（0-100）を計算
@@ -85,38 +161,18 @@ def calculate_attendance_rate(db: Session, student_id: str) -> int:
     Returns:
         出席率（パーセント）
     """
-    records = get_student_attendance(db, student_id)
-
-    if not records:
-        return 0
-
-    present_count = sum(1 for r in records if r.status == "出席")
-    return round((present_count / len(records)) * 100)
+    return get_attendance_summary(db, student_id)["rate"]
 
 def get_attendance_summary(db: Session, student_id: str) -> dict:
     """
-    出席状況のサマリーを取得
+    出席状況のサマリーを取得（学期ごとの出欠ビット配列から集計）
 
     Returns:
-        {"present": 出席数, "absent": 欠席数, "late": 遅刻数, "rate": 出席率}
+        {"present": 出席数, "absent": 欠席数, "late": 遅刻数,
+         "rate": 出席率, "total": 記録数,
+         "current_streak": 直近の連続出席, "longest_streak": 最長の連続出席}
     """
-    records = get_student_attendance(db, student_id)
-
-    if not records:
-        return {"present": 0, "absent": 0, "late": 0, "rate": 0}
-
-    present = sum(1 for r in records if r.status == "出席")
-    absent = sum(1 for r in records if r.status == "欠席")
-    late = sum(1 for r in records if r.status == "遅刻")
-    rate = round((present / len(records)) * 100)
-
-    return {
-        "present": present,
-        "absent": absent,
-        "late": late,
-        "rate": rate,
-        "total": len(records)
-    }
+    return attendance_bitmap.get_attendance_summary(db, student_id)
 
 def get_grade_summary(db: Session, student_id: str) -> dict:
     """
@@ -159,12 +215,26 @@ def generate_advice(db: Session, student_id: str) -> str:
     """
     summary = get_grade_summary(db, student_id)
     attendance = get_attendance_summary(db, student_id)
+    trend = get_student_trend(db, student_id) if summary["count"] else None
+    return compose_advice(
+        summary["count"], summary["average"], attendance["rate"], trend
+    )
 
-    if summary["count"] == 0:
-        return "成績データがまだ登録されていません。"
 
-    average = summary["average"]
-    attendance_rate = attendance["rate"]
+def compose_advice(
+    grade_count: int, average: int, attendance_rate: int, trend: dict = None
+) -> str:
+    """
+    集計値からアドバイス文を組み立てる（generate_advice と夜間の事前計算で共通）
+
+    Args:
+        grade_count: 成績数
+        average: 平均スコア（0-100）
+        attendance_rate: 出席率（0-100）
+        trend: compute_trends の1生徒分（なければ None）
+    """
+    if grade_count == 0:
+        return "成績データがまだ登録されていません。"
 
     advice_list = []
 
@@ -176,6 +246,13 @@ def generate_advice(db: Session, student_id: str) -> str:
     else:
         advice_list.append("成績の向上が必要です。苦手な分野に集中して取り組んでください。")
 
+    # 推移に基づくアドバイス（直線の傾き）
+    if trend and trend["direction"] == "上昇":
+        advice_list.append("最近の成績は上昇傾向です。今の学習方法を続けましょう。")
+    elif trend and trend["direction"] == "下降":
+        weakest = min(trend["subjects"].items(), key=lambda item: item[1]["slope"])[0]
+        advice_list.append(f"最近の成績は下降傾向です。特に{SCORE_LABELS[weakest]}の復習を優先してください。")
+
     # 出席に基づくアドバイス
     if attendance_rate == 100:
         advice_list.append("出席率100％です。その調子で頑張ってください！")
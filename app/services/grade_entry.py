@@ -0,0 +1,128 @@
+"""
+成績入力
+1件入力（create_grade）と講座一括入力（グリッド）で共通の検証・採番・保存処理
+"""
+
+from datetime import date
+from typing import Dict, List, Tuple
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.orm import Session
+
+from app.database import run_after_commit
+from app.events import publish_after_commit
+from app.models.grade import Grade
+from app.models.student import Student
+from app.services.grade_store import record_grades
+
+# 入力する5科目（Grade の score_* / max_* に対応）
+SCORE_FIELDS = ("comprehension", "unseen", "grammar", "vocabulary", "listening")
+SCORE_LABELS = {
+    "comprehension": "理解",
+    "unseen": "初見",
+    "grammar": "文法",
+    "vocabulary": "単語",
+    "listening": "リスニング",
+}
+MAX_SCORE = 20
+
+
+def parse_score_row(values: Dict[str, str]) -> Tuple[Dict[str, int], List[str]]:
+    """
+    フォームの得点入力（文字列）を検証
+
+    Args:
+        values: {科目名: 入力値}（空欄は 0 点）
+
+    Returns:
+        ({科目名: 得点}, エラーメッセージのリスト)
+    """
+    scores = {}
+    errors = []
+    for field in SCORE_FIELDS:
+        raw = (values.get(field) or "").strip()
+        try:
+            score = int(raw) if raw else 0
+        except ValueError:
+            errors.append(f"{SCORE_LABELS[field]}は数値で入力してください")
+            continue
+        if not 0 <= score <= MAX_SCORE:
+            errors.append(f"{SCORE_LABELS[field]}は 0〜{MAX_SCORE} で入力してください")
+            continue
+        scores[field] = score
+    return scores, errors
+
+
+def allocate_lesson_numbers(db: Session, student_ids: List[str]) -> Dict[str, int]:
+    """
+    生徒ごとの次の授業回（その生徒の最大 + 1）を1回のクエリでまとめて採番
+    """
+    rows = db.execute(
+        select(Grade.student_id, func.max(Grade.lesson_number))
+        .where(Grade.student_id.in_(student_ids))
+        .group_by(Grade.student_id)
+    )
+    current = {student_id: max_lesson or 0 for student_id, max_lesson in rows}
+    return {sid: current.get(sid, 0) + 1 for sid in student_ids}
+
+
+def insert_grades(
+    db: Session,
+    class_id: str,
+    target_date: date,
+    lesson_content: str,
+    scores_by_student: Dict[str, Dict[str, int]],
+) -> List[dict]:
+    """
+    成績をまとめて追加（授業回の採番1回・一括 INSERT 1回・コミット1回）
+
+    Args:
+        db: DB セッション
+        class_id: 講座ID
+        target_date: テスト日
+        lesson_content: 授業内容
+        scores_by_student: {生徒ID: {科目名: 得点}}
+
+    Returns:
+        追加した成績行（dict）のリスト
+    """
+    if not scores_by_student:
+        return []
+
+    lesson_numbers = allocate_lesson_numbers(db, list(scores_by_student))
+    rows = []
+    for student_id, scores in scores_by_student.items():
+        lesson_number = lesson_numbers[student_id]
+        row = {
+            "id": f"g_{student_id}_{target_date.isoformat()}_{lesson_number}",
+            "student_id": student_id,
+            "class_id": class_id,
+            "date": target_date,
+            "lesson_number": lesson_number,
+            "lesson_content": lesson_content,
+            "score_total": sum(scores.values()),
+        }
+        for field in SCORE_FIELDS:
+            row[f"score_{field}"] = scores.get(field, 0)
+        rows.append(row)
+
+    db.execute(insert(Grade), rows)
+    db.commit()
+    run_after_commit(db, lambda: record_grades(rows))
+    publish_after_commit(
+        db,
+        "grades-changed",
+        class_ids=[class_id],
+        student_ids=list(scores_by_student),
+    )
+    return rows
+
+
+def get_grade_grid(db: Session, class_id: str) -> List[Student]:
+    """講座一括入力グリッドに並べる生徒（ふりがな順）"""
+    return (
+        db.query(Student)
+        .filter(Student.class_id == class_id)
+        .order_by(Student.name_kana, Student.name)
+        .all()
+    )
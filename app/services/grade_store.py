@@ -0,0 +1,316 @@
+"""
+成績の列指向インメモリストア（分析用・任意）
+grades を起動時に1回だけ読み込み、型付き配列（array モジュール）で保持する
+ID は辞書符号化して整数で持ち、1行あたり約40バイト
+
+集計は NumPy があれば配列をコピーせずにベクトル化したマスクで行い、
+なければ同じ配列を Python のループで走査する
+
+書き込み（insert_grades / save_csv_data / API の一括登録）はコミット後に
+record_grades で追記する。別プロセスからの書き込みは反映されないため、
+GRADE_STORE_ENABLED=true のときだけ使う
+教室ごとに DB を分けている場合は教室ごとにストアを持つ
+"""
+
+import logging
+from array import array
+from datetime import date
+from threading import Lock
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.branches import DEFAULT_BRANCH, current_branch
+from app.database import run_after_commit
+from app.models.grade import Grade
+from app.models.student import Student
+
+try:
+    import numpy as np
+except ImportError:  # NumPy は任意（speedups）
+    np = None
+
+logger = logging.getLogger(__name__)
+
+SUBJECTS = ("comprehension", "unseen", "grammar", "vocabulary", "listening")
+NO_CLASS = -1
+
+# 教室コード → ストア（起動時に init_grade_store で作成。無効時は空のまま）
+_stores: Dict[str, "GradeStore"] = {}
+
+
+def _value(row: dict, column: str, default: int) -> int:
+    """列の値（NULL・列なしは既定値。満点の 0 は 0 のまま）"""
+    value = row.get(column)
+    return default if value is None else value
+
+
+class GradeStore:
+    """成績の列指向ストア（列ごとの型付き配列 + 辞書符号化した ID）"""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._student_index: Dict[str, int] = {}
+        self._class_index: Dict[str, int] = {}
+        # 生徒 index → 所属講座 index（講座平均は所属で絞るため）
+        self.student_class = array("i")
+
+        self.student = array("i")
+        self.class_ = array("i")
+        self.date = array("i")         # date.toordinal()
+        self.lesson = array("i")
+        self.scores = {s: array("h") for s in SUBJECTS}
+        self.maxes = {s: array("h") for s in SUBJECTS}
+        self.total = array("h")
+        self.max_total = array("h")
+
+    def __len__(self) -> int:
+        return len(self.student)
+
+    # ---- 辞書符号化 ----
+
+    def _student_code(self, student_id: str) -> int:
+        code = self._student_index.get(student_id)
+        if code is None:
+            code = self._student_index[student_id] = len(self._student_index)
+            self.student_class.append(NO_CLASS)
+        return code
+
+    def _class_code(self, class_id: Optional[str]) -> int:
+        if class_id is None:
+            return NO_CLASS
+        code = self._class_index.get(class_id)
+        if code is None:
+            code = self._class_index[class_id] = len(self._class_index)
+        return code
+
+    # ---- 書き込み ----
+
+    def set_student_class(self, student_id: str, class_id: Optional[str]):
+        """生徒の所属講座を更新"""
+        with self._lock:
+            code = self._student_code(student_id)
+            self.student_class[code] = self._class_code(class_id)
+
+    def _append(self, row: dict):
+        self.student.append(self._student_code(row["student_id"]))
+        self.class_.append(self._class_code(row.get("class_id")))
+        self.date.append(row["date"].toordinal())
+        self.lesson.append(row.get("lesson_number") or 0)
+        for s in SUBJECTS:
+            self.scores[s].append(row.get(f"score_{s}") or 0)
+            self.maxes[s].append(_value(row, f"max_{s}", 20))
+        self.total.append(row.get("score_total") or 0)
+        self.max_total.append(_value(row, "max_total", 100))
+
+    def _overwrite(self, i: int, row: dict):
+        for s in SUBJECTS:
+            if f"score_{s}" in row:
+                self.scores[s][i] = row[f"score_{s}"] or 0
+            if f"max_{s}" in row:
+                self.maxes[s][i] = _value(row, f"max_{s}", 20)
+        if "score_total" in row:
+            self.total[i] = row["score_total"] or 0
+        if "max_total" in row:
+            self.max_total[i] = _value(row, "max_total", 100)
+
+    def upsert(self, rows: List[dict]):
+        """
+        成績行を反映（生徒・日付・授業回が同じ行は上書き、それ以外は追記）
+        対象生徒の既存行だけを1回走査して位置を引く
+        """
+        if not rows:
+            return
+        with self._lock:
+            codes = {self._student_code(r["student_id"]) for r in rows}
+            if np is not None and len(self.student):
+                students = np.frombuffer(self.student, dtype=np.intc)
+                candidates = np.flatnonzero(np.isin(students, list(codes))).tolist()
+                del students
+            else:
+                candidates = [i for i, s in enumerate(self.student) if s in codes]
+            positions = {
+                (self.student[i], self.date[i], self.lesson[i]): i for i in candidates
+            }
+            for row in rows:
+                key = (
+                    self._student_index[row["student_id"]],
+                    row["date"].toordinal(),
+                    row.get("lesson_number") or 0,
+                )
+                i = positions.get(key)
+                if i is None:
+                    positions[key] = len(self.student)
+                    self._append(row)
+                else:
+                    self._overwrite(i, row)
+
+    def load(
+        self,
+        rows: Iterable[dict],
+        memberships: Iterable[Tuple[str, Optional[str]]],
+    ):
+        """起動時の一括読み込み（重複チェックなしで追記）"""
+        with self._lock:
+            for student_id, class_id in memberships:
+                code = self._student_code(student_id)
+                self.student_class[code] = self._class_code(class_id)
+            for row in rows:
+                self._append(row)
+
+    # ---- 集計 ----
+
+    def average(
+        self,
+        student_id: Optional[str] = None,
+        class_id: Optional[str] = None,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+    ) -> Tuple[int, int]:
+        """
+        条件に合う成績の平均スコア（0-100 に正規化）と件数
+        class_id は生徒の所属講座で絞る（get_class_grades と同じ）
+
+        Returns:
+            (平均スコア, 件数)
+        """
+        with self._lock:
+            if not len(self.student):
+                return 0, 0
+            student_code = self._student_index.get(student_id) if student_id else None
+            class_code = self._class_index.get(class_id) if class_id else None
+            if student_id and student_code is None:
+                return 0, 0
+            if class_id and class_code is None:
+                return 0, 0
+            start = date_from.toordinal() if date_from else None
+            end = date_to.toordinal() if date_to else None
+
+            if np is not None:
+                return self._average_numpy(student_code, class_code, start, end)
+            return self._average_python(student_code, class_code, start, end)
+
+    def _average_numpy(self, student_code, class_code, start, end) -> Tuple[int, int]:
+        # array の内部バッファをコピーせずに参照する
+        students = np.frombuffer(self.student, dtype=np.intc)
+        mask = np.ones(len(students), dtype=bool)
+        if student_code is not None:
+            mask &= students == student_code
+        if class_code is not None:
+            membership = np.frombuffer(self.student_class, dtype=np.intc)
+            mask &= membership[students] == class_code
+        if start is not None or end is not None:
+            dates = np.frombuffer(self.date, dtype=np.intc)
+            if start is not None:
+                mask &= dates >= start
+            if end is not None:
+                mask &= dates <= end
+
+        totals = np.frombuffer(self.total, dtype=np.int16)[mask].astype(np.float64)
+        maxes = np.frombuffer(self.max_total, dtype=np.int16)[mask].astype(np.float64)
+        count = int(totals.size)
+        if count == 0:
+            return 0, 0
+        normalized = np.divide(
+            totals * 100, maxes, out=np.zeros_like(totals), where=maxes > 0
+        )
+        return round(float(normalized.sum()) / count), count
+
+    def _average_python(self, student_code, class_code, start, end) -> Tuple[int, int]:
+        total_score = 0.0
+        count = 0
+        membership = self.student_class
+        for i, s in enumerate(self.student):
+            if student_code is not None and s != student_code:
+                continue
+            if class_code is not None and membership[s] != class_code:
+                continue
+            d = self.date[i]
+            if (start is not None and d < start) or (end is not None and d > end):
+                continue
+            max_total = self.max_total[i]
+            total_score += (self.total[i] / max_total * 100) if max_total else 0
+            count += 1
+        if count == 0:
+            return 0, 0
+        return round(total_score / count), count
+
+    def memory_bytes(self) -> int:
+        """列配列が使っているバイト数（辞書を除く）"""
+        columns = [
+            self.student, self.class_, self.date, self.lesson,
+            self.total, self.max_total, *self.scores.values(), *self.maxes.values(),
+        ]
+        return sum(c.itemsize * len(c) for c in columns)
+
+
+def get_grade_store() -> Optional[GradeStore]:
+    """有効なら処理中の教室の成績ストアを返す（無効・未初期化なら None）"""
+    return _stores.get(current_branch())
+
+
+def init_grade_store(engine: Engine, branch: str = DEFAULT_BRANCH) -> GradeStore:
+    """教室の grades を列射影で1回だけ読み込んでストアを作る"""
+    store = GradeStore()
+    columns = [
+        Grade.student_id, Grade.class_id, Grade.date, Grade.lesson_number,
+        *(getattr(Grade, f"score_{s}") for s in SUBJECTS),
+        *(getattr(Grade, f"max_{s}") for s in SUBJECTS),
+        Grade.score_total, Grade.max_total,
+    ]
+    with Session(engine) as db:
+        memberships = db.execute(select(Student.id, Student.class_id)).all()
+        result = db.execute(
+            select(*columns).where(Grade.date.isnot(None)).execution_options(yield_per=10000)
+        )
+        keys = list(result.keys())
+        store.load((dict(zip(keys, row)) for row in result), memberships)
+    _stores[branch] = store
+    logger.info(
+        "Grade store loaded (%s): %d rows, %d bytes",
+        branch, len(store), store.memory_bytes(),
+    )
+    return store
+
+
+def record_grades(rows: List[dict]):
+    """
+    コミット済みの成績行をストアへ反映（無効時は何もしない）
+    rows は Grade の列名をキーにした dict（date は date 型）
+    """
+    store = get_grade_store()
+    if store is not None:
+        store.upsert(rows)
+
+
+# 生徒の所属講座の変更をコミット後に反映
+@event.listens_for(Session, "after_flush")
+def _collect_students(session, flush_context):
+    if session.info.get("branch", DEFAULT_BRANCH) not in _stores:
+        return
+    pending = session.info.setdefault("grade_store_students", {})
+    for obj in (*session.new, *session.dirty):
+        if isinstance(obj, Student):
+            pending[obj.id] = obj.class_id
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_students(session):
+    pending = session.info.pop("grade_store_students", None)
+    branch = session.info.get("branch", DEFAULT_BRANCH)
+    if pending and branch in _stores:
+        run_after_commit(session, lambda: _apply_memberships(branch, pending))
+
+
+def _apply_memberships(branch: str, pending: Dict[str, Optional[str]]):
+    store = _stores.get(branch)
+    if store is not None:
+        for student_id, class_id in pending.items():
+            store.set_student_class(student_id, class_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_students(session):
+    session.info.pop("grade_store_students", None)
@@ -0,0 +1,386 @@
+"""
+CSV 取込の履歴と取消
+取込ごとに import_batches の行を作り、追加・更新した生徒と成績に batch_id を付ける
+更新した行は上書き前の値を students_prior / grades_prior に残す
+
+取消は数文の集合演算で行う
+    1. 上書きした行を prior テーブルから1文で書き戻す（batch_id も上書き前の値に戻す）
+    2. まだこの取込の batch_id が付いている行（＝追加した行）を batch_id で削除
+後の取込が同じ行を上書きしていると正しく戻せないため、取消できるのは最新の取込だけ
+
+再取込の差分
+    ファイル全体の SHA-256 が取込済み（取消していない）のファイルと同じで、
+    その取込の後に students / grades への書き込みがなければ、解析せずに
+    取込済みと判定する
+    正規化した行ごとのハッシュを import_row_hashes に残し、
+    次の取込では保存済みのハッシュとの集合の差（新しい行・値の変わった行）だけを
+    突き合わせ・保存の対象にする
+    ハッシュには書き込んだ生徒・成績と値のハッシュも残し、画面・API・スクリプトで
+    後から値が変わった（削除された）行は省かずに差分の対象に戻す
+"""
+
+import hashlib
+import time
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, exists, func, inspect, select, update
+from sqlalchemy.orm import Session
+
+# 取込・取消の一括 UPDATE / DELETE / COPY で生徒検索のインデックスを更新する
+# （イベントの登録のみ）
+import app.services.student_search  # noqa: F401
+from app.branches import DEFAULT_BRANCH
+from app.data_version import mark_tables_changed
+from app.database import get_branch_engine, run_after_commit, stored_data_version
+from app.events import publish_after_commit
+from app.models.archive import grades_archive
+from app.models.attendance_bitmap import AttendanceBitmap
+from app.models.grade import Grade
+from app.models.import_batch import GradePrior, ImportBatch, ImportRowHash, StudentPrior
+from app.models.student import Student
+from app.models.student_stats import StudentStats
+from app.services.archive import attendance_entity, grade_entity
+from app.services.bulk_write import bulk_insert, upsert
+from app.services.grade_store import get_grade_store, init_grade_store
+
+# 取込で上書きする列（prior テーブルに残す列）
+STUDENT_COLUMNS = (
+    "name", "name_kana", "classroom", "gender", "high_school", "course_subject",
+    "school_class", "club", "target_university", "target_dept",
+)
+GRADE_COLUMNS = (
+    "score_comprehension", "score_unseen", "score_grammar",
+    "score_vocabulary", "score_listening", "score_total",
+)
+
+ACTIVE = "取込済"
+ROLLED_BACK = "取消済"
+
+# 取込の後に書き込みがあればファイル単位の判定をしないテーブル
+_FILE_TABLES = ("students", "grades")
+
+# 行を省く前に、今も同じ値か確かめる列
+_VERIFY_COLUMNS = {
+    "student": STUDENT_COLUMNS,
+    "grade": ("student_id", "date", "lesson_number", *GRADE_COLUMNS),
+}
+
+# IN 句1回あたりのハッシュ数
+_HASH_CHUNK = 500
+
+
+# ---- 再取込の差分 ----
+
+def file_digest(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def row_digest(kind: str, row: Dict, keys: Optional[List[str]] = None) -> str:
+    """
+    正規化した行のハッシュ（kind は "student" / "grade"）
+    前後の空白を除いた値を列名順に並べる
+    解析時に数値へ変換した列は "07" と "7" を区別しない
+
+    Args:
+        keys: 列名の並び
+            （同じ形の行をまとめて処理するときに渡す。省略時は row から作る）
+    """
+    if keys is None:
+        keys = sorted(key for key in row if key != "row_hash")
+    text = "\x1f".join([kind, *(f"{key}={str(row[key]).strip()}" for key in keys)])
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+
+def value_digest(kind: str, values: Dict) -> str:
+    """取込で書き込んだ値（_VERIFY_COLUMNS の列）のハッシュ（None と空文字は同じ）"""
+    return _digest_values([values.get(c) for c in _VERIFY_COLUMNS[kind]])
+
+
+def _digest_values(values) -> str:
+    text = "\x1f".join(["" if v is None else str(v).strip() for v in values])
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+
+def _file_tables_version(db: Session) -> str:
+    return ",".join(map(str, stored_data_version(db, *_FILE_TABLES)[1:]))
+
+
+def find_imported_file(db: Session, sha256: Optional[str]) -> Optional[ImportBatch]:
+    """
+    同じ内容のファイルを取り込んだ最新の取込（取消済みは除く）
+    その取込の後に students / grades に書き込みがあれば None（行ごとの差分で判定する）
+    """
+    if not sha256:
+        return None
+    batch = (
+        db.query(ImportBatch)
+        .filter(ImportBatch.file_sha256 == sha256.lower(), ImportBatch.status == ACTIVE)
+        .order_by(ImportBatch.id.desc())
+        .first()
+    )
+    if batch is None or batch.data_version != _file_tables_version(db):
+        return None
+    return batch
+
+
+def _known_hashes(db: Session, hashes: List[str]) -> set:
+    """
+    hashes のうち取込済みで、書き込んだ行が今も同じ値のもの
+    （ファイルの行数に比例し、取込済みの総行数には依存しない）
+    書き込んだ生徒・成績（アーカイブ済みの成績も含む）と結合し、今の値のハッシュと比べる
+    """
+    hashes_table = ImportRowHash.__table__
+    sources = {
+        "student": Student.__table__,
+        "grade": inspect(grade_entity(db, date.min)).selectable,
+    }
+    conn = db.connection()
+    known = set()
+    for i in range(0, len(hashes), _HASH_CHUNK):
+        chunk = hashes[i:i + _HASH_CHUNK]
+        for kind, source in sources.items():
+            rows = conn.execute(
+                select(
+                    hashes_table.c.row_hash, hashes_table.c.value_digest,
+                    *(source.c[c] for c in _VERIFY_COLUMNS[kind]),
+                )
+                .join(source, source.c.id == hashes_table.c.entity_id)
+                .where(hashes_table.c.row_hash.in_(chunk), hashes_table.c.kind == kind)
+            )
+            known.update(
+                row_hash for row_hash, digest, *values in rows
+                if digest == _digest_values(values)
+            )
+    return known
+
+
+def filter_new_rows(
+    db: Session, students: List[Dict], grades: List[Dict]
+) -> Tuple[List[Dict], List[Dict], Dict]:
+    """
+    取込済みの行を除く
+    （各行に "row_hash" を付ける。ファイル内の重複行も1行にまとめる）
+
+    Returns:
+        (新しい・変わった生徒行, 新しい・変わった成績行,
+         {"students": 省いた生徒行数, "grades": 省いた成績行数})
+    """
+    for kind, rows in (("student", students), ("grade", grades)):
+        keys = None
+        for row in rows:
+            # 解析結果の行はどれも同じ列を持つので、列名の並びは最初の行で決める
+            if keys is None:
+                keys = sorted(key for key in row if key != "row_hash")
+            row["row_hash"] = row_digest(kind, row, keys)
+    seen = _known_hashes(db, list({row["row_hash"] for row in (*students, *grades)}))
+
+    def _fresh(rows: List[Dict]) -> List[Dict]:
+        fresh = []
+        for row in rows:
+            if row["row_hash"] not in seen:
+                seen.add(row["row_hash"])
+                fresh.append(row)
+        return fresh
+
+    new_students, new_grades = _fresh(students), _fresh(grades)
+    skipped = {
+        "students": len(students) - len(new_students),
+        "grades": len(grades) - len(new_grades),
+    }
+    return new_students, new_grades, skipped
+
+
+def hash_entry(row: Dict, digest: Optional[str] = None) -> Dict:
+    """
+    差分の行（import_diff）から import_row_hashes の行を作る
+    digest を省くと行の values から値のハッシュを作る
+    """
+    return {
+        "row_hash": row["row_hash"],
+        "kind": row["kind"],
+        "entity_id": row["key"],
+        "value_digest": digest or value_digest(row["kind"], row["values"]),
+    }
+
+
+def record_row_hashes(db: Session, batch_id: int, entries: Iterable[Dict]):
+    """
+    保存した行のハッシュを記録（コミットは呼び出し側）
+    値が変わって省かなかった行のハッシュは記録済みなので、この取込の値で上書きする
+    """
+    rows = {
+        e["row_hash"]: {**e, "batch_id": batch_id} for e in entries if e["row_hash"]
+    }
+    upsert(db, ImportRowHash, list(rows.values()))
+
+
+def stamp_file_version(db: Session, batch: ImportBatch):
+    """
+    取込を確定するコミットの後の students / grades のバージョンを記録
+    （このコミットで両方を進めるので、今の値 + 1 になる。コミットは呼び出し側）
+    """
+    mark_tables_changed(db, *_FILE_TABLES)
+    db.flush()
+    versions = stored_data_version(db, *_FILE_TABLES)[1:]
+    batch.data_version = ",".join(str(v + 1) for v in versions)
+
+
+# ---- 取込の記録 ----
+
+def start_batch(
+    db: Session, filename: str = "", file_sha256: Optional[str] = None
+) -> ImportBatch:
+    """取込の行を作る（id を採番するため flush する）"""
+    batch = ImportBatch(
+        filename=filename or None,
+        file_sha256=file_sha256,
+        created_at=datetime.now(),
+        status=ACTIVE,
+    )
+    db.add(batch)
+    db.flush()
+    return batch
+
+
+def record_priors(db: Session, students: List[dict] = (), grades: List[dict] = ()):
+    """上書き前の値をまとめて保存（同じ行は最初の値だけ渡すこと）"""
+    bulk_insert(db, StudentPrior, list(students))
+    bulk_insert(db, GradePrior, list(grades))
+
+
+def finish_batch(batch: ImportBatch, results: Dict, started: float):
+    """
+    件数と所要時間を記録
+    （started は time.perf_counter() の値。コミットは呼び出し側）
+    """
+    batch.added_students = results["added_students"]
+    batch.updated_students = results["updated_students"]
+    batch.added_grades = results["added_grades"]
+    batch.updated_grades = results["updated_grades"]
+    batch.duration_ms = int((time.perf_counter() - started) * 1000)
+
+
+def list_batches(db: Session, limit: int = 20) -> List[ImportBatch]:
+    return db.query(ImportBatch).order_by(ImportBatch.id.desc()).limit(limit).all()
+
+
+def latest_active_batch_id(db: Session):
+    return db.scalar(
+        select(func.max(ImportBatch.id)).where(ImportBatch.status == ACTIVE)
+    )
+
+
+def _restore(db: Session, model, prior, key_column: str, columns, batch_id: int) -> int:
+    """prior テーブルの値で1文で書き戻す（相関副問い合わせ）"""
+    key = getattr(prior, key_column)
+    prior_ids = select(key).where(prior.batch_id == batch_id)
+
+    def _prior_value(column: str):
+        return (
+            select(getattr(prior, column))
+            .where(prior.batch_id == batch_id, key == model.id)
+            .scalar_subquery()
+        )
+
+    values = {c: _prior_value(c) for c in columns}
+    values["batch_id"] = _prior_value("prior_batch_id")
+    return db.execute(
+        update(model).where(model.id.in_(prior_ids)).values(**values),
+        execution_options={"synchronize_session": False},
+    ).rowcount
+
+
+def rollback_batch(db: Session, batch_id: int) -> Dict:
+    """
+    取込を取り消す（最新の取込のみ）
+
+    Returns:
+        {"restored_students", "restored_grades", "deleted_students", "deleted_grades"}
+
+    Raises:
+        ValueError: 取消できない（最新でない・取消済み・追加した生徒に他の記録がある）
+    """
+    batch = db.get(ImportBatch, batch_id)
+    if batch is None or batch.status != ACTIVE:
+        raise ValueError("取消できる取込が見つかりません")
+    if batch_id != latest_active_batch_id(db):
+        raise ValueError(
+            "新しい取込が残っているため取り消せません"
+            "（新しいものから順に取り消してください）"
+        )
+
+    # 追加した生徒（batch_id が付いていて、上書き前の値がない行）
+    added_students = select(Student.id).where(
+        Student.batch_id == batch_id,
+        Student.id.not_in(
+            select(StudentPrior.student_id).where(StudentPrior.batch_id == batch_id)
+        ),
+    )
+    if db.scalar(select(exists().where(grades_archive.c.batch_id == batch_id))):
+        raise ValueError("この取込の成績はアーカイブ済みのため取り消せません")
+    grades = grade_entity(db, date.min)
+    if db.scalar(select(exists().where(
+        grades.student_id.in_(added_students),
+        func.coalesce(grades.batch_id, 0) != batch_id,
+    ))):
+        raise ValueError(
+            "この取込で追加した生徒に、後から入力した成績があるため取り消せません"
+        )
+    attendance = attendance_entity(db, date.min)
+    if db.scalar(select(exists().where(attendance.student_id.in_(added_students)))):
+        raise ValueError("この取込で追加した生徒に出席記録があるため取り消せません")
+
+    changed_students = set(db.scalars(
+        select(StudentPrior.student_id).where(StudentPrior.batch_id == batch_id)
+    ))
+    deleted_student_ids = set(db.scalars(added_students))
+    affected_grades = db.execute(
+        select(Grade.student_id, Grade.class_id).where(Grade.batch_id == batch_id)
+    ).all()
+
+    result = {
+        "restored_students": _restore(
+            db, Student, StudentPrior, "student_id", STUDENT_COLUMNS, batch_id
+        ),
+        "restored_grades": _restore(
+            db, Grade, GradePrior, "grade_id", GRADE_COLUMNS, batch_id
+        ),
+    }
+    # 書き戻した行は batch_id が変わっているので、残りは追加した行
+    result["deleted_grades"] = db.execute(
+        delete(Grade).where(Grade.batch_id == batch_id),
+        execution_options={"synchronize_session": False},
+    ).rowcount
+    for model in (StudentStats, AttendanceBitmap):
+        db.execute(delete(model).where(model.student_id.in_(added_students)))
+    result["deleted_students"] = db.execute(
+        delete(Student).where(Student.batch_id == batch_id),
+        execution_options={"synchronize_session": False},
+    ).rowcount
+
+    db.execute(delete(StudentPrior).where(StudentPrior.batch_id == batch_id))
+    db.execute(delete(GradePrior).where(GradePrior.batch_id == batch_id))
+    # 取り消した行は次の取込で再び対象になる
+    db.execute(delete(ImportRowHash).where(ImportRowHash.batch_id == batch_id))
+    batch.status = ROLLED_BACK
+    batch.rolled_back_at = datetime.now()
+    db.commit()
+
+    # 削除した成績はストアから個別に消せないので読み直す
+    if get_grade_store() is not None:
+        branch = db.info.get("branch", DEFAULT_BRANCH)
+        run_after_commit(
+            db, lambda: init_grade_store(get_branch_engine(branch), branch)
+        )
+
+    student_ids = changed_students | deleted_student_ids
+    if student_ids:
+        publish_after_commit(db, "students-changed", student_ids=list(student_ids))
+    if affected_grades:
+        publish_after_commit(
+            db, "grades-changed",
+            class_ids={class_id for _, class_id in affected_grades},
+            student_ids={student_id for student_id, _ in affected_grades},
+        )
+    return result
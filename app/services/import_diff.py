@@ -0,0 +1,374 @@
+"""
+CSV 取込の差分
+突き合わせ済みの生徒行・成績行を現在の DB の値と比べ、1行ずつ
+    added（新規）/ changed（上書き。列ごとの変更前後を持つ）/ unchanged（同じ値）/
+    error（保存できない）
+に分類する。DB は生徒・成績・講座をそれぞれまとめて読むだけで、
+行ごとの問い合わせはしない
+
+save_csv_data はプレビューの差分をそのまま使い、書き込みのトランザクション内で
+差分の行の生徒・成績だけを主キーで読み直す（stale_student_keys / stale_grade_keys。
+テーブルごとに1回の問い合わせ）。プレビュー後に画面・API・別の取込で該当行が
+変わっていればやり直しを求める
+"""
+
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.models.class_ import Class
+from app.models.grade import Grade
+from app.models.student import Student
+from app.services.import_batch import GRADE_COLUMNS, STUDENT_COLUMNS
+
+# 列の表示名（変更内容の表示用）
+STUDENT_LABELS = {
+    "name": "氏名",
+    "name_kana": "ふりがな",
+    "classroom": "教室",
+    "gender": "性別",
+    "high_school": "高校",
+    "course_subject": "文系/理系",
+    "school_class": "学校クラス",
+    "club": "部活",
+    "target_university": "志望大学",
+    "target_dept": "志望学部",
+}
+GRADE_LABELS = {
+    "score_comprehension": "授業内容の理解",
+    "score_unseen": "初見問題",
+    "score_grammar": "文法語法",
+    "score_vocabulary": "単語",
+    "score_listening": "リスニング",
+    "score_total": "合計",
+}
+
+# CSV の成績列 → grades の列
+_GRADE_CSV_KEYS = {
+    "score_comprehension": "comprehension",
+    "score_unseen": "unseen_problems",
+    "score_grammar": "grammar",
+    "score_vocabulary": "vocabulary",
+    "score_listening": "listening",
+    "score_total": "total",
+}
+
+STATUSES = ("added", "changed", "unchanged", "error")
+
+_IN_CHUNK = 500
+
+
+def _same(old, new) -> bool:
+    """空文字と NULL は同じ値とみなす"""
+    return (old if old is not None else "") == (new if new is not None else "")
+
+
+def _fetch_students(db: Session, student_ids: List[str]) -> Dict[str, dict]:
+    columns = [
+        Student.id, Student.class_id, Student.batch_id,
+        *(getattr(Student, c) for c in STUDENT_COLUMNS),
+    ]
+    found = {}
+    for i in range(0, len(student_ids), _IN_CHUNK):
+        chunk = student_ids[i:i + _IN_CHUNK]
+        for row in db.execute(select(*columns).where(Student.id.in_(chunk))):
+            found[row.id] = row._asdict()
+    return found
+
+
+def _fetch_grades(
+    db: Session, student_ids: List[str], dates: List[date]
+) -> Dict[Tuple, dict]:
+    """(生徒ID, 日付, 授業回) → 既存の成績（生徒IDと日付の範囲でまとめて読む）"""
+    if not student_ids or not dates:
+        return {}
+    columns = [
+        Grade.id, Grade.student_id, Grade.date, Grade.lesson_number,
+        Grade.class_id, Grade.batch_id,
+        *(getattr(Grade, c) for c in GRADE_COLUMNS),
+    ]
+    found = {}
+    for i in range(0, len(student_ids), _IN_CHUNK):
+        rows = db.execute(
+            select(*columns).where(
+                Grade.student_id.in_(student_ids[i:i + _IN_CHUNK]),
+                Grade.date.between(min(dates), max(dates)),
+            )
+        )
+        for row in rows:
+            key = (row.student_id, row.date, row.lesson_number)
+            found.setdefault(key, row._asdict())
+    return found
+
+
+def _fetch_class_ids(db: Session, codes: Iterable[str]) -> set:
+    codes = [c for c in set(codes) if c]
+    found = set()
+    for i in range(0, len(codes), _IN_CHUNK):
+        chunk = codes[i:i + _IN_CHUNK]
+        found.update(db.scalars(select(Class.id).where(Class.id.in_(chunk))))
+    return found
+
+
+def _fetch_grade_ids(db: Session, grade_ids: List[str]) -> set:
+    found = set()
+    for i in range(0, len(grade_ids), _IN_CHUNK):
+        chunk = grade_ids[i:i + _IN_CHUNK]
+        found.update(db.scalars(select(Grade.id).where(Grade.id.in_(chunk))))
+    return found
+
+
+def _classify(
+    existing: Optional[dict], values: dict, labels: Dict[str, str]
+) -> Tuple[str, List[dict]]:
+    if existing is None:
+        return "added", []
+    changes = [
+        {"field": label, "old": existing[column], "new": values[column]}
+        for column, label in labels.items()
+        if not _same(existing[column], values[column])
+    ]
+    return ("changed" if changes else "unchanged"), changes
+
+
+def _prior(existing: dict, key_name: str, columns) -> dict:
+    return {
+        key_name: existing["id"],
+        "prior_batch_id": existing["batch_id"],
+        **{c: existing[c] for c in columns},
+    }
+
+
+def _count(rows: List[dict]) -> Dict[str, int]:
+    counts = dict.fromkeys(STATUSES, 0)
+    for row in rows:
+        counts[row["status"]] += 1
+    return counts
+
+
+def diff_import(
+    db: Session,
+    students_with_ids: List[Tuple[Dict, str]],
+    matched_grades: List[Tuple[Dict, str]],
+) -> Dict:
+    """
+    突き合わせ結果を DB の現在値と比べる
+
+    Returns:
+        {"students": [行], "grades": [行],
+         "counts": {"students": {状態: 件数}, "grades": {...}},
+         "duplicates": CSV 内で同じ生徒・同じ成績が重なって省いた行数,
+         "superseded": 省いた行の [{"kind", "key": 後の行の key, "row_hash"}]}
+        行は {"kind", "status", "key", "label", "values": 書き込む列,
+              "changes": [{"field", "old", "new"}],
+              "prior": 上書き前の値（changed のみ）, "row_hash", "message"}
+    """
+    grade_student_ids = {student_id for _, student_id in matched_grades}
+    student_ids = {sid for _, sid in students_with_ids} | grade_student_ids
+    students_by_id = _fetch_students(db, list(student_ids))
+    class_ids = _fetch_class_ids(
+        db,
+        (s.get("student_code", "") for s, sid in students_with_ids
+         if sid not in students_by_id),
+    )
+
+    # 同じ生徒・同じ成績が複数行あれば後の行を使う（上書きを順に適用した結果と同じ）
+    # 省いた行のハッシュも記録し、次の取込で前の行だけが差分として残らないようにする
+    superseded = []
+    latest_students = {}
+    for student, student_id in students_with_ids:
+        if student_id in latest_students:
+            superseded.append({
+                "kind": "student", "key": student_id,
+                "row_hash": latest_students[student_id].get("row_hash"),
+            })
+        latest_students[student_id] = student
+
+    today = date.today()
+    student_rows = []
+    new_classes = {}
+    for student_id, student in latest_students.items():
+        values = {c: student[c] for c in STUDENT_COLUMNS}
+        existing = students_by_id.get(student_id)
+        status, changes = _classify(existing, values, STUDENT_LABELS)
+        if existing is None:
+            code = student.get("student_code", "")
+            values.update(class_id=code if code in class_ids else None, join_date=today)
+            new_classes[student_id] = values["class_id"]
+        else:
+            values["class_id"] = existing["class_id"]
+        student_rows.append({
+            "kind": "student",
+            "status": status,
+            "key": student_id,
+            "label": student["name"],
+            "values": values,
+            "changes": changes,
+            "prior": (
+                _prior(existing, "student_id", STUDENT_COLUMNS)
+                if status == "changed" else None
+            ),
+            "row_hash": student.get("row_hash"),
+            "message": "",
+        })
+
+    parsed = []
+    grade_rows = []
+    for grade, student_id in matched_grades:
+        try:
+            parsed.append((grade, student_id, date.fromisoformat(grade["date"])))
+        except (TypeError, ValueError):
+            grade_rows.append({
+                "kind": "grade", "status": "error", "key": None,
+                "label": (
+                    f"{grade['name']} 第{grade['lesson_number']}回 {grade['date']}"
+                ),
+                "values": {}, "changes": [], "prior": None, "row_hash": None,
+                "message": f"日付 {grade['date']} を読み取れません",
+            })
+    existing_grades = _fetch_grades(
+        db, sorted(grade_student_ids), [d for _, _, d in parsed]
+    )
+
+    latest_grades = {}
+    superseded_grades = []
+    for grade, student_id, grade_date in parsed:
+        key = (student_id, grade_date, grade["lesson_number"])
+        if key in latest_grades:
+            superseded_grades.append((key, latest_grades[key].get("row_hash")))
+        latest_grades[key] = grade
+
+    grade_ids = {}
+
+    for (student_id, grade_date, lesson_number), grade in latest_grades.items():
+        values = {column: grade[key] for column, key in _GRADE_CSV_KEYS.items()}
+        existing = existing_grades.get((student_id, grade_date, lesson_number))
+        status, changes = _classify(existing, values, GRADE_LABELS)
+        if existing is None:
+            student = students_by_id.get(student_id)
+            class_id = student["class_id"] if student else new_classes.get(student_id)
+            values.update(
+                id=f"g_{student_id}_{grade['date']}_{lesson_number}",
+                student_id=student_id,
+                class_id=class_id,
+                date=grade_date,
+                lesson_number=lesson_number,
+                lesson_content=grade["lesson_content"],
+            )
+        else:
+            values.update(
+                id=existing["id"], student_id=student_id, class_id=existing["class_id"],
+                date=grade_date, lesson_number=lesson_number,
+            )
+        grade_ids[(student_id, grade_date, lesson_number)] = values["id"]
+        grade_rows.append({
+            "kind": "grade",
+            "status": status,
+            "key": values["id"],
+            "label": f"{grade['name']} 第{lesson_number}回 {grade['date']}",
+            "values": values,
+            "changes": changes,
+            "prior": (
+                _prior(existing, "grade_id", GRADE_COLUMNS)
+                if status == "changed" else None
+            ),
+            "row_hash": grade.get("row_hash"),
+            "message": "",
+        })
+
+    # 追加する成績の ID が別の成績（日付・授業回を画面で直したものなど）に使われていれば
+    # 保存できない行にする（1件の主キー重複で取込全体が失敗しないように）
+    added = [row for row in grade_rows if row["status"] == "added"]
+    taken = _fetch_grade_ids(db, [row["key"] for row in added])
+    for row in added:
+        if row["key"] in taken:
+            message = f"成績ID {row['key']} は別の成績で使われています"
+            row.update(status="error", message=message)
+
+    return {
+        "students": student_rows,
+        "grades": grade_rows,
+        "counts": {"students": _count(student_rows), "grades": _count(grade_rows)},
+        "duplicates": len(superseded) + len(superseded_grades),
+        "superseded": [row for row in superseded if row["row_hash"]] + [
+            {"kind": "grade", "key": grade_ids[key], "row_hash": row_hash}
+            for key, row_hash in superseded_grades if row_hash
+        ],
+    }
+
+
+def _current_values(db: Session, model, rows: List[dict], columns) -> Dict[str, dict]:
+    """差分の行（error 以外）の主キーで現在の値をまとめて読む"""
+    ids = [row["key"] for row in rows if row["status"] != "error"]
+    selected = [model.id, *(getattr(model, c) for c in columns)]
+    current = {}
+    for i in range(0, len(ids), _IN_CHUNK):
+        chunk = ids[i:i + _IN_CHUNK]
+        for row in db.execute(select(*selected).where(model.id.in_(chunk))):
+            current[row.id] = row._asdict()
+    return current
+
+
+def _stale(rows: List[dict], current: Dict[str, dict], columns) -> set:
+    """
+    added は ID が使われていれば、changed は上書き前の値と、
+    unchanged は書き込む値と違えば変わったとみなす
+    """
+    stale = set()
+    for row in rows:
+        now = current.get(row["key"])
+        if row["status"] == "added":
+            expected = None
+        elif row["status"] == "changed":
+            expected = row["prior"]
+        elif row["status"] == "unchanged":
+            expected = row["values"]
+        else:
+            continue
+        if (now is None) != (expected is None) or (
+            now is not None and any(not _same(now[c], expected[c]) for c in columns)
+        ):
+            stale.add(row["key"])
+    return stale
+
+
+def stale_student_keys(db: Session, rows: List[dict]) -> set:
+    """
+    差分を作った後に DB で変わった生徒の ID（stale_grade_keys の生徒版）
+    所属講座が変わった生徒と、追加する生徒の講座が消えた場合も含む
+    """
+    current = _current_values(db, Student, rows, (*STUDENT_COLUMNS, "class_id"))
+    stale = _stale(rows, current, STUDENT_COLUMNS)
+    for row in rows:
+        now = current.get(row["key"])
+        if row["status"] in ("changed", "unchanged") and now is not None and (
+            now["class_id"] != row["values"]["class_id"]
+        ):
+            stale.add(row["key"])
+    added_classes = {
+        row["key"]: row["values"]["class_id"]
+        for row in rows if row["status"] == "added" and row["values"]["class_id"]
+    }
+    if added_classes:
+        found = _fetch_class_ids(db, added_classes.values())
+        stale.update(key for key, code in added_classes.items() if code not in found)
+    return stale
+
+
+def stale_grade_keys(db: Session, rows: List[dict]) -> set:
+    """差分を作った後に DB で変わった成績の ID"""
+    current = _current_values(db, Grade, rows, GRADE_COLUMNS)
+    return _stale(rows, current, GRADE_COLUMNS)
+
+
+def filter_rows(diff: Dict, kind: str, status: Optional[str] = None) -> List[dict]:
+    """
+    プレビューの表示用に行を絞り込む
+    kind は "students" / "grades"、status 省略時は全件
+    """
+    rows = diff.get(kind, [])
+    if status in STATUSES:
+        rows = [row for row in rows if row["status"] == status]
+    return rows
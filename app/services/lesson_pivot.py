@@ -0,0 +1,205 @@
+"""
+講座 × 授業回（または授業内容）のピボット集計
+成績を1回の GROUP BY（講座, 授業回）で集計し、合計・各科目の正規化スコア（0-100）の
+件数・和・二乗和から平均とばらつき（標準偏差）を求める
+
+全講座の列（授業回ごとの全体）と講座ごとの全体は、同じ集計の和を足し合わせて求める（再集計しない）
+結果は教室ごと・集計軸ごとに grades / classes のデータバージョンをキーにキャッシュする
+"""
+
+from threading import Lock
+from typing import Dict, List
+
+from sqlalchemy import case, func, select
+from sqlalchemy.orm import Session
+
+from app.branches import current_branch
+from app.data_version import get_data_version
+from app.models.grade import Grade
+from app.services.read_models import class_options
+from app.services.trends import SERIES
+from app.single_flight import coalesce
+
+# 集計軸 → 表示名
+AXES = {
+    "lesson_number": "授業回",
+    "lesson_content": "授業内容",
+}
+DEFAULT_AXIS = "lesson_number"
+# 全講座で平均が低い順にこの数だけ「難しい回」として示す
+HARDEST_COUNT = 5
+
+_cache: dict = {}
+_cache_lock = Lock()
+
+
+def _normalized(series: str):
+    """
+    得点を満点 100 に換算する式
+    （満点が 0・未設定なら 0 点。calculate_class_average と同じ扱い）
+    """
+    score = func.coalesce(getattr(Grade, f"score_{series}"), 0)
+    max_score = getattr(Grade, f"max_{series}")
+    return case((max_score > 0, score * 100.0 / max_score), else_=0.0)
+
+
+def _cell(n: int, total: float, squares: float) -> dict:
+    mean = total / n
+    variance = max(squares / n - mean * mean, 0.0)
+    return {"avg": round(mean, 1), "sd": round(variance ** 0.5, 1), "count": n}
+
+
+def _add(target: Dict, key, n: int, sums: Dict[str, tuple]):
+    entry = target.get(key)
+    if entry is None:
+        target[key] = [n, {name: list(s) for name, s in sums.items()}]
+        return
+    entry[0] += n
+    for name, (total, squares) in sums.items():
+        entry[1][name][0] += total
+        entry[1][name][1] += squares
+
+
+def _cells(n: int, sums: Dict[str, tuple]) -> Dict[str, dict]:
+    return {name: _cell(n, total, squares) for name, (total, squares) in sums.items()}
+
+
+def _sort_key(lesson):
+    # 授業回・授業内容が未設定の成績は最後の列
+    return (lesson is None, lesson if lesson is not None else "")
+
+
+def compute_lesson_pivot(db: Session, axis: str = DEFAULT_AXIS) -> dict:
+    """
+    講座 × 授業回のピボットを1回の GROUP BY で集計
+
+    Args:
+        axis: "lesson_number"（授業回）または "lesson_content"（授業内容）
+
+    Returns:
+        {
+            "axis": 集計軸,
+            "lessons": 列（授業回・授業内容）のリスト,
+            "classes": [
+                {"id", "name", "cells": {列: {系列: セル}}, "overall": {系列: セル}},
+                ...
+            ],
+            "school": {列: {系列: セル}}（全講座）,
+        }
+        セルは {"avg": 平均, "sd": 標準偏差, "count": 成績数}、系列は "total" と各科目
+    """
+    lesson = getattr(Grade, axis)
+    columns = [Grade.class_id, lesson, func.count()]
+    for name in SERIES:
+        value = _normalized(name)
+        columns += [func.sum(value), func.sum(value * value)]
+    stmt = (
+        select(*columns)
+        .where(Grade.class_id.isnot(None))
+        .group_by(Grade.class_id, lesson)
+    )
+
+    by_class: Dict[str, Dict] = {}
+    class_totals: Dict[str, list] = {}
+    school: Dict = {}
+    for row in db.execute(stmt):
+        class_id, key, n = row[0], row[1], row[2]
+        sums = {
+            name: (float(row[3 + 2 * i]), float(row[4 + 2 * i]))
+            for i, name in enumerate(SERIES)
+        }
+        by_class.setdefault(class_id, {})[key] = _cells(n, sums)
+        _add(class_totals, class_id, n, sums)
+        _add(school, key, n, sums)
+
+    names = {c.id: c.name for c in class_options(db)}
+    classes = [
+        {
+            "id": class_id,
+            "name": names.get(class_id, class_id),
+            "cells": by_class[class_id],
+            "overall": _cells(*class_totals[class_id]),
+        }
+        for class_id in sorted(by_class, key=lambda c: names.get(c, c))
+    ]
+    return {
+        "axis": axis,
+        "lessons": sorted(school, key=_sort_key),
+        "classes": classes,
+        "school": {key: _cells(*entry) for key, entry in school.items()},
+    }
+
+
+@coalesce("lesson_pivot", "grades", "classes")
+def get_lesson_pivot(db: Session, axis: str = DEFAULT_AXIS) -> dict:
+    """
+    ピボット（grades / classes が更新されるまでキャッシュ。
+    同時の呼び出しは1回の集計にまとめる）
+    """
+    version = get_data_version("grades", "classes")
+    cache_key = (current_branch(), axis)
+    cached = _cache.get(cache_key)
+    if cached and cached[0] == version:
+        return cached[1]
+    with _cache_lock:
+        cached = _cache.get(cache_key)
+        if cached and cached[0] == version:
+            return cached[1]
+        pivot = compute_lesson_pivot(db, axis)
+        _cache[cache_key] = (version, pivot)
+        return pivot
+
+
+def lesson_label(axis: str, lesson) -> str:
+    """列の見出し（授業回は「第N回」）"""
+    if lesson is None:
+        return "未設定"
+    return f"第{lesson}回" if axis == "lesson_number" else str(lesson)
+
+
+def heatmap(pivot: dict, series: str = "total") -> dict:
+    """
+    ヒートマップの表（1系列分のセルを列の順に並べる。成績のない組み合わせは None）
+
+    Returns:
+        {"columns": 見出しのリスト,
+         "rows": [{"name", "cells", "overall"}, ...],
+         "school": セルのリスト}
+    """
+    lessons = pivot["lessons"]
+
+    def pick(cells: dict) -> list:
+        return [
+            cells[lesson][series] if lesson in cells else None for lesson in lessons
+        ]
+
+    return {
+        "columns": [lesson_label(pivot["axis"], lesson) for lesson in lessons],
+        "rows": [
+            {
+                "name": row["name"],
+                "cells": pick(row["cells"]),
+                "overall": row["overall"][series],
+            }
+            for row in pivot["classes"]
+        ],
+        "school": pick(pivot["school"]),
+    }
+
+
+def hardest_lessons(
+    pivot: dict, series: str = "total", limit: int = HARDEST_COUNT
+) -> List[dict]:
+    """
+    全講座で平均が低い授業回（難しい回）
+
+    Returns:
+        [{"lesson": 列の見出し, "avg", "sd", "count"}, ...]（平均が低い順）
+    """
+    rows = [
+        {"lesson": lesson_label(pivot["axis"], lesson), **cells[series]}
+        for lesson, cells in pivot["school"].items()
+    ]
+    rows.sort(key=lambda r: r["avg"])
+    return rows[:limit]
+
@@ -0,0 +1,125 @@
+"""
+定期処理のジョブ本体
+夜間の事前計算・翌日の講座のキャッシュ準備・DB の最適化・期限切れプレビューの削除
+
+定期処理はリーダーのプロセスだけで動くので、DB を使うジョブは全教室の DB を順に処理する
+（for_each_branch）
+プレビュー・分割アップロードは UPLOAD_SPOOL_DIR のファイルなので、どのプロセスで
+削除しても全ワーカーに反映される（プレビューは保存のたびにも期限切れを削除する）
+"""
+
+import logging
+from datetime import date, timedelta
+from typing import Dict
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from app.branches import branch_codes
+from app.database import engine, for_each_branch, get_branch_engine
+from app.models.class_ import Class
+from app.scheduler import Scheduler
+from app.services.chunked_upload import purge_expired_sessions
+from app.services.dashboard_publisher import invalidate_branch
+from app.services.grade_calculator import calculate_class_average
+from app.services.grade_entry import get_grade_grid
+from app.services.roll_call import get_roll_call
+from app.services.student_stats import precompute_student_stats
+from app.services.trends import get_all_trends
+from app.services.upload_preview import purge_expired_previews
+
+logger = logging.getLogger(__name__)
+
+# Class.day の表記（date.weekday() の順）
+WEEKDAYS = ("月", "火", "水", "木", "金", "土", "日")
+
+
+def _summary(results: Dict[str, str]) -> str:
+    """教室ごとの結果を1行にする（教室が1つならその結果だけ）"""
+    if len(results) == 1:
+        return next(iter(results.values()))
+    return " / ".join(f"{branch}: {result}" for branch, result in results.items())
+
+
+def precompute_stats_job() -> str:
+    counts = for_each_branch(precompute_student_stats)
+    # 事前計算はイベントを発行しないので、書き出したダッシュボードを古いものにする
+    for branch in counts:
+        invalidate_branch(branch)
+    return _summary({branch: f"{n}名分を計算" for branch, n in counts.items()})
+
+
+def warm_tomorrow_job() -> str:
+    """
+    翌日に授業がある講座（Class.day）の表示に使うデータを先に読み込む
+    全生徒のトレンドはプロセス内にキャッシュされ、
+    講座の成績・出欠は DB のページキャッシュに載る
+    """
+    target = date.today() + timedelta(days=1)
+    weekday = WEEKDAYS[target.weekday()]
+
+    def _warm(db) -> str:
+        get_all_trends(db)
+        classes = db.query(Class).filter(Class.day == weekday).all()
+        students = 0
+        for class_obj in classes:
+            calculate_class_average(db, class_obj.id)
+            get_roll_call(db, class_obj.id, target)
+            students += len(get_grade_grid(db, class_obj.id))
+        return f"{weekday}曜日 {len(classes)}講座・{students}名"
+
+    return _summary(for_each_branch(_warm))
+
+
+def optimize_database(db_engine: Engine = engine) -> str:
+    """統計情報の更新と空き領域の回収"""
+    if db_engine.dialect.name == "sqlite":
+        with db_engine.connect() as conn:
+            conn.exec_driver_sql("ANALYZE")
+            conn.exec_driver_sql("PRAGMA optimize")
+            # auto_vacuum=INCREMENTAL の DB でだけ領域が回収される
+            # （それ以外は何もしない）
+            mode = conn.exec_driver_sql("PRAGMA auto_vacuum").scalar()
+            conn.exec_driver_sql("PRAGMA incremental_vacuum")
+            conn.commit()
+        note = "" if mode == 2 else "（auto_vacuum 無効のため領域回収なし）"
+        return "ANALYZE / PRAGMA optimize / incremental_vacuum" + note
+
+    # PostgreSQL の VACUUM はトランザクション外で実行する
+    autocommit = db_engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+    with autocommit as conn:
+        conn.execute(text("VACUUM ANALYZE"))
+    return "VACUUM ANALYZE"
+
+
+def optimize_databases_job() -> str:
+    """全教室の DB を最適化"""
+    return _summary({
+        branch: optimize_database(get_branch_engine(branch))
+        for branch in branch_codes()
+    })
+
+
+def purge_previews_job() -> str:
+    previews, sessions = purge_expired_previews(), purge_expired_sessions()
+    return f"プレビュー{previews}件・分割アップロード{sessions}件を削除"
+
+
+def register_jobs(scheduler: Scheduler):
+    """既定のジョブを登録（スケジュールは cron 形式: 分 時 日 月 曜日）"""
+    scheduler.register(
+        "precompute_stats", "0 2 * * *", precompute_stats_job,
+        "生徒の集計・アドバイスの事前計算",
+    )
+    scheduler.register(
+        "optimize_database", "30 3 * * *", optimize_databases_job,
+        "DB の統計更新・最適化",
+    )
+    scheduler.register(
+        "warm_tomorrow", "0 21 * * *", warm_tomorrow_job,
+        "翌日の講座のデータを事前読み込み",
+    )
+    scheduler.register(
+        "purge_previews", "*/10 * * * *", purge_previews_job,
+        "期限切れの取込プレビュー・分割アップロードを削除",
+    )
@@ -0,0 +1,128 @@
+"""
+一覧表示用の読み取りモデル
+テンプレートが使う列だけを Core の select() で射影し、
+NamedTuple（__dict__ を持たないタプル）で返す
+ORM のインスタンス生成・アイデンティティマップへの登録・変更追跡・
+relationship の遅延読み込みを行わない
+
+各型はテンプレートが参照する属性名を ORM のモデルと同じにしてあるので、
+同じパーシャルで描画できる
+書き込み後の再読込など、ORM のインスタンスが必要な処理には使わない
+"""
+
+from datetime import date
+from typing import Iterator, List, NamedTuple, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.models.class_ import Class
+from app.models.grade import Grade
+from app.models.student import Student
+
+
+class StudentRow(NamedTuple):
+    """partials/students_table.html の1行"""
+    name: str
+    name_kana: Optional[str]
+    target_university: Optional[str]
+    target_dept: Optional[str]
+    gender: Optional[str]
+
+
+class StudentOption(NamedTuple):
+    """生徒セレクトボックスの選択肢"""
+    id: str
+    name: str
+
+
+class ClassRow(NamedTuple):
+    """partials/classes_table.html の1行（生徒数は GROUP BY で数える）"""
+    id: str
+    name: str
+    day: Optional[str]
+    time: Optional[str]
+    student_count: int
+
+
+class ClassOption(NamedTuple):
+    id: str
+    name: str
+
+
+class GradeRow(NamedTuple):
+    """partials/grades_table.html の1行"""
+    date: date
+    lesson_content: Optional[str]
+    score_comprehension: int
+    max_comprehension: int
+    score_unseen: int
+    max_unseen: int
+    score_grammar: int
+    max_grammar: int
+    score_vocabulary: int
+    max_vocabulary: int
+    score_listening: int
+    max_listening: int
+    score_total: int
+    max_total: int
+
+
+def _columns(model, row_type) -> list:
+    return [getattr(model, name) for name in row_type._fields]
+
+
+_GRADE_COLUMNS = _columns(Grade, GradeRow)
+
+
+def student_rows(db: Session) -> List[StudentRow]:
+    """生徒一覧（氏名順）"""
+    stmt = select(*_columns(Student, StudentRow)).order_by(Student.name)
+    return list(map(StudentRow._make, db.execute(stmt)))
+
+
+def class_student_options(db: Session, class_id: str) -> List[StudentOption]:
+    """講座の生徒（連鎖セレクト用）"""
+    stmt = select(Student.id, Student.name).where(Student.class_id == class_id)
+    return list(map(StudentOption._make, db.execute(stmt)))
+
+
+def class_rows(db: Session) -> List[ClassRow]:
+    """講座一覧と生徒数（1回の LEFT JOIN + GROUP BY。講座ごとに生徒を読み込まない）"""
+    stmt = (
+        select(Class.id, Class.name, Class.day, Class.time, func.count(Student.id))
+        .outerjoin(Student, Student.class_id == Class.id)
+        .group_by(Class.id, Class.name, Class.day, Class.time)
+    )
+    return list(map(ClassRow._make, db.execute(stmt)))
+
+
+def class_options(db: Session) -> List[ClassOption]:
+    stmt = select(Class.id, Class.name).order_by(Class.id)
+    return list(map(ClassOption._make, db.execute(stmt)))
+
+
+def recent_grade_rows(db: Session, limit: Optional[int] = None) -> List[GradeRow]:
+    """成績を新しい順に"""
+    stmt = select(*_GRADE_COLUMNS).order_by(Grade.date.desc())
+    if limit:
+        stmt = stmt.limit(limit)
+    return list(map(GradeRow._make, db.execute(stmt)))
+
+
+def iter_recent_grade_rows(
+    db: Session, limit: Optional[int] = None, batch_size: int = 500
+) -> Iterator[GradeRow]:
+    """
+    成績を新しい順に少しずつ読み出す
+    （テンプレートの描画に合わせて batch_size 行ずつフェッチ）
+    読み終えるまで db を閉じないこと
+    """
+    stmt = (
+        select(*_GRADE_COLUMNS)
+        .order_by(Grade.date.desc())
+        .execution_options(yield_per=batch_size)
+    )
+    if limit:
+        stmt = stmt.limit(limit)
+    return map(GradeRow._make, db.execute(stmt))
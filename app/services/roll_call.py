@@ -0,0 +1,163 @@
+"""
+出欠入力（講座×日付の一括記録）
+講座の全生徒分を1トランザクション・1コミットで記録／修正する
+"""
+
+import hashlib
+from datetime import date
+from typing import Dict, List
+
+from sqlalchemy import select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from app.events import publish_after_commit
+from app.models.attendance import Attendance
+from app.models.class_ import Class
+from app.models.student import Student
+from app.services.attendance_bitmap import apply_attendance
+
+ATTENDANCE_STATUSES = ("出席", "欠席", "遅刻")
+DEFAULT_STATUS = "出席"
+
+
+def attendance_id(student_id: str, class_id: str, target_date: date) -> str:
+    """(生徒, 講座, 日付) から決まる出席ID（String(20) に収まる長さ）"""
+    key = f"{student_id}|{class_id}|{target_date.isoformat()}"
+    return "a" + hashlib.blake2b(key.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def _existing_records(
+    db: Session, class_id: str, target_date: date
+) -> Dict[str, tuple]:
+    """生徒ID → (出席ID, 状態)"""
+    rows = db.execute(
+        select(Attendance.student_id, Attendance.id, Attendance.status)
+        .where(Attendance.class_id == class_id, Attendance.date == target_date)
+    )
+    return {student_id: (record_id, status) for student_id, record_id, status in rows}
+
+
+def _upsert(db: Session, rows: List[dict]):
+    """
+    出欠を追加（読んでから書くまでに別のプロセスが同じ生徒・講座・日付を
+    記録していれば、一意インデックスの衝突として状態を上書きする）
+    """
+    dialect = db.get_bind().dialect.name
+    stmt = (pg_insert if dialect == "postgresql" else sqlite_insert)(Attendance)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["student_id", "class_id", "date"],
+        set_={"status": stmt.excluded.status},
+    )
+    db.execute(stmt, rows)
+
+
+def get_roll_call(db: Session, class_id: str, target_date: date) -> dict:
+    """
+    出欠入力グリッド用のデータを取得
+
+    Returns:
+        {
+            "class": 講座（なければ None）,
+            "rows": [{"student": 生徒, "status": 状態, "recorded": 記録済みか}, ...],
+            "counts": {状態: 人数}
+        }
+    """
+    class_obj = db.query(Class).filter(Class.id == class_id).first()
+    students = (
+        db.query(Student)
+        .filter(Student.class_id == class_id)
+        .order_by(Student.name_kana, Student.name)
+        .all()
+    )
+    existing = _existing_records(db, class_id, target_date)
+
+    rows = []
+    for student in students:
+        record = existing.get(student.id)
+        rows.append({
+            "student": student,
+            "status": record[1] if record else DEFAULT_STATUS,
+            "recorded": record is not None,
+        })
+
+    counts = {s: sum(1 for r in rows if r["status"] == s) for s in ATTENDANCE_STATUSES}
+    return {"class": class_obj, "rows": rows, "counts": counts}
+
+
+def record_roll_call(
+    db: Session,
+    class_id: str,
+    target_date: date,
+    statuses: Dict[str, str],
+) -> dict:
+    """
+    講座の出欠を一括で記録（既存は更新、未記録は追加）
+
+    (student_id, class_id, date) をキーに既存記録を1回のクエリで引き、
+    一括 UPDATE と一括 INSERT（ON CONFLICT DO UPDATE）の後に1回だけコミットする
+
+    Args:
+        db: DB セッション
+        class_id: 講座ID
+        target_date: 授業日
+        statuses: {生徒ID: "出席" / "欠席" / "遅刻"}
+
+    Returns:
+        {"added": 追加件数, "updated": 更新件数, "unchanged": 変更なし件数}
+    """
+    invalid = {s for s in statuses.values() if s not in ATTENDANCE_STATUSES}
+    if invalid:
+        raise ValueError(f"不正な出欠状態です: {', '.join(sorted(invalid))}")
+
+    members = set(db.scalars(select(Student.id).where(Student.class_id == class_id)))
+    outsiders = set(statuses) - members
+    if outsiders:
+        ids = ", ".join(sorted(outsiders))
+        raise ValueError(f"講座に所属していない生徒が含まれています: {ids}")
+
+    existing = _existing_records(db, class_id, target_date)
+    new_rows: List[dict] = []
+    changed_rows: List[dict] = []
+    unchanged = 0
+
+    for student_id, status in statuses.items():
+        record = existing.get(student_id)
+        if record is None:
+            new_rows.append({
+                "id": attendance_id(student_id, class_id, target_date),
+                "student_id": student_id,
+                "class_id": class_id,
+                "date": target_date,
+                "status": status,
+            })
+        elif record[1] != status:
+            changed_rows.append({"id": record[0], "status": status})
+        else:
+            unchanged += 1
+
+    if new_rows:
+        _upsert(db, new_rows)
+    if changed_rows:
+        db.execute(update(Attendance), changed_rows)
+    if new_rows or changed_rows:
+        changed = {row["id"] for row in changed_rows}
+        apply_attendance(db, [
+            (student_id, target_date)
+            for student_id in statuses
+            if student_id not in existing or existing[student_id][0] in changed
+        ])
+    db.commit()
+    publish_after_commit(
+        db,
+        "attendance-changed",
+        class_ids=[class_id],
+        student_ids=list(statuses),
+    )
+
+    return {
+        "added": len(new_rows),
+        "updated": len(changed_rows),
+        "unchanged": unchanged,
+    }
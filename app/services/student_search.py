@@ -0,0 +1,322 @@
+"""
+生徒検索
+氏名・ふりがな・高校・志望大学・部活を正規化してインデックス化し、
+前方一致（索引の範囲検索）と部分一致（SQLite FTS5 trigram）で検索する
+
+インデックスは students への書き込みと同じトランザクションで更新する
+    ORM のフラッシュ          after_flush（_sync_index）
+    SQL 式の INSERT / UPDATE / DELETE（session.execute）
+                              do_orm_execute（_sync_core_write）
+    PostgreSQL の COPY        bulk_write の書き込み後の関数（_sync_bulk_write）
+正規化は Python で行うので、DB のトリガーでは作れない
+"""
+
+import logging
+import unicodedata
+from typing import Iterable, List, Set
+
+from sqlalchemy import (
+    and_,
+    delete,
+    event,
+    exists,
+    func,
+    insert,
+    or_,
+    select,
+    text,
+)
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import ORMExecuteState, Session
+
+from app.models.student import Student
+from app.models.student_search import StudentSearch
+from app.services.bulk_write import listen_bulk_write
+
+logger = logging.getLogger(__name__)
+
+# カタカナ（ァ〜ヶ）→ ひらがな
+_KATA_TO_HIRA = {code: code - 0x60 for code in range(0x30A1, 0x30F7)}
+
+# 前方一致の上限（これより大きい文字は正規化後の文字列に現れない）
+_PREFIX_END = "\U0010ffff"
+
+# FTS5（trigram）を用意できた DB の URL（ensure_search_index で判定。
+# 教室ごとに DB が分かれ、SQLite と PostgreSQL が混在しうるので DB ごとに持つ）
+_fts_urls: Set[str] = set()
+
+# インデックス化する項目（書き込む行にすべてあれば DB を読み直さない）
+_INDEXED_FIELDS = ("name", "name_kana", "high_school", "target_university", "club")
+
+_IN_CHUNK = 500
+
+_FTS_REBUILD = text(
+    "INSERT INTO student_search_fts(student_search_fts) VALUES ('rebuild')"
+)
+_FTS_COUNT = text("SELECT COUNT(*) FROM student_search_fts_docsize")
+
+_FTS_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS student_search_fts USING fts5(
+        body, content='student_search', content_rowid='id', tokenize='trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS student_search_ai AFTER INSERT ON student_search BEGIN
+        INSERT INTO student_search_fts(rowid, body) VALUES (new.id, new.body);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS student_search_ad AFTER DELETE ON student_search BEGIN
+        INSERT INTO student_search_fts(student_search_fts, rowid, body)
+        VALUES ('delete', old.id, old.body);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS student_search_au AFTER UPDATE ON student_search BEGIN
+        INSERT INTO student_search_fts(student_search_fts, rowid, body)
+        VALUES ('delete', old.id, old.body);
+        INSERT INTO student_search_fts(rowid, body) VALUES (new.id, new.body);
+    END
+    """,
+]
+
+
+def _fts_enabled(bind: Engine) -> bool:
+    return str(bind.url) in _fts_urls
+
+
+def normalize_search_text(value: str) -> str:
+    """
+    検索用に文字列を正規化
+    全角/半角（NFKC）・カタカナ/ひらがな・大文字/小文字・空白の違いを吸収する
+    """
+    if not value:
+        return ""
+    value = unicodedata.normalize("NFKC", value).lower().translate(_KATA_TO_HIRA)
+    return "".join(value.split())
+
+
+def _index_values(student: Student) -> dict:
+    """生徒1件分のインデックス行"""
+    fields = [getattr(student, field) for field in _INDEXED_FIELDS]
+    return {
+        "student_id": student.id,
+        "name_key": normalize_search_text(student.name),
+        "kana_key": normalize_search_text(student.name_kana),
+        # 項目の境界をまたいで一致しないよう空白で区切る（検索語の空白は除去済み）
+        "body": " ".join(normalize_search_text(f) for f in fields if f),
+    }
+
+
+# ORM 経由の書き込み（生徒追加・CSV取込・JSON移行）と同じトランザクションで更新
+@event.listens_for(Session, "after_flush")
+def _sync_index(session, flush_context):
+    written = [o for o in (*session.new, *session.dirty) if isinstance(o, Student)]
+    deleted = [o.id for o in session.deleted if isinstance(o, Student)]
+    if not written and not deleted:
+        return
+
+    table = StudentSearch.__table__
+    connection = session.connection()
+    stale = deleted + [s.id for s in written]
+    for i in range(0, len(stale), _IN_CHUNK):
+        chunk = stale[i:i + _IN_CHUNK]
+        connection.execute(delete(table).where(table.c.student_id.in_(chunk)))
+    if written:
+        connection.execute(insert(table), [_index_values(s) for s in written])
+
+
+def refresh_search_index(db: Session, student_ids: Iterable[str]):
+    """
+    ORM を通さずに書き換えた生徒のインデックスを DB の値から作り直す
+    存在しなくなった生徒は削除だけ行う（コミットは呼び出し側）
+    """
+    table = StudentSearch.__table__
+    student_ids = list(student_ids)
+    for i in range(0, len(student_ids), _IN_CHUNK):
+        chunk = student_ids[i:i + _IN_CHUNK]
+        db.execute(delete(table).where(table.c.student_id.in_(chunk)))
+        students = db.execute(
+            select(Student.id, *(getattr(Student, f) for f in _INDEXED_FIELDS))
+            .where(Student.id.in_(chunk))
+        ).all()
+        if students:
+            db.execute(insert(table), [_index_values(s) for s in students])
+
+
+def reindex_students(db: Session, rows: List[dict]):
+    """
+    書き込んだ行（主キー "id" を含む dict）の生徒のインデックスを作り直す
+    インデックス化する項目がすべてあれば、その値から作る（DB を読み直さない）
+    """
+    if not rows:
+        return
+    if not all(field in rows[0] for field in _INDEXED_FIELDS):
+        refresh_search_index(db, [row["id"] for row in rows])
+        return
+    table = StudentSearch.__table__
+    values = [_index_values(Student(**row)) for row in rows]
+    for i in range(0, len(values), _IN_CHUNK):
+        chunk = values[i:i + _IN_CHUNK]
+        ids = [v["student_id"] for v in chunk]
+        db.execute(delete(table).where(table.c.student_id.in_(ids)))
+        db.execute(insert(table), chunk)
+
+
+def _unindexed_ids(db: Session) -> List[str]:
+    """インデックスのない生徒"""
+    indexed = exists().where(StudentSearch.student_id == Student.id)
+    return list(db.scalars(select(Student.id).where(~indexed)))
+
+
+# SQL 式で students を書き換えたとき（CSV 取込の一括 UPDATE・取消など）
+@event.listens_for(Session, "do_orm_execute")
+def _sync_core_write(state: ORMExecuteState):
+    if not (state.is_insert or state.is_update or state.is_delete):
+        return None
+    table = getattr(state.statement, "table", None)
+    if table is None or table.name != Student.__tablename__:
+        return None
+
+    params = state.parameters
+    rows = params if isinstance(params, list) else [params] if params else []
+    session = state.session
+    if state.is_insert:
+        result = state.invoke_statement()
+        if rows and all("id" in row for row in rows):
+            reindex_students(session, rows)
+        else:
+            # INSERT ... SELECT など、追加した生徒が分からない
+            refresh_search_index(session, _unindexed_ids(session))
+        return result
+
+    if rows and all("id" in row for row in rows):
+        # 主キー指定の一括 UPDATE / DELETE
+        result = state.invoke_statement()
+        if state.is_update:
+            reindex_students(session, rows)
+        else:
+            refresh_search_index(session, [row["id"] for row in rows])
+        return result
+    # WHERE で対象を選ぶ文は、書き込む前に同じ条件で対象の生徒を調べる
+    target = select(Student.id)
+    if state.statement.whereclause is not None:
+        target = target.where(state.statement.whereclause)
+    student_ids = list(session.scalars(target))
+    result = state.invoke_statement()
+    refresh_search_index(session, student_ids)
+    return result
+
+
+# COPY で書き込んだとき（session.execute を通らない）
+@listen_bulk_write(Student.__tablename__)
+def _sync_bulk_write(db: Session, rows: List[dict]):
+    reindex_students(db, rows)
+
+
+def rebuild_search_index(db: Session) -> int:
+    """
+    インデックスを全件作り直す（既存DBへの導入時や不整合時）
+
+    Returns:
+        インデックス化した生徒数
+    """
+    table = StudentSearch.__table__
+    db.execute(delete(table))
+    rows = [_index_values(s) for s in db.query(Student).all()]
+    if rows:
+        db.execute(insert(table), rows)
+    if _fts_enabled(db.get_bind()):
+        db.execute(_FTS_REBUILD)
+    db.commit()
+    return len(rows)
+
+
+def ensure_search_index(engine: Engine):
+    """
+    起動時に FTS5 テーブルとトリガーを用意し、件数が合わなければ再構築
+    SQLite 以外や FTS5 非対応の環境では LIKE 検索にフォールバック
+    """
+    if engine.dialect.name == "sqlite":
+        try:
+            with engine.begin() as conn:
+                for ddl in _FTS_DDL:
+                    conn.execute(text(ddl))
+                # トリガーを作る前に書き込まれた行（アプリの起動前の JSON 移行など）を
+                # FTS に反映（FTS にない行をトリガーで削除すると FTS が壊れる）
+                indexed = conn.scalar(select(func.count()).select_from(StudentSearch))
+                if conn.scalar(_FTS_COUNT) != indexed:
+                    conn.execute(_FTS_REBUILD)
+            _fts_urls.add(str(engine.url))
+        except Exception as e:
+            logger.warning("FTS5 trigram is unavailable, falling back to LIKE: %s", e)
+
+    with Session(engine) as db:
+        indexed = db.scalar(select(func.count()).select_from(StudentSearch))
+        students = db.scalar(select(func.count()).select_from(Student))
+        fts_rows = db.scalar(_FTS_COUNT) if _fts_enabled(engine) else indexed
+        if indexed != students or fts_rows != indexed:
+            count = rebuild_search_index(db)
+            logger.info("Student search index rebuilt: %d students", count)
+
+
+def search_students(db: Session, query: str, limit: int = 10) -> List[Student]:
+    """
+    生徒を検索（前方一致を優先し、不足分を部分一致で補う）
+
+    Args:
+        db: DB セッション
+        query: 検索語（氏名・ふりがな・高校・志望大学・部活）
+        limit: 最大件数
+
+    Returns:
+        一致した生徒のリスト（前方一致 → 部分一致の順）
+    """
+    q = normalize_search_text(query)
+    if not q:
+        return []
+
+    # 1. 氏名・ふりがなの前方一致（索引の範囲検索）
+    upper = q + _PREFIX_END
+    ids = list(db.scalars(
+        select(StudentSearch.student_id)
+        .where(or_(
+            and_(StudentSearch.name_key >= q, StudentSearch.name_key < upper),
+            and_(StudentSearch.kana_key >= q, StudentSearch.kana_key < upper),
+        ))
+        .order_by(StudentSearch.kana_key)
+        .limit(limit)
+    ))
+
+    # 2. 全項目の部分一致（trigram は3文字以上、それ未満は LIKE）
+    if len(ids) < limit:
+        if len(q) >= 3 and _fts_enabled(db.get_bind()):
+            substring_ids = db.scalars(
+                text(
+                    "SELECT s.student_id FROM student_search_fts f "
+                    "JOIN student_search s ON s.id = f.rowid "
+                    "WHERE student_search_fts MATCH :q LIMIT :n"
+                ),
+                {"q": '"' + q.replace('"', '""') + '"', "n": limit + len(ids)},
+            )
+        else:
+            escaped = (
+                q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            )
+            pattern = "%" + escaped + "%"
+            substring_ids = db.scalars(
+                select(StudentSearch.student_id)
+                .where(StudentSearch.body.like(pattern, escape="\\"))
+                .limit(limit + len(ids))
+            )
+        for student_id in substring_ids:
+            if student_id not in ids:
+                ids.append(student_id)
+            if len(ids) >= limit:
+                break
+
+    if not ids:
+        return []
+    students = {s.id: s for s in db.query(Student).filter(Student.id.in_(ids)).all()}
+    return [students[i] for i in ids if i in students]
@@ -0,0 +1,105 @@
+"""
+生徒ごとの集計・アドバイスの事前計算（夜間の定期処理）
+平均・出席率は GROUP BY 1回ずつ、トレンドは compute_trends で全生徒まとめて求め、
+student_stats を一括で入れ替える
+
+計算時の grades / attendance / students のバージョン（DB に記録したもの）を行に保存し、
+その後どのプロセスからも書き込みがなければ学習アドバイスは事前計算の結果を返す
+（定期処理はリーダーのプロセスだけで動くので、プロセス内のバージョンでは比べられない）
+"""
+
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import case, delete, func, insert, select
+from sqlalchemy.orm import Session
+
+from app.database import stored_data_version
+from app.db_writer import submit_write_sync
+from app.models.attendance import Attendance
+from app.models.grade import Grade
+from app.models.student import Student
+from app.models.student_stats import StudentStats
+from app.services.grade_calculator import compose_advice
+from app.services.trends import compute_trends
+
+SOURCE_TABLES = ("grades", "attendance", "students")
+
+
+def _source_version(db: Session) -> str:
+    """元データのバージョン（DB に記録したもの）を文字列にする"""
+    return ",".join(map(str, stored_data_version(db, *SOURCE_TABLES)[1:]))
+
+
+def precompute_student_stats(db: Session) -> int:
+    """
+    全生徒の集計とアドバイスを計算して student_stats を入れ替える
+
+    Returns:
+        計算した生徒数
+    """
+    # 集計より先に読む
+    # （集計中に書き込まれたら古いバージョンが残り、事前計算は使われない）
+    version = _source_version(db)
+
+    # calculate_student_average と同じく満点0の成績は0点として平均する
+    normalized = case(
+        (Grade.max_total > 0, Grade.score_total * 100.0 / Grade.max_total), else_=0
+    )
+    averages = {
+        student_id: (round(avg or 0), count)
+        for student_id, avg, count in db.execute(
+            select(Grade.student_id, func.avg(normalized), func.count())
+            .group_by(Grade.student_id)
+        )
+    }
+    attendance = {
+        student_id: round(present * 100 / total) if total else 0
+        for student_id, present, total in db.execute(
+            select(
+                Attendance.student_id,
+                func.sum(case((Attendance.status == "出席", 1), else_=0)),
+                func.count(),
+            ).group_by(Attendance.student_id)
+        )
+    }
+    trends = compute_trends(db)
+
+    now = datetime.now()
+    rows = []
+    for student_id in db.scalars(select(Student.id)):
+        average, count = averages.get(student_id, (0, 0))
+        rate = attendance.get(student_id, 0)
+        trend = trends.get(student_id)
+        rows.append({
+            "student_id": student_id,
+            "grade_count": count,
+            "average": average,
+            "attendance_rate": rate,
+            "trend_direction": trend["direction"] if trend else None,
+            "trend_slope": trend["total"]["slope"] if trend else None,
+            "forecast": trend["total"]["forecast"] if trend else None,
+            "advice": compose_advice(count, average, rate, trend),
+            "computed_at": now,
+            "source_version": version,
+        })
+
+    def _replace(w: Session):
+        w.execute(delete(StudentStats))
+        if rows:
+            w.execute(insert(StudentStats), rows)
+        w.commit()
+
+    submit_write_sync(_replace, db)
+    return len(rows)
+
+
+def get_precomputed_advice(db: Session, student_id: str) -> Optional[str]:
+    """事前計算後にデータが変わっていなければ、そのアドバイスを返す"""
+    row = db.execute(
+        select(StudentStats.advice, StudentStats.source_version)
+        .where(StudentStats.student_id == student_id)
+    ).first()
+    if row is None or row.source_version != _source_version(db):
+        return None
+    return row.advice
@@ -0,0 +1,305 @@
+"""
+成績トレンド・予測（全生徒一括）
+生徒ごとの (日付, 正規化スコア) 系列に最小二乗で直線を当てはめ、
+科目別の傾き・直近 N 回の移動平均・ばらつき・次回テストの予測点と予測区間を求める
+
+成績は1回のクエリで読み込み、回帰に必要な和（n, Σx, Σy, Σxy, Σx², Σy²）を
+生徒ごとにまとめて集計する（NumPy があれば bincount でベクトル化、なければ1回のループ）
+全生徒分の結果は教室ごとに grades のデータバージョンをキーにキャッシュする
+"""
+
+from collections import deque
+from datetime import date
+from threading import Lock
+from typing import Dict, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.branches import current_branch
+from app.data_version import get_data_version
+from app.models.grade import Grade
+from app.models.student import Student
+from app.single_flight import coalesce
+
+try:
+    import numpy as np
+except ImportError:  # NumPy は任意（speedups）
+    np = None
+
+SUBJECTS = ("comprehension", "unseen", "grammar", "vocabulary", "listening")
+SERIES = ("total", *SUBJECTS)
+
+# 移動平均に使う直近の回数
+DEFAULT_WINDOW = 5
+# 傾きの表示単位（30日あたりの点数変化）
+SLOPE_DAYS = 30
+# 30日あたりこの点数以上の変化で「上昇」「下降」とみなす
+TREND_THRESHOLD = 3.0
+
+# t 分布の 97.5% 点（自由度 1〜30）。それ以上は正規分布で近似
+_T_975 = (
+    12.71, 4.30, 3.18, 2.78, 2.57, 2.45, 2.36, 2.31, 2.26, 2.23,
+    2.20, 2.18, 2.16, 2.14, 2.13, 2.12, 2.11, 2.10, 2.09, 2.09,
+    2.08, 2.07, 2.07, 2.06, 2.06, 2.06, 2.05, 2.05, 2.05, 2.04,
+)
+
+_cache: dict = {}
+_cache_lock = Lock()
+
+
+def _t_value(df: int) -> float:
+    return _T_975[df - 1] if 1 <= df <= len(_T_975) else 1.96
+
+
+def _load_series(db: Session, student_ids: Optional[List[str]]):
+    """
+    成績を (生徒, 日付, 授業回) 順に1回のクエリで読み込む
+
+    Returns:
+        (生徒IDのリスト, 日付序数のリスト, 系列ごとの正規化スコア（0-100）のリスト)
+    """
+    columns = [
+        Grade.student_id, Grade.date,
+        Grade.score_total, Grade.max_total,
+        *(getattr(Grade, f"score_{s}") for s in SUBJECTS),
+        *(getattr(Grade, f"max_{s}") for s in SUBJECTS),
+    ]
+    stmt = select(*columns).order_by(Grade.student_id, Grade.date, Grade.lesson_number)
+    if student_ids is not None:
+        stmt = stmt.where(Grade.student_id.in_(student_ids))
+
+    ids: List[str] = []
+    days: List[int] = []
+    values = {name: [] for name in SERIES}
+    n_subjects = len(SUBJECTS)
+    # ORM を通さず Core で読む（行数が多いので結果処理の負担を減らす）
+    for row in db.connection().execute(stmt.execution_options(yield_per=10000)):
+        ids.append(row[0])
+        days.append(row[1].toordinal())
+        values["total"].append(
+            row[2] * 100 / row[3] if row[2] is not None and row[3] else 0.0
+        )
+        for i, s in enumerate(SUBJECTS):
+            score, max_score = row[4 + i], row[4 + n_subjects + i]
+            values[s].append(
+                score * 100 / max_score if score is not None and max_score else 0.0
+            )
+    return ids, days, values
+
+
+def _fit(n, sx, sy, sxy, sxx, syy):
+    """和から傾き・切片・残差標準偏差・Sxx（中心化）を求める"""
+    mean_x = sx / n
+    mean_y = sy / n
+    sxx_c = sxx - sx * mean_x
+    sxy_c = sxy - sx * mean_y
+    syy_c = syy - sy * mean_y
+    slope = sxy_c / sxx_c if sxx_c > 0 else 0.0
+    intercept = mean_y - slope * mean_x
+    sse = max(syy_c - slope * sxy_c, 0.0)
+    resid_sd = (sse / (n - 2)) ** 0.5 if n > 2 else 0.0
+    return slope, intercept, resid_sd, sxx_c, mean_x
+
+
+def _summarize(n, sums, first_x, last_x, origin, moving_avg) -> dict:
+    """1生徒分の和から結果を組み立てる（x は origin からの日数）"""
+    result = {"count": n, "subjects": {}}
+    # 次回テスト日は平均間隔で見込む
+    interval = (last_x - first_x) / (n - 1) if n > 1 else 0.0
+    next_x = last_x + interval
+
+    for name in SERIES:
+        sx, sy, sxy, sxx, syy = sums[name]
+        slope, intercept, resid_sd, sxx_c, mean_x = _fit(n, sx, sy, sxy, sxx, syy)
+        entry = {
+            "slope": round(slope * SLOPE_DAYS, 1),
+            "moving_avg": round(moving_avg[name], 1),
+            "volatility": round(resid_sd, 1),
+        }
+        if name == "total":
+            forecast = intercept + slope * next_x if n > 1 else sy / n
+            if n > 2 and sxx_c > 0:
+                spread = 1 + 1 / n + (next_x - mean_x) ** 2 / sxx_c
+                margin = _t_value(n - 2) * resid_sd * spread ** 0.5
+            else:
+                margin = None
+            entry["forecast"] = round(min(max(forecast, 0.0), 100.0), 1)
+            if margin is not None:
+                entry["low"] = round(max(forecast - margin, 0.0), 1)
+                entry["high"] = round(min(forecast + margin, 100.0), 1)
+            else:
+                entry["low"] = entry["high"] = None
+            entry["next_date"] = date.fromordinal(int(round(next_x + origin)))
+            result["total"] = entry
+        else:
+            result["subjects"][name] = entry
+
+    slope_total = result["total"]["slope"]
+    if n < 3:
+        result["direction"] = "データ不足"
+    elif slope_total >= TREND_THRESHOLD:
+        result["direction"] = "上昇"
+    elif slope_total <= -TREND_THRESHOLD:
+        result["direction"] = "下降"
+    else:
+        result["direction"] = "横ばい"
+    return result
+
+
+def _compute_numpy(ids, days, values, window) -> Dict[str, dict]:
+    # 行は生徒順に並んでいるので、生徒の切れ目から各行の生徒番号を作る
+    id_array = np.array(ids, dtype=object)
+    starts = np.concatenate(([0], np.flatnonzero(id_array[1:] != id_array[:-1]) + 1))
+    counts = np.diff(np.append(starts, len(ids)))
+    groups = np.repeat(np.arange(len(starts)), counts)
+    ends = starts + counts - 1
+
+    # x は全体の最小日からの日数（二乗和の桁落ちを避ける）
+    origin = min(days)
+    x = np.array(days, dtype=np.float64) - origin
+    # 末尾から数えた位置（0 が最新）で直近 N 回を選ぶ
+    from_end = ends[groups] - np.arange(len(ids))
+    recent = from_end < window
+    recent_counts = np.bincount(groups, weights=recent.astype(np.float64))
+
+    n_groups = len(starts)
+    sx = np.bincount(groups, weights=x, minlength=n_groups)
+    sxx = np.bincount(groups, weights=x * x, minlength=n_groups)
+    sums = {}
+    moving = {}
+    for name in SERIES:
+        y = np.asarray(values[name], dtype=np.float64)
+        sums[name] = (
+            sx,
+            np.bincount(groups, weights=y, minlength=n_groups),
+            np.bincount(groups, weights=x * y, minlength=n_groups),
+            sxx,
+            np.bincount(groups, weights=y * y, minlength=n_groups),
+        )
+        recent_sum = np.bincount(
+            groups, weights=np.where(recent, y, 0.0), minlength=n_groups
+        )
+        moving[name] = recent_sum / recent_counts
+
+    results = {}
+    first_x = x[starts]
+    last_x = x[ends]
+    for g in range(n_groups):
+        n = int(counts[g])
+        student_sums = {name: tuple(float(a[g]) for a in sums[name]) for name in SERIES}
+        results[ids[int(starts[g])]] = _summarize(
+            n, student_sums, float(first_x[g]), float(last_x[g]), origin,
+            {name: float(moving[name][g]) for name in SERIES},
+        )
+    return results
+
+
+def _compute_python(ids, days, values, window) -> Dict[str, dict]:
+    results = {}
+    origin = min(days)
+    i = 0
+    total_rows = len(ids)
+    while i < total_rows:
+        student_id = ids[i]
+        n = 0
+        sums = {name: [0.0, 0.0, 0.0, 0.0, 0.0] for name in SERIES}
+        recent = {name: deque(maxlen=window) for name in SERIES}
+        first_x = days[i] - origin
+        while i < total_rows and ids[i] == student_id:
+            x = days[i] - origin
+            for name in SERIES:
+                y = values[name][i]
+                s = sums[name]
+                s[0] += x
+                s[1] += y
+                s[2] += x * y
+                s[3] += x * x
+                s[4] += y * y
+                recent[name].append(y)
+            last_x = x
+            n += 1
+            i += 1
+        results[student_id] = _summarize(
+            n, sums, first_x, last_x, origin,
+            {name: sum(recent[name]) / len(recent[name]) for name in SERIES},
+        )
+    return results
+
+
+def compute_trends(
+    db: Session,
+    student_ids: Optional[List[str]] = None,
+    window: int = DEFAULT_WINDOW,
+) -> Dict[str, dict]:
+    """
+    生徒ごとの成績トレンドを一括計算
+
+    Args:
+        db: DB セッション
+        student_ids: 対象の生徒ID（None なら全生徒）
+        window: 移動平均に使う直近の回数
+
+    Returns:
+        {生徒ID: {
+            "count": 成績数,
+            "direction": "上昇" / "下降" / "横ばい" / "データ不足",
+            "total": {"slope": 30日あたりの変化, "moving_avg", "volatility",
+                      "forecast": 次回予測, "low", "high": 95%予測区間, "next_date"},
+            "subjects": {科目名: {"slope", "moving_avg", "volatility"}}
+        }}
+    """
+    ids, days, values = _load_series(db, student_ids)
+    if not ids:
+        return {}
+    if np is not None:
+        return _compute_numpy(ids, days, values, window)
+    return _compute_python(ids, days, values, window)
+
+
+@coalesce("all_trends", "grades")
+def get_all_trends(db: Session) -> Dict[str, dict]:
+    """
+    全生徒のトレンド（grades が更新されるまでキャッシュ。
+    キャッシュがないときの同時の呼び出しは1回の計算にまとめる）
+    """
+    version = get_data_version("grades")
+    branch = current_branch()
+    cached = _cache.get(branch)
+    if cached and cached[0] == version:
+        return cached[1]
+    with _cache_lock:
+        cached = _cache.get(branch)
+        if cached and cached[0] == version:
+            return cached[1]
+        trends = compute_trends(db)
+        _cache[branch] = (version, trends)
+        return trends
+
+
+def get_student_trend(db: Session, student_id: str) -> Optional[dict]:
+    """1生徒分のトレンド（全生徒分がキャッシュ済みならそれを使う）"""
+    cached = _cache.get(current_branch())
+    if cached and cached[0] == get_data_version("grades"):
+        return cached[1].get(student_id)
+    return compute_trends(db, [student_id]).get(student_id)
+
+
+def trend_report(db: Session, class_id: Optional[str] = None) -> List[dict]:
+    """
+    レポート用の一覧（下降が大きい順）
+
+    Returns:
+        [{"student": 生徒, "trend": トレンド}, ...]
+    """
+    trends = get_all_trends(db)
+    query = db.query(Student)
+    if class_id:
+        query = query.filter(Student.class_id == class_id)
+    rows = [
+        {"student": student, "trend": trends[student.id]}
+        for student in query.all()
+        if student.id in trends
+    ]
+    rows.sort(key=lambda r: r["trend"]["total"]["slope"])
+    return rows
@@ -0,0 +1,99 @@
+"""
+CSV 取込プレビューの一時保存
+アップロード〜保存確定の間だけ解析結果を UPLOAD_SPOOL_DIR/previews に保存する
+（UUID キーはセッションに保存）
+ファイルに置くので、プレビューと保存確定・ページ送りが別のワーカーに届いても参照できる
+確定されずに残ったものは PREVIEW_TTL_SECONDS 後に削除する（保存時と定期処理）
+"""
+
+import os
+import pickle
+import re
+import time
+import uuid
+from typing import Optional
+
+from app.config import settings
+
+# プレビューの保持時間（秒）
+PREVIEW_TTL_SECONDS = 60 * 60
+
+_PREVIEW_KEY = re.compile(r"[0-9a-f]{32}")
+
+
+def _preview_dir() -> str:
+    return os.path.join(settings.UPLOAD_SPOOL_DIR, "previews")
+
+
+def _path(cache_key: Optional[str]) -> Optional[str]:
+    # キーはセッション由来だが、ファイル名に使うので形式を確かめる
+    if not cache_key or not _PREVIEW_KEY.fullmatch(cache_key):
+        return None
+    return os.path.join(_preview_dir(), f"{cache_key}.pickle")
+
+
+def _expired(path: str) -> bool:
+    return time.time() - os.path.getmtime(path) > PREVIEW_TTL_SECONDS
+
+
+def _load(path: str) -> Optional[dict]:
+    try:
+        if _expired(path):
+            return None
+        with open(path, "rb") as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def store_preview(data: dict) -> str:
+    """プレビューを保存してキーを返す"""
+    purge_expired_previews()
+    os.makedirs(_preview_dir(), exist_ok=True)
+    cache_key = uuid.uuid4().hex
+    path = _path(cache_key)
+    with open(f"{path}.tmp", "wb") as f:
+        pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(f"{path}.tmp", path)
+    return cache_key
+
+
+def get_preview(cache_key: Optional[str]) -> Optional[dict]:
+    """プレビューを参照（取り出さない。ページ送り・絞り込みの表示用）"""
+    path = _path(cache_key)
+    return _load(path) if path else None
+
+
+def pop_preview(cache_key: Optional[str]) -> Optional[dict]:
+    """プレビューを取り出す（期限切れ・存在しなければ None）"""
+    path = _path(cache_key)
+    if path is None:
+        return None
+    # 先に名前を変えて取り出す（保存の二重送信で同じプレビューを2回書き込まない）
+    claimed = f"{path}.{uuid.uuid4().hex}.claimed"
+    try:
+        os.rename(path, claimed)
+    except FileNotFoundError:
+        return None
+    try:
+        return _load(claimed)
+    finally:
+        os.remove(claimed)
+
+
+def purge_expired_previews() -> int:
+    """期限切れのプレビューを削除して件数を返す"""
+    try:
+        names = os.listdir(_preview_dir())
+    except FileNotFoundError:
+        return 0
+    removed = 0
+    for name in names:
+        path = os.path.join(_preview_dir(), name)
+        try:
+            if _expired(path):
+                os.remove(path)
+                removed += 1
+        except FileNotFoundError:
+            continue
+    return removed
@@ -0,0 +1,132 @@
+"""
+同じ計算の同時実行をまとめる（シングルフライト）
+同じキーの計算が実行中なら、後から来た呼び出しは計算せずにその結果を待って受け取る
+テスト直後に同じ講座の生徒がいっせいにダッシュボードを開いても、クラス平均の集計は1回で済む
+
+キーは (名前, 教室コード, 対象テーブルのデータバージョン, 引数)
+書き込みがコミットされるとバージョンが変わるので、その後の呼び出しが書き込み前の結果を受け取ることはない
+結果は保持しない（キャッシュではない）。計算が終わればキーは消え、次の呼び出しは新しく計算する
+
+使い方:
+    @coalesce("class_average", "grades", "students")
+    def calculate_class_average(db, class_id): ...
+
+    calculate_class_average(db, class_id)                  # スレッドから（同期）
+    await calculate_class_average.run_async(db, class_id)  # async のエンドポイントから
+
+async 版は先頭の呼び出しがスレッドプールで計算し、後続はイベントループ上で結果を待つ
+計算には先頭の呼び出しのセッションを使う（後続のセッションは使わない）
+"""
+
+import asyncio
+from collections import defaultdict
+from concurrent.futures import Future
+from functools import wraps
+from threading import Lock
+from typing import Callable, Dict, Hashable, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from app.data_version import get_data_version
+
+_COUNTERS = ("calls", "executions", "coalesced", "errors")
+
+_lock = Lock()
+# キー → 実行中の計算の Future
+_in_flight: Dict[Hashable, Future] = {}
+# 名前 → {"calls", "executions", "coalesced", "errors"}
+_stats: Dict[str, Dict[str, int]] = defaultdict(lambda: dict.fromkeys(_COUNTERS, 0))
+
+
+def _join(name: str, key: Hashable) -> Tuple[Future, bool]:
+    """実行中の計算に相乗りする。なければ登録して先頭になる（戻り値の2つ目が True）"""
+    with _lock:
+        stats = _stats[name]
+        stats["calls"] += 1
+        future = _in_flight.get(key)
+        if future is not None:
+            stats["coalesced"] += 1
+            return future, False
+        future = _in_flight[key] = Future()
+        stats["executions"] += 1
+        return future, True
+
+
+def _lead(name: str, key: Hashable, future: Future, fn: Callable):
+    """先頭の呼び出しとして計算し、待っている呼び出しへ結果（または例外）を渡す"""
+    try:
+        result = fn()
+    except BaseException as e:
+        with _lock:
+            _stats[name]["errors"] += 1
+            del _in_flight[key]
+        future.set_exception(e)
+        raise
+    with _lock:
+        del _in_flight[key]
+    future.set_result(result)
+    return result
+
+
+def coalesce(name: str, *tables: str):
+    """
+    fn(db, *args) の同時実行をまとめるデコレータ
+
+    Args:
+        name: 集計の名前（メトリクスとキーに使う）
+        tables: 結果が依存するテーブル（このデータバージョンをキーに含める）
+    """
+
+    def decorator(fn: Callable):
+        def _key(args: tuple, kwargs: dict) -> tuple:
+            return (
+                name, get_data_version(*tables), args, tuple(sorted(kwargs.items()))
+            )
+
+        @wraps(fn)
+        def wrapper(db, *args, **kwargs):
+            key = _key(args, kwargs)
+            future, leader = _join(name, key)
+            if not leader:
+                return future.result()
+            return _lead(name, key, future, lambda: fn(db, *args, **kwargs))
+
+        async def run_async(db, *args, **kwargs):
+            key = _key(args, kwargs)
+            future, leader = _join(name, key)
+            if not leader:
+                # 待っている側が切断されても、先頭の計算（と他の待ち手）は取り消さない
+                return await asyncio.shield(asyncio.wrap_future(future))
+            return await run_in_threadpool(
+                _lead, name, key, future, lambda: fn(db, *args, **kwargs)
+            )
+
+        wrapper.run_async = run_async
+        return wrapper
+
+    return decorator
+
+
+def coalescing_stats() -> Dict[str, dict]:
+    """
+    名前ごとの呼び出し数・実際の計算回数・相乗りした回数・失敗数・実行中の計算数
+
+    Returns:
+        {名前: {"calls", "executions", "coalesced", "errors", "in_flight",
+               "coalesced_ratio"}}
+    """
+    with _lock:
+        in_flight = defaultdict(int)
+        for key in _in_flight:
+            in_flight[key[0]] += 1
+        return {
+            name: {
+                **stats,
+                "in_flight": in_flight[name],
+                "coalesced_ratio": (
+                    round(stats["coalesced"] / stats["calls"], 3)
+                    if stats["calls"] else 0.0
+                ),
+            }
+            for name, stats in sorted(_stats.items())
+        }
@@ -0,0 +1,83 @@
+"""
+起動処理の所要時間の記録（/health で返す）
+
+    import    app の読み込み開始（main.py が最初に読み込むこのモジュール）から
+              app.main の読み込み完了まで
+    phases    lifespan の起動処理の各段階（スキーマ確認・インデックス確認など）
+    ready     lifespan の起動処理が終わった時点（ここから /health が応答する）
+    warmup    起動後に別スレッドで行う準備（テンプレートの事前コンパイルなど）
+
+時間はすべてミリ秒。import と ready は読み込み開始からの経過時間
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+_started = time.perf_counter()
+_timings: Dict[str, Optional[float]] = {"import": None, "ready": None}
+_phases: Dict[str, float] = {}
+_warmup: Dict[str, dict] = {}
+_lock = threading.Lock()
+
+
+def _elapsed_ms(since: float) -> float:
+    return round((time.perf_counter() - since) * 1000, 1)
+
+
+def mark_imported():
+    """app.main の読み込み完了（main.py の末尾で呼ぶ）"""
+    _timings["import"] = _elapsed_ms(_started)
+
+
+def mark_ready():
+    """起動処理の完了（lifespan の yield の直前で呼ぶ）"""
+    _timings["ready"] = _elapsed_ms(_started)
+    logger.info("Startup finished: import %.1f ms, ready %.1f ms, phases %s",
+                _timings["import"] or 0, _timings["ready"], _phases)
+
+
+@contextmanager
+def phase(name: str):
+    """起動処理の1段階の時間を記録（教室ごとに繰り返す段階は合計する）"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _phases[name] = round(_phases.get(name, 0) + _elapsed_ms(started), 1)
+
+
+def start_warmup(name: str, fn: Callable[[], object]) -> threading.Thread:
+    """起動を待たせずに別スレッドで fn を実行（失敗してもログに残すだけ）"""
+    with _lock:
+        _warmup[name] = {"status": "running", "ms": None}
+
+    def _run():
+        started = time.perf_counter()
+        try:
+            fn()
+            status = "done"
+        except Exception as e:
+            logger.error("Warmup %s failed: %s", name, e, exc_info=True)
+            status = "failed"
+        with _lock:
+            _warmup[name] = {"status": status, "ms": _elapsed_ms(started)}
+
+    thread = threading.Thread(target=_run, name=f"warmup-{name}", daemon=True)
+    thread.start()
+    return thread
+
+
+def startup_report() -> dict:
+    with _lock:
+        warmup = {name: dict(state) for name, state in _warmup.items()}
+    return {
+        "import_ms": _timings["import"],
+        "ready_ms": _timings["ready"],
+        "phases": dict(_phases),
+        "warmup": warmup,
+    }
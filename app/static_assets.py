@@ -0,0 +1,55 @@
+"""
+静的ファイル配信
+内容ハッシュ付き URL（/static/css/styles.css?v=xxxx）を発行し、
+ハッシュ一致時は immutable で長期キャッシュさせる
+"""
+
+import hashlib
+import os
+
+from starlette.staticfiles import StaticFiles
+from starlette.types import Scope
+
+STATIC_DIR = os.path.join(os.path.dirname(__file__), "..", "static")
+
+# 相対パス → (mtime, ハッシュ)
+_hash_cache: dict = {}
+
+
+def _file_hash(path: str) -> str:
+    """ファイル内容のハッシュ（更新時刻が変わったときだけ再計算）"""
+    full_path = os.path.join(STATIC_DIR, path)
+    try:
+        mtime = os.stat(full_path).st_mtime
+    except OSError:
+        return ""
+    cached = _hash_cache.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(full_path, "rb") as f:
+        digest = hashlib.blake2b(f.read(), digest_size=6).hexdigest()
+    _hash_cache[path] = (mtime, digest)
+    return digest
+
+
+def static_url(path: str) -> str:
+    """テンプレート用: 内容ハッシュ付きの静的ファイル URL"""
+    path = path.lstrip("/")
+    digest = _file_hash(path)
+    return f"/static/{path}?v={digest}" if digest else f"/static/{path}"
+
+
+class HashedStaticFiles(StaticFiles):
+    """?v= が現在の内容ハッシュと一致するリクエストに immutable キャッシュを付ける"""
+
+    def file_response(
+        self, full_path, stat_result, scope: Scope, status_code: int = 200
+    ):
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        query = scope.get("query_string", b"").decode("latin-1")
+        version = dict(p.split("=", 1) for p in query.split("&") if "=" in p).get("v")
+        if version and version == _file_hash(self.get_path(scope).replace(os.sep, "/")):
+            response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        else:
+            response.headers["Cache-Control"] = "no-cache"
+        return response
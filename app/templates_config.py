@@ -1,6 +1,157 @@
+"""
+テンプレート環境（全ルーターで共有）
+バイトコードキャッシュ・起動時プリコンパイル・フラグメントキャッシュ
+"""
+
 import os
+from threading import Lock
+from typing import Callable, Iterator, Optional
+
+import anyio
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import HTMLResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+from starlette.types import Receive, Scope, Send
+
+from app.branches import current_branch
+from app.config import settings
+from app.data_version import get_data_version
+from app.static_assets import static_url
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(__file__), "templates")
+
+
+def _create_bytecode_cache():
+    """コンパイル済みテンプレートをディスクに保存（再起動後も再利用）"""
+    if not settings.TEMPLATE_CACHE_DIR:
+        return None
+    os.makedirs(settings.TEMPLATE_CACHE_DIR, exist_ok=True)
+    return FileSystemBytecodeCache(settings.TEMPLATE_CACHE_DIR)
+
 
-templates = Jinja2Templates(
-    directory=os.path.join(os.path.dirname(__file__), "templates")
+env = Environment(
+    loader=FileSystemLoader(TEMPLATES_DIR),
+    autoescape=True,
+    bytecode_cache=_create_bytecode_cache(),
+    # 本番ではテンプレートの更新チェック（stat）を省略
+    auto_reload=settings.DEBUG,
 )
+
+env.globals["static_url"] = static_url
+
+templates = Jinja2Templates(env=env)
+
+
+def precompile_templates() -> int:
+    """
+    全テンプレートを事前にコンパイル
+    初回リクエストでのコンパイル待ちをなくす
+
+    Returns:
+        コンパイルしたテンプレート数
+    """
+    names = env.list_templates(extensions=["html"])
+    for name in names:
+        env.get_template(name)
+    return len(names)
+
+
+class _ClosingStreamingResponse(StreamingResponse):
+    """
+    送信の終了時（クライアントの切断・送信の失敗も含む）に、描画中のジェネレーターと
+    on_close を必ず閉じるストリーミング応答
+    （切断時の Starlette は本文のイテレーターを閉じず、
+    BackgroundTask も呼ばないことがある）
+    """
+
+    def __init__(
+        self, content: Iterator[str], on_close: Optional[Callable[[], None]], **kwargs
+    ):
+        super().__init__(content, **kwargs)
+        self._content = content
+        self._on_close = on_close
+
+    def _close(self):
+        try:
+            self._content.close()
+        finally:
+            if self._on_close is not None:
+                self._on_close()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            # 取り消されていても後始末は最後まで行う（セッションの close は DB を待つ）
+            with anyio.CancelScope(shield=True):
+                await run_in_threadpool(self._close)
+
+
+def stream_template(
+    name: str, context: dict, chunk_size: int = 8192,
+    on_close: Optional[Callable[[], None]] = None,
+) -> StreamingResponse:
+    """
+    テンプレートを generate() で少しずつ描画して送信
+    context に行のジェネレーターを渡せば、全件・全HTMLを同時にメモリへ載せずに済む
+
+    Args:
+        name: テンプレート名
+        context: テンプレートに渡す値
+        chunk_size: まとめて送る文字数の目安（細かすぎる送信を避ける）
+        on_close: 送信の終了時に必ず呼ぶ後始末（行のジェネレーターを閉じるなど）
+    """
+    def body():
+        buffer = []
+        size = 0
+        for piece in env.get_template(name).generate(context):
+            buffer.append(piece)
+            size += len(piece)
+            if size >= chunk_size:
+                yield "".join(buffer)
+                buffer = []
+                size = 0
+        if buffer:
+            yield "".join(buffer)
+
+    return _ClosingStreamingResponse(
+        body(), on_close, media_type="text/html; charset=utf-8"
+    )
+
+
+# (テンプレート名, キー, 教室コード) → (データバージョン, HTML)
+# データバージョンは get_db が DB の data_versions を読んで他のワーカーの書き込みも
+# 取り込むので、複数ワーカーでも古い HTML を返さない
+_fragment_cache: dict = {}
+_fragment_lock = Lock()
+
+
+def render_fragment(
+    name: str,
+    tables: tuple,
+    load_context: Callable[[], dict],
+    key: tuple = (),
+) -> HTMLResponse:
+    """
+    パーシャルをデータバージョン付きでキャッシュして返す
+    データが変わっていなければクエリもレンダリングも行わない
+
+    Args:
+        name: テンプレート名
+        tables: 表示内容が依存するテーブル名
+        load_context: キャッシュミス時にテンプレート変数を返す関数（request 非依存）
+        key: 同じテンプレートで内容が変わる場合の追加キー（講座IDなど）
+    """
+    cache_key = (name, key, current_branch())
+    # 取得前のバージョンで保存する（取得中に更新されても次回は再描画される）
+    version = get_data_version(*tables)
+
+    cached = _fragment_cache.get(cache_key)
+    if cached and cached[0] == version:
+        return HTMLResponse(cached[1])
+
+    html = env.get_template(name).render(load_context())
+    with _fragment_lock:
+        _fragment_cache[cache_key] = (version, html)
+    return HTMLResponse(html)
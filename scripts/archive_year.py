@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+年度アーカイブの実行・検証
+
+実行:
+    uv run python scripts/archive_year.py 2024       # 2024年度を移動して検証
+    uv run python scripts/archive_year.py --verify   # 全年度を検証（年度指定も可）
+    uv run python scripts/archive_year.py --list     # アーカイブ済みの年度一覧
+
+移動後はアプリを再起動してください（成績ストア・集計のキャッシュを読み直すため）
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+# プロジェクトルートを sys.path に追加
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.branches import DEFAULT_BRANCH
+from app.database import SessionLocal, create_db_and_tables
+from app.services.archive import archive_year, list_archives, verify_archive
+from app.services.dashboard_publisher import invalidate_branch
+
+
+def verify(session, years) -> bool:
+    ok = True
+    for year in years:
+        problems = verify_archive(session, year)
+        if problems:
+            ok = False
+            print(f"  ✗ {year}年度")
+            for problem in problems:
+                print(f"      {problem}")
+        else:
+            print(f"  ✓ {year}年度")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="終了した年度の成績・出席をアーカイブへ移動"
+    )
+    parser.add_argument(
+        "year", nargs="?", type=int, help="アーカイブする年度（例: 2024）"
+    )
+    parser.add_argument(
+        "--verify", action="store_true", help="アーカイブ済みの年度を検証"
+    )
+    parser.add_argument(
+        "--list", action="store_true", help="アーカイブ済みの年度を表示"
+    )
+    args = parser.parse_args()
+
+    create_db_and_tables()
+    session = SessionLocal()
+    try:
+        if args.list:
+            for record in list_archives(session):
+                print(
+                    f"{record.academic_year}年度（{record.start_date}〜{record.end_date}）"
+                    f" 成績 {record.grades} 件 / 出席 {record.attendance} 件"
+                    f" / {record.archived_at:%Y-%m-%d %H:%M}"
+                )
+            return 0
+
+        if args.verify:
+            years = (
+                [args.year] if args.year
+                else [r.academic_year for r in list_archives(session)]
+            )
+            print("🔍 アーカイブを検証中...")
+            return 0 if verify(session, years) else 1
+
+        if args.year is None:
+            parser.print_help()
+            return 1
+
+        print(f"📦 {args.year}年度をアーカイブ中...")
+        try:
+            result = archive_year(session, args.year)
+        except ValueError as e:
+            print(f"  ⚠️  {e}")
+            return 1
+        print(f"  移動: 成績 {result['grades']} 件 / 出席 {result['attendance']} 件")
+        print(
+            f"  アーカイブ内: 成績 {result['total_grades']} 件"
+            f" / 出席 {result['total_attendance']} 件"
+        )
+
+        # アーカイブはイベントを発行しないので、書き出したダッシュボードを古いものにする
+        invalidate_branch(session.info.get("branch", DEFAULT_BRANCH))
+
+        print("🔍 検証中...")
+        if not verify(session, [args.year]):
+            return 1
+        print("完了しました。アプリを再起動してください")
+        return 0
+    finally:
+        session.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+出席サマリーのベンチマーク（attendance の全行走査 と 学期ごとのビット配列）
+
+履歴の年数を変えた一時 DB を作り、生徒1人あたりのサマリー取得時間を比べる
+ビット配列は学期ごとに1行なので、履歴が伸びても取得時間はほとんど変わらない
+
+実行: uv run python scripts/bench_attendance.py [生徒数]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+# 一時 DB を使う（app を読み込む前に設定する）
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy import delete, insert, select
+
+from app.database import SessionLocal, create_db_and_tables
+from app.models.attendance import Attendance
+from app.models.class_ import Class
+from app.models.student import Student
+from app.services.attendance_bitmap import (
+    get_attendance_summary,
+    rebuild_attendance_bitmaps,
+)
+from app.services.roll_call import attendance_id
+
+STATUSES = ("出席",) * 8 + ("欠席", "遅刻")
+YEARS = (1, 3, 10)
+REPEAT = 200
+
+
+def legacy_summary(db, student_id: str) -> dict:
+    """従来の集計（全記録を読み込んで Python で数える）"""
+    records = (
+        db.query(Attendance)
+        .filter(Attendance.student_id == student_id)
+        .order_by(Attendance.date)
+        .all()
+    )
+    present = sum(1 for r in records if r.status == "出席")
+    return {
+        "present": present,
+        "absent": sum(1 for r in records if r.status == "欠席"),
+        "late": sum(1 for r in records if r.status == "遅刻"),
+        "rate": round(present * 100 / len(records)) if records else 0,
+    }
+
+
+def populate(db, students: int, years: int):
+    """週1回の授業を years 年分記録"""
+    db.execute(delete(Attendance))
+    rng = random.Random(years)
+    start = date(2026, 4, 6) - timedelta(weeks=52 * years)
+    rows = []
+    for i in range(students):
+        student_id = f"bench{i:05d}"
+        for week in range(52 * years):
+            target_date = start + timedelta(weeks=week)
+            rows.append({
+                "id": attendance_id(student_id, "bench", target_date),
+                "student_id": student_id,
+                "class_id": "bench",
+                "date": target_date,
+                "status": rng.choice(STATUSES),
+            })
+    db.execute(insert(Attendance), rows)
+    db.commit()
+    rebuild_attendance_bitmaps(db)
+    return len(rows)
+
+
+def measure(fn, db, student_ids) -> float:
+    start = time.perf_counter()
+    for i in range(REPEAT):
+        fn(db, student_ids[i % len(student_ids)])
+    return (time.perf_counter() - start) / REPEAT * 1000
+
+
+def main():
+    students = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    create_db_and_tables()
+    db = SessionLocal()
+    db.add(Class(id="bench", name="ベンチマーク"))
+    db.add_all(
+        Student(id=f"bench{i:05d}", name=f"生徒{i}", class_id="bench")
+        for i in range(students)
+    )
+    db.commit()
+    student_ids = list(db.scalars(select(Student.id)))
+
+    print(f"生徒 {students} 名、週1回の授業、{REPEAT} 回の平均（ms/生徒）")
+    print(f"{'履歴':>6} {'記録数':>10} {'全行走査':>10} {'ビット配列':>10}")
+    for years in YEARS:
+        rows = populate(db, students, years)
+        # 両方の結果が一致することを確認
+        for student_id in student_ids[:20]:
+            expected = legacy_summary(db, student_id)
+            actual = get_attendance_summary(db, student_id)
+            assert all(actual[k] == v for k, v in expected.items()), (
+                student_id, expected, actual,
+            )
+        legacy = measure(legacy_summary, db, student_ids)
+        bitmap = measure(get_attendance_summary, db, student_ids)
+        print(f"{years:>5}年 {rows:>10} {legacy:>10.3f} {bitmap:>10.3f}")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+同時の集計をまとめる効果のベンチマーク（app.single_flight）
+
+1講座の生徒全員が同時にダッシュボードを開いた状況を、生徒数ぶんの同時の
+クラス平均の呼び出しで再現し、まとめない場合（各自がスレッドプールで計算）と
+まとめる場合（run_async）の所要時間と DB への問い合わせ回数を比べる
+
+実行: uv run python scripts/bench_coalescing.py [生徒数] [1人あたりの成績数]
+"""
+
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+# 一時 DB を使う（app を読み込む前に設定する）
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy import event, insert
+from sqlalchemy.exc import TimeoutError
+from starlette.concurrency import run_in_threadpool
+
+from app.database import SessionLocal, create_db_and_tables, engine
+from app.models.class_ import Class
+from app.models.grade import Grade
+from app.models.student import Student
+from app.services.grade_calculator import calculate_class_average
+from app.single_flight import coalescing_stats
+
+CLASS_ID = "c001"
+
+_queries = 0
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _count_query(*args):
+    global _queries
+    _queries += 1
+
+
+def seed(students: int, lessons: int):
+    rng = random.Random(0)
+    with SessionLocal() as db:
+        db.add(
+            Class(id=CLASS_ID, name="高3英語@難関大", day="月", time="19:00-20:30")
+        )
+        db.execute(insert(Student), [
+            {
+                "id": f"s{i:04d}",
+                "name": f"生徒{i}",
+                "class_id": CLASS_ID,
+                "join_date": date(2025, 4, 1),
+            }
+            for i in range(students)
+        ])
+        rows = []
+        for i in range(students):
+            for n in range(lessons):
+                scores = [rng.randint(5, 20) for _ in range(5)]
+                rows.append({
+                    "id": f"g{i:04d}_{n}",
+                    "student_id": f"s{i:04d}",
+                    "class_id": CLASS_ID,
+                    "date": date(2025, 4, 7) + timedelta(weeks=n),
+                    "lesson_number": n + 1,
+                    "score_comprehension": scores[0],
+                    "score_unseen": scores[1],
+                    "score_grammar": scores[2],
+                    "score_vocabulary": scores[3],
+                    "score_listening": scores[4],
+                    "score_total": sum(scores),
+                })
+        db.execute(insert(Grade), rows)
+        db.commit()
+
+
+def _uncoalesced() -> int:
+    with SessionLocal() as db:
+        return calculate_class_average.__wrapped__(db, CLASS_ID)
+
+
+async def _coalesced() -> int:
+    # セッションは接続を遅延して取るので、相乗りした呼び出しは DB に接続しない
+    with SessionLocal() as db:
+        return await calculate_class_average.run_async(db, CLASS_ID)
+
+
+async def burst(callers: int, coalesced: bool):
+    """callers 件の同時の呼び出し（リクエストと同じくそれぞれ自分のセッションを使う）"""
+    if coalesced:
+        return await asyncio.gather(*(_coalesced() for _ in range(callers)))
+    return await asyncio.gather(
+        *(run_in_threadpool(_uncoalesced) for _ in range(callers))
+    )
+
+
+def timed(label: str, callers: int, coalesced: bool):
+    global _queries
+    _queries = 0
+    start = time.perf_counter()
+    try:
+        results = asyncio.run(burst(callers, coalesced))
+    except TimeoutError:
+        # 計算が重いと同時の呼び出しが接続プールを使い切る
+        print(f"{label:<20} 接続プールの待ち時間切れ（問い合わせ {_queries} 回）")
+        return
+    elapsed = (time.perf_counter() - start) * 1000
+    print(
+        f"{label:<20} {elapsed:>10.1f} ms  問い合わせ {_queries:>4} 回"
+        f"  平均 {results[0]}"
+    )
+
+
+def main():
+    students = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    lessons = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    create_db_and_tables()
+    seed(students, lessons)
+
+    print(f"生徒 {students} 名 × 成績 {lessons} 回、同時 {students} 件のクラス平均")
+    timed("まとめない", students, coalesced=False)
+    timed("まとめる", students, coalesced=True)
+    print(coalescing_stats()["class_average"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+CSV 再取込のベンチマーク（行ハッシュによる差分取込）
+
+一時 DB に成績 N 行の CSV を取り込んだあと、
+    1. 同じファイルをもう一度取り込む（ファイルのハッシュで判定）
+    2. 末尾に 200 行を追加したファイルを取り込む（行ハッシュの差だけを突き合わせ・保存）
+    3. 別の 200 行だけのファイルを取り込む（比較用）
+の解析〜保存の時間を比べる。2 は 3 とほぼ同じ時間になるのが目標
+
+実行: uv run python scripts/bench_import.py [成績行数]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+# 一時 DB を使う（app を読み込む前に設定する）
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.database import SessionLocal, create_db_and_tables
+from app.services.csv_importer import (
+    match_grades_to_students,
+    match_students_to_ids,
+    parse_new_format_csv,
+    save_csv_data,
+)
+from app.services.import_batch import (
+    file_digest,
+    filter_new_rows,
+    find_imported_file,
+)
+
+STUDENTS = 500
+APPENDED = 200
+
+STUDENT_HEADER = "教室コード,教室,氏名,ｼﾒｲ,性,高校,学科,学校ｸﾗｽ,部活,志望大学,志望学部"
+GRADE_HEADER = (
+    "氏名,授業回,授業内容,日付,授業内容の理解,初見問題,文法語法,単語,リスニング,合計"
+)
+
+
+def build_csv(grade_rows) -> bytes:
+    lines = ["【生徒データ】セクション", STUDENT_HEADER]
+    lines += [
+        f"c001,難関大クラス,生徒{i:04d},せいと{i},男,高校{i % 20},理系,3-A,,"
+        f"大学{i % 30},工学部"
+        for i in range(STUDENTS)
+    ]
+    lines += ["", "【チェックテスト成績】セクション", GRADE_HEADER, *grade_rows]
+    return "\n".join(lines).encode("utf-8")
+
+
+def grade_rows(start: int, count: int):
+    rng = random.Random(start)
+    rows = []
+    for n in range(start, start + count):
+        scores = [rng.randint(5, 20) for _ in range(5)]
+        lesson_date = date(2025, 4, 7) + timedelta(weeks=n // STUDENTS)
+        lesson = n // STUDENTS + 1
+        rows.append(
+            f"生徒{n % STUDENTS:04d},{lesson},Unit {lesson},{lesson_date},"
+            + ",".join(map(str, scores)) + f",{sum(scores)}"
+        )
+    return rows
+
+
+def run_import(content: bytes) -> dict:
+    """
+    アップロード〜保存と同じ手順
+    （ファイル判定 → 解析 → 差分 → 突き合わせ → 保存）
+    """
+    db = SessionLocal()
+    try:
+        file_sha256 = file_digest(content)
+        if find_imported_file(db, file_sha256) is not None:
+            return {"duplicate": True}
+        students_raw, grades_raw = parse_new_format_csv(content.decode("utf-8-sig"))
+        new_students, new_grades, skipped = filter_new_rows(
+            db, students_raw, grades_raw
+        )
+        students_with_ids = match_students_to_ids(db, new_students)
+        matched = match_grades_to_students(
+            db, students_with_ids, new_grades,
+            known_names={s["name"] for s in students_raw},
+        )
+        results = save_csv_data(
+            db, students_with_ids, matched, "bench.csv", file_sha256
+        )
+        return {**results, "skipped": skipped}
+    finally:
+        db.close()
+
+
+def timed(label: str, content: bytes):
+    start = time.perf_counter()
+    result = run_import(content)
+    elapsed = (time.perf_counter() - start) * 1000
+    if result.get("duplicate"):
+        summary = "取込済みのファイル"
+    else:
+        summary = (
+            f"生徒 追加{result['added_students']}・更新{result['updated_students']}、"
+            f"成績 追加{result['added_grades']}・更新{result['updated_grades']}、"
+            f"省略 {result['skipped']['students'] + result['skipped']['grades']} 行"
+        )
+    print(f"{label:<28} {elapsed:>10.1f} ms  {summary}")
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    create_db_and_tables()
+    base = grade_rows(0, rows)
+    appended = grade_rows(rows, APPENDED)
+
+    print(f"生徒 {STUDENTS} 名、成績 {rows} 行の CSV（追加 {APPENDED} 行）")
+    timed("初回の取込", build_csv(base))
+    timed("同じファイルを再取込", build_csv(base))
+    timed(f"{APPENDED} 行を追加して再取込", build_csv(base + appended))
+    # 比較用: 別の追加分だけのファイル（生徒セクションは同じ）
+    others = grade_rows(rows + APPENDED, APPENDED)
+    timed(f"{APPENDED} 行だけのファイル", build_csv(others))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+講座 × 授業回のピボット（app.services.lesson_pivot）のベンチマーク
+
+一時 DB に 講座数 × 授業回数 × 1講座あたりの生徒数 の成績を作り、
+    1. 集計（1回の GROUP BY）
+    2. ヒートマップの描画（partials/lesson_pivot.html）
+    3. キャッシュ済みのピボットの取得（データバージョンが同じ間）
+の時間を測る
+
+実行: uv run python scripts/bench_lesson_pivot.py [講座数] [授業回数] [生徒数]
+    （生徒数は1講座あたり）
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+# 一時 DB を使う（app を読み込む前に設定する）
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+os.environ["TEMPLATE_CACHE_DIR"] = ""
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy import insert
+
+from app.database import SessionLocal, create_db_and_tables
+from app.models.class_ import Class
+from app.models.grade import Grade
+from app.models.student import Student
+from app.services.grade_entry import SCORE_LABELS
+from app.services.lesson_pivot import (
+    AXES,
+    compute_lesson_pivot,
+    get_lesson_pivot,
+    hardest_lessons,
+    heatmap,
+)
+from app.templates_config import env
+
+
+def seed(classes: int, lessons: int, students: int):
+    rng = random.Random(0)
+    with SessionLocal() as db:
+        db.execute(insert(Class), [
+            {"id": f"c{c:03d}", "name": f"講座{c:03d}"} for c in range(classes)
+        ])
+        db.execute(insert(Student), [
+            {
+                "id": f"s{c:03d}_{i:03d}", "name": f"生徒{c}-{i}",
+                "class_id": f"c{c:03d}",
+            }
+            for c in range(classes) for i in range(students)
+        ])
+        rows = []
+        for c in range(classes):
+            for n in range(lessons):
+                # 授業回ごとに難易度を変える
+                difficulty = rng.randint(0, 8)
+                for i in range(students):
+                    scores = [
+                        max(0, rng.randint(8, 20) - difficulty) for _ in range(5)
+                    ]
+                    rows.append({
+                        "id": f"g{c:03d}_{i:03d}_{n}",
+                        "student_id": f"s{c:03d}_{i:03d}", "class_id": f"c{c:03d}",
+                        "date": date(2025, 4, 7) + timedelta(weeks=n),
+                        "lesson_number": n + 1, "lesson_content": f"Unit {n + 1}",
+                        "score_comprehension": scores[0], "score_unseen": scores[1],
+                        "score_grammar": scores[2], "score_vocabulary": scores[3],
+                        "score_listening": scores[4], "score_total": sum(scores),
+                    })
+        db.execute(insert(Grade), rows)
+        db.commit()
+    return len(rows)
+
+
+def timed(label: str, fn, repeat: int = 5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, (time.perf_counter() - start) * 1000)
+    print(f"{label:<28} {best:>10.2f} ms")
+    return result
+
+
+def main():
+    classes = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    lessons = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+    students = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+    create_db_and_tables()
+    count = seed(classes, lessons, students)
+
+    print(
+        f"講座 {classes} × 授業回 {lessons} × 生徒 {students} 名"
+        f"（成績 {count} 行、最良値）"
+    )
+    template = env.get_template("partials/lesson_pivot.html")
+    labels = {"total": "合計", **SCORE_LABELS}
+    with SessionLocal() as db:
+        for axis in AXES:
+            pivot = timed(f"集計（{axis}）", lambda: compute_lesson_pivot(db, axis))
+            timed("ヒートマップの描画", lambda: template.render(
+                table=heatmap(pivot), axis=axis, series="total", axes=AXES,
+                labels=labels, hardest=hardest_lessons(pivot),
+            ))
+        get_lesson_pivot(db)
+        timed("キャッシュ済みの取得", lambda: get_lesson_pivot(db))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+PostgreSQL と SQLite の書き込み・読み出しのベンチマーク（app.services.bulk_write）
+
+同じ処理を SQLite（一時ファイル）と PostgreSQL で実行して時間を比べる
+    1. CSV の初回取込（成績 N 行の追加。PostgreSQL は COPY）
+    2. 全行の点数を変えた CSV の再取込
+       （更新。PostgreSQL は一時テーブルへの COPY と UPDATE ... FROM）
+    3. 成績の一括登録・更新 API と同じ upsert
+       （半分が追加・半分が更新。PostgreSQL は ON CONFLICT）
+    4. 成績一覧のストリーミング描画（yield_per。PostgreSQL はサーバー側カーソル）
+
+PostgreSQL の接続先
+    BENCH_POSTGRES_URL を指定すればその DB を使う
+    （テーブルを作り直すので専用の空の DB を指定すること）
+    未指定で initdb / pg_ctl が PATH（または POSTGRES_BIN のディレクトリ）にあれば
+    一時クラスタを作って使い、終了時に止める
+    （root では initdb が動かないので URL を指定する）
+    どちらもなければ SQLite だけを測る
+PostgreSQL には psycopg2（uv sync --extra postgres）か psycopg 3 が必要
+
+実行: uv run python scripts/bench_postgres.py [成績行数]
+"""
+
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+STUDENTS = 500
+STREAM_BATCH_SIZE = 500
+
+STUDENT_HEADER = "教室コード,教室,氏名,ｼﾒｲ,性,高校,学科,学校ｸﾗｽ,部活,志望大学,志望学部"
+GRADE_HEADER = (
+    "氏名,授業回,授業内容,日付,授業内容の理解,初見問題,文法語法,単語,リスニング,合計"
+)
+
+
+def build_csv(rows: int, seed: int) -> bytes:
+    rng = random.Random(seed)
+    lines = ["【生徒データ】セクション", STUDENT_HEADER]
+    lines += [
+        f"c001,難関大クラス,生徒{i:04d},せいと{i},男,高校{i % 20},理系,3-A,,"
+        f"大学{i % 30},工学部"
+        for i in range(STUDENTS)
+    ]
+    lines += ["", "【チェックテスト成績】セクション", GRADE_HEADER]
+    for n in range(rows):
+        scores = [rng.randint(5, 20) for _ in range(5)]
+        lesson_date = date(2025, 4, 7) + timedelta(weeks=n // STUDENTS)
+        lesson = n // STUDENTS + 1
+        lines.append(
+            f"生徒{n % STUDENTS:04d},{lesson},Unit {lesson},{lesson_date},"
+            + ",".join(map(str, scores)) + f",{sum(scores)}"
+        )
+    return "\n".join(lines).encode("utf-8")
+
+
+# ---- 計測（DATABASE_URL を設定した子プロセスで実行） ----
+
+def worker(rows: int):
+    sys.path.insert(0, str(ROOT))
+    from sqlalchemy import select
+
+    from app.database import Base, SessionLocal, create_db_and_tables, engine
+    from app.models.class_ import Class
+    from app.models.grade import Grade
+    from app.services import read_models
+    from app.services.bulk_write import copy_supported, upsert
+    from app.services.csv_importer import (
+        match_grades_to_students,
+        match_students_to_ids,
+        parse_new_format_csv,
+        save_csv_data,
+    )
+    from app.services.import_batch import filter_new_rows
+    from app.templates_config import env
+
+    Base.metadata.drop_all(bind=engine)
+    create_db_and_tables()
+    with SessionLocal() as db:
+        db.add(Class(id="c001", name="難関大クラス"))
+        db.commit()
+
+    def run_import(content: bytes) -> dict:
+        with SessionLocal() as db:
+            students_raw, grades_raw = parse_new_format_csv(content.decode("utf-8"))
+            new_students, new_grades, _ = filter_new_rows(db, students_raw, grades_raw)
+            students_with_ids = match_students_to_ids(db, new_students)
+            known_names = {s["name"] for s in students_raw}
+            matched = match_grades_to_students(
+                db, students_with_ids, new_grades, known_names=known_names,
+            )
+            return save_csv_data(db, students_with_ids, matched, "bench.csv")
+
+    def api_upsert() -> tuple:
+        with SessionLocal() as db:
+            existing = db.execute(
+                select(
+                    Grade.id, Grade.student_id, Grade.class_id, Grade.date,
+                    Grade.lesson_number,
+                )
+                .order_by(Grade.id).limit(rows // 2)
+            ).all()
+            payload = [
+                {"id": g.id, "student_id": g.student_id, "class_id": g.class_id,
+                 "date": g.date, "lesson_number": g.lesson_number, "score_total": 50}
+                for g in existing
+            ]
+            payload += [
+                {"id": f"g_extra_{i}",
+                 "student_id": existing[i % len(existing)].student_id,
+                 "class_id": "c001", "date": date(2030, 1, 1) + timedelta(days=i),
+                 "lesson_number": 1, "score_total": 60}
+                for i in range(rows - len(payload))
+            ]
+            start = time.perf_counter()
+            created = upsert(db, Grade, payload)
+            db.commit()
+            elapsed = (time.perf_counter() - start) * 1000
+        return elapsed, f"追加 {len(created)}・更新 {len(payload) - len(created)}"
+
+    def stream_grades() -> int:
+        with SessionLocal() as db:
+            grades = read_models.iter_recent_grade_rows(db, None, STREAM_BATCH_SIZE)
+            template = env.get_template("partials/grades_table.html")
+            return sum(len(piece) for piece in template.generate(grades=grades))
+
+    def timed(label: str, fn, *args):
+        start = time.perf_counter()
+        result = fn(*args)
+        elapsed = (time.perf_counter() - start) * 1000
+        if isinstance(result, dict):
+            added, updated = result["added_grades"], result["updated_grades"]
+            result = f"成績 追加{added}・更新{updated}"
+        elif isinstance(result, int):
+            result = f"{result / 1024 / 1024:.1f} MB"
+        print(f"  {label:<24} {elapsed:>10.1f} ms  {result}", flush=True)
+
+    with SessionLocal() as db:
+        mode = "COPY" if copy_supported(db) else "executemany"
+    dialect = engine.dialect
+    print(f"{dialect.name}（{dialect.driver}、一括書き込み: {mode}）", flush=True)
+    timed("CSV 初回取込", run_import, build_csv(rows, 0))
+    timed("CSV 再取込（全行更新）", run_import, build_csv(rows, 1))
+    elapsed, summary = api_upsert()
+    print(f"  {'一括 upsert':<24} {elapsed:>10.1f} ms  {summary}", flush=True)
+    timed("成績一覧のストリーミング", stream_grades)
+
+
+# ---- 接続先の用意 ----
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _postgres_driver() -> str:
+    for module, driver in (("psycopg2", "psycopg2"), ("psycopg", "psycopg")):
+        try:
+            __import__(module)
+            return driver
+        except ImportError:
+            continue
+    return ""
+
+
+def _pg_command(name: str):
+    bin_dir = os.getenv("POSTGRES_BIN")
+    if bin_dir:
+        path = os.path.join(bin_dir, name)
+        return path if os.access(path, os.X_OK) else None
+    return shutil.which(name)
+
+
+def start_temp_cluster(tmp: str):
+    """
+    initdb / pg_ctl で一時クラスタを起動
+    (URL, 停止用の関数) を返す。使えなければ None
+    """
+    initdb, pg_ctl = _pg_command("initdb"), _pg_command("pg_ctl")
+    if not (initdb and pg_ctl) or os.geteuid() == 0:
+        return None
+    driver = _postgres_driver()
+    if not driver:
+        print("psycopg2 / psycopg が未導入のため PostgreSQL は測りません"
+              "（uv sync --extra postgres）")
+        return None
+    data_dir = os.path.join(tmp, "pgdata")
+    port = _free_port()
+    subprocess.run(
+        [initdb, "-D", data_dir, "-U", "postgres", "--auth=trust",
+         "--encoding=UTF8", "--no-locale"],
+        check=True, stdout=subprocess.DEVNULL,
+    )
+    subprocess.run(
+        [pg_ctl, "-D", data_dir, "-w", "-l", os.path.join(tmp, "pg.log"),
+         "-o", f"-p {port} -k {tmp} -c listen_addresses=''", "start"],
+        check=True, stdout=subprocess.DEVNULL,
+    )
+
+    def stop():
+        subprocess.run(
+            [pg_ctl, "-D", data_dir, "-w", "-m", "fast", "stop"],
+            stdout=subprocess.DEVNULL,
+        )
+
+    return f"postgresql+{driver}://postgres@/postgres?host={tmp}&port={port}", stop
+
+
+def run_worker(url: str, rows: int):
+    env = {
+        **os.environ,
+        "DATABASE_URL": url,
+        "TEMPLATE_CACHE_DIR": "",
+        "GRADE_STORE_ENABLED": "false",
+    }
+    command = [sys.executable, __file__, "--worker", str(rows)]
+    subprocess.run(command, env=env, check=False)
+
+
+def main():
+    args = [a for a in sys.argv[1:] if a != "--worker"]
+    rows = int(args[0]) if args else 20000
+    if "--worker" in sys.argv:
+        worker(rows)
+        return
+
+    tmp = tempfile.mkdtemp()
+    print(f"生徒 {STUDENTS} 名、成績 {rows} 行")
+    run_worker(f"sqlite:///{tmp}/bench.db", rows)
+
+    stop = None
+    url = os.getenv("BENCH_POSTGRES_URL")
+    if not url:
+        cluster = start_temp_cluster(tmp)
+        if cluster is None:
+            print("PostgreSQL が見つかりません"
+                  "（BENCH_POSTGRES_URL か、PATH に initdb / pg_ctl）")
+            return
+        url, stop = cluster
+    try:
+        run_worker(url, rows)
+    finally:
+        if stop is not None:
+            stop()
+
+
+if __name__ == "__main__":
+    main()
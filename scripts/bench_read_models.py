@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+一覧表示のベンチマーク（ORM のインスタンス と 読み取りモデル）
+
+一時 DB に生徒・成績を N 行ずつ作り、各一覧のパーシャルを描画するまでの時間と
+メモリのピーク（tracemalloc）を ORM の経路（従来）と読み取りモデルで比べる
+成績一覧は管理画面と同じくストリーミング描画（yield_per）で比べる
+
+実行: uv run python scripts/bench_read_models.py [行数]
+"""
+
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+from pathlib import Path
+
+# 一時 DB を使う（app を読み込む前に設定する）
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+os.environ["TEMPLATE_CACHE_DIR"] = ""
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy import insert, select
+
+from app.database import SessionLocal, create_db_and_tables
+from app.models.class_ import Class
+from app.models.grade import Grade
+from app.models.student import Student
+from app.services import read_models
+from app.templates_config import env
+
+CLASSES = 200
+STREAM_BATCH_SIZE = 500
+
+
+def seed(rows: int):
+    with SessionLocal() as db:
+        db.execute(insert(Class), [
+            {"id": f"c{i:03d}", "name": f"講座{i}", "day": "月", "time": "19:00-20:30"}
+            for i in range(CLASSES)
+        ])
+        db.execute(insert(Student), [
+            {
+                "id": f"s{i:06d}", "name": f"生徒{i:06d}", "name_kana": f"せいと{i}",
+                "gender": "男女"[i % 2], "target_university": f"大学{i % 50}",
+                "target_dept": "工学部", "class_id": f"c{i % CLASSES:03d}",
+            }
+            for i in range(rows)
+        ])
+        for start in range(0, rows, 20000):
+            db.execute(insert(Grade), [
+                {
+                    "id": f"g{i:07d}", "student_id": f"s{i:06d}",
+                    "class_id": f"c{i % CLASSES:03d}",
+                    "date": date(2025, 4, 7) + timedelta(days=i % 300),
+                    "lesson_number": i % 40 + 1,
+                    "lesson_content": f"Unit {i % 40 + 1}",
+                    "score_comprehension": 15, "score_unseen": 14, "score_grammar": 13,
+                    "score_vocabulary": 12, "score_listening": 11, "score_total": 65,
+                }
+                for i in range(start, min(start + 20000, rows))
+            ])
+        db.commit()
+
+
+def render(template: str, context: dict) -> int:
+    """全体を一度に描画（render_fragment と同じ）"""
+    return len(env.get_template(template).render(context))
+
+
+def stream(template: str, context: dict) -> int:
+    """少しずつ描画（stream_template と同じ。送信したことにして捨てる）"""
+    return sum(len(piece) for piece in env.get_template(template).generate(context))
+
+
+def orm_students(db):
+    students = db.query(Student).order_by(Student.name).all()
+    return render("partials/students_table.html", {"students": students})
+
+
+def model_students(db):
+    students = read_models.student_rows(db)
+    return render("partials/students_table.html", {"students": students})
+
+
+# 従来のテンプレート（講座ごとに c.students を読み込んで数える）
+_ORM_CLASSES_TABLE = env.from_string(
+    env.loader.get_source(env, "partials/classes_table.html")[0]
+    .replace("c.student_count", "c.students | length")
+)
+
+
+def orm_classes(db):
+    return len(_ORM_CLASSES_TABLE.render({"classes": db.query(Class).all()}))
+
+
+def model_classes(db):
+    classes = read_models.class_rows(db)
+    return render("partials/classes_table.html", {"classes": classes})
+
+
+def orm_class_students(db):
+    total = 0
+    for i in range(CLASSES):
+        students = db.query(Student).filter(Student.class_id == f"c{i:03d}").all()
+        total += render(
+            "partials/class_students_select.html", {"students": students}
+        )
+    return total
+
+
+def model_class_students(db):
+    total = 0
+    for i in range(CLASSES):
+        students = read_models.class_student_options(db, f"c{i:03d}")
+        total += render(
+            "partials/class_students_select.html", {"students": students}
+        )
+    return total
+
+
+def orm_grades(db):
+    stmt = (
+        select(Grade)
+        .order_by(Grade.date.desc())
+        .execution_options(yield_per=STREAM_BATCH_SIZE)
+    )
+    return stream("partials/grades_table.html", {"grades": db.scalars(stmt)})
+
+
+def model_grades(db):
+    grades = read_models.iter_recent_grade_rows(db, None, STREAM_BATCH_SIZE)
+    return stream("partials/grades_table.html", {"grades": grades})
+
+
+def measure(fn) -> tuple:
+    """
+    時間は tracemalloc なしで測り、メモリのピークは別の回で測る
+    （tracemalloc は処理を遅くする）
+    """
+    gc.collect()
+    with SessionLocal() as db:
+        start = time.perf_counter()
+        fn(db)
+        elapsed = (time.perf_counter() - start) * 1000
+    gc.collect()
+    with SessionLocal() as db:
+        tracemalloc.start()
+        fn(db)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return elapsed, peak / 1024 / 1024
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    create_db_and_tables()
+    seed(rows)
+
+    cases = [
+        ("生徒一覧", orm_students, model_students),
+        ("講座一覧（生徒数）", orm_classes, model_classes),
+        (f"講座別生徒 x{CLASSES}", orm_class_students, model_class_students),
+        ("成績一覧（ストリーミング）", orm_grades, model_grades),
+    ]
+    print(
+        f"生徒 {rows} 名、成績 {rows} 行、講座 {CLASSES}"
+        "（時間 ms / メモリのピーク MB）"
+    )
+    print(f"{'':<26}{'ORM':>18}{'読み取りモデル':>18}")
+    for label, orm_fn, model_fn in cases:
+        orm_ms, orm_mb = measure(orm_fn)
+        model_ms, model_mb = measure(model_fn)
+        print(
+            f"{label:<26}{orm_ms:>9.0f} / {orm_mb:>5.1f}"
+            f"{model_ms:>11.0f} / {model_mb:>5.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
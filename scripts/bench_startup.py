@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+起動時間のベンチマーク（プロセスの起動から /health が初めて 200 を返すまで）
+
+uvicorn を子プロセスで起動し、/health に応答するまでの時間を測る
+    初回    新しい DB・空のテンプレートキャッシュ（デプロイ直後の最初の起動）
+    2回目以降  テーブル作成済み（スキーマの指紋の確認だけ）・バイトコードキャッシュあり
+/health が返す起動処理の内訳（app の読み込み・各段階・起動後の事前コンパイル）も表示する
+最後に app.main の読み込み時間（python -X importtime）を重い順に表示する
+（ルーターの読み込みを遅らせる価値があるかの判断用。ルーター自体は数 ms で、
+大半は起動時にどのみち必要な fastapi・sqlalchemy・各サービスが占める）
+
+実行: uv run python scripts/bench_startup.py [起動回数]
+"""
+
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+TIMEOUT = 60
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def cold_start(env: dict) -> tuple:
+    """
+    uvicorn を起動して /health が 200 を返すまでの ms と /health の内容を返す
+    （測ったら止める）
+    """
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}/health"
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "app.main:app",
+            "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning",
+        ],
+        cwd=ROOT,
+        env=env,
+    )
+    try:
+        while time.perf_counter() - start < TIMEOUT:
+            if process.poll() is not None:
+                raise RuntimeError(
+                    f"uvicorn が終了しました（終了コード {process.returncode}）"
+                )
+            try:
+                with urllib.request.urlopen(url, timeout=1) as response:
+                    body = json.loads(response.read())
+                    return (time.perf_counter() - start) * 1000, body
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.005)
+        raise RuntimeError(f"{TIMEOUT} 秒以内に /health が応答しませんでした")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def import_times(env: dict, top: int = 15) -> list:
+    """
+    app.main を読み込むときのモジュールごとの時間（ms、下位モジュールを含む）を
+    重い順に返す。最上位のパッケージ（fastapi など）と app 配下のモジュールだけを数える
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        # 形式: "import time:  self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        if "." not in name or name.startswith("app."):
+            times[name] = max(times.get(name, 0), int(cumulative) / 1000)
+    return sorted(times.items(), key=lambda item: item[1], reverse=True)[:top]
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    tmp = tempfile.mkdtemp()
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{tmp}/bench.db",
+        "TEMPLATE_CACHE_DIR": f"{tmp}/jinja",
+        "SCHEDULER_LOCK_FILE": f"{tmp}/scheduler.lock",
+    }
+
+    print(f"{'':<10}{'/health まで':>14}{'読み込み':>10}{'起動処理':>10}  内訳（ms）")
+    for i in range(runs):
+        elapsed, body = cold_start(env)
+        report = body["startup"]
+        phases = ", ".join(f"{name} {ms}" for name, ms in report["phases"].items())
+        label = "初回" if i == 0 else f"{i + 1}回目"
+        print(
+            f"{label:<10}{elapsed:>12.0f} ms{report['import_ms']:>8.0f} ms"
+            f"{report['ready_ms']:>8.0f} ms  {phases}"
+        )
+
+    print("\napp.main の読み込み時間（下位モジュールを含む、重い順）")
+    for name, ms in import_times(env):
+        print(f"  {name:<45}{ms:>8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
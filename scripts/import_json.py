@@ -6,21 +6,36 @@
 """
 
 import json
-from pathlib import Path
-from datetime import date
 import sys
+from datetime import date
+from pathlib import Path
 
 # プロジェクトルートを sys.path に追加
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+from sqlalchemy import select
+
 from app.database import SessionLocal, create_db_and_tables
+from app.models.attendance import Attendance
 from app.models.class_ import Class
-from app.models.student import Student
 from app.models.grade import Grade
-from app.models.attendance import Attendance
+from app.models.student import Student
+from app.services.attendance_bitmap import rebuild_attendance_bitmaps
+from app.services.bulk_write import bulk_insert
 
 DATA_DIR = Path(__file__).parent.parent / "data"
 
+# IN 句1回あたりの件数
+IN_CHUNK_SIZE = 500
+
+def _existing_ids(session, id_column, ids):
+    """登録済みの ID（1件ずつ問い合わせず IN 句でまとめて調べる）"""
+    found = set()
+    for i in range(0, len(ids), IN_CHUNK_SIZE):
+        chunk = ids[i:i + IN_CHUNK_SIZE]
+        found.update(session.scalars(select(id_column).where(id_column.in_(chunk))))
+    return found
+
 def import_classes(session):
     """講座データをインポート"""
     print("📚 講座データをインポート中...")
@@ -96,10 +111,11 @@ def import_grades(session):
         return
 
     data = json.loads(data_file.read_text(encoding="utf-8"))
-    count = 0
+    grade_ids = [g["id"] for g in data.get("grades", [])]
+    existing = _existing_ids(session, Grade.id, grade_ids)
+    rows = []
     for g in data.get("grades", []):
-        existing = session.query(Grade).filter(Grade.id == g["id"]).first()
-        if not existing:
+        if g["id"] not in existing:
             scores = g.get("scores", {})
             max_scores = g.get("maxScores", {})
 
@@ -110,7 +126,7 @@ def import_grades(session):
                 except ValueError:
                     pass
 
-            session.add(Grade(
+            rows.append(dict(
                 id=g["id"],
                 student_id=g["studentId"],
                 class_id=g.get("classId"),
@@ -130,11 +146,13 @@ def import_grades(session):
                 max_listening=max_scores.get("listening", 20),
                 max_total=max_scores.get("total", 100),
             ))
-            count += 1
+            existing.add(g["id"])
             print(f"  ✓ 成績ID: {g['id']}")
 
+    # まとめて追加（PostgreSQL は COPY）
+    bulk_insert(session, Grade, rows)
     session.commit()
-    print(f"  完了: {count} 件の成績")
+    print(f"  完了: {len(rows)} 件の成績")
 
 def import_attendance(session):
     """出席データをインポート"""
@@ -146,10 +164,11 @@ def import_attendance(session):
         return
 
     data = json.loads(data_file.read_text(encoding="utf-8"))
-    count = 0
+    attendance_ids = [a["id"] for a in data.get("attendance", [])]
+    existing = _existing_ids(session, Attendance.id, attendance_ids)
+    rows = []
     for a in data.get("attendance", []):
-        existing = session.query(Attendance).filter(Attendance.id == a["id"]).first()
-        if not existing:
+        if a["id"] not in existing:
             att_date = None
             if a.get("date"):
                 try:
@@ -157,18 +176,22 @@ def import_attendance(session):
                 except ValueError:
                     pass
 
-            session.add(Attendance(
+            rows.append(dict(
                 id=a["id"],
                 student_id=a["studentId"],
                 class_id=a.get("classId"),
                 date=att_date,
                 status=a["status"]
             ))
-            count += 1
+            existing.add(a["id"])
             print(f"  ✓ 出席ID: {a['id']}")
 
+    bulk_insert(session, Attendance, rows)
     session.commit()
-    print(f"  完了: {count} 件の出席記録")
+    print(f"  完了: {len(rows)} 件の出席記録")
+
+    # 出欠のビット配列（集計用）を作り直す
+    rebuild_attendance_bitmaps(session)
 
 def main():
     print("=" * 60)
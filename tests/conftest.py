@@ -0,0 +1,148 @@
+"""
+テストの共通設定
+
+PostgreSQL のテスト（pg_db フィクスチャ）の接続先
+    TEST_POSTGRES_URL を指定すればその DB を使う
+    （テーブルを作り直すので専用の空の DB を指定すること）
+    未指定で initdb / pg_ctl が PATH（または POSTGRES_BIN のディレクトリ）にあれば
+    一時クラスタを作って使い、テストの終了時に止める
+    どちらもなければ PostgreSQL のテストは skip する
+PostgreSQL には psycopg2（uv sync --extra postgres）が必要
+
+実行: uv run pytest
+"""
+
+import importlib
+import os
+import pkgutil
+import shutil
+import socket
+import subprocess
+import tempfile
+
+import pytest
+
+# アプリの設定は import 時に読まれるので、先に一時ディレクトリの SQLite と無効化を指定
+_tmp = tempfile.mkdtemp(prefix="student-manager-test-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_tmp}/test.db")
+os.environ["TEMPLATE_CACHE_DIR"] = ""
+os.environ["GRADE_STORE_ENABLED"] = "false"
+os.environ["WRITE_QUEUE_ENABLED"] = "false"
+os.environ["SCHEDULER_ENABLED"] = "false"
+
+import app.models  # noqa: E402
+from app.branches import DEFAULT_BRANCH  # noqa: E402
+from app.database import (  # noqa: E402
+    Base,
+    SessionLocal,
+    _create_engine,
+    _create_sessionmaker,
+    engine,
+    migrate_schema,
+)
+
+# 全モデルを Base.metadata に登録
+for _module in pkgutil.iter_modules(app.models.__path__):
+    importlib.import_module(f"app.models.{_module.name}")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _pg_command(name: str):
+    bin_dir = os.getenv("POSTGRES_BIN")
+    if bin_dir:
+        path = os.path.join(bin_dir, name)
+        return path if os.access(path, os.X_OK) else None
+    return shutil.which(name)
+
+
+def _start_temp_cluster(tmp: str):
+    """
+    initdb / pg_ctl で一時クラスタを起動
+    (URL, 停止用の関数) を返す。使えなければ None
+    """
+    initdb, pg_ctl = _pg_command("initdb"), _pg_command("pg_ctl")
+    if not (initdb and pg_ctl) or os.geteuid() == 0:
+        # root では initdb が動かない（TEST_POSTGRES_URL で接続先を渡す）
+        return None
+    data_dir = os.path.join(tmp, "pgdata")
+    port = _free_port()
+    subprocess.run(
+        [initdb, "-D", data_dir, "-U", "postgres", "--auth=trust",
+         "--encoding=UTF8", "--no-locale"],
+        check=True, stdout=subprocess.DEVNULL,
+    )
+    subprocess.run(
+        [pg_ctl, "-D", data_dir, "-w", "-l", os.path.join(tmp, "pg.log"),
+         "-o", f"-p {port} -k {tmp} -c listen_addresses=''", "start"],
+        check=True, stdout=subprocess.DEVNULL,
+    )
+
+    def stop():
+        subprocess.run(
+            [pg_ctl, "-D", data_dir, "-w", "-m", "fast", "stop"],
+            stdout=subprocess.DEVNULL,
+        )
+
+    return f"postgresql+psycopg2://postgres@/postgres?host={tmp}&port={port}", stop
+
+
+@pytest.fixture
+def sqlite_db(tmp_path):
+    """空の SQLite（一時ファイル）のセッション"""
+    engine = _create_engine(f"sqlite:///{tmp_path}/test.db")
+    migrate_schema(engine)
+    factory = _create_sessionmaker(engine, DEFAULT_BRANCH)
+    with factory() as db:
+        yield db
+    engine.dispose()
+
+
+@pytest.fixture
+def app_db():
+    """
+    アプリの既定の DB（DATABASE_URL の一時ファイル）のセッション
+    書き込みキュー・定期処理など SessionLocal を直接使う処理のテスト用
+    （終了時に空にする）
+    """
+    migrate_schema(engine)
+    with SessionLocal() as db:
+        yield db
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture(scope="session")
+def pg_engine():
+    """テスト用の PostgreSQL のエンジン（見つからなければ skip）"""
+    pytest.importorskip("psycopg2")
+    stop = None
+    url = os.getenv("TEST_POSTGRES_URL")
+    if not url:
+        cluster = _start_temp_cluster(tempfile.mkdtemp(dir=_tmp))
+        if cluster is None:
+            pytest.skip("PostgreSQL が見つかりません（TEST_POSTGRES_URL を指定）")
+        url, stop = cluster
+    engine = _create_engine(url)
+    try:
+        yield engine
+    finally:
+        engine.dispose()
+        if stop is not None:
+            stop()
+
+
+@pytest.fixture
+def pg_db(pg_engine):
+    """
+    テーブルを作り直した PostgreSQL のセッション
+    （アプリと同じくデータバージョンを数える）
+    """
+    Base.metadata.drop_all(bind=pg_engine)
+    migrate_schema(pg_engine)
+    factory = _create_sessionmaker(pg_engine, DEFAULT_BRANCH)
+    with factory() as db:
+        yield db
@@ -0,0 +1,48 @@
+"""テスト用の CSV と取込の手順（アップロード画面と同じ順に呼ぶ）"""
+
+from app.services.csv_importer import (
+    match_grades_to_students,
+    match_students_to_ids,
+    parse_new_format_csv,
+    save_csv_data,
+)
+from app.services.import_batch import filter_new_rows
+from app.services.import_diff import diff_import
+
+STUDENT_HEADER = "教室コード,教室,氏名,ｼﾒｲ,性,高校,学科,学校ｸﾗｽ,部活,志望大学,志望学部"
+GRADE_HEADER = (
+    "氏名,授業回,授業内容,日付,授業内容の理解,初見問題,文法語法,単語,リスニング,合計"
+)
+
+
+def build_csv(score: int, students: int = 3, lessons: int = 6) -> str:
+    """生徒 students 名、成績 lessons 行（各科目 score 点）の CSV"""
+    lines = ["【生徒データ】セクション", STUDENT_HEADER]
+    lines += [
+        f"c001,難関大クラス,生徒{i},せいと{i},男,高校{i},理系,3-A,,大学{i},工学部"
+        for i in range(students)
+    ]
+    lines += ["", "【チェックテスト成績】セクション", GRADE_HEADER]
+    lines += [
+        f"生徒{n % students},{n},Unit {n},2025-04-{7 + n:02d},"
+        f"{score},{score},{score},{score},{score},{score * 5}"
+        for n in range(lessons)
+    ]
+    return "\n".join(lines)
+
+
+def preview(db, csv_text: str) -> tuple:
+    """プレビューまで（save_csv_data に渡す (生徒, 成績, 差分) を返す）"""
+    students_raw, grades_raw = parse_new_format_csv(csv_text)
+    new_students, new_grades, _ = filter_new_rows(db, students_raw, grades_raw)
+    students_with_ids = match_students_to_ids(db, new_students)
+    known_names = {s["name"] for s in students_raw}
+    matched = match_grades_to_students(
+        db, students_with_ids, new_grades, known_names=known_names,
+    )
+    return students_with_ids, matched, diff_import(db, students_with_ids, matched)
+
+
+def run_import(db, csv_text: str) -> dict:
+    students_with_ids, matched, diff = preview(db, csv_text)
+    return save_csv_data(db, students_with_ids, matched, "test.csv", diff=diff)
@@ -0,0 +1,133 @@
+"""JSON API v1（キーセットページング・一括登録の冪等性・全校の集計）"""
+
+import asyncio
+from datetime import date
+
+import pytest
+from sqlalchemy import func, select
+
+from app.models.attendance import Attendance
+from app.models.class_ import Class
+from app.models.grade import Grade
+from app.models.student import Student
+from app.routers.api_v1 import (
+    GRADE_COLUMNS,
+    STUDENT_COLUMNS,
+    GradeIn,
+    StudentIn,
+    _page,
+    _upsert_grades,
+    _upsert_students,
+    get_school_stats,
+)
+
+DAY = date(2025, 4, 7)
+
+
+@pytest.fixture(params=["sqlite_db", "pg_db"])
+def db(request):
+    db = request.getfixturevalue(request.param)
+    db.add(Class(id="c001", name="難関大"))
+    db.commit()
+    return db
+
+
+def _all_pages(db, columns, filters, limit) -> list:
+    ids, after = [], None
+    while True:
+        page = _page(db, columns, filters, after, limit)
+        ids += [item["id"] for item in page["items"]]
+        if page["next_cursor"] is None:
+            return ids
+        assert page["next_cursor"] == page["items"][-1]["id"]
+        after = page["next_cursor"]
+
+
+def test_cursor_round_trips_every_row_once(db):
+    # 数字の桁・記号・大文字小文字で、照合順序と Python の順序が違いうる ID
+    ids = [
+        "s1", "s10", "s2", "s_1", "s-1", "S1", "s1a", "s01", "s100", "s9",
+        "t", "ｓ1", "生徒1",
+    ]
+    db.add_all(Student(id=sid, name=sid, class_id="c001") for sid in ids)
+    db.commit()
+    ordered = db.scalars(select(Student.id).order_by(Student.id)).all()
+
+    for limit in (1, 3, 5, len(ids), len(ids) + 1):
+        assert _all_pages(db, STUDENT_COLUMNS, [], limit) == ordered
+
+
+def test_grade_cursor_with_equal_dates(db):
+    # 並び順以外の列（日付・授業回）がすべて同じ行が続いても、ID で1件ずつ進む
+    db.add_all(Student(id=f"s{i}", name=f"生徒{i}", class_id="c001") for i in range(7))
+    db.flush()
+    db.add_all(
+        Grade(id=f"g_s{i}_{DAY}_1", student_id=f"s{i}", class_id="c001", date=DAY,
+              lesson_number=1, score_total=50)
+        for i in range(7)
+    )
+    db.commit()
+    filters = [Grade.date == DAY]
+    assert sorted(_all_pages(db, GRADE_COLUMNS, filters, 2)) == sorted(
+        f"g_s{i}_{DAY}_1" for i in range(7)
+    )
+    assert _page(db, GRADE_COLUMNS, filters, "g_s6_9999", 2) == {
+        "items": [], "next_cursor": None,
+    }
+
+
+def test_bulk_upserts_are_idempotent(db):
+    students = [
+        StudentIn(id="s001", name="生徒1", class_id="c001"),
+        StudentIn(id="s002", name="生徒2", class_id="c001"),
+    ]
+    assert [r["status"] for r in _upsert_students(db, students)] == ["created"] * 2
+    assert [r["status"] for r in _upsert_students(db, students)] == ["updated"] * 2
+    assert db.scalar(select(func.count()).select_from(Student)) == 2
+
+    grades = [
+        GradeIn(student_id=sid, class_id="c001", date=DAY, lesson_number=1,
+                score_comprehension=10, score_grammar=5)
+        for sid in ("s001", "s002")
+    ]
+    first = _upsert_grades(db, grades)
+    assert [r["status"] for r in first] == ["created"] * 2
+    snapshot = db.execute(select(*GRADE_COLUMNS).order_by(Grade.id)).all()
+
+    second = _upsert_grades(db, grades)
+    assert [r["id"] for r in second] == [r["id"] for r in first]
+    assert [r["status"] for r in second] == ["updated"] * 2
+    assert db.execute(select(*GRADE_COLUMNS).order_by(Grade.id)).all() == snapshot
+    assert snapshot[0].score_total == 15
+
+
+def test_school_stats(app_db):
+    app_db.add(Class(id="c001", name="難関大"))
+    app_db.add_all([
+        Student(id="s001", name="生徒1", class_id="c001"),
+        Student(id="s002", name="生徒2", class_id="c001"),
+    ])
+    app_db.flush()
+    app_db.add_all([
+        Grade(id="g1", student_id="s001", date=DAY, score_total=80, max_total=100),
+        Grade(id="g2", student_id="s001", date=DAY, score_total=30, max_total=50),
+        # 満点 0 は 0 点として数える
+        Grade(id="g3", student_id="s002", date=DAY, score_total=10, max_total=0),
+        Attendance(id="a1", student_id="s001", class_id="c001", date=DAY,
+                   status="出席"),
+        Attendance(id="a2", student_id="s002", class_id="c001", date=DAY,
+                   status="欠席"),
+        Attendance(id="a3", student_id="s001", class_id="c001",
+                   date=date(2025, 4, 14), status="出席"),
+    ])
+    app_db.commit()
+
+    stats = asyncio.run(get_school_stats(None))
+    expected = {
+        "students": 2, "classes": 1, "grade_count": 3,
+        # (80 + 60 + 0) / 3
+        "average": 47,
+        "attendance_rate": 67,
+    }
+    assert {k: stats[k] for k in expected} == expected
+    assert list(stats["branches"].values()) == [expected]
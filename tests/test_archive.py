@@ -0,0 +1,42 @@
+"""年度アーカイブと、期間を指定しない問い合わせ"""
+
+from datetime import date
+
+import pytest
+
+from app.models.class_ import Class
+from app.models.grade import Grade
+from app.models.student import Student
+from app.services.archive import archive_year, archived_until
+from app.services.grade_calculator import get_student_grades
+
+
+@pytest.fixture
+def db(sqlite_db):
+    sqlite_db.add(Class(id="c001", name="難関大クラス"))
+    sqlite_db.add(Student(id="s001", name="生徒1", class_id="c001"))
+    sqlite_db.add_all([
+        Grade(id="g_old", student_id="s001", class_id="c001",
+              date=date(2023, 6, 1), lesson_number=1, score_total=60),
+        Grade(id="g_new", student_id="s001", class_id="c001",
+              date=date.today(), lesson_number=1, score_total=80),
+    ])
+    sqlite_db.commit()
+    return sqlite_db
+
+
+def test_cutoff_reflects_archive_made_elsewhere(db):
+    assert archived_until(db) is None
+    # 別のセッション（scripts/archive_year.py にあたる）で移動する
+    with type(db)(bind=db.get_bind()) as other:
+        archive_year(other, 2023)
+    assert archived_until(db) == date(2024, 3, 31)
+
+
+def test_archived_grades_need_include_archive(db):
+    archive_year(db, 2023)
+    assert [g.id for g in get_student_grades(db, "s001")] == ["g_new"]
+    everything = get_student_grades(db, "s001", include_archive=True)
+    assert [g.id for g in everything] == ["g_old", "g_new"]
+    since_2023 = get_student_grades(db, "s001", date_from=date(2023, 4, 1))
+    assert [g.id for g in since_2023] == ["g_old", "g_new"]
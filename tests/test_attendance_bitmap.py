@@ -0,0 +1,51 @@
+"""出欠のビット配列と、同じ日に複数の記録がある生徒"""
+
+from datetime import date
+
+import pytest
+
+from app.models.attendance import Attendance
+from app.models.class_ import Class
+from app.models.student import Student
+from app.services.attendance_bitmap import (
+    get_attendance_summary,
+    rebuild_attendance_bitmaps,
+)
+from app.services.roll_call import attendance_id, record_roll_call
+
+DAY = date(2025, 4, 7)
+
+
+@pytest.fixture
+def db(sqlite_db):
+    sqlite_db.add_all([Class(id="c001", name="難関大"), Class(id="c002", name="共通")])
+    sqlite_db.add(Student(id="s001", name="生徒1", class_id="c001"))
+    sqlite_db.commit()
+    return sqlite_db
+
+
+def _other_class_record(db, status: str):
+    """講座の移動前など、別の講座で同じ日に記録がある"""
+    db.add(Attendance(
+        id=attendance_id("s001", "c002", DAY), student_id="s001",
+        class_id="c002", date=DAY, status=status,
+    ))
+    db.commit()
+    rebuild_attendance_bitmaps(db)
+
+
+@pytest.mark.parametrize(("other", "recorded", "expected"), [
+    ("出席", "欠席", "absent"),
+    ("欠席", "出席", "absent"),
+    ("出席", "遅刻", "late"),
+])
+def test_most_severe_status_wins(db, other, recorded, expected):
+    _other_class_record(db, other)
+    record_roll_call(db, "c001", DAY, {"s001": recorded})
+    summary = get_attendance_summary(db, "s001")
+    assert summary["total"] == 1
+    assert summary[expected] == 1
+
+    # 全件の再構築でも同じ（記録の順序によらない）
+    rebuild_attendance_bitmaps(db)
+    assert get_attendance_summary(db, "s001") == summary
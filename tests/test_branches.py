@@ -0,0 +1,66 @@
+"""教室ごとの DB（書き込みスレッドと成績ストアも教室ごと）"""
+
+from datetime import date
+
+import pytest
+
+from app import database, db_writer
+from app.branches import DEFAULT_BRANCH, current_branch
+from app.config import settings
+from app.database import branch_session, get_branch_engine, migrate_schema
+from app.models.class_ import Class
+from app.models.grade import Grade
+from app.models.student import Student
+from app.services import grade_store
+from app.services.grade_store import get_grade_store, init_grade_store
+
+
+@pytest.fixture
+def branch(app_db, tmp_path, monkeypatch):
+    """既定の教室に加えて教室 "b2" の DB を用意"""
+    monkeypatch.setattr(
+        settings, "BRANCH_DATABASES", {"b2": f"sqlite:///{tmp_path}/b2.db"}
+    )
+    migrate_schema(get_branch_engine("b2"))
+    yield "b2"
+    get_branch_engine("b2").dispose()
+    database._sessionmakers.pop("b2")
+
+
+def _seed(db, name: str):
+    db.add(Class(id="c001", name="難関大クラス"))
+    db.add(Student(id="s001", name=name, class_id="c001"))
+    db.commit()
+
+
+def test_writer_per_branch(branch, monkeypatch):
+    monkeypatch.setattr(settings, "WRITE_QUEUE_ENABLED", True)
+    db_writer.start_writer()
+    try:
+        assert set(db_writer._writers) == {DEFAULT_BRANCH, branch}
+        with branch_session(branch) as db:
+            seen = db_writer.submit_write_sync(
+                lambda w: _seed(w, "生徒b2") or current_branch(), db
+            )
+            assert seen == branch
+            assert db.get(Student, "s001").name == "生徒b2"
+    finally:
+        db_writer.stop_writer()
+    assert not db_writer._writers
+
+
+def test_grade_store_per_branch(app_db, branch, monkeypatch):
+    monkeypatch.setattr(grade_store, "_stores", {})
+    _seed(app_db, "生徒main")
+    with branch_session(branch) as db:
+        _seed(db, "生徒b2")
+        db.add(Grade(id="g001", student_id="s001", class_id="c001",
+                     date=date(2025, 4, 7), lesson_number=1,
+                     score_total=80, max_total=100))
+        db.commit()
+
+    init_grade_store(get_branch_engine(DEFAULT_BRANCH))
+    init_grade_store(get_branch_engine(branch), branch)
+    assert get_grade_store().average(student_id="s001") == (0, 0)
+    with branch_session(branch):
+        assert get_grade_store().average(student_id="s001") == (80, 1)
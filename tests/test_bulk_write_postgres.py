@@ -0,0 +1,135 @@
+"""PostgreSQL での一括書き込み（COPY・UPDATE ... FROM・ON CONFLICT）と CSV 取込"""
+
+from datetime import date
+
+from sqlalchemy import func, select, text
+
+from app.data_version import get_data_version
+from app.models.class_ import Class
+from app.models.grade import Grade
+from app.models.import_batch import GradePrior
+from app.models.student import Student
+from app.services.bulk_write import bulk_insert, bulk_update, copy_supported, upsert
+from app.services.student_search import search_students
+from tests.helpers import build_csv, run_import
+
+
+def _seed(db, students=3):
+    db.add(Class(id="c001", name="難関大クラス"))
+    db.add_all(
+        Student(id=f"s{i:03d}", name=f"生徒{i}", class_id="c001")
+        for i in range(students)
+    )
+    db.commit()
+
+
+def _grade(i: int, **values) -> dict:
+    return {
+        "id": f"g{i:03d}", "student_id": f"s{i % 3:03d}", "class_id": "c001",
+        "date": date(2025, 4, 7), "lesson_number": i, **values,
+    }
+
+
+def test_copy_supported(pg_db):
+    assert copy_supported(pg_db)
+
+
+def test_bulk_insert_fills_defaults_and_bumps_version(pg_db):
+    _seed(pg_db)
+    before = get_data_version("grades")
+    bulk_insert(pg_db, Grade, [
+        _grade(1, lesson_content='引用符 "と" カンマ, を含む', score_total=80),
+        _grade(2, lesson_content=None),
+    ])
+    pg_db.commit()
+
+    rows = {g.id: g for g in pg_db.scalars(select(Grade))}
+    assert rows["g001"].lesson_content == '引用符 "と" カンマ, を含む'
+    assert rows["g001"].score_total == 80
+    # COPY は ORM を通らないので、Python 側の既定値を bulk_insert が補う
+    assert rows["g001"].max_total == 100
+    assert rows["g002"].score_total == 0
+    # 空文字ではなく NULL
+    assert rows["g002"].lesson_content is None
+    assert get_data_version("grades") != before
+
+
+def test_bulk_update_changes_only_given_rows(pg_db):
+    _seed(pg_db)
+    bulk_insert(pg_db, Grade, [_grade(i, score_total=10) for i in range(4)])
+    pg_db.commit()
+
+    bulk_update(pg_db, Grade, [
+        {"id": "g000", "score_total": 90, "batch_id": 7},
+        {"id": "g002", "score_total": 70, "batch_id": 7},
+    ])
+    pg_db.commit()
+
+    scores = dict(pg_db.execute(select(Grade.id, Grade.score_total)).all())
+    assert scores == {"g000": 90, "g001": 10, "g002": 70, "g003": 10}
+    # 一時テーブルは残らない
+    temp = pg_db.scalar(
+        text("SELECT count(*) FROM pg_tables WHERE tablename LIKE '_bulk_%'")
+    )
+    assert temp == 0
+
+
+def test_upsert_reports_created_rows(pg_db):
+    _seed(pg_db)
+    bulk_insert(pg_db, Grade, [_grade(i, score_total=10) for i in range(2)])
+    pg_db.commit()
+
+    created = upsert(pg_db, Grade, [_grade(i, score_total=50) for i in range(4)])
+    pg_db.commit()
+
+    assert created == {"g002", "g003"}
+    scores = dict(pg_db.execute(select(Grade.id, Grade.score_total)).all())
+    assert scores == {"g000": 50, "g001": 50, "g002": 50, "g003": 50}
+
+
+def test_save_csv_data_insert_then_update(pg_db):
+    pg_db.add(Class(id="c001", name="難関大クラス"))
+    pg_db.commit()
+
+    first = run_import(pg_db, build_csv(10))
+    assert first["errors"] == []
+    assert (first["added_students"], first["added_grades"]) == (3, 6)
+    assert pg_db.scalar(select(func.count()).select_from(Grade)) == 6
+    high_school = select(Student.high_school).where(Student.name == "生徒1")
+    assert pg_db.scalar(high_school) == "高校1"
+
+    second = run_import(pg_db, build_csv(15))
+    assert (second["updated_grades"], second["added_grades"]) == (6, 0)
+    totals = set(pg_db.scalars(select(Grade.score_total)))
+    assert totals == {75}
+    # 取消用に上書き前の得点が残る
+    priors = set(pg_db.scalars(
+        select(GradePrior.score_total).where(GradePrior.batch_id == second["batch_id"])
+    ))
+    assert priors == {50}
+
+
+def test_postgres_only_indexes_exist(pg_db):
+    indexes = dict(pg_db.execute(
+        text("SELECT indexname, indexdef FROM pg_indexes WHERE schemaname = 'public'")
+    ).all())
+    assert "INCLUDE (lesson_number, score_total, max_total)" in (
+        indexes["ix_grades_student_date_cover"]
+    )
+    assert "INCLUDE (student_id, score_total, max_total)" in (
+        indexes["ix_grades_class_date_cover"]
+    )
+    assert "INCLUDE (status)" in indexes["ix_attendance_student_date_cover"]
+    assert "WHERE (class_id IS NOT NULL)" in indexes["ix_students_class_cover"]
+    assert "WHERE ((status)::text = '取込済'::text)" in (
+        indexes["ix_import_batches_active"]
+    )
+
+
+def test_bulk_update_refreshes_search_index(pg_db):
+    _seed(pg_db)
+    # COPY と UPDATE ... FROM は session.execute を通らない
+    bulk_update(pg_db, Student, [{"id": "s001", "name": "山田太郎", "club": "卓球部"}])
+    pg_db.commit()
+    assert [s.id for s in search_students(pg_db, "卓球")] == ["s001"]
+    assert [s.id for s in search_students(pg_db, "山田")] == ["s001"]
@@ -0,0 +1,70 @@
+"""書き込みキュー経由の CSV 保存（成績を分けて別の書き込みジョブにする）"""
+
+import asyncio
+
+import pytest
+from sqlalchemy import func, select
+
+from app import db_writer
+from app.config import settings
+from app.models.class_ import Class
+from app.models.grade import Grade
+from app.models.import_batch import ImportBatch
+from app.services import csv_importer
+from app.services.csv_importer import save_csv_data_in_chunks
+from tests.helpers import build_csv, preview
+
+
+@pytest.fixture
+def db(app_db, monkeypatch):
+    monkeypatch.setattr(csv_importer, "IMPORT_CHUNK_ROWS", 2)
+    app_db.add(Class(id="c001", name="難関大クラス"))
+    app_db.commit()
+    return app_db
+
+
+@pytest.fixture
+def writer(monkeypatch):
+    monkeypatch.setattr(settings, "WRITE_QUEUE_ENABLED", True)
+    yield db_writer.start_writer()
+    db_writer.stop_writer()
+
+
+def _save(db, csv_text: str) -> dict:
+    students, grades, diff = preview(db, csv_text)
+    save = save_csv_data_in_chunks(db, students, grades, "test.csv", None, diff)
+    return asyncio.run(save)
+
+
+def test_chunks_through_writer_queue(db, writer, monkeypatch):
+    jobs = []
+    submit = writer.submit
+    monkeypatch.setattr(writer, "submit", lambda fn: jobs.append(fn) or submit(fn))
+
+    results = _save(db, build_csv(10, lessons=6))
+
+    # 生徒と取込の開始・成績 2 行ずつ 3 回・完了の記録
+    assert len(jobs) == 5
+    assert results["added_grades"] == 6
+    batch = db.get(ImportBatch, results["batch_id"])
+    assert (batch.added_students, batch.added_grades) == (3, 6)
+    assert db.scalar(select(func.count()).select_from(Grade)) == 6
+
+
+def test_failed_chunk_rolls_back_the_import(db, monkeypatch):
+    calls = []
+    write_grades = csv_importer._write_grades
+
+    def _fail_second(w, state, rows, recheck=False):
+        calls.append(rows)
+        if len(calls) == 2:
+            raise RuntimeError("disk full")
+        write_grades(w, state, rows, recheck)
+
+    monkeypatch.setattr(csv_importer, "_write_grades", _fail_second)
+    with pytest.raises(RuntimeError):
+        _save(db, build_csv(10, lessons=6))
+
+    db.expire_all()
+    assert db.scalar(select(ImportBatch.status)) == "取消済"
+    assert db.scalar(select(func.count()).select_from(Grade)) == 0
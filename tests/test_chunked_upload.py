@@ -0,0 +1,160 @@
+"""CSV の分割・再開可能アップロード（チャンクの検証・再送・別プロセスでの再開）"""
+
+import hashlib
+import os
+import time
+
+import pytest
+
+from app.config import settings
+from app.services import chunked_upload
+from app.services.chunked_upload import (
+    OffsetMismatch,
+    append_chunk,
+    create_session,
+    finalize_session,
+    get_session,
+    purge_expired_sessions,
+)
+from app.services.csv_importer import parse_new_format_csv
+from tests.helpers import build_csv
+
+CSV = build_csv(15, students=4, lessons=8)
+DATA = CSV.encode("utf-8")
+
+
+@pytest.fixture(autouse=True)
+def spool(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "UPLOAD_SPOOL_DIR", str(tmp_path))
+    monkeypatch.setattr(chunked_upload, "_sessions", {})
+    return tmp_path
+
+
+def _sha(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _send(session, start: int, end: int, data: bytes = DATA) -> int:
+    """data[start:end] を1チャンクとして送る"""
+    chunk = data[start:end]
+    content_range = f"bytes {start}-{end - 1}/{len(data)}"
+    return append_chunk(session, content_range, _sha(chunk), chunk)
+
+
+def test_chunks_parse_like_whole_file(spool):
+    session = create_session("grades.csv", len(DATA), _sha(DATA))
+    # 7 バイトずつ（行の途中・マルチバイト文字の途中で切れる）
+    for start in range(0, len(DATA), 7):
+        assert _send(session, start, min(start + 7, len(DATA))) == min(
+            start + 7, len(DATA)
+        )
+    assert session.complete
+    assert finalize_session(session) == parse_new_format_csv(CSV)
+    # 確定したら保存ファイルを消す
+    assert os.listdir(spool) == []
+
+
+def test_resent_chunk_is_ignored_and_gap_rejected():
+    session = create_session("grades.csv", len(DATA))
+    assert _send(session, 0, 100) == 100
+    # 応答が届かずに再送した範囲は何もしない
+    assert _send(session, 0, 100) == 100
+    with pytest.raises(OffsetMismatch) as excinfo:
+        _send(session, 150, 200)
+    assert excinfo.value.offset == 100
+    assert os.path.getsize(session.data_path) == 100
+
+
+@pytest.mark.parametrize("content_range, checksum, message", [
+    (None, None, "Content-Range"),
+    ("bytes 0-9/5", None, "ファイルサイズ"),
+    ("bytes 0-19/{size}", None, "チャンクの長さ"),
+    ("bytes 0-9/{size}", "", "X-Chunk-SHA256"),
+    ("bytes 0-9/{size}", "0" * 64, "チェックサム"),
+])
+def test_invalid_chunk_rejected(content_range, checksum, message):
+    session = create_session("grades.csv", len(DATA))
+    chunk = DATA[:10]
+    if content_range is not None:
+        content_range = content_range.format(size=len(DATA))
+    with pytest.raises(ValueError, match=message):
+        append_chunk(
+            session, content_range, _sha(chunk) if checksum is None else checksum, chunk
+        )
+    assert session.offset == 0
+
+
+def test_resume_in_another_process():
+    session = create_session("grades.csv", len(DATA), _sha(DATA))
+    half = len(DATA) // 2 + 1
+    _send(session, 0, half)
+    # 別のワーカー（セッションを持っていない）が保存ファイルから続きを受ける
+    chunked_upload._sessions.clear()
+    resumed = get_session(session.id)
+    assert resumed is not session
+    assert resumed.status() == {
+        "upload_id": session.id, "offset": half, "size": len(DATA), "complete": False,
+    }
+    _send(resumed, half, len(DATA))
+    assert finalize_session(resumed) == parse_new_format_csv(CSV)
+
+
+def test_other_process_append_is_replayed():
+    session = create_session("grades.csv", len(DATA))
+    _send(session, 0, 50)
+    # 別のワーカーが同じセッションに追記した
+    with open(session.data_path, "ab") as f:
+        f.write(DATA[50:80])
+    assert get_session(session.id).offset == 80
+    assert _send(session, 80, len(DATA)) == len(DATA)
+    assert finalize_session(session) == parse_new_format_csv(CSV)
+
+
+def test_unknown_session():
+    for upload_id in ("0" * 32, "../../etc/passwd"):
+        with pytest.raises(KeyError):
+            get_session(upload_id)
+
+
+def test_finalize_checks_completeness_and_file_checksum(spool):
+    session = create_session("grades.csv", len(DATA), _sha(b"other file"))
+    _send(session, 0, 10)
+    with pytest.raises(OffsetMismatch):
+        finalize_session(session)
+    _send(session, 10, len(DATA))
+    with pytest.raises(ValueError, match="ファイル全体のチェックサム"):
+        finalize_session(session)
+    # 一致しなかったセッションは破棄する
+    assert os.listdir(spool) == []
+    with pytest.raises(KeyError):
+        get_session(session.id)
+
+
+def test_non_utf8_upload_discarded(spool):
+    data = "氏名\n".encode("shift_jis")
+    session = create_session("grades.csv", len(data))
+    with pytest.raises(ValueError, match="UTF-8"):
+        _send(session, 0, len(data), data)
+    assert os.listdir(spool) == []
+
+
+def test_size_limit(monkeypatch):
+    monkeypatch.setattr(chunked_upload, "MAX_UPLOAD_SIZE", 1024)
+    with pytest.raises(ValueError, match="ファイルサイズ"):
+        create_session("big.csv", 1025)
+
+
+def test_purge_removes_only_expired_sessions(spool):
+    stale = create_session("old.csv", len(DATA))
+    _send(stale, 0, 10)
+    fresh = create_session("new.csv", len(DATA))
+    past = time.time() - chunked_upload.SESSION_TTL_SECONDS - 60
+    for path in (stale.data_path, stale.meta_path):
+        os.utime(path, (past, past))
+
+    assert purge_expired_sessions() == 1
+    assert sorted(os.listdir(spool)) == sorted(
+        os.path.basename(p) for p in (fresh.data_path, fresh.meta_path)
+    )
+    with pytest.raises(KeyError):
+        get_session(stale.id)
@@ -0,0 +1,104 @@
+"""CSV 取込のプレビューと保存確定"""
+
+import pytest
+from sqlalchemy import delete, select, update
+
+from app.models.class_ import Class
+from app.models.grade import Grade
+from app.models.student import Student
+from app.services import csv_importer
+from app.services.csv_importer import save_csv_data
+from app.services.import_batch import find_imported_file
+from tests.helpers import build_csv, preview, run_import
+
+
+@pytest.fixture
+def db(sqlite_db):
+    sqlite_db.add(Class(id="c001", name="難関大クラス"))
+    sqlite_db.commit()
+    run_import(sqlite_db, build_csv(10))
+    return sqlite_db
+
+
+def test_save_uses_preview_when_nothing_changed(db):
+    students, grades, diff = preview(db, build_csv(15))
+    results = save_csv_data(db, students, grades, "test.csv", diff=diff)
+    assert results["updated_grades"] == 6
+    assert set(db.scalars(select(Grade.score_total))) == {75}
+
+
+def test_save_rejects_rows_edited_after_preview(db):
+    students, grades, diff = preview(db, build_csv(15))
+    # プレビューの後に画面（成績グリッド）で1件を直した
+    grade_id = diff["grades"][0]["key"]
+    db.execute(update(Grade).where(Grade.id == grade_id).values(score_total=99))
+    db.commit()
+
+    with pytest.raises(ValueError, match="プレビューの後"):
+        save_csv_data(db, students, grades, "test.csv", diff=diff)
+    db.rollback()
+    assert db.get(Grade, grade_id).score_total == 99
+
+
+def test_save_reuses_preview_diff(db, monkeypatch):
+    students, grades, diff = preview(db, build_csv(15))
+
+    def _no_diff(*args, **kwargs):
+        raise AssertionError("保存時に差分を作り直した")
+
+    monkeypatch.setattr(csv_importer, "diff_import", _no_diff)
+    results = save_csv_data(db, students, grades, "test.csv", diff=diff)
+    assert results["updated_grades"] == 6
+
+
+def test_save_rejects_students_edited_after_preview(db):
+    students, grades, diff = preview(db, build_csv(15).replace("理系", "文系"))
+    assert diff["counts"]["students"]["changed"] == 3
+    # プレビューの後に画面で生徒の部活を直した
+    student_id = diff["students"][0]["key"]
+    db.execute(update(Student).where(Student.id == student_id).values(club="野球部"))
+    db.commit()
+
+    with pytest.raises(ValueError, match="プレビューの後"):
+        save_csv_data(db, students, grades, "test.csv", diff=diff)
+    db.rollback()
+    assert db.get(Student, student_id).course_subject == "理系"
+
+
+def test_taken_grade_id_is_reported_not_fatal(db):
+    # 取込済みの成績の日付を画面で直すと、同じ ID のまま (生徒, 日付, 授業回) が変わる
+    moved = db.scalars(select(Grade).order_by(Grade.lesson_number)).first()
+    moved.date = moved.date.replace(year=2024)
+    db.commit()
+
+    students, grades, diff = preview(db, build_csv(15))
+    results = save_csv_data(db, students, grades, "test.csv", diff=diff)
+    assert results["updated_grades"] == 5
+    assert len(results["errors"]) == 1
+    assert moved.id in results["errors"][0]
+
+
+def test_rows_edited_after_import_are_not_skipped(db):
+    # 取込の後に画面で1件を直し、1件を消した
+    edited, removed = db.scalars(select(Grade).order_by(Grade.id).limit(2)).all()
+    edited.score_total = 99
+    db.execute(delete(Grade).where(Grade.id == removed.id))
+    db.commit()
+
+    # 同じ CSV を取り込み直すと、その2行だけが差分になる
+    students, grades, diff = preview(db, build_csv(10))
+    assert len(grades) == 2
+    assert diff["counts"]["grades"]["changed"] == 1
+    assert diff["counts"]["grades"]["added"] == 1
+    save_csv_data(db, students, grades, "test.csv", diff=diff)
+    assert set(db.scalars(select(Grade.score_total))) == {50}
+
+
+def test_same_file_is_duplicate_only_until_other_writes(db):
+    students, grades, diff = preview(db, build_csv(15))
+    save_csv_data(db, students, grades, "test.csv", "ab" * 32, diff)
+    assert find_imported_file(db, "ab" * 32) is not None
+
+    db.execute(update(Grade).values(score_total=0))
+    db.commit()
+    assert find_imported_file(db, "ab" * 32) is None
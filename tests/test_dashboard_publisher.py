@@ -0,0 +1,76 @@
+"""ダッシュボードの静的配信と、イベントを発行しない書き込みでの取り消し"""
+
+import pytest
+from sqlalchemy import select
+from starlette.requests import Request
+
+from app.branches import DEFAULT_BRANCH
+from app.database import SessionLocal
+from app.models.class_ import Class
+from app.models.student import Student
+from app.services import dashboard_publisher
+from app.services.dashboard_publisher import (
+    DashboardPublisher,
+    publish_student,
+    published_page,
+)
+from app.services.maintenance import precompute_stats_job
+from tests.helpers import build_csv, run_import
+
+
+def _request(if_none_match: str = "") -> Request:
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    return Request({"type": "http", "method": "GET", "headers": headers})
+
+
+@pytest.fixture
+def publisher(app_db, tmp_path, monkeypatch):
+    app_db.add(Class(id="c001", name="難関大クラス"))
+    app_db.commit()
+    run_import(app_db, build_csv(10))
+    # スレッドは起動せず、書き出しはテストから呼ぶ
+    publisher = DashboardPublisher(str(tmp_path))
+    monkeypatch.setattr(dashboard_publisher, "_publisher", publisher)
+    return publisher
+
+
+def _publish(publisher, student_id: str):
+    with SessionLocal() as db:
+        assert publish_student(db, publisher.root, DEFAULT_BRANCH, student_id)
+
+
+def test_published_page_uses_weak_etag(app_db, publisher):
+    student_id = app_db.scalar(select(Student.id).order_by(Student.id))
+    assert published_page(_request(), DEFAULT_BRANCH, student_id) is None
+    _publish(publisher, student_id)
+
+    response = published_page(_request(), DEFAULT_BRANCH, student_id)
+    etag = response.headers["etag"]
+    assert etag.startswith('W/"')
+    # 圧縮して返した応答の ETag でも、強い形で送られても一致とみなす
+    for tag in (etag, etag[2:]):
+        response = published_page(_request(tag), DEFAULT_BRANCH, student_id)
+        assert response.status_code == 304
+
+
+def test_write_without_event_discards_page(app_db, publisher):
+    student_id = app_db.scalar(select(Student.id).order_by(Student.id))
+    _publish(publisher, student_id)
+    # 夜間の事前計算（イベントは発行せず、教室の .generation を書き換える）
+    precompute_stats_job()
+    assert (publisher.root / DEFAULT_BRANCH / ".generation").exists()
+    assert published_page(_request(), DEFAULT_BRANCH, student_id) is None
+
+    _publish(publisher, student_id)
+    assert published_page(_request(), DEFAULT_BRANCH, student_id).status_code == 200
+
+
+def test_published_page_does_not_touch_db(app_db, publisher, monkeypatch):
+    student_id = app_db.scalar(select(Student.id).order_by(Student.id))
+    _publish(publisher, student_id)
+
+    def _no_db(*args, **kwargs):
+        raise AssertionError("配信時に DB を読んだ")
+
+    monkeypatch.setattr("sqlalchemy.orm.Session.execute", _no_db)
+    assert published_page(_request(), DEFAULT_BRANCH, student_id).status_code == 200
@@ -0,0 +1,79 @@
+"""データバージョンと、他のプロセスの書き込みの取り込み（フラグメントキャッシュ）"""
+
+import pytest
+from sqlalchemy import update
+
+from app import data_version
+from app.config import settings
+from app.database import data_versions, engine, refresh_data_versions
+from app.models.class_ import Class
+from app.templates_config import render_fragment
+
+
+@pytest.fixture
+def render(app_db, monkeypatch):
+    # 間隔を空けた取り込みはテストから切り替える（既定は取り込まない）
+    monkeypatch.setattr(settings, "DATA_VERSION_REFRESH_SECONDS", 3600)
+    renders = []
+
+    def _render():
+        def load_context():
+            renders.append(1)
+            return {"classes": app_db.query(Class).all()}
+
+        response = render_fragment(
+            "partials/class_options.html", ("classes",), load_context
+        )
+        return response.body.decode("utf-8")
+
+    refresh_data_versions(app_db)
+    _render.count = renders
+    return _render
+
+
+def test_other_process_write_invalidates_fragment(app_db, render):
+    assert "難関大" not in render()
+    before = len(render.count)
+    # 別のワーカーにあたる書き込み（このプロセスのイベントを通らない）
+    with engine.begin() as conn:
+        conn.execute(Class.__table__.insert().values(id="c001", name="難関大クラス"))
+        conn.execute(
+            update(data_versions)
+            .where(data_versions.c.table_name == "classes")
+            .values(version=data_versions.c.version + 1)
+        )
+    assert "難関大" not in render()
+
+    # 間隔が過ぎたあとにキャッシュのキーを作るときに取り込む
+    settings.DATA_VERSION_REFRESH_SECONDS = 0
+    assert "難関大" in render()
+    assert len(render.count) == before + 1
+
+
+def test_refresh_is_throttled(app_db, render, monkeypatch):
+    render()
+    queries = []
+    monkeypatch.setattr(settings, "DATA_VERSION_REFRESH_SECONDS", 0)
+    loader = data_version._loader
+    monkeypatch.setattr(
+        data_version, "_loader", lambda branch: queries.append(1) or loader(branch)
+    )
+    render()
+    assert len(queries) == 1
+    # 間隔内の呼び出しは DB に問い合わせない
+    settings.DATA_VERSION_REFRESH_SECONDS = 3600
+    render()
+    render()
+    assert len(queries) == 1
+
+
+def test_own_commit_is_not_counted_twice(app_db, render):
+    render()
+    before = len(render.count)
+    app_db.add(Class(id="c001", name="難関大クラス"))
+    app_db.commit()
+    assert "難関大" in render()
+
+    refresh_data_versions(app_db)
+    render()
+    assert len(render.count) == before + 1
@@ -0,0 +1,70 @@
+"""書き込みキュー（取り消された書き込みと、その後の書き込み）"""
+
+import asyncio
+import threading
+
+import pytest
+
+from app import db_writer
+from app.branches import DEFAULT_BRANCH
+from app.database import SessionLocal
+from app.db_writer import DatabaseWriter, submit_write
+from app.models.class_ import Class
+
+
+@pytest.fixture
+def writer(app_db, monkeypatch):
+    writer = DatabaseWriter(DEFAULT_BRANCH)
+    writer.start()
+    monkeypatch.setattr(db_writer, "_writers", {DEFAULT_BRANCH: writer})
+    yield writer
+    writer.stop()
+
+
+def _add_class(class_id: str):
+    def _write(db):
+        db.add(Class(id=class_id, name=class_id))
+        db.commit()
+        return class_id
+
+    return _write
+
+
+def test_cancelled_write_does_not_stop_writer(app_db, writer):
+    release = threading.Event()
+
+    async def scenario():
+        # 先の書き込みで書き込みスレッドを止めておき、その間に次の書き込みを取り消す
+        first = asyncio.ensure_future(
+            submit_write(app_db, lambda db: release.wait(5))
+        )
+        await asyncio.sleep(0.05)
+        cancelled = asyncio.ensure_future(submit_write(app_db, _add_class("c_gone")))
+        await asyncio.sleep(0.01)
+        cancelled.cancel()
+        release.set()
+        await first
+        return await asyncio.wait_for(submit_write(app_db, _add_class("c_next")), 5)
+
+    assert asyncio.run(scenario()) == "c_next"
+    with SessionLocal() as db:
+        assert db.get(Class, "c_next") is not None
+        assert db.get(Class, "c_gone") is None
+
+
+def test_cancel_while_running_still_delivers_others(app_db, writer):
+    started = threading.Event()
+    release = threading.Event()
+
+    def _slow(db):
+        started.set()
+        release.wait(5)
+        return _add_class("c_slow")(db)
+
+    running = writer.submit(_slow)
+    assert started.wait(5)
+    # 実行中の処理は取り消せない（結果はそのまま届く）
+    assert not running.cancel()
+    release.set()
+    assert running.result(5) == "c_slow"
+    assert writer.submit(_add_class("c_after")).result(5) == "c_after"
@@ -0,0 +1,128 @@
+"""変更イベントの配信（接続ごとの絞り込み・SSE で溜まったイベントをまとめて送る）"""
+
+import asyncio
+
+import pytest
+from starlette.requests import Request
+
+from app.branches import DEFAULT_BRANCH
+from app.events import Event, EventBus, Subscription, publish_after_commit
+from app.routers import events as events_router
+
+
+def _event(class_ids=(), student_ids=(), branch=DEFAULT_BRANCH, name="grades-changed"):
+    return Event(name, "", frozenset(class_ids), frozenset(student_ids), branch)
+
+
+def _subscription(class_id=None, student_id=None, branch=DEFAULT_BRANCH):
+    # 絞り込みだけを見る（イベントループには届けない）
+    return Subscription(None, class_id, student_id, branch)
+
+
+def test_unscoped_subscription_wants_whole_branch():
+    subscription = _subscription()
+    assert subscription.wants(_event())
+    assert subscription.wants(_event(class_ids={"c1"}, student_ids={"s1"}))
+    # 別の教室のイベントは届けない
+    assert not subscription.wants(_event(branch="osaka"))
+
+
+def test_subscription_filters_by_class_and_student():
+    by_class = _subscription(class_id="c1")
+    assert by_class.wants(_event(class_ids={"c1", "c2"}))
+    assert not by_class.wants(_event(class_ids={"c2"}))
+    assert not by_class.wants(_event(student_ids={"s1"}))
+
+    by_student = _subscription(student_id="s1")
+    assert by_student.wants(_event(student_ids={"s1"}))
+    assert not by_student.wants(_event(class_ids={"c1"}, student_ids={"s2"}))
+
+    # 講座と生徒の両方を指定したらどちらかに当たれば届ける
+    both = _subscription(class_id="c1", student_id="s1")
+    assert both.wants(_event(class_ids={"c1"}))
+    assert both.wants(_event(student_ids={"s1"}))
+    assert not both.wants(_event(class_ids={"c2"}, student_ids={"s2"}))
+    assert not both.wants(_event(class_ids={"c1"}, branch="osaka"))
+
+
+def test_publish_delivers_to_matching_subscriptions():
+    bus = EventBus()
+    seen = []
+
+    def failing(event):
+        raise RuntimeError("listener failed")
+
+    async def scenario():
+        c1 = bus.subscribe(class_id="c1")
+        c2 = bus.subscribe(class_id="c2")
+        bus.add_listener(failing)
+        bus.add_listener(lambda event: seen.append(event.name))
+        # 講座のない成績（None）は講座の絞り込みに使わない
+        bus.publish("grades-changed", "a\nb", class_ids=["c1", None])
+        await asyncio.sleep(0)
+        bus.unsubscribe(c2)
+        return c1.queue.get_nowait(), c2.queue.qsize(), bus.subscriber_count
+
+    event, c2_size, count = asyncio.run(scenario())
+    assert (event.name, event.data, event.class_ids) == (
+        "grades-changed", "a b", frozenset({"c1"}),
+    )
+    assert c2_size == 0
+    assert count == 1
+    # 失敗したリスナーがあっても他のリスナーと接続には届く
+    assert seen == ["grades-changed"]
+
+
+def test_publish_after_commit_waits_for_group_commit(sqlite_db, monkeypatch):
+    bus = EventBus()
+    monkeypatch.setattr("app.events.event_bus", bus)
+    published = []
+    bus.add_listener(lambda event: published.append((event.name, event.branch)))
+
+    # 書き込みキュー内（グループコミット待ち）では発行を遅らせる
+    sqlite_db.info["deferred_callbacks"] = deferred = []
+    publish_after_commit(sqlite_db, "students-changed", student_ids=["s1"])
+    assert published == []
+    for callback in deferred:
+        callback()
+    assert published == [("students-changed", DEFAULT_BRANCH)]
+
+
+@pytest.fixture
+def bus(monkeypatch):
+    bus = EventBus()
+    monkeypatch.setattr(events_router, "event_bus", bus)
+    return bus
+
+
+def _request() -> Request:
+    return Request({
+        "type": "http", "method": "GET", "path": "/api/events",
+        "query_string": b"", "headers": [],
+    })
+
+
+def test_stream_coalesces_queued_events_by_name(bus):
+    async def scenario():
+        response = await events_router.stream_events(_request(), class_id="c1")
+        chunks = response.body_iterator
+        assert await anext(chunks) == "retry: 5000\n\n"
+        # 接続が読む前に溜まったイベント（取込中の連続した更新など）
+        for i in range(3):
+            bus.publish("grades-changed", f"batch {i}", class_ids=["c1"])
+        bus.publish("students-changed", "", class_ids=["c1"])
+        bus.publish("grades-changed", "other class", class_ids=["c2"])
+        await asyncio.sleep(0)
+        sent = [await anext(chunks), await anext(chunks)]
+        bus.close()
+        rest = [chunk async for chunk in chunks]
+        return sent, rest
+
+    sent, rest = asyncio.run(scenario())
+    # 同じ名前は最後の1件だけ送る
+    assert sent == [
+        "event: grades-changed\ndata: batch 2\n\n",
+        "event: students-changed\ndata: \n\n",
+    ]
+    assert rest == []
+    assert bus.subscriber_count == 0
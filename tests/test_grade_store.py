@@ -0,0 +1,104 @@
+"""成績ストアの集計と ORM の集計が同じ値になること（NumPy の有無とも）"""
+
+from datetime import date
+
+import pytest
+from sqlalchemy import select
+
+from app.database import engine
+from app.models.class_ import Class
+from app.models.grade import Grade
+from app.models.import_batch import ImportBatch
+from app.models.student import Student
+from app.services import grade_store
+from app.services.grade_calculator import (
+    calculate_class_average,
+    calculate_student_average,
+)
+from app.services.grade_store import init_grade_store
+from app.services.import_batch import rollback_batch
+from tests.helpers import build_csv, run_import
+
+DAY1 = date(2025, 4, 7)
+DAY2 = date(2025, 4, 14)
+
+
+@pytest.fixture(params=["numpy", "python"])
+def db(request, app_db, monkeypatch):
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(grade_store, "np", None)
+    monkeypatch.setattr(grade_store, "_stores", {})
+    app_db.add_all([Class(id="c001", name="難関大"), Class(id="c002", name="共通")])
+    app_db.commit()
+    return app_db
+
+
+def _averages(db) -> dict:
+    students = db.scalars(select(Student.id).order_by(Student.id)).all()
+    return {
+        "students": {sid: calculate_student_average(db, sid) for sid in students},
+        "classes": {
+            (class_id, day): calculate_class_average(db, class_id, day)
+            for class_id in ("c001", "c002", "c999")
+            for day in (None, DAY1, DAY2, date(2025, 5, 1))
+        },
+    }
+
+
+def _assert_store_matches_orm(db):
+    with_store = _averages(db)
+    stores = dict(grade_store._stores)
+    grade_store._stores.clear()
+    try:
+        assert with_store == _averages(db)
+    finally:
+        grade_store._stores.update(stores)
+
+
+def _grade(grade_id, student_id, day, total, max_total=100, class_id="c001"):
+    return Grade(
+        id=grade_id, student_id=student_id, class_id=class_id, date=day,
+        lesson_number=1 if day == DAY1 else 2, score_total=total, max_total=max_total,
+    )
+
+
+def test_loaded_store_matches_orm(db):
+    db.add_all([
+        Student(id="s001", name="生徒1", class_id="c001"),
+        Student(id="s002", name="生徒2", class_id="c001"),
+        # 成績の講座と所属が違う（講座平均は所属で絞る）
+        Student(id="s003", name="生徒3", class_id="c002"),
+    ])
+    db.flush()
+    db.add_all([
+        _grade("g1", "s001", DAY1, 73),
+        _grade("g2", "s001", DAY2, 41, max_total=60),
+        _grade("g3", "s002", DAY1, 88),
+        # 満点が 0 の成績は 0 点として数える
+        _grade("g4", "s002", DAY2, 15, max_total=0),
+        _grade("g5", "s003", DAY1, 52, class_id="c001"),
+    ])
+    db.commit()
+
+    init_grade_store(engine)
+    assert len(grade_store._stores) == 1
+    _assert_store_matches_orm(db)
+
+
+def test_store_follows_overwrite_and_rollback(db):
+    init_grade_store(engine)
+    run_import(db, build_csv(10))
+    _assert_store_matches_orm(db)
+
+    # 同じ成績を上書き
+    run_import(db, build_csv(15))
+    _assert_store_matches_orm(db)
+    assert calculate_student_average(db, "s1") == 75
+
+    # 取消でストアを読み直す
+    batch_id = db.scalar(select(ImportBatch.id).order_by(ImportBatch.id.desc()))
+    rollback_batch(db, batch_id)
+    _assert_store_matches_orm(db)
+    assert calculate_student_average(db, "s1") == 50
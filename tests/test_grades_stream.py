@@ -0,0 +1,104 @@
+"""最近の成績一覧のストリーミング（クライアントの切断で読み出し用のセッションを閉じる）"""
+
+import asyncio
+from datetime import date, timedelta
+
+import pytest
+from starlette.requests import ClientDisconnect, Request
+
+from app.models.class_ import Class
+from app.models.grade import Grade
+from app.models.student import Student
+from app.routers import grades as grades_router
+from app.routers.grades import list_grades
+
+
+@pytest.fixture
+def closed(app_db, monkeypatch):
+    """読み出し用のセッションを閉じた回数"""
+    app_db.add(Class(id="c001", name="難関大"))
+    app_db.add(Student(id="s001", name="生徒1", class_id="c001"))
+    app_db.flush()
+    app_db.add_all(
+        Grade(id=f"g{i}", student_id="s001", class_id="c001",
+              date=date(2025, 4, 7) + timedelta(days=i), lesson_number=i,
+              lesson_content=f"Unit {i}", score_total=50)
+        for i in range(400)
+    )
+    app_db.commit()
+
+    closed = []
+    sessionmaker = grades_router.get_branch_sessionmaker
+
+    def _tracking(branch):
+        def _session():
+            session = sessionmaker(branch)()
+            close = session.close
+            session.close = lambda: (closed.append(True), close())[1]
+            return session
+        return _session
+
+    monkeypatch.setattr(grades_router, "get_branch_sessionmaker", _tracking)
+    return closed
+
+
+def _scope(spec_version: str) -> dict:
+    return {
+        "type": "http", "method": "GET", "path": "/api/grades", "query_string": b"",
+        "headers": [], "asgi": {"spec_version": spec_version},
+    }
+
+
+def test_full_response_closes_session(closed):
+    async def scenario():
+        request = Request(_scope("2.4"))
+        response = await list_grades(request, None, None)
+        bodies = []
+
+        async def send(message):
+            bodies.append(message.get("body", b""))
+
+        await response(request.scope, None, send)
+        return b"".join(bodies).decode()
+
+    html = asyncio.run(scenario())
+    assert html.count("Unit ") == 400
+    assert closed == [True]
+
+
+def test_send_failure_closes_session(closed):
+    async def scenario():
+        request = Request(_scope("2.4"))
+        response = await list_grades(request, None, None)
+
+        async def send(message):
+            if message.get("body"):
+                raise OSError("connection reset")
+
+        with pytest.raises(ClientDisconnect):
+            await response(request.scope, None, send)
+        # 応答への参照が残っていても（GC を待たずに）閉じている
+        return list(closed)
+
+    assert asyncio.run(scenario()) == [True]
+
+
+def test_disconnect_closes_session(closed):
+    async def scenario():
+        request = Request(_scope("2.0"))
+        response = await list_grades(request, None, None)
+        disconnected = asyncio.Event()
+
+        async def receive():
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message.get("body"):
+                disconnected.set()
+                await asyncio.sleep(0.05)
+
+        await response(request.scope, receive, send)
+        return list(closed)
+
+    assert asyncio.run(scenario()) == [True]
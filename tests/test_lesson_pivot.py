@@ -0,0 +1,167 @@
+"""講座 × 授業回のピボット（手計算との一致・1回の GROUP BY・キャッシュ）"""
+
+from datetime import date
+
+import pytest
+from sqlalchemy import event
+
+from app import templates_config
+from app.config import settings
+from app.database import engine, refresh_data_versions
+from app.models.class_ import Class
+from app.models.grade import Grade
+from app.models.student import Student
+from app.services import lesson_pivot
+from app.services.lesson_pivot import (
+    compute_lesson_pivot,
+    get_lesson_pivot,
+    hardest_lessons,
+    heatmap,
+)
+from app.templates_config import render_fragment
+
+
+def _grade(grade_id, class_id, lesson, total, max_total=100, **scores):
+    return Grade(
+        id=grade_id, student_id="s1", class_id=class_id, date=date(2025, 4, 7),
+        lesson_number=lesson,
+        lesson_content=f"第{lesson}回の内容" if lesson else None,
+        score_total=total, max_total=max_total, **scores,
+    )
+
+
+@pytest.fixture
+def grades(app_db, monkeypatch):
+    monkeypatch.setattr(settings, "DATA_VERSION_REFRESH_SECONDS", 3600)
+    monkeypatch.setattr(lesson_pivot, "_cache", {})
+    monkeypatch.setattr(templates_config, "_fragment_cache", {})
+    app_db.add_all([
+        Class(id="c1", name="A講座"),
+        Class(id="c2", name="B講座"),
+        Student(id="s1", name="生徒1"),
+    ])
+    app_db.add_all([
+        # A講座 第1回: 合計 80, 60 点 / 読解 10/20, 20/20 点
+        _grade("g1", "c1", 1, 80, score_comprehension=10, max_comprehension=20),
+        _grade("g2", "c1", 1, 60, score_comprehension=20, max_comprehension=20),
+        # A講座 第2回: 45/50 点 → 90
+        _grade("g3", "c1", 2, 45, max_total=50),
+        # B講座 第1回: 40 点（満点 0 の科目は 0 点として数える）
+        _grade("g4", "c2", 1, 40, score_comprehension=5, max_comprehension=0),
+        # 授業回が未設定の成績は最後の列
+        _grade("g5", "c2", None, 70),
+        # 講座のない成績は集計しない
+        _grade("g6", None, 1, 0),
+    ])
+    app_db.commit()
+    refresh_data_versions(app_db)
+    return app_db
+
+
+def test_pivot_matches_hand_computed_averages(grades):
+    pivot = compute_lesson_pivot(grades)
+    assert pivot["lessons"] == [1, 2, None]
+    a, b = pivot["classes"]
+    assert (a["name"], b["name"]) == ("A講座", "B講座")
+
+    assert a["cells"][1]["total"] == {"avg": 70.0, "sd": 10.0, "count": 2}
+    assert a["cells"][1]["comprehension"] == {"avg": 75.0, "sd": 25.0, "count": 2}
+    assert a["cells"][2]["total"] == {"avg": 90.0, "sd": 0.0, "count": 1}
+    # 80, 60, 90 → 平均 76.7・標準偏差 12.5
+    assert a["overall"]["total"] == {"avg": 76.7, "sd": 12.5, "count": 3}
+
+    assert b["cells"][1]["comprehension"]["avg"] == 0.0
+    assert b["cells"][None]["total"]["avg"] == 70.0
+    # 全講座の第1回: 80, 60, 40 → 平均 60・標準偏差 16.3（講座のない g6 を含まない）
+    assert pivot["school"][1]["total"] == {"avg": 60.0, "sd": 16.3, "count": 3}
+
+
+def test_pivot_by_lesson_content(grades):
+    pivot = compute_lesson_pivot(grades, "lesson_content")
+    assert pivot["lessons"] == ["第1回の内容", "第2回の内容", None]
+    assert pivot["school"]["第2回の内容"]["total"]["avg"] == 90.0
+
+
+def test_pivot_reads_grades_in_one_group_by(grades):
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        compute_lesson_pivot(grades)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    grade_queries = [s for s in statements if "FROM grades" in s]
+    assert len(grade_queries) == 1
+    assert "GROUP BY" in grade_queries[0]
+
+
+def test_heatmap_and_hardest_lessons(grades):
+    pivot = compute_lesson_pivot(grades)
+    table = heatmap(pivot)
+    assert table["columns"] == ["第1回", "第2回", "未設定"]
+    # 成績のない組み合わせ（A講座の未設定・B講座の第2回）は None
+    assert table["rows"][0]["cells"][2] is None
+    assert table["rows"][1]["cells"][1] is None
+    assert [row["lesson"] for row in hardest_lessons(pivot, limit=2)] == [
+        "第1回", "未設定",
+    ]
+
+
+def test_pivot_cached_until_grades_change(grades, monkeypatch):
+    computed = []
+    compute = lesson_pivot.compute_lesson_pivot
+    monkeypatch.setattr(
+        lesson_pivot,
+        "compute_lesson_pivot",
+        lambda db, axis: computed.append(axis) or compute(db, axis),
+    )
+    first = get_lesson_pivot(grades)
+    assert get_lesson_pivot(grades) is first
+    assert len(computed) == 1
+
+    grades.add(_grade("g7", "c2", 2, 100))
+    grades.commit()
+    pivot = get_lesson_pivot(grades)
+    assert len(computed) == 2
+    assert pivot["school"][2]["total"]["count"] == 2
+
+
+def test_fragment_rendered_once_per_version_and_key(grades):
+    renders = []
+
+    def render(series: str) -> str:
+        def load_context():
+            renders.append(series)
+            pivot = get_lesson_pivot(grades)
+            return {
+                "table": heatmap(pivot, series),
+                "axis": pivot["axis"],
+                "series": series,
+                "axes": lesson_pivot.AXES,
+                "labels": {"total": "合計", "comprehension": "読解"},
+                "hardest": hardest_lessons(pivot, series),
+            }
+
+        response = render_fragment(
+            "partials/lesson_pivot.html",
+            ("grades", "classes"),
+            load_context,
+            key=("lesson_number", series),
+        )
+        return response.body.decode("utf-8")
+
+    html = render("total")
+    assert "A講座" in html
+    assert render("total") == html
+    assert renders == ["total"]
+    # 科目が変われば別のキー
+    render("comprehension")
+    assert renders == ["total", "comprehension"]
+
+    grades.add(_grade("g7", "c2", 2, 100))
+    grades.commit()
+    render("total")
+    assert renders == ["total", "comprehension", "total"]
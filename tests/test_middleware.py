@@ -0,0 +1,183 @@
+"""ETag・圧縮ミドルウェア（304・エンコーディングの選択・ストリーミング応答）"""
+
+import asyncio
+import gzip
+import zlib
+
+import pytest
+from jinja2 import DictLoader, Environment
+from starlette.responses import Response, StreamingResponse
+
+from app import middleware, templates_config
+from app.middleware import CompressionMiddleware, ETagMiddleware
+from app.templates_config import stream_template
+
+BODY = "成績一覧 " * 200
+
+
+def _stack(make_response):
+    """
+    app.main と同じ順（圧縮が外側）
+    応答はヘッダーを書き換えられるので呼び出しごとに作る
+    """
+    async def app(scope, receive, send):
+        await make_response()(scope, receive, send)
+
+    return CompressionMiddleware(ETagMiddleware(app), minimum_size=500)
+
+
+def _call(app, **headers) -> list:
+    """ASGI アプリを呼び、送られたメッセージを順に返す"""
+    messages = []
+    scope = {
+        "type": "http", "method": "GET", "path": "/", "query_string": b"",
+        "headers": [
+            (k.replace("_", "-").encode(), v.encode()) for k, v in headers.items()
+        ],
+    }
+
+    async def receive():
+        # 切断しない（ストリーミング応答の切断待ちが戻らないように）
+        await asyncio.Event().wait()
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    return messages
+
+
+def _headers(messages) -> dict:
+    return {k.decode(): v.decode() for k, v in messages[0]["headers"]}
+
+
+def _body(messages) -> bytes:
+    return b"".join(m.get("body", b"") for m in messages[1:])
+
+
+def test_matching_etag_returns_304():
+    app = _stack(lambda: Response(BODY, media_type="text/html"))
+    first = _call(app)
+    etag = _headers(first)["etag"]
+    assert etag.startswith('W/"')
+    assert _headers(first)["cache-control"] == "no-cache"
+
+    # 強い形で送られても、複数の候補のうちの1つでも一致とみなす
+    for if_none_match in (etag, etag[2:], f'"other", {etag}'):
+        messages = _call(app, if_none_match=if_none_match)
+        assert messages[0]["status"] == 304
+        assert _body(messages) == b""
+        assert "content-length" not in _headers(messages)
+
+    assert _call(app, if_none_match='W/"other"')[0]["status"] == 200
+
+
+def test_gzip_is_chosen_and_varies_on_accept_encoding(monkeypatch):
+    monkeypatch.setattr(middleware, "brotli", None)
+    app = _stack(lambda: Response(BODY, media_type="text/html"))
+    messages = _call(app, accept_encoding="br;q=1.0, gzip")
+    headers = _headers(messages)
+    assert headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in headers["vary"]
+    assert int(headers["content-length"]) == len(_body(messages))
+    assert gzip.decompress(_body(messages)).decode() == BODY
+
+    plain = _call(app)
+    assert "content-encoding" not in _headers(plain)
+    assert _body(plain).decode() == BODY
+
+
+def test_brotli_is_preferred_when_installed():
+    brotli = pytest.importorskip("brotli")
+    messages = _call(
+        _stack(lambda: Response(BODY, media_type="text/html")),
+        accept_encoding="gzip, br",
+    )
+    assert _headers(messages)["content-encoding"] == "br"
+    assert brotli.decompress(_body(messages)).decode() == BODY
+
+
+def test_small_and_encoded_bodies_are_not_compressed():
+    small = _call(
+        _stack(lambda: Response("ok", media_type="text/plain")), accept_encoding="gzip"
+    )
+    assert "content-encoding" not in _headers(small)
+    assert _body(small) == b"ok"
+
+    compressed = gzip.compress(BODY.encode())
+    encoded = _call(
+        _stack(lambda: Response(
+            compressed, media_type="text/html", headers={"Content-Encoding": "gzip"}
+        )),
+        accept_encoding="gzip",
+    )
+    assert _headers(encoded)["content-encoding"] == "gzip"
+    assert _body(encoded) == compressed
+
+
+def _streaming(media_type: str, produced: list):
+    async def chunks():
+        for i in range(3):
+            produced.append(i)
+            yield f"<p>{i}</p>" * 100
+
+    return StreamingResponse(chunks(), media_type=media_type)
+
+
+def test_streamed_html_is_compressed_chunk_by_chunk():
+    produced = []
+    sent = []
+    inner = _streaming("text/html", produced)
+
+    async def app(scope, receive, send):
+        async def record(message):
+            # 各チャンクは次のチャンクを作る前に送られている
+            if message["type"] == "http.response.body" and message.get("more_body"):
+                sent.append(len(produced))
+            await send(message)
+        await _stack(lambda: inner)(scope, receive, record)
+
+    messages = _call(app, accept_encoding="gzip")
+    headers = _headers(messages)
+    assert headers["content-encoding"] == "gzip"
+    assert "etag" not in headers
+    assert "content-length" not in headers
+    assert sent == [1, 2, 3]
+
+    # チャンクごとに flush しているので、届いた分だけで展開できる
+    decoder = zlib.decompressobj(31)
+    bodies = [m["body"] for m in messages[1:] if m.get("more_body")]
+    assert [decoder.decompress(b).decode() for b in bodies] == [
+        f"<p>{i}</p>" * 100 for i in range(3)
+    ]
+
+
+def test_event_stream_passes_through():
+    produced = []
+    messages = _call(
+        _stack(lambda: _streaming("text/event-stream", produced)),
+        accept_encoding="gzip",
+    )
+    headers = _headers(messages)
+    assert "content-encoding" not in headers
+    assert "etag" not in headers
+    assert [m["body"] for m in messages[1:] if m.get("body")] == [
+        (f"<p>{i}</p>" * 100).encode() for i in range(3)
+    ]
+
+
+def test_stream_template_is_sent_in_chunks(monkeypatch):
+    monkeypatch.setattr(templates_config, "env", Environment(loader=DictLoader({
+        "rows.html": "{% for row in rows %}<tr><td>{{ row }}</td></tr>{% endfor %}",
+    })))
+    rows = (f"生徒{i}" for i in range(600))
+    messages = _call(
+        _stack(lambda: stream_template("rows.html", {"rows": rows}, chunk_size=4096)),
+        accept_encoding="gzip",
+    )
+    headers = _headers(messages)
+    assert headers["content-encoding"] == "gzip"
+    assert "etag" not in headers
+    assert len([m for m in messages[1:] if m.get("more_body")]) > 1
+    html = gzip.decompress(_body(messages)).decode()
+    assert html.count("<tr>") == 600
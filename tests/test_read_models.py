@@ -0,0 +1,102 @@
+"""一覧表示用の読み取りモデル（テンプレートが使う列があるか・ORM と同じ描画か）"""
+
+from datetime import date
+
+import pytest
+from jinja2 import Environment, StrictUndefined
+
+from app.models.class_ import Class
+from app.models.grade import Grade
+from app.models.student import Student
+from app.services import read_models
+from app.templates_config import env
+
+# テンプレートが参照する属性が射影にないときに空文字にせず例外にする
+strict_env = Environment(loader=env.loader, autoescape=True, undefined=StrictUndefined)
+
+
+def _render(name: str, **context) -> str:
+    return strict_env.get_template(name).render(**context)
+
+
+@pytest.fixture
+def school(sqlite_db):
+    db = sqlite_db
+    db.add_all([
+        Class(id="c1", name="高3英語@難関大", day="月", time="19:00-20:30"),
+        Class(id="c2", name="高2英語", day=None, time=None),
+        Student(
+            id="s1", name="佐藤", name_kana="さとう", gender="女",
+            target_university="東大", target_dept="文", class_id="c1",
+        ),
+        Student(id="s2", name="鈴木", class_id="c1"),
+        Student(id="s3", name="高橋", class_id=None),
+    ])
+    db.add_all([
+        Grade(
+            id="g1", student_id="s1", class_id="c1", date=date(2025, 4, 7),
+            lesson_content="第1回", score_comprehension=15, score_unseen=12,
+            score_grammar=18, score_vocabulary=20, score_listening=0,
+            score_total=65, max_listening=0, max_total=80,
+        ),
+        Grade(
+            id="g2", student_id="s2", class_id="c1", date=date(2025, 4, 14),
+            score_total=0, max_total=0,
+        ),
+    ])
+    db.commit()
+    db.expunge_all()
+    return db
+
+
+def test_student_rows_render_like_orm(school):
+    rows = read_models.student_rows(school)
+    entities = school.query(Student).order_by(Student.name).all()
+    html = _render("partials/students_table.html", students=rows)
+    assert html == _render("partials/students_table.html", students=entities)
+    assert "さとう" in html and "東大" in html
+
+
+def test_grade_rows_render_like_orm(school):
+    rows = read_models.recent_grade_rows(school)
+    entities = school.query(Grade).order_by(Grade.date.desc()).all()
+    html = _render("partials/grades_table.html", grades=rows)
+    assert html == _render("partials/grades_table.html", grades=entities)
+    # 満点 0 の列も 0 のまま描画する
+    assert "0/0" in html and "65/80" in html
+
+
+def test_streamed_grade_rows_match_list(school):
+    rows = read_models.iter_recent_grade_rows(school, batch_size=1)
+    assert list(rows) == read_models.recent_grade_rows(school)
+    assert read_models.recent_grade_rows(school, limit=1)[0].date == date(2025, 4, 14)
+
+
+def test_class_rows_count_students_in_one_query(school):
+    rows = {row.id: row for row in read_models.class_rows(school)}
+    assert rows["c1"].student_count == 2
+    # 生徒のいない講座も 0 人で出る（LEFT JOIN）
+    assert rows["c2"].student_count == 0
+    html = _render("partials/classes_table.html", classes=list(rows.values()))
+    assert "高2英語" in html and ">0</td>" in html
+
+
+def test_option_rows_render(school):
+    html = _render(
+        "partials/class_options.html", classes=read_models.class_options(school)
+    )
+    assert '<option value="c1">高3英語@難関大</option>' in html
+    students = read_models.class_student_options(school, "c1")
+    assert sorted(s.id for s in students) == ["s1", "s2"]
+    html = _render(
+        "partials/class_students_select.html", students=students, empty_message=None
+    )
+    assert '<option value="s1">佐藤</option>' in html
+
+
+def test_rows_are_plain_tuples(school):
+    rows = read_models.student_rows(school) + read_models.recent_grade_rows(school)
+    assert all(isinstance(row, tuple) for row in rows)
+    assert not any(hasattr(row, "__dict__") for row in rows)
+    # ORM のインスタンスを作らない（アイデンティティマップに何も入らない）
+    assert len(school.identity_map) == 0
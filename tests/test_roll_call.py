@@ -0,0 +1,69 @@
+"""出欠入力の一括保存（同じ出欠の二重保存・別のプロセスとの競合）"""
+
+from datetime import date
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+
+from app.models.attendance import Attendance
+from app.models.class_ import Class
+from app.models.student import Student
+from app.services import roll_call
+from app.services.roll_call import record_roll_call
+
+DAY = date(2025, 4, 7)
+
+
+@pytest.fixture(params=["sqlite_db", "pg_db"])
+def db(request):
+    db = request.getfixturevalue(request.param)
+    db.add(Class(id="c001", name="難関大"))
+    db.add_all([
+        Student(id="s001", name="生徒1", class_id="c001"),
+        Student(id="s002", name="生徒2", class_id="c001"),
+    ])
+    db.commit()
+    return db
+
+
+def _statuses(db) -> dict:
+    return dict(db.execute(select(Attendance.student_id, Attendance.status)).all())
+
+
+def test_saving_same_roll_call_twice(db):
+    statuses = {"s001": "出席", "s002": "欠席"}
+    assert record_roll_call(db, "c001", DAY, statuses) == {
+        "added": 2, "updated": 0, "unchanged": 0,
+    }
+    assert record_roll_call(db, "c001", DAY, statuses) == {
+        "added": 0, "updated": 0, "unchanged": 2,
+    }
+    assert db.scalar(select(func.count()).select_from(Attendance)) == 2
+    assert _statuses(db) == statuses
+
+
+def test_concurrent_record_is_overwritten(db, monkeypatch):
+    # 別のプロセスが、こちらが既存の記録を読んだ後に別の ID で記録した
+    db.add(Attendance(
+        id="a_other", student_id="s001", class_id="c001", date=DAY, status="欠席",
+    ))
+    db.commit()
+    monkeypatch.setattr(roll_call, "_existing_records", lambda *args: {})
+
+    record_roll_call(db, "c001", DAY, {"s001": "遅刻"})
+    assert db.scalars(select(Attendance.id)).all() == ["a_other"]
+    assert _statuses(db) == {"s001": "遅刻"}
+
+
+def test_duplicate_key_is_rejected(db):
+    db.add(Attendance(
+        id="a_other", student_id="s001", class_id="c001", date=DAY, status="欠席",
+    ))
+    db.commit()
+    db.add(Attendance(
+        id="a_dup", student_id="s001", class_id="c001", date=DAY, status="出席",
+    ))
+    with pytest.raises(IntegrityError):
+        db.commit()
+    db.rollback()
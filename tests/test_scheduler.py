@@ -0,0 +1,83 @@
+"""定期処理のスケジューラ（cron 形式の解析・次回実行時刻・ロック・実行履歴）"""
+
+from datetime import datetime
+
+import pytest
+
+from app import scheduler as scheduler_module
+from app.scheduler import CronSchedule, Scheduler, _job_lock, recent_runs
+
+
+@pytest.mark.parametrize(("expr", "field", "expected"), [
+    ("*/15 * * * *", "minutes", {0, 15, 30, 45}),
+    ("0 9-11 * * *", "hours", {9, 10, 11}),
+    ("0 0 1,15 * *", "days", {1, 15}),
+    ("0 0 * 4-12/4 *", "months", {4, 8, 12}),
+    ("0 0 * * 1-5", "weekdays", {1, 2, 3, 4, 5}),
+    # 7 も日曜
+    ("0 0 * * 0,7", "weekdays", {0}),
+    ("5/20 * * * *", "minutes", {5, 25, 45}),
+])
+def test_fields_are_parsed(expr, field, expected):
+    assert getattr(CronSchedule(expr), field) == expected
+
+
+@pytest.mark.parametrize("expr", [
+    "* * * *", "60 * * * *", "* 24 * * *", "* * 0 * *", "* * * 13 *",
+    "* * * * 8", "*/0 * * * *", "5-1 * * * *", "a * * * *",
+])
+def test_invalid_schedules_are_rejected(expr):
+    with pytest.raises(ValueError):
+        CronSchedule(expr)
+
+
+def test_day_and_weekday_match_either():
+    # 日と曜日の両方を指定したら cron と同じくどちらかに合えばよい（15日 または 月曜）
+    schedule = CronSchedule("0 8 15 * 1")
+    assert schedule.matches(datetime(2025, 4, 15, 8, 0))   # 火曜の15日
+    assert schedule.matches(datetime(2025, 4, 14, 8, 0))   # 月曜
+    assert not schedule.matches(datetime(2025, 4, 16, 8, 0))
+    # 片方が * なら両方に合う必要がある
+    assert not CronSchedule("0 8 15 * *").matches(datetime(2025, 4, 14, 8, 0))
+    assert not CronSchedule("0 8 * * 1").matches(datetime(2025, 4, 15, 8, 0))
+
+
+@pytest.mark.parametrize(("expr", "now", "expected"), [
+    ("0 2 * * *", datetime(2025, 4, 7, 1, 59, 30), datetime(2025, 4, 7, 2, 0)),
+    # ちょうどの時刻なら次の回
+    ("0 2 * * *", datetime(2025, 4, 7, 2, 0), datetime(2025, 4, 8, 2, 0)),
+    ("*/10 * * * *", datetime(2025, 4, 7, 23, 55), datetime(2025, 4, 8, 0, 0)),
+    # 月末・年末をまたぐ
+    ("30 3 1 * *", datetime(2025, 12, 31, 12, 0), datetime(2026, 1, 1, 3, 30)),
+    ("0 21 * * 0", datetime(2025, 4, 7, 12, 0), datetime(2025, 4, 13, 21, 0)),
+    ("0 0 29 2 *", datetime(2025, 3, 1, 0, 0), None),
+])
+def test_next_after(expr, now, expected):
+    assert CronSchedule(expr).next_after(now) == expected
+
+
+def test_run_is_recorded_in_default_db(app_db):
+    scheduler = Scheduler()
+    scheduler.register("hello", "0 2 * * *", lambda: "3件")
+    assert scheduler.run_job("hello")
+
+    runs = recent_runs()
+    assert [(r.job_name, r.status, r.message) for r in runs] == [
+        ("hello", "成功", "3件"),
+    ]
+
+
+def test_job_running_in_another_process_is_not_started(app_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        scheduler_module.settings, "SCHEDULER_LOCK_FILE", str(tmp_path / "s.lock")
+    )
+    calls = []
+    scheduler = Scheduler()
+    scheduler.register("hello", "0 2 * * *", lambda: calls.append(1))
+    # 別のワーカー（リーダー）が同じジョブを実行中
+    with _job_lock("hello") as locked:
+        assert locked
+        assert not scheduler.run_job("hello")
+    assert calls == []
+    assert scheduler.run_job("hello")
+    assert calls == [1]
@@ -0,0 +1,49 @@
+"""複数のワーカーが同時に起動したときのスキーマ更新"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import inspect, text
+
+from app.database import _create_engine, migrate_schema
+
+
+def test_concurrent_migration_runs_once(tmp_path):
+    bind = _create_engine(f"sqlite:///{tmp_path}/workers.db")
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(lambda _: migrate_schema(bind), range(4)))
+    assert results.count(True) == 1
+    assert migrate_schema(bind) is False
+
+
+def test_migration_adds_dropped_column_once(tmp_path):
+    bind = _create_engine(f"sqlite:///{tmp_path}/workers.db")
+    migrate_schema(bind)
+    # 後から追加した列がない古い DB にあたる（指紋も消して更新させる）
+    with bind.begin() as conn:
+        conn.execute(text("ALTER TABLE students DROP COLUMN name_kana"))
+        conn.execute(text("DELETE FROM schema_version"))
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(lambda _: migrate_schema(bind), range(4)))
+    assert results.count(True) == 1
+    columns = {c["name"] for c in inspect(bind).get_columns("students")}
+    assert "name_kana" in columns
+
+
+def test_unique_index_drops_duplicate_rows(tmp_path):
+    bind = _create_engine(f"sqlite:///{tmp_path}/workers.db")
+    migrate_schema(bind)
+    # 一意インデックスを追加する前の DB に、同じ生徒・講座・日付の出欠が2件ある
+    with bind.begin() as conn:
+        conn.execute(text("DROP INDEX ux_attendance_student_class_date"))
+        conn.execute(text("DELETE FROM schema_version"))
+        conn.execute(text("INSERT INTO students (id, name) VALUES ('s001', '生徒1')"))
+        for record_id in ("a1", "a2"):
+            conn.execute(text(
+                "INSERT INTO attendance (id, student_id, class_id, date, status) "
+                f"VALUES ('{record_id}', 's001', NULL, '2025-04-07', '出席')"
+            ))
+    assert migrate_schema(bind) is True
+    with bind.connect() as conn:
+        assert conn.scalars(text("SELECT id FROM attendance")).all() == ["a1"]
+    indexes = {i["name"] for i in inspect(bind).get_indexes("attendance")}
+    assert "ux_attendance_student_class_date" in indexes
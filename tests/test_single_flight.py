@@ -0,0 +1,93 @@
+"""同じ計算の同時実行をまとめる（シングルフライト）"""
+
+import asyncio
+import threading
+
+import pytest
+
+from app.data_version import bump_data_version
+from app.single_flight import coalesce, coalescing_stats
+
+TABLE = "single_flight_test"
+
+
+def _gated(name: str, result=lambda calls: calls):
+    """release が立つまで計算を止めておく関数（呼ばれた回数を数える）"""
+    state = {"calls": 0, "started": threading.Event(), "release": threading.Event()}
+
+    @coalesce(name, TABLE)
+    def compute(db, key):
+        state["calls"] += 1
+        calls = state["calls"]
+        state["started"].set()
+        assert state["release"].wait(5)
+        return result(calls)
+
+    return compute, state
+
+
+async def _when_started(state):
+    while not state["started"].is_set():
+        await asyncio.sleep(0.005)
+
+
+def test_concurrent_calls_run_once(app_db):
+    compute, state = _gated("sf_once")
+
+    async def scenario():
+        tasks = [asyncio.ensure_future(compute.run_async(None, "k")) for _ in range(5)]
+        await _when_started(state)
+        await asyncio.sleep(0.02)
+        state["release"].set()
+        return await asyncio.gather(*tasks)
+
+    assert asyncio.run(scenario()) == [1] * 5
+    assert state["calls"] == 1
+    stats = coalescing_stats()["sf_once"]
+    assert (stats["calls"], stats["executions"], stats["coalesced"]) == (5, 1, 4)
+    assert stats["in_flight"] == 0
+
+    # 計算が終われば結果は保持しない（次の呼び出しは計算し直す）
+    assert compute(None, "k") == 2
+
+
+def test_errors_are_shared_and_counted(app_db):
+    def _fail(calls):
+        raise RuntimeError(f"failed {calls}")
+
+    compute, state = _gated("sf_errors", _fail)
+
+    async def scenario():
+        tasks = [asyncio.ensure_future(compute.run_async(None, "k")) for _ in range(3)]
+        await _when_started(state)
+        await asyncio.sleep(0.02)
+        state["release"].set()
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert [str(e) for e in results] == ["failed 1"] * 3
+    stats = coalescing_stats()["sf_errors"]
+    assert (stats["executions"], stats["errors"], stats["in_flight"]) == (1, 1, 0)
+
+    state["release"].set()
+    with pytest.raises(RuntimeError, match="failed 2"):
+        compute(None, "k")
+    assert coalescing_stats()["sf_errors"]["errors"] == 2
+
+
+def test_data_version_bump_starts_new_computation(app_db):
+    compute, state = _gated("sf_version")
+
+    async def scenario():
+        stale = asyncio.ensure_future(compute.run_async(None, "k"))
+        await _when_started(state)
+        # 計算中に書き込みがコミットされた: 後の呼び出しは書き込み前の計算に相乗りしない
+        bump_data_version(TABLE)
+        fresh = asyncio.ensure_future(compute.run_async(None, "k"))
+        await asyncio.sleep(0.02)
+        state["release"].set()
+        return await asyncio.gather(stale, fresh)
+
+    assert sorted(asyncio.run(scenario())) == [1, 2]
+    stats = coalescing_stats()["sf_version"]
+    assert (stats["executions"], stats["coalesced"]) == (2, 0)
@@ -0,0 +1,59 @@
+"""生徒検索のインデックスと、ORM を通さない students の書き込み"""
+
+import pytest
+from sqlalchemy import delete, insert, update
+
+from app.models.class_ import Class
+from app.models.student import Student
+from app.services.bulk_write import bulk_update
+from app.services.student_search import ensure_search_index, search_students
+
+
+@pytest.fixture
+def db(sqlite_db):
+    sqlite_db.add(Class(id="c001", name="難関大クラス"))
+    sqlite_db.commit()
+    return sqlite_db
+
+
+def _found(db, query: str) -> list:
+    return [s.id for s in search_students(db, query)]
+
+
+def test_core_insert_and_update_are_indexed(db):
+    db.execute(insert(Student), [
+        {"id": "s001", "name": "山田太郎", "name_kana": "ヤマダタロウ",
+         "club": "テニス部"},
+        {"id": "s002", "name": "佐藤花子", "name_kana": "サトウハナコ"},
+    ])
+    assert _found(db, "やまだ") == ["s001"]
+
+    # 主キー指定の一括 UPDATE（一部の列だけ）
+    bulk_update(db, Student, [{"id": "s002", "club": "茶道部"}])
+    assert _found(db, "茶道") == ["s002"]
+    assert _found(db, "さとう") == ["s002"]
+
+    # WHERE で選ぶ UPDATE
+    db.execute(update(Student).where(Student.club == "テニス部").values(club="卓球部"))
+    db.commit()
+    assert _found(db, "卓球") == ["s001"]
+    assert _found(db, "テニス") == []
+
+
+def test_core_delete_removes_index(db):
+    db.add(Student(id="s001", name="山田太郎", class_id="c001"))
+    db.commit()
+    db.execute(delete(Student).where(Student.class_id == "c001"))
+    db.commit()
+    assert _found(db, "山田") == []
+
+
+def test_fts_is_enabled_per_database(db, pg_db):
+    # SQLite の教室で FTS5 を用意しても、PostgreSQL の教室は LIKE で検索する
+    ensure_search_index(db.get_bind())
+    ensure_search_index(pg_db.get_bind())
+    for session in (db, pg_db):
+        session.add(Student(id="s001", name="山田太郎", high_school="北高等学校"))
+        session.commit()
+        assert _found(session, "高等学") == ["s001"]
+        assert _found(session, "高") == ["s001"]
@@ -0,0 +1,50 @@
+"""生徒の集計の事前計算と、DB に記録したデータバージョン"""
+
+import pytest
+from sqlalchemy import select, update
+
+from app import data_version
+from app.database import SessionLocal, stored_data_version
+from app.models.class_ import Class
+from app.models.grade import Grade
+from app.models.student import Student
+from app.services.student_stats import get_precomputed_advice, precompute_student_stats
+from tests.helpers import build_csv, run_import
+
+
+@pytest.fixture
+def db(app_db):
+    app_db.add(Class(id="c001", name="難関大クラス"))
+    app_db.commit()
+    run_import(app_db, build_csv(10))
+    return app_db
+
+
+def _student_id(db) -> str:
+    return db.scalar(select(Student.id).order_by(Student.id))
+
+
+def test_commit_bumps_stored_version(db):
+    before = stored_data_version(db, "grades", "classes")
+    db.execute(update(Grade).values(score_total=20))
+    db.commit()
+    after = stored_data_version(db, "grades", "classes")
+    assert after[1] == before[1] + 1
+    assert after[2] == before[2]
+
+
+def test_precomputed_advice_survives_other_process(db):
+    assert precompute_student_stats(db) == 3
+    # 定期処理はリーダーのプロセスで動く（このプロセスのバージョンは進んでいない）
+    data_version._versions.clear()
+    assert get_precomputed_advice(db, _student_id(db))
+
+
+def test_precomputed_advice_discarded_after_write(db):
+    precompute_student_stats(db)
+    # 別のセッション（別のワーカーにあたる）で成績を直す
+    with SessionLocal() as other:
+        other.execute(update(Grade).values(score_total=0))
+        other.commit()
+    data_version._versions.clear()
+    assert get_precomputed_advice(db, _student_id(db)) is None
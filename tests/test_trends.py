@@ -0,0 +1,119 @@
+"""成績トレンド・予測（直線の傾き・予測区間・NumPy なしでも同じ結果）"""
+
+import statistics
+from datetime import date, timedelta
+
+import pytest
+
+from app.models.grade import Grade
+from app.models.student import Student
+from app.services import trends
+from app.services.trends import compute_trends
+
+START = date(2025, 4, 1)
+
+
+def _add_series(db, student_id: str, totals, step_days: int = 10, **subjects):
+    db.add(Student(id=student_id, name=student_id))
+    for i, total in enumerate(totals):
+        db.add(Grade(
+            id=f"{student_id}-{i}", student_id=student_id,
+            date=START + timedelta(days=i * step_days), lesson_number=i + 1,
+            score_total=total, max_total=100,
+            **{key: values[i] for key, values in subjects.items()},
+        ))
+
+
+@pytest.fixture(params=["numpy", "python"])
+def grades(request, sqlite_db, monkeypatch):
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(trends, "np", None)
+    db = sqlite_db
+    # 10日ごとに 5 点ずつ上がる（30日あたり +15）
+    _add_series(
+        db, "linear", [50, 55, 60, 65, 70],
+        score_comprehension=[10, 11, 12, 13, 14],
+    )
+    _add_series(db, "noisy", [60, 64, 66, 72])
+    _add_series(db, "falling", [80, 70, 60, 50])
+    _add_series(db, "short", [40, 90])
+    _add_series(db, "capped", [80, 90, 100])
+    db.commit()
+    return db
+
+
+def test_linear_series_has_exact_slope_and_forecast(grades):
+    trend = compute_trends(grades)["linear"]
+    total = trend["total"]
+    assert trend["count"] == 5
+    assert total["slope"] == 15.0
+    # 次回は平均間隔（10日）後、直線上の 75 点。残差がないので区間の幅も 0
+    assert total["next_date"] == START + timedelta(days=50)
+    assert total["forecast"] == total["low"] == total["high"] == 75.0
+    assert total["volatility"] == 0.0
+    assert total["moving_avg"] == 60.0
+    assert trend["direction"] == "上昇"
+    # 読解は満点 20 で換算（10日ごとに 5 点 → 30日あたり +15）
+    assert trend["subjects"]["comprehension"]["slope"] == 15.0
+    assert trend["subjects"]["comprehension"]["moving_avg"] == 60.0
+
+
+def test_forecast_band_matches_hand_computed_interval(grades):
+    total = compute_trends(grades)["noisy"]["total"]
+    xs, ys = [0, 10, 20, 30], [60, 64, 66, 72]
+    fit = statistics.linear_regression(xs, ys)
+    residuals = [y - (fit.intercept + fit.slope * x) for x, y in zip(xs, ys)]
+    resid_sd = (sum(r * r for r in residuals) / (len(xs) - 2)) ** 0.5
+    mean_x = statistics.fmean(xs)
+    sxx = sum((x - mean_x) ** 2 for x in xs)
+    next_x = 40
+    forecast = fit.intercept + fit.slope * next_x
+    # 自由度 2 の t 分布の 97.5% 点
+    margin = 4.30 * resid_sd * (1 + 1 / 4 + (next_x - mean_x) ** 2 / sxx) ** 0.5
+
+    assert total["slope"] == round(fit.slope * 30, 1)
+    assert total["forecast"] == round(forecast, 1)
+    assert total["low"] == round(forecast - margin, 1)
+    assert total["high"] == round(forecast + margin, 1)
+    assert total["volatility"] == round(resid_sd, 1)
+    assert total["low"] < total["forecast"] < total["high"]
+
+
+def test_direction_and_short_series(grades):
+    result = compute_trends(grades)
+    assert result["falling"]["direction"] == "下降"
+    assert result["falling"]["total"]["slope"] == -30.0
+    # 2回だけでは区間を出さない
+    short = result["short"]["total"]
+    assert result["short"]["direction"] == "データ不足"
+    assert short["low"] is None and short["high"] is None
+    assert short["forecast"] == 100.0
+
+
+def test_forecast_clamped_to_full_marks(grades):
+    total = compute_trends(grades)["capped"]["total"]
+    assert total["forecast"] == 100.0
+    assert total["high"] == 100.0
+
+
+def test_moving_average_uses_last_window(grades):
+    trend = compute_trends(grades, window=2)["linear"]["total"]
+    assert trend["moving_avg"] == 67.5
+
+
+def test_selected_students_only(grades):
+    assert set(compute_trends(grades, ["noisy", "short"])) == {"noisy", "short"}
+    assert compute_trends(grades, ["missing"]) == {}
+
+
+def test_numpy_and_python_agree(sqlite_db, monkeypatch):
+    pytest.importorskip("numpy")
+    _add_series(sqlite_db, "a", [55, 61, 58, 70, 66, 75], step_days=7)
+    _add_series(sqlite_db, "b", [90, 82, 85, 79], step_days=14)
+    _add_series(sqlite_db, "c", [70])
+    sqlite_db.commit()
+    with_numpy = compute_trends(sqlite_db)
+    monkeypatch.setattr(trends, "np", None)
+    assert compute_trends(sqlite_db) == with_numpy